@@ -20,6 +20,13 @@ def get_app_data_dir() -> Path:
     # path.mkdir(parents=True, exist_ok=True)
     # return path
 
+    # REGULENS_DATA_DIR overrides the location (used by benchmarks and isolated test runs)
+    override = os.getenv("REGULENS_DATA_DIR")
+    if override:
+        path = Path(override)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
     # 測試用：直接回傳專案根目錄下的 user_data 資料夾。需要被mark掉
     path = Path(__file__).parent.parent / "user_data"
 
@@ -0,0 +1,473 @@
+"""Headless command-line runner for Regulens-AI.
+
+Runs the v1.1 compliance pipeline for one or many projects without the Qt
+GUI, e.g. for nightly re-assessments on a server with no display::
+
+    python -m app.cli run --all --jobs 4
+    python -m app.cli run --project "符合規範案例 (Demo)"
+    python -m app.cli run --dir /data/audits/2024Q3 --dir /data/audits/2024Q4
+
+``cache migrate`` moves the per-project caches between storage backends, e.g.
+from one file per entry into a single SQLite database per project::
+
+    python -m app.cli cache migrate --to sqlite
+
+``cache gc`` reports the size of every cache and evicts the least recently
+used entries beyond the size cap (``pipeline.cache_max_mb`` unless
+``--max-mb`` is given). ``--delete-orphans`` also removes the caches of
+projects that are neither in ``projects.json`` nor were ever run with
+``run --dir``, and index directories left by interrupted runs::
+
+    python -m app.cli cache gc --max-mb 2048 --delete-orphans --dry-run
+
+Progress is written to ``stdout`` as JSON lines (one object per event) so it
+can be piped into log collectors. The process exit code is 0 when every
+project completed, 1 when at least one project failed or was cancelled, and
+2 for usage errors (for example when no project matched the selection).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from app.app_paths import get_app_data_dir
+from app.logger import logger
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+# File suffixes picked up from an ad-hoc project directory's procedures folder.
+PROCEDURE_SUFFIXES = (".txt", ".md", ".pdf", ".docx", ".xlsx", ".xlsm")  # see app.pipeline.extractors
+
+
+# ----------------------------------------------------------------------------
+# Project discovery
+# ----------------------------------------------------------------------------
+def load_projects_file(projects_file: Path) -> List[Dict[str, Any]]:
+    """Reads ``projects.json`` and returns the raw project dictionaries."""
+    if not projects_file.exists():
+        return []
+    try:
+        data = json.loads(projects_file.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, OSError) as e:
+        logger.error(f"Error reading projects file {projects_file}: {e}")
+        return []
+    if not isinstance(data, list):
+        return []
+    return [d for d in data if isinstance(d, dict) and d.get("name")]
+
+
+def project_dict_from_directory(directory: Path) -> Optional[Dict[str, Any]]:
+    """
+    Builds a project dictionary (same shape as a ``projects.json`` entry) from an
+    ad-hoc directory laid out like the bundled samples::
+
+        <dir>/external_regulations/<any>.json
+        <dir>/procedures/<files>.txt|.md|.pdf|.docx|.xlsx
+
+    A flat directory holding one ``.json`` file and the procedure files directly
+    is accepted as well. ``run.json`` is written into the directory itself.
+    """
+    directory = directory.resolve()
+    if not directory.is_dir():
+        logger.error(f"Project directory not found: {directory}")
+        return None
+
+    ext_reg_dir = directory / "external_regulations"
+    json_candidates = sorted(ext_reg_dir.glob("*.json")) if ext_reg_dir.is_dir() else []
+    if not json_candidates:
+        json_candidates = sorted(p for p in directory.glob("*.json") if p.name != "run.json")
+    if not json_candidates:
+        logger.error(f"No external regulations JSON found in {directory}")
+        return None
+
+    proc_dir = directory / "procedures"
+    search_dir = proc_dir if proc_dir.is_dir() else directory
+    procedure_paths = sorted(
+        p for p in search_dir.iterdir()
+        if p.is_file() and p.suffix.lower() in PROCEDURE_SUFFIXES
+    )
+
+    return {
+        "name": directory.name,
+        "external_regulations_json_path": str(json_candidates[0]),
+        "procedure_doc_paths": [str(p) for p in procedure_paths],
+        "run_json_path": str(directory / "run.json"),
+    }
+
+
+def select_projects(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Resolves the command-line selection into a list of project dictionaries."""
+    selected: List[Dict[str, Any]] = []
+
+    if args.all or args.project:
+        stored = load_projects_file(Path(args.projects_file))
+        if args.all:
+            selected.extend(stored)
+        else:
+            by_name = {d["name"]: d for d in stored}
+            for name in args.project:
+                if name in by_name:
+                    selected.append(by_name[name])
+                else:
+                    logger.error(f"Project '{name}' not found in {args.projects_file}")
+
+    adhoc: List[str] = []
+    for directory in args.dir or []:
+        project_dict = project_dict_from_directory(Path(directory))
+        if project_dict:
+            selected.append(project_dict)
+            adhoc.append(project_dict["name"])
+    if adhoc:
+        from app.pipeline.cache_gc import register_cli_projects
+        # projects.json does not list them; without this `cache gc --delete-orphans` would drop their caches
+        register_cli_projects(adhoc)
+
+    return selected
+
+
+def build_pipeline_settings(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Creates the PipelineSettings for this run and returns it as a plain dict so it
+    can be shipped to worker processes.
+    """
+    from app.pipeline_settings import PipelineSettings
+    from app.settings import Settings
+
+    pipeline_settings = PipelineSettings.from_settings(Settings())
+    if args.api_key:
+        pipeline_settings.openai_api_key = args.api_key
+    elif not pipeline_settings.openai_api_key:
+        pipeline_settings.openai_api_key = os.environ.get("OPENAI_API_KEY", "")
+    if getattr(args, "base_url", None):
+        pipeline_settings.openai_base_url = args.base_url
+    return pipeline_settings.model_dump(mode="json")
+
+
+# ----------------------------------------------------------------------------
+# Execution
+# ----------------------------------------------------------------------------
+def _message_to_json(message: Any) -> Any:
+    """Converts a pipeline progress message (str or pydantic model) to JSON data."""
+    if hasattr(message, "model_dump"):
+        return message.model_dump(mode="json")
+    return str(message)
+
+
+def run_single_project(
+    project_dict: Dict[str, Any],
+    settings_dict: Dict[str, Any],
+    emit: Callable[[Dict[str, Any]], None],
+) -> Dict[str, Any]:
+    """
+    Runs the pipeline for one project in the current process.
+
+    Returns a result dictionary with the project name, status
+    ("completed", "failed" or "error"), elapsed seconds and token usage.
+    """
+    from app.models.project_data import ProjectData
+    from app.pipeline.llm_utils import get_token_usage, reset_token_usage
+    from app.pipeline.pipeline_v1_1 import run_project_pipeline_v1_1
+    from app.pipeline_settings import PipelineSettings
+
+    name = project_dict.get("name", "")
+    reset_token_usage()
+    started = time.perf_counter()
+    emit({"event": "project_started", "project": name})
+
+    def progress_callback(progress: float, message: Any) -> None:
+        emit({
+            "event": "progress",
+            "project": name,
+            "progress": round(float(progress), 4),
+            "message": _message_to_json(message),
+        })
+
+    status = "failed"
+    error: Optional[str] = None
+    try:
+        project = ProjectData.from_dict(project_dict)
+        settings = PipelineSettings.model_validate(settings_dict)
+        completed = run_project_pipeline_v1_1(project, settings, progress_callback, lambda: False)
+        status = "completed" if completed else "failed"
+    except Exception as e:
+        status = "error"
+        error = f"{type(e).__name__}: {e}"
+        logger.error(f"Pipeline crashed for project {name}: {e}\n{traceback.format_exc()}")
+
+    result = {
+        "project": name,
+        "status": status,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "token_usage": get_token_usage(),
+        "run_json_path": project_dict.get("run_json_path"),
+    }
+    if error:
+        result["error"] = error
+    emit({"event": "project_finished", **result})
+    return result
+
+
+def _worker_entry(project_dict: Dict[str, Any], settings_dict: Dict[str, Any], event_queue: Any) -> Dict[str, Any]:
+    """Process-pool entry point; forwards events to the parent through a queue."""
+    return run_single_project(project_dict, settings_dict, event_queue.put)
+
+
+class _JsonLinesWriter:
+    """Serializes events from any thread into one JSON object per line."""
+
+    def __init__(self, stream: TextIO, enabled: bool = True):
+        self._stream = stream
+        self._enabled = enabled
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        if not self._enabled:
+            return
+        event.setdefault("ts", round(time.time(), 3))
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+
+def run_projects(
+    projects: List[Dict[str, Any]],
+    settings_dict: Dict[str, Any],
+    jobs: int,
+    emit: Callable[[Dict[str, Any]], None],
+) -> List[Dict[str, Any]]:
+    """
+    Runs every project, in-process when ``jobs`` is 1 and across a process pool
+    otherwise. Results are returned in the order of ``projects``.
+    """
+    if jobs <= 1 or len(projects) <= 1:
+        return [run_single_project(p, settings_dict, emit) for p in projects]
+
+    results: Dict[int, Dict[str, Any]] = {}
+    with multiprocessing.Manager() as manager:
+        event_queue = manager.Queue()
+
+        def _drain() -> None:
+            while True:
+                event = event_queue.get()
+                if event is None:
+                    break
+                emit(event)
+
+        drain_thread = threading.Thread(target=_drain, name="cli-event-drain", daemon=True)
+        drain_thread.start()
+        try:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(projects))) as pool:
+                futures = {
+                    pool.submit(_worker_entry, p, settings_dict, event_queue): idx
+                    for idx, p in enumerate(projects)
+                }
+                for future in as_completed(futures):
+                    idx = futures[future]
+                    try:
+                        results[idx] = future.result()
+                    except Exception as e:  # Worker process died (e.g. out of memory)
+                        name = projects[idx].get("name", "")
+                        results[idx] = {
+                            "project": name,
+                            "status": "error",
+                            "elapsed_seconds": None,
+                            "token_usage": {},
+                            "run_json_path": projects[idx].get("run_json_path"),
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+                        event_queue.put({"event": "project_finished", **results[idx]})
+        finally:
+            event_queue.put(None)
+            drain_thread.join()
+
+    return [results[i] for i in range(len(projects))]
+
+
+def summarize(results: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    """Aggregates per-project results into the run summary."""
+    totals: Dict[str, int] = {}
+    for r in results:
+        for key, value in (r.get("token_usage") or {}).items():
+            totals[key] = totals.get(key, 0) + value
+    return {
+        "event": "summary",
+        "projects": len(results),
+        "completed": sum(1 for r in results if r["status"] == "completed"),
+        "failed": sum(1 for r in results if r["status"] != "completed"),
+        "wall_seconds": round(wall_seconds, 3),
+        "project_seconds": round(sum(r.get("elapsed_seconds") or 0 for r in results), 3),
+        "token_usage": totals,
+        "results": results,
+    }
+
+
+def _log_summary_table(summary: Dict[str, Any]) -> None:
+    lines = [f"{'Project':<40} {'Status':<10} {'Seconds':>9} {'Chat tok':>10} {'Embed tok':>10}"]
+    for r in summary["results"]:
+        usage = r.get("token_usage") or {}
+        seconds = r.get("elapsed_seconds")
+        lines.append(
+            f"{r['project'][:40]:<40} {r['status']:<10} "
+            f"{(f'{seconds:.1f}' if seconds is not None else '-'):>9} "
+            f"{usage.get('chat_total_tokens', 0):>10} {usage.get('embedding_total_tokens', 0):>10}"
+        )
+    lines.append(
+        f"{summary['completed']}/{summary['projects']} completed in {summary['wall_seconds']:.1f}s"
+    )
+    logger.info("Batch run summary:\n" + "\n".join(lines))
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    projects = select_projects(args)
+    if not projects:
+        logger.error("No projects selected. Use --all, --project NAME or --dir PATH.")
+        return EXIT_USAGE
+
+    emit = _JsonLinesWriter(sys.stdout, enabled=not args.quiet)
+    settings_dict = build_pipeline_settings(args)
+
+    started = time.perf_counter()
+    emit({"event": "batch_started", "projects": [p["name"] for p in projects], "jobs": args.jobs})
+    results = run_projects(projects, settings_dict, args.jobs, emit)
+    summary = summarize(results, time.perf_counter() - started)
+    emit(dict(summary))
+    _log_summary_table(summary)
+
+    if args.summary_json:
+        Path(args.summary_json).write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    return EXIT_OK if summary["failed"] == 0 else EXIT_FAILED
+
+
+def cache_dirs(names: Optional[List[str]] = None) -> List[Path]:
+    """Per-project cache directories (see app.pipeline.cache.CacheService), all of them when ``names`` is empty."""
+    root = get_app_data_dir() / "cache" / "embeddings"
+    if names:
+        return [root / name for name in names]
+    return sorted(p for p in root.iterdir() if p.is_dir()) if root.exists() else []
+
+
+def cmd_cache_migrate(args: argparse.Namespace) -> int:
+    from app.pipeline.cache_backends import open_backend, migrate_cache
+    from app.pipeline_settings import CACHE_BACKEND_FILE, CACHE_BACKEND_SQLITE
+
+    source_name = CACHE_BACKEND_FILE if args.to == CACHE_BACKEND_SQLITE else CACHE_BACKEND_SQLITE
+    emit = _JsonLinesWriter(sys.stdout, enabled=not args.quiet)
+    directories = cache_dirs(args.project)
+    if not directories:
+        logger.error("No project caches found.")
+        return EXIT_USAGE
+
+    failed = 0
+    for directory in directories:
+        if not directory.is_dir():
+            logger.error(f"Cache directory {directory} does not exist")
+            failed += 1
+            continue
+        started = time.perf_counter()
+        source = open_backend(source_name, directory)
+        target = open_backend(args.to, directory)
+        try:
+            copied = migrate_cache(source, target, delete_source=not args.keep_source)
+        except Exception as e:
+            logger.error(f"Migrating cache {directory} failed: {e}")
+            failed += 1
+            continue
+        finally:
+            source.close()
+            target.close()
+        emit({"event": "cache_migrated", "cache_dir": str(directory), "from": source_name, "to": args.to,
+              "entries": copied, "seconds": round(time.perf_counter() - started, 3)})
+    return EXIT_OK if failed == 0 else EXIT_FAILED
+
+
+def cmd_cache_gc(args: argparse.Namespace) -> int:
+    from app.pipeline.cache_gc import cache_usage, enforce_cache_limit
+
+    if args.max_mb is None:
+        from app.pipeline_settings import PipelineSettings
+        from app.settings import Settings
+        args.max_mb = PipelineSettings.from_settings(Settings()).cache_max_mb
+    emit = _JsonLinesWriter(sys.stdout, enabled=not args.quiet)
+    started = time.perf_counter()
+    try:
+        report = enforce_cache_limit(args.max_mb * 1024 * 1024, Path(args.projects_file),
+                                     delete_orphans=args.delete_orphans, dry_run=args.dry_run)
+    except Exception as e:
+        logger.error(f"Cache garbage collection failed: {e}")
+        return EXIT_FAILED
+
+    # The report has no usage when the caches were under the cap; nothing changed, so measure it now
+    for item in report.usage or cache_usage(Path(args.projects_file)):
+        emit({"event": "cache_usage", **item.model_dump()})
+    for item in report.removed_orphans:
+        emit({"event": "cache_orphan_removed", "namespace": item.namespace, "name": item.name,
+              "path": item.path, "bytes": item.bytes, "dry_run": args.dry_run})
+    emit({"event": "cache_gc", "max_bytes": args.max_mb * 1024 * 1024, "evicted_entries": report.evicted_entries,
+          "evicted_bytes": report.evicted_bytes, "orphans_removed": len(report.removed_orphans),
+          "total_bytes": report.total_bytes, "dry_run": args.dry_run,
+          "seconds": round(time.perf_counter() - started, 3)})
+    return EXIT_OK
+
+
+# ----------------------------------------------------------------------------
+# Argument parsing
+# ----------------------------------------------------------------------------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="regulens-ai", description="Regulens-AI headless runner")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the compliance pipeline for one or more projects")
+    run_parser.add_argument("--all", action="store_true", help="Run every project in projects.json")
+    run_parser.add_argument("--project", action="append", metavar="NAME", help="Run a project from projects.json by name (repeatable)")
+    run_parser.add_argument("--dir", action="append", metavar="PATH", help="Run an ad-hoc project directory (repeatable)")
+    run_parser.add_argument("--projects-file", default=str(get_app_data_dir() / "projects.json"), help="Path to projects.json")
+    run_parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of projects to run in parallel (process pool)")
+    run_parser.add_argument("--api-key", default=None, help="OpenAI API key (defaults to settings, then OPENAI_API_KEY)")
+    run_parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local stand-in server (defaults to settings)")
+    run_parser.add_argument("--summary-json", default=None, metavar="PATH", help="Also write the run summary to this file")
+    run_parser.add_argument("--quiet", "-q", action="store_true", help="Do not write JSON-lines progress to stdout")
+    run_parser.set_defaults(func=cmd_run)
+
+    cache_parser = subparsers.add_parser("cache", help="Maintain the per-project embedding caches")
+    cache_subparsers = cache_parser.add_subparsers(dest="cache_command", required=True)
+    migrate_parser = cache_subparsers.add_parser("migrate", help="Move cache entries between storage backends")
+    migrate_parser.add_argument("--to", choices=("sqlite", "file"), default="sqlite", help="Target backend (the other one is the source)")
+    migrate_parser.add_argument("--project", action="append", metavar="NAME", help="Only this project's cache (repeatable; default: all)")
+    migrate_parser.add_argument("--keep-source", action="store_true", help="Keep the migrated entries in the source backend")
+    migrate_parser.add_argument("--quiet", "-q", action="store_true", help="Do not write JSON-lines progress to stdout")
+    migrate_parser.set_defaults(func=cmd_cache_migrate)
+    gc_parser = cache_subparsers.add_parser("gc", help="Report cache sizes and evict least recently used entries beyond the size cap")
+    gc_parser.add_argument("--max-mb", type=int, default=None, help="Size cap in MB (default: pipeline.cache_max_mb; 0 = no limit)")
+    gc_parser.add_argument("--delete-orphans", action="store_true", help="Remove caches of projects that are neither in projects.json nor were run with 'run --dir', "
+                                                                          "and index directories of interrupted runs")
+    gc_parser.add_argument("--projects-file", default=str(get_app_data_dir() / "projects.json"), help="Path to projects.json")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    gc_parser.add_argument("--quiet", "-q", action="store_true", help="Do not write JSON-lines progress to stdout")
+    gc_parser.set_defaults(func=cmd_cache_gc)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
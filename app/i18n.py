@@ -183,6 +183,9 @@ MESSAGES = {
         "select_procedure_docs_dialog_title": "Select Procedure Documents",
         "text_files_filter": "Text Files (*.txt)",
         "markdown_files_filter": "Markdown Files (*.md)",
+        "pdf_files_filter": "PDF Files (*.pdf)",
+        "word_files_filter": "Word Documents (*.docx)",
+        "excel_files_filter": "Excel Workbooks (*.xlsx *.xlsm)",
         "all_files_filter": "All Files (*.*)",
         "error_reading_file_preview": "Error reading file: {error}",
         "error_loading_json_preview": "Error loading JSON: {error}",
@@ -534,6 +537,9 @@ MESSAGES = {
         "select_procedure_docs_dialog_title": "選擇程序文件",
         "text_files_filter": "文字檔案 (*.txt)",
         "markdown_files_filter": "Markdown 檔案 (*.md)",
+        "pdf_files_filter": "PDF 檔案 (*.pdf)",
+        "word_files_filter": "Word 文件 (*.docx)",
+        "excel_files_filter": "Excel 活頁簿 (*.xlsx *.xlsm)",
         "all_files_filter": "所有檔案 (*.*)",
         "error_reading_file_preview": "讀取檔案時發生錯誤：{error}",
         "error_loading_json_preview": "載入 JSON 時發生錯誤：{error}",
@@ -34,9 +34,13 @@ class MatchSet(BaseModel):
     matched_embed_set_id: str  # EmbedSet ID of the matched chunk
     matched_chunk_text: str    # Text of the matched chunk
     
-    score: float               # Similarity score (e.g., 1 / (1 + L2_distance))
-    # Optional: raw L2 distance if needed for fine-tuning thresholds later
+    score: float               # Similarity score: cosine similarity for cosine indexes, else 1 / (1 + L2_distance)
+    # Optional: raw FAISS value (L2 distance, or inner product for cosine indexes) for fine-tuning thresholds later
     raw_faiss_distance: Optional[float] = None
+    # Raw BM25 score when the match came from (or was fused with) keyword retrieval
+    lexical_score: Optional[float] = None
+    # Retrieval score before reranking; ``score`` then holds the reranker's score (see app.pipeline.rerank)
+    retrieval_score: Optional[float] = None
 
     # To identify the relationship (e.g. External Regulation -> Procedure)
     query_doc_type: str 
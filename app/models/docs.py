@@ -38,6 +38,8 @@ class IndexMeta(BaseModel):
     num_vectors: int       # Number of vectors in the index
     vector_dimension: int  # Dimension of the vectors (e.g., 1536 for text-embedding-ada-002, 3072 for text-embedding-3-large)
     model_name: str        # Name of the embedding model used to create these vectors (e.g., "text-embedding-3-large")
+    metric: str = "l2"     # "l2" (score 1 / (1 + distance)) or "cosine" (inner product over normalized vectors)
+    lexical_index_path: Optional[Path] = None  # BM25 index (.npz) over the same ids, when built (see app.pipeline.lexical)
 
 
 class AuditTask(BaseModel): # Define AuditTask first as ExternalRegulationClause references it
@@ -57,3 +59,7 @@ class ExternalRegulationClause(BaseModel):
     metadata: Dict[str, Any] = Field(default_factory=dict)  # Additional metadata, e.g., source, section
     need_procedure: Optional[bool] = None  # To be determined by LLM in Step 1
     tasks: List[AuditTask] = Field(default_factory=list)  # To be populated by LLM in Step 2
+    # Ids of the clause's deduplicated evidence, in the order chosen for the judge (see app.pipeline.evidence).
+    # The excerpts live once per project in ProjectRunData.evidence; tasks' top_k entries reference
+    # them as {"evidence_id", "score"}. Older runs stored full excerpts in top_k.
+    evidence: List[str] = Field(default_factory=list)
@@ -1,35 +1,103 @@
 from __future__ import annotations
 
+import hashlib
 from typing import List, Dict, Any, Optional
-from app.models.docs import ExternalRegulationClause
+from app.models.docs import AuditTask, ExternalRegulationClause
+
+EVIDENCE_ID_PREFIX = "ev_"
+# Fields of an evidence table entry; top_k entries of older runs carried them inline
+EVIDENCE_FIELDS = ("embed_set_id", "excerpt", "source_txt", "page_no", "section")
+
+
+def evidence_id_for(embed_set_id: str) -> str:
+    """Short, stable evidence id for a procedure chunk."""
+    return EVIDENCE_ID_PREFIX + hashlib.sha1(embed_set_id.encode("utf-8")).hexdigest()[:12]
+
+
+def _migrate_clause_evidence(clause_data: Dict[str, Any], evidence: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Moves excerpts stored inside a clause into the project evidence table and
+    returns the clause data in the current layout. Older run.json files kept
+    a full excerpt in every top_k entry, or a per-clause evidence dict.
+    """
+    clause_evidence = clause_data.get("evidence")
+    if isinstance(clause_evidence, dict):
+        for evidence_id, entry in clause_evidence.items():
+            evidence.setdefault(evidence_id, entry)
+        clause_evidence = list(clause_evidence)
+    clause_evidence = list(clause_evidence or [])
+
+    tasks = []
+    for task_data in clause_data.get("tasks") or []:
+        top_k = task_data.get("top_k") or []
+        if any("evidence_id" not in ev and "excerpt" in ev for ev in top_k):
+            refs = []
+            for ev in top_k:
+                if "evidence_id" in ev or "excerpt" not in ev:
+                    refs.append(ev)
+                    continue
+                # Legacy entries have no embed-set id; their source and text identify them instead
+                key = ev.get("embed_set_id") or f"{ev.get('source_txt')}\n{ev.get('excerpt')}"
+                evidence_id = evidence_id_for(key)
+                evidence.setdefault(evidence_id, {field: ev.get(field) for field in EVIDENCE_FIELDS if field in ev})
+                if evidence_id not in clause_evidence:
+                    clause_evidence.append(evidence_id)
+                ref = {k: v for k, v in ev.items() if k not in EVIDENCE_FIELDS}
+                refs.append({"evidence_id": evidence_id, **ref})
+            task_data = {**task_data, "top_k": refs}
+        tasks.append(task_data)
+    return {**clause_data, "tasks": tasks, "evidence": clause_evidence}
+
 
 class ProjectRunData:
-    def __init__(self, 
-                 project_name: str, 
+    def __init__(self,
+                 project_name: str,
                  external_regulation_clauses: List[ExternalRegulationClause],
                  external_regulations_file_timestamp: Optional[float] = None,
-                 procedure_files_timestamps: Optional[Dict[str, float]] = None
+                 procedure_files_timestamps: Optional[Dict[str, float]] = None,
+                 evidence: Optional[Dict[str, Dict[str, Any]]] = None
                 ):
         self.project_name = project_name
         self.external_regulation_clauses: List[ExternalRegulationClause] = external_regulation_clauses
         self.external_regulations_file_timestamp: Optional[float] = external_regulations_file_timestamp
         self.procedure_files_timestamps: Optional[Dict[str, float]] = procedure_files_timestamps if procedure_files_timestamps is not None else {}
+        # Evidence table: each retrieved procedure chunk (excerpt, source, page, section) stored once
+        # per project, keyed by evidence_id_for(embed_set_id). Tasks' top_k entries reference it.
+        self.evidence: Dict[str, Dict[str, Any]] = evidence if evidence is not None else {}
+
+    def task_evidence(self, task: AuditTask) -> List[Dict[str, Any]]:
+        """The task's top_k with references resolved against the evidence table; legacy full entries pass through."""
+        return [{**self.evidence.get(ev.get("evidence_id"), {}), **ev} for ev in task.top_k or []]
+
+    def referenced_evidence_ids(self) -> set:
+        """Evidence ids used by any clause or task; the rest of the table is not saved."""
+        referenced = set()
+        for clause in self.external_regulation_clauses:
+            referenced.update(clause.evidence)
+            for task in clause.tasks:
+                referenced.update(ev["evidence_id"] for ev in task.top_k or [] if "evidence_id" in ev)
+        return referenced
 
     def to_dict(self) -> Dict[str, Any]:
+        referenced = self.referenced_evidence_ids()
         return {
             "project_name": self.project_name,
             "external_regulation_clauses": [cc.model_dump() for cc in self.external_regulation_clauses],
             "external_regulations_file_timestamp": self.external_regulations_file_timestamp,
-            "procedure_files_timestamps": self.procedure_files_timestamps
+            "procedure_files_timestamps": self.procedure_files_timestamps,
+            "evidence": {eid: ev for eid, ev in self.evidence.items() if eid in referenced}
         }
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> ProjectRunData:
+        evidence = dict(data.get("evidence") or {})
         clauses_data = data.get("external_regulation_clauses", [])
-        external_regulation_clauses = [ExternalRegulationClause(**cc_data) for cc_data in clauses_data]
+        external_regulation_clauses = [ExternalRegulationClause(**_migrate_clause_evidence(cc_data, evidence))
+                                       for cc_data in clauses_data]
         return cls(
-            project_name=data.get("project_name", "Unknown Project"), 
+            project_name=data.get("project_name", "Unknown Project"),
             external_regulation_clauses=external_regulation_clauses,
             external_regulations_file_timestamp=data.get("external_regulations_file_timestamp"),
-            procedure_files_timestamps=data.get("procedure_files_timestamps")
-        )
\ No newline at end of file
+            procedure_files_timestamps=data.get("procedure_files_timestamps"),
+            evidence=evidence
+        )
@@ -14,8 +14,9 @@ import faiss  # type: ignore
 from app.settings import Settings # Used by PipelineSettings.from_settings
 # PipelineSettings is now in its own file
 from ..pipeline_settings import PipelineSettings 
-# Import CompareProject directly since we need it for type hints
-from app.models.project import CompareProject
+# The plain project model keeps this package importable without PySide6;
+# the GUI's CompareProject is a subclass, so it is accepted as well.
+from app.models.project_data import ProjectData
 # Remove pydantic imports if no longer directly used here for model definition
 # from pydantic import BaseModel, Field 
 
@@ -31,11 +32,13 @@ if TYPE_CHECKING:
 from app.logger import logger
 
 # Pipeline Modules (These are fine as they are submodules)
-from .ingestion import ingest_documents 
-from .normalize import normalize_document # Still used by old pipeline logic if retained
-from .embed import generate_embeddings # Still used by old pipeline logic
-from .index import create_or_load_index # Still used by old pipeline logic
-from .retrieve import retrieve_similar_chunks # Still used by old pipeline logic
+from .ingestion import ingest_documents, iter_ingest_documents
+from .normalize import normalize_document, normalize_documents, iter_normalize_documents
+from .embed import generate_embeddings, iter_embedded_documents # generate_embeddings: still used by old pipeline logic
+from .index import create_or_load_index, IndexBuilder # create_or_load_index: still used by old pipeline logic
+from .retrieve import retrieve_similar_chunks, retrieve_chunks # retrieve_similar_chunks: still used by old pipeline logic
+from .lexical import BM25Index
+from .rerank import get_reranker, rerank_matches
 # from .judge_llm import assess_triplet_with_llm # Old assessment logic
 from .cache import CacheService # Still potentially useful
 
@@ -45,7 +48,7 @@ from .pipeline_v1_1 import run_project_pipeline_v1_1
 
 # Main Pipeline Orchestration Function
 def run_pipeline(
-    project: CompareProject,
+    project: ProjectData,
     # The 'settings' parameter here is the global Settings object, not PipelineSettings
     global_app_settings: Settings,
     progress_callback: Optional[Callable[[float, Any], None]] = None, # Message type changed to Any
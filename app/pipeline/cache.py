@@ -1,23 +1,115 @@
 import hashlib
-import gzip
+import io
 import json
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Type, TypeVar
+from typing import Any, Dict, Iterable, Optional, Tuple, Type, TypeVar
 import numpy as np
 from pydantic import BaseModel
 
 # Add this import
 from app.app_paths import get_app_data_dir
+from app.pipeline import cache_codecs
+from app.pipeline.cache_backends import CacheBackend, FileCacheBackend, open_backend
+from app.pipeline.tracing import incr, span
+from app.pipeline_settings import CACHE_BACKEND_SQLITE, CACHE_CODEC_GZIP
 
 # For generic type hinting of BaseModel subtypes
 T = TypeVar('T', bound=BaseModel)
 
+# Default budget of a CacheService's in-memory tier (PipelineSettings.cache_memory_mb)
+MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class MemoryLRU:
+    """
+    Byte-bounded, thread-safe LRU of decoded cache values (pydantic models and
+    NumPy arrays). The size of a model is its JSON length, the size of an
+    array its ``nbytes``. Values larger than the whole budget are not kept.
+    """
+
+    def __init__(self, max_bytes: int = MEMORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, kind: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get((key, kind))
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end((key, kind))
+                self.hits += 1
+        incr("cache_memory_hits" if entry is not None else "cache_memory_misses")
+        return entry[0] if entry is not None else None
+
+    def put(self, key: str, kind: str, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        evicted = 0
+        with self._lock:
+            previous = self._entries.pop((key, kind), None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[(key, kind)] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            incr("cache_memory_evictions", evicted)
+
+    def invalidate(self, key: str, kind: str) -> None:
+        with self._lock:
+            entry = self._entries.pop((key, kind), None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
 
 class CacheService:
-    def __init__(self, project_name: str): # Modified constructor
+    def __init__(self, project_name: str, backend: str = CACHE_BACKEND_SQLITE,
+                 memory_max_bytes: int = MEMORY_CACHE_MAX_BYTES, codec: str = CACHE_CODEC_GZIP): # Modified constructor
         # Modified to use project-specific cache directory within app_data_dir
         self.cache_dir = get_app_data_dir() / "cache" / "embeddings" / project_name
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Entries live in the backend (see app.pipeline.cache_backends); the SQLite
+        # database is a single file inside cache_dir.
+        self.backend: CacheBackend = open_backend(backend, self.cache_dir)
+        # Entries a previous version left as loose files are still read (and copied into
+        # the backend) until `python -m app.cli cache migrate` moves them over.
+        self._legacy: Optional[FileCacheBackend] = None
+        if not isinstance(self.backend, FileCacheBackend):
+            legacy = FileCacheBackend(self.cache_dir)
+            if legacy.has_entries():
+                self._legacy = legacy
+        # Values loaded during this run are kept decoded in memory, so loading the
+        # same key again skips the backend read, gzip and pydantic validation (0 = off).
+        # Callers must treat loaded models and arrays as read-only: they are shared.
+        self.memory: Optional[MemoryLRU] = MemoryLRU(memory_max_bytes) if memory_max_bytes > 0 else None
+        # Codec of new JSON entries; the header of each stored value names its own codec
+        # (see app.pipeline.cache_codecs). The kind stays "json.gz" whatever the codec.
+        self.codec = cache_codecs.resolve_codec(codec)
 
     @staticmethod
     def generate_key(*args: str) -> str:
@@ -27,79 +119,167 @@ class CacheService:
         s = "".join(args)
         return hashlib.sha256(s.encode('utf-8')).hexdigest()
 
+    def _get_many(self, keys: Iterable[str], kind: str) -> Dict[str, bytes]:
+        keys = list(keys)
+        found = self.backend.get_many(keys, kind)
+        if self._legacy is not None and len(found) < len(keys):
+            legacy_found = self._legacy.get_many([k for k in keys if k not in found], kind)
+            if legacy_found:
+                self.backend.put_many(legacy_found, kind)
+                found.update(legacy_found)
+        return found
+
+    def _get(self, key: str, kind: str) -> Optional[bytes]:
+        return self._get_many([key], kind).get(key)
+
+    def _encode_json(self, data: BaseModel) -> bytes:
+        # The pydantic-core serializer returns UTF-8 bytes directly; model_dump_json
+        # would build a str first and then need encoding
+        return cache_codecs.encode(data.__pydantic_serializer__.to_json(data), self.codec)
+
+    def _invalidate(self, key: str, kind: str) -> None:
+        if self.memory is not None:
+            self.memory.invalidate(key, kind)
+
     def save_json(self, key: str, data: BaseModel) -> None:
         """
         Serializes a Pydantic model to JSON, compresses it, and saves to cache.
         """
-        file_path = self.cache_dir / f"{key}.json.gz"
+        self._invalidate(key, "json.gz")
         try:
-            json_data = data.model_dump_json()
-            with gzip.open(file_path, 'wt', encoding='utf-8') as f:
-                f.write(json_data)
-            # print(f"Saved JSON data to {file_path}")
-        except IOError as e:
-            print(f"Error saving JSON data to {file_path}: {e}")
+            with span("cache_save_json", "cache") as save_span:
+                value = self._encode_json(data)
+                self.backend.put(key, "json.gz", value)
+                save_span.set(bytes=len(value))
         except Exception as e:
-            print(f"An unexpected error occurred while saving JSON {file_path}: {e}")
+            print(f"An unexpected error occurred while saving JSON {key}: {e}")
+
+    def save_json_many(self, items: Dict[str, BaseModel]) -> None:
+        """Saves several models in one backend write (one transaction with SQLite)."""
+        for key in items:
+            self._invalidate(key, "json.gz")
+        try:
+            with span("cache_save_json", "cache", entries=len(items)) as save_span:
+                values = {key: self._encode_json(data) for key, data in items.items()}
+                self.backend.put_many(values, "json.gz")
+                save_span.set(bytes=sum(map(len, values.values())))
+        except Exception as e:
+            print(f"An unexpected error occurred while saving {len(items)} JSON entries: {e}")
+
+    def _decode_json(self, key: str, value: bytes, model_type: Type[T]) -> Optional[T]:
+        try:
+            raw, _ = cache_codecs.decode(value)
+        except Exception as e:  # Corrupt data, or a codec that is not installed here
+            print(f"Error decompressing JSON data for {key}: {e}")
+            return None
+        try:
+            model = model_type.model_validate_json(raw)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON for {key}: {e}")
+            return None
+        except Exception as e:
+            print(f"An unexpected error occurred while loading JSON {key}: {e}")
+            return None
+        if self.memory is not None:
+            self.memory.put(key, "json.gz", model, len(raw))
+        return model
+
+    def _from_memory(self, key: str, kind: str, model_type: Optional[Type[T]] = None) -> Optional[Any]:
+        if self.memory is None:
+            return None
+        value = self.memory.get(key, kind)
+        # The same key read as another model type goes to the backend
+        if value is not None and model_type is not None and not isinstance(value, model_type):
+            return None
+        return value
 
     def load_json(self, key: str, model_type: Type[T]) -> Optional[T]:
         """
         Loads, decompresses, and deserializes JSON data from cache into a Pydantic model.
         """
-        file_path = self.cache_dir / f"{key}.json.gz"
-        if not file_path.exists():
-            # print(f"JSON cache file not found: {file_path}")
-            return None
+        cached = self._from_memory(key, "json.gz", model_type)
+        if cached is not None:
+            return cached
         try:
-            with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                json_data = f.read()
-            return model_type.model_validate_json(json_data)
-        except IOError as e:
-            print(f"Error loading JSON data from {file_path}: {e}")
+            value = self._get(key, "json.gz")
+        except Exception as e:
+            print(f"Error loading JSON data for {key}: {e}")
             return None
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON from {file_path}: {e}")
+        if value is None:
             return None
+        with span("cache_load_json", "cache", bytes=len(value)):
+            return self._decode_json(key, value, model_type)
+
+    def load_json_many(self, keys: Iterable[str], model_type: Type[T]) -> Dict[str, T]:
+        """Loads several models in one backend read; missing or unreadable keys are left out."""
+        loaded: Dict[str, T] = {}
+        missing = []
+        for key in keys:
+            cached = self._from_memory(key, "json.gz", model_type)
+            if cached is not None:
+                loaded[key] = cached
+            else:
+                missing.append(key)
+        if not missing:
+            return loaded
+        try:
+            values = self._get_many(missing, "json.gz")
         except Exception as e:
-            print(f"An unexpected error occurred while loading JSON {file_path}: {e}")
-            return None
+            print(f"Error loading JSON data: {e}")
+            return loaded
+        with span("cache_load_json", "cache", entries=len(values), bytes=sum(map(len, values.values()))):
+            for key, value in values.items():
+                model = self._decode_json(key, value, model_type)
+                if model is not None:
+                    loaded[key] = model
+        return loaded
 
     def save_numpy(self, key: str, array: np.ndarray) -> None:
         """
         Saves a NumPy array to cache.
         """
-        file_path = self.cache_dir / f"{key}.npy"
+        self._invalidate(key, "npy")
         try:
-            np.save(file_path, array)
-            # print(f"Saved NumPy array to {file_path}")
-        except IOError as e:
-            print(f"Error saving NumPy array to {file_path}: {e}")
+            buffer = io.BytesIO()
+            np.save(buffer, array)
+            self.backend.put(key, "npy", buffer.getvalue())
+            # print(f"Saved NumPy array to {key}")
         except Exception as e:
-            print(f"An unexpected error occurred while saving NumPy array {file_path}: {e}")
+            print(f"An unexpected error occurred while saving NumPy array {key}: {e}")
 
     def load_numpy(self, key: str) -> Optional[np.ndarray]:
         """
         Loads a NumPy array from cache.
         """
-        file_path = self.cache_dir / f"{key}.npy"
-        if not file_path.exists():
-            # print(f"NumPy cache file not found: {file_path}")
-            return None
+        cached = self._from_memory(key, "npy")
+        if cached is not None:
+            return cached
         try:
-            return np.load(file_path)
-        except IOError as e:
-            print(f"Error loading NumPy array from {file_path}: {e}")
-            return None
+            value = self._get(key, "npy")
+            if value is None:
+                # print(f"NumPy cache entry not found: {key}")
+                return None
+            array = np.load(io.BytesIO(value))
         except Exception as e:  # Catch other potential errors like unpickling errors
-            print(f"An unexpected error occurred while loading NumPy array {file_path}: {e}")
+            print(f"An unexpected error occurred while loading NumPy array {key}: {e}")
             return None
+        if self.memory is not None:
+            array.flags.writeable = False  # Shared with later loads of the same key
+            self.memory.put(key, "npy", array, array.nbytes)
+        return array
 
     def exists(self, key: str, extension: str) -> bool:
         """
-        Checks if a cache file with the given key and extension exists.
+        Checks if a cache entry with the given key and extension ("json.gz" or "npy") exists.
         """
-        file_path = self.cache_dir / f"{key}.{extension}"
-        return file_path.exists()
+        if self.backend.exists(key, extension):
+            return True
+        return self._legacy is not None and self._legacy.exists(key, extension)
+
+    def close(self) -> None:
+        if self.memory is not None:
+            self.memory.clear()
+        self.backend.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,349 @@
+"""
+Storage backends for ``CacheService``.
+
+A backend maps ``(key, kind)`` to bytes. ``kind`` is the value's format and
+doubles as the legacy file extension: ``"json.gz"`` for JSON models (compressed
+with the codec named in each value's header, see app.pipeline.cache_codecs;
+the name is historical), ``"npy"`` for NumPy arrays. ``CacheService`` does the serialization,
+so both backends store identical bytes and ``migrate_cache`` only copies them.
+
+- ``FileCacheBackend``: one ``<key>.<kind>`` file per entry in a flat
+  directory (the original layout). Every lookup costs a ``stat`` and an
+  ``open``. With chunk-level caching that means hundreds of thousands of small
+  files, which is slow on NTFS in particular.
+- ``SQLiteCacheBackend``: a single ``cache.sqlite3`` file per project. It uses
+  WAL mode, so readers never block the writer, and stores values as BLOBs.
+  ``get_many``/``put_many`` read or write a whole batch in one statement or
+  transaction.
+
+Both backends track when each entry was last read or written: in the
+``last_access`` column, or in the file's mtime. Reads update it at most once
+per ``ACCESS_RESOLUTION_SECONDS``. ``app.pipeline.cache_gc`` uses it to evict
+the least recently used entries once the caches exceed their size cap.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    from app.pipeline.tracing import span
+    from app.pipeline_settings import CACHE_BACKEND_FILE, CACHE_BACKEND_SQLITE, CACHE_BACKENDS
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from app.pipeline.tracing import span  # type: ignore
+    from app.pipeline_settings import CACHE_BACKEND_FILE, CACHE_BACKEND_SQLITE, CACHE_BACKENDS  # type: ignore
+
+# Value formats written by CacheService; anything else in a cache directory is not an entry
+CACHE_KINDS = ("json.gz", "npy")
+SQLITE_FILENAME = "cache.sqlite3"
+# Keys per "IN (...)" query, below SQLite's host parameter limit
+SQLITE_BATCH_KEYS = 500
+# A read refreshes an entry's last access time only if it is older than this,
+# so a busy cache is not rewritten on every lookup
+ACCESS_RESOLUTION_SECONDS = 3600
+
+
+class CacheEntryInfo(NamedTuple):
+    key: str
+    kind: str
+    size: int  # Bytes of the stored value
+    last_access: float  # Unix time of the last read or write
+
+
+class CacheBackend:
+    """Key/value store for cache entries; values are opaque bytes."""
+    name = ""
+
+    def get(self, key: str, kind: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put(self, key: str, kind: str, value: bytes) -> None:
+        raise NotImplementedError
+
+    def exists(self, key: str, kind: str) -> bool:
+        return self.get(key, kind) is not None
+
+    def get_many(self, keys: Iterable[str], kind: str) -> Dict[str, bytes]:
+        """Values of the ``keys`` that are present; missing keys are left out."""
+        found = {}
+        for key in keys:
+            value = self.get(key, kind)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def put_many(self, items: Dict[str, bytes], kind: str) -> None:
+        for key, value in items.items():
+            self.put(key, kind, value)
+
+    def delete(self, key: str, kind: str) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, entries: Iterable[Tuple[str, str]]) -> None:
+        for key, kind in entries:
+            self.delete(key, kind)
+
+    def entries(self) -> Iterator[Tuple[str, str]]:
+        """All ``(key, kind)`` pairs in the cache."""
+        raise NotImplementedError
+
+    def entry_infos(self) -> Iterator[CacheEntryInfo]:
+        """Size and last access time of every entry, for accounting and eviction."""
+        raise NotImplementedError
+
+    def stats(self) -> Tuple[int, int, float]:
+        """(entries, bytes of stored values, most recent last access)."""
+        entries = size = 0
+        newest = 0.0
+        for info in self.entry_infos():
+            entries += 1
+            size += info.size
+            newest = max(newest, info.last_access)
+        return entries, size, newest
+
+    def compact(self) -> None:
+        """Returns the space of deleted entries to the file system."""
+
+    def close(self) -> None:
+        pass
+
+
+class FileCacheBackend(CacheBackend):
+    name = CACHE_BACKEND_FILE
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str, kind: str) -> Path:
+        return self.cache_dir / f"{key}.{kind}"
+
+    def get(self, key: str, kind: str) -> Optional[bytes]:
+        path = self.path_for(key, kind)
+        try:
+            value = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # The mtime doubles as the last access time (atime is often disabled)
+        try:
+            now = time.time()
+            if path.stat().st_mtime < now - ACCESS_RESOLUTION_SECONDS:
+                os.utime(path, (now, now))
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, kind: str, value: bytes) -> None:
+        self.path_for(key, kind).write_bytes(value)
+
+    def exists(self, key: str, kind: str) -> bool:
+        return self.path_for(key, kind).exists()
+
+    def delete(self, key: str, kind: str) -> None:
+        try:
+            self.path_for(key, kind).unlink()
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> Iterator[Tuple[str, str]]:
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                key, _, kind = entry.name.partition(".")
+                if kind in CACHE_KINDS and entry.is_file():
+                    yield key, kind
+
+    def entry_infos(self) -> Iterator[CacheEntryInfo]:
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                key, _, kind = entry.name.partition(".")
+                if kind in CACHE_KINDS and entry.is_file():
+                    st = entry.stat()
+                    yield CacheEntryInfo(key, kind, st.st_size, st.st_mtime)
+
+    def has_entries(self) -> bool:
+        """Whether the directory holds at least one entry; stops at the first one."""
+        return next(self.entries(), None) is not None
+
+
+class SQLiteCacheBackend(CacheBackend):
+    name = CACHE_BACKEND_SQLITE
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per backend, shared by the pipeline's threads under a lock
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30.0, check_same_thread=False,
+                                     isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            # Lets compact() hand freed pages back; only takes effect on a new, empty database
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only syncs at checkpoints; a crash may lose the last
+            # writes but never corrupts the database, which is fine for a cache
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT NOT NULL, kind TEXT NOT NULL, value BLOB NOT NULL,"
+                " last_access INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (key, kind)) WITHOUT ROWID"
+            )
+            # Databases created before access tracking: their entries count as least recently used
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+            if "last_access" not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN last_access INTEGER NOT NULL DEFAULT 0")
+
+    def _touch(self, keys: List[str], kind: str) -> None:
+        """Refreshes last_access of ``keys`` that were not read recently; caller holds the lock."""
+        now = int(time.time())
+        placeholders = ",".join("?" * len(keys))
+        self._conn.execute(
+            f"UPDATE entries SET last_access = ? WHERE kind = ? AND last_access < ? AND key IN ({placeholders})",
+            (now, kind, now - ACCESS_RESOLUTION_SECONDS, *keys))
+
+    def get(self, key: str, kind: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ? AND kind = ?", (key, kind)).fetchone()
+            if row is not None:
+                self._touch([key], kind)
+        return bytes(row[0]) if row is not None else None
+
+    def exists(self, key: str, kind: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM entries WHERE key = ? AND kind = ?",
+                                      (key, kind)).fetchone() is not None
+
+    def put(self, key: str, kind: str, value: bytes) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO entries (key, kind, value, last_access) VALUES (?, ?, ?, ?)",
+                               (key, kind, sqlite3.Binary(value), int(time.time())))
+
+    def get_many(self, keys: Iterable[str], kind: str) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, bytes] = {}
+        with span("cache_get_many", "cache", keys=len(keys)) as get_span:
+            for start in range(0, len(keys), SQLITE_BATCH_KEYS):
+                batch = keys[start:start + SQLITE_BATCH_KEYS]
+                placeholders = ",".join("?" * len(batch))
+                with self._lock:
+                    rows = self._conn.execute(
+                        f"SELECT key, value FROM entries WHERE kind = ? AND key IN ({placeholders})",
+                        (kind, *batch)).fetchall()
+                    if rows:
+                        self._touch([key for key, _ in rows], kind)
+                found.update((key, bytes(value)) for key, value in rows)
+            get_span.set(hits=len(found))
+        return found
+
+    def put_many(self, items: Dict[str, bytes], kind: str) -> None:
+        if not items:
+            return
+        with span("cache_put_many", "cache", keys=len(items)), self._lock:
+            # One transaction for the whole batch
+            self._conn.execute("BEGIN")
+            try:
+                now = int(time.time())
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, kind, value, last_access) VALUES (?, ?, ?, ?)",
+                    ((key, kind, sqlite3.Binary(value), now) for key, value in items.items()))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def delete(self, key: str, kind: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ? AND kind = ?", (key, kind))
+
+    def delete_many(self, entries: Iterable[Tuple[str, str]]) -> None:
+        entries = list(entries)
+        if not entries:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM entries WHERE key = ? AND kind = ?", entries)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def entries(self) -> Iterator[Tuple[str, str]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, kind FROM entries").fetchall()
+        return iter(rows)
+
+    def entry_infos(self) -> Iterator[CacheEntryInfo]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, kind, length(value), last_access FROM entries").fetchall()
+        return (CacheEntryInfo(key, kind, size, float(last_access)) for key, kind, size, last_access in rows)
+
+    def stats(self) -> Tuple[int, int, float]:
+        with self._lock:
+            count, size, newest = self._conn.execute(
+                "SELECT count(*), coalesce(sum(length(value)), 0), coalesce(max(last_access), 0) FROM entries").fetchone()
+        return int(count), int(size), float(newest)
+
+    def compact(self) -> None:
+        with span("cache_compact", "cache"), self._lock:
+            if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:  # INCREMENTAL
+                # execute() steps the pragma once, which frees a single page; executescript runs it to the end
+                self._conn.executescript("PRAGMA incremental_vacuum;")
+            else:  # Database created before auto_vacuum was set; a full VACUUM also switches it over
+                self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_backend(name: str, cache_dir: Path) -> CacheBackend:
+    """Backend ``name`` (one of CACHE_BACKENDS) for the cache directory ``cache_dir``."""
+    if name == CACHE_BACKEND_FILE:
+        return FileCacheBackend(cache_dir)
+    if name == CACHE_BACKEND_SQLITE:
+        return SQLiteCacheBackend(Path(cache_dir) / SQLITE_FILENAME)
+    raise ValueError(f"Unknown cache backend '{name}'; expected one of {', '.join(CACHE_BACKENDS)}")
+
+
+def migrate_cache(source: CacheBackend, target: CacheBackend, delete_source: bool = False,
+                  batch_size: int = SQLITE_BATCH_KEYS) -> int:
+    """
+    Copies every entry of ``source`` into ``target`` in batches (existing
+    entries are overwritten) and returns the number copied. With
+    ``delete_source``, each batch is removed from ``source`` once written.
+    """
+    copied = 0
+    with span("cache_migrate", "cache", source=source.name, target=target.name) as migrate_span:
+        by_kind: Dict[str, List[str]] = {}
+        for key, kind in source.entries():
+            by_kind.setdefault(kind, []).append(key)
+        for kind, keys in by_kind.items():
+            for start in range(0, len(keys), batch_size):
+                values = source.get_many(keys[start:start + batch_size], kind)
+                target.put_many(values, kind)
+                copied += len(values)
+                if delete_source:
+                    for key in values:
+                        source.delete(key, kind)
+        migrate_span.set(entries=copied)
+    return copied
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = FileCacheBackend(Path(tmp))
+        files.put_many({f"k{i}": f"value {i}".encode() for i in range(3)}, "npy")
+        db = open_backend(CACHE_BACKEND_SQLITE, Path(tmp))
+        print("migrated:", migrate_cache(files, db, delete_source=True), "entries")
+        print(db.get_many(["k0", "k2", "missing"], "npy"), "left in files:", list(files.entries()))
+        db.close()
@@ -0,0 +1,135 @@
+"""
+Compression codecs for the JSON values ``CacheService`` stores.
+
+Every value written now starts with a 4-byte header: ``CODEC_MAGIC``
+followed by one codec id byte. Readers pick the decoder from the header,
+so entries written with different codecs can share a cache, and changing
+``PipelineSettings.cache_codec`` never invalidates anything. Values without
+the header come from earlier versions and are plain gzip (they start with
+the gzip magic ``1f 8b``). They are still read.
+
+Codecs (``PipelineSettings.cache_codec``):
+
+- ``"none"``: the JSON bytes as they are. Fastest, and the largest on disk.
+- ``"gzip"`` (default): gzip at level 1. It is several times faster to
+  write than the old default level 9 and only slightly larger.
+- ``"zstd"``: Zstandard level 3. It needs the optional ``zstandard`` package.
+- ``"lz4"``: LZ4 frames. It needs the optional ``lz4`` package.
+
+An optional codec that is not installed falls back to gzip when writing.
+Reading such an entry raises, so ``CacheService`` treats it as a miss.
+"""
+
+import gzip
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+try:
+    from app.pipeline_settings import CACHE_CODEC_GZIP, CACHE_CODEC_LZ4, CACHE_CODEC_NONE, CACHE_CODEC_ZSTD
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from app.pipeline_settings import (CACHE_CODEC_GZIP, CACHE_CODEC_LZ4, CACHE_CODEC_NONE,  # type: ignore
+                                       CACHE_CODEC_ZSTD)
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # Optional
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame  # type: ignore
+except ImportError:  # Optional
+    lz4_frame = None
+
+# "RL" + version; gzip data starts with 1f 8b, so the two never collide
+CODEC_MAGIC = b"RL\x01"
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+
+# Codec name -> id byte in the header. Ids are stored on disk: never reuse one
+CODEC_IDS: Dict[str, int] = {CACHE_CODEC_NONE: 0, CACHE_CODEC_GZIP: 1, CACHE_CODEC_ZSTD: 2, CACHE_CODEC_LZ4: 3}
+_CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    # Frames written by compress() record their size, so this is a single allocation
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# zlib.compress with wbits=31 writes the gzip container without gzip.compress's extra copy
+_COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    CACHE_CODEC_NONE: bytes,
+    CACHE_CODEC_GZIP: lambda data: zlib.compress(data, GZIP_LEVEL, wbits=31),
+    CACHE_CODEC_ZSTD: _zstd_compress,
+    CACHE_CODEC_LZ4: lambda data: lz4_frame.compress(data),
+}
+_DECOMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    CACHE_CODEC_NONE: bytes,
+    CACHE_CODEC_GZIP: gzip.decompress,
+    CACHE_CODEC_ZSTD: _zstd_decompress,
+    CACHE_CODEC_LZ4: lambda data: lz4_frame.decompress(data),
+}
+
+
+def codec_available(name: str) -> bool:
+    if name == CACHE_CODEC_ZSTD:
+        return zstandard is not None
+    if name == CACHE_CODEC_LZ4:
+        return lz4_frame is not None
+    return name in CODEC_IDS
+
+
+def resolve_codec(name: str) -> str:
+    """``name`` if it can be used for writing here, otherwise gzip."""
+    if codec_available(name):
+        return name
+    if name in CODEC_IDS:
+        print(f"Cache codec '{name}' needs a package that is not installed; using gzip instead.")
+    else:
+        print(f"Unknown cache codec '{name}'; using gzip instead.")
+    return CACHE_CODEC_GZIP
+
+
+def encode(data: bytes, codec: str) -> bytes:
+    """Header plus ``data`` compressed with ``codec`` (which must be available, see resolve_codec)."""
+    return CODEC_MAGIC + bytes((CODEC_IDS[codec],)) + _COMPRESSORS[codec](data)
+
+
+def decode(value: bytes) -> Tuple[bytes, str]:
+    """(uncompressed data, codec name) of a stored value, headerless legacy gzip included."""
+    if value[:len(CODEC_MAGIC)] == CODEC_MAGIC:
+        codec = _CODEC_NAMES.get(value[len(CODEC_MAGIC)])
+        if codec is None:
+            raise ValueError(f"Unknown cache codec id {value[len(CODEC_MAGIC)]}")
+        if not codec_available(codec):
+            raise ValueError(f"Cache entry was written with '{codec}', which is not installed")
+        return _DECOMPRESSORS[codec](memoryview(value)[len(CODEC_MAGIC) + 1:]), codec
+    if value[:2] == GZIP_MAGIC:
+        return gzip.decompress(value), CACHE_CODEC_GZIP
+    raise ValueError("Cache entry has neither a codec header nor gzip data")
+
+
+if __name__ == '__main__':
+    import json
+    import time
+
+    payload = json.dumps({"items": [{"id": f"es{i}", "embedding": [i / 7] * 256} for i in range(200)]}).encode()
+    for name in CODEC_IDS:
+        if not codec_available(name):
+            print(f"{name:5} not installed")
+            continue
+        started = time.perf_counter()
+        stored = encode(payload, name)
+        encoded_at = time.perf_counter()
+        assert decode(stored) == (payload, name)
+        print(f"{name:5} {len(stored) / len(payload):6.1%} of {len(payload)} bytes, "
+              f"encode {1000 * (encoded_at - started):.1f} ms, decode {1000 * (time.perf_counter() - encoded_at):.1f} ms")
+    legacy = gzip.compress(payload)
+    print("legacy gzip decodes:", decode(legacy)[0] == payload)
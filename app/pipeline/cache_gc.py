@@ -0,0 +1,315 @@
+"""
+Accounting and garbage collection for the caches under ``<app data>/cache``.
+
+Three namespaces live there:
+
+- ``embeddings/<project>``: the per-project CacheService (normalized docs,
+  embeddings, rerank scores), in a SQLite database and/or legacy loose files.
+- ``faiss_index/project_<hash>``: the procedure index of a search step. The
+  pipeline removes it when the step ends, so any directory left behind belongs
+  to an interrupted run.
+- ``ingest``: the fingerprint database and the extracted text of ingested
+  files (see app.pipeline.fingerprints). Only the extracted text is evictable.
+
+The run traces in ``<app data>/traces`` (see app.pipeline.tracing) are
+accounted and evicted with them, one file at a time.
+
+``cache_usage`` reports entries and bytes per cache directory and flags
+orphans: project caches whose project is neither in ``projects.json`` nor was
+run ad hoc with ``cli run --dir`` (recorded in ``cli_projects.json``, see
+``register_cli_projects``), and leftover index directories. ``enforce_cache_limit`` evicts the least recently
+used entries across all projects until the caches fit ``max_bytes``. Nothing
+read or written in the last ``GC_GRACE_SECONDS`` is touched, so a running
+pipeline never loses the entries it is working with. It first adds up file
+sizes (``cache_total_bytes``) and only opens the project databases when
+that total is over the cap.
+
+Run it by hand with ``python -m app.cli cache gc``. The pipeline enforces
+``PipelineSettings.cache_max_mb`` after every search step.
+"""
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+try:
+    from app.app_paths import get_app_data_dir
+    from app.pipeline.cache_backends import (SQLITE_FILENAME, CacheBackend, FileCacheBackend, SQLiteCacheBackend)
+    from app.pipeline.tracing import span
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from app.app_paths import get_app_data_dir  # type: ignore
+    from app.pipeline.cache_backends import (SQLITE_FILENAME, CacheBackend, FileCacheBackend,  # type: ignore
+                                             SQLiteCacheBackend)
+    from app.pipeline.tracing import span  # type: ignore
+
+NAMESPACE_EMBEDDINGS = "embeddings"
+NAMESPACE_FAISS_INDEX = "faiss_index"
+NAMESPACE_INGEST = "ingest"
+NAMESPACE_TRACES = "traces"  # <app data>/traces, next to rather than under cache/
+CACHE_NAMESPACES = (NAMESPACE_EMBEDDINGS, NAMESPACE_FAISS_INDEX, NAMESPACE_INGEST, NAMESPACE_TRACES)
+# Entries used this recently are never evicted or treated as orphans: a run may still need them
+GC_GRACE_SECONDS = 600
+# Names of the projects run with `cli run --dir`, which projects.json does not list
+CLI_PROJECTS_FILENAME = "cli_projects.json"
+
+
+class CacheUsage(BaseModel):
+    namespace: str  # One of CACHE_NAMESPACES
+    name: str  # Project name, index directory name, or "" for the ingest cache and traces
+    path: str
+    entries: int = 0
+    bytes: int = 0  # On-disk size, database files included
+    last_access: float = 0.0  # Unix time of the most recent read or write
+    orphan: bool = False  # Belongs to no project in projects.json (or to an interrupted run)
+
+
+class GcReport(BaseModel):
+    usage: List[CacheUsage] = Field(default_factory=list)  # Before collection; empty when nothing was over the cap
+    removed_orphans: List[CacheUsage] = Field(default_factory=list)
+    evicted_entries: int = 0
+    evicted_bytes: int = 0
+    total_bytes: int = 0  # After collection (estimated with dry_run)
+
+
+def cache_root() -> Path:
+    return get_app_data_dir() / "cache"
+
+
+def _dir_size(path: Path) -> Tuple[int, int, float]:
+    """(files, bytes, newest mtime) of everything below ``path``."""
+    files = size = 0
+    newest = 0.0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue  # Removed while walking
+            files += 1
+            size += st.st_size
+            newest = max(newest, st.st_mtime)
+    return files, size, newest
+
+
+def _project_backends(cache_dir: Path) -> List[CacheBackend]:
+    """Backends holding entries in a project cache directory; never creates a database."""
+    backends: List[CacheBackend] = []
+    if (cache_dir / SQLITE_FILENAME).exists():
+        backends.append(SQLiteCacheBackend(cache_dir / SQLITE_FILENAME))
+    files = FileCacheBackend(cache_dir)
+    if files.has_entries():
+        backends.append(files)
+    return backends
+
+
+def cli_projects() -> Set[str]:
+    """Names recorded by ``register_cli_projects``."""
+    try:
+        data = json.loads((cache_root() / CLI_PROJECTS_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return set()
+    return {name for name in data if isinstance(name, str)} if isinstance(data, list) else set()
+
+
+def register_cli_projects(names: Iterable[str]) -> None:
+    """Records projects run outside ``projects.json`` so their caches are not taken for orphans."""
+    known = cli_projects()
+    new = set(names) - known
+    if not new:
+        return
+    path = cache_root() / CLI_PROJECTS_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(sorted(known | new), ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def known_projects(projects_file: Optional[Path] = None) -> Optional[Set[str]]:
+    """
+    Names of the projects in ``projects.json`` plus those run with
+    ``cli run --dir``, or None when ``projects.json`` is missing or
+    unreadable and orphans cannot be told apart.
+    """
+    projects_file = projects_file or (get_app_data_dir() / "projects.json")
+    try:
+        data = json.loads(projects_file.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(data, list):
+        return None
+    names = {project["name"] for project in data if isinstance(project, dict) and project.get("name")}
+    return names | cli_projects()
+
+
+def cache_total_bytes() -> int:
+    """On-disk size of the caches and traces, from file sizes alone: no database is opened."""
+    return _dir_size(cache_root())[1] + _dir_size(get_app_data_dir() / NAMESPACE_TRACES)[1]
+
+
+def cache_usage(projects_file: Optional[Path] = None, now: Optional[float] = None) -> List[CacheUsage]:
+    """Size and entry count of every cache directory, with orphans flagged."""
+    now = time.time() if now is None else now
+    root = cache_root()
+    known = known_projects(projects_file)
+    usage: List[CacheUsage] = []
+
+    embeddings_root = root / NAMESPACE_EMBEDDINGS
+    for cache_dir in sorted(p for p in embeddings_root.iterdir() if p.is_dir()) if embeddings_root.exists() else []:
+        # The database file changes on every write, so the last access comes from the entries
+        _, size, _ = _dir_size(cache_dir)
+        entries = 0
+        newest = 0.0
+        for backend in _project_backends(cache_dir):
+            try:
+                backend_entries, _, backend_newest = backend.stats()
+            finally:
+                backend.close()
+            entries += backend_entries
+            newest = max(newest, backend_newest)
+        usage.append(CacheUsage(namespace=NAMESPACE_EMBEDDINGS, name=cache_dir.name, path=str(cache_dir),
+                                entries=entries, bytes=size, last_access=newest,
+                                orphan=known is not None and cache_dir.name not in known
+                                and newest < now - GC_GRACE_SECONDS))
+
+    index_root = root / NAMESPACE_FAISS_INDEX
+    for index_dir in sorted(p for p in index_root.iterdir() if p.is_dir()) if index_root.exists() else []:
+        files, size, newest = _dir_size(index_dir)
+        # Index directories only outlive their search step when a run was interrupted
+        usage.append(CacheUsage(namespace=NAMESPACE_FAISS_INDEX, name=index_dir.name, path=str(index_dir),
+                                entries=files, bytes=size, last_access=newest,
+                                orphan=newest < now - GC_GRACE_SECONDS))
+
+    ingest_dir = root / NAMESPACE_INGEST
+    if ingest_dir.exists():
+        files, size, newest = _dir_size(ingest_dir)
+        usage.append(CacheUsage(namespace=NAMESPACE_INGEST, name="", path=str(ingest_dir), entries=files,
+                                bytes=size, last_access=newest))
+
+    trace_dir = get_app_data_dir() / NAMESPACE_TRACES
+    if trace_dir.exists():
+        files, size, newest = _dir_size(trace_dir)
+        usage.append(CacheUsage(namespace=NAMESPACE_TRACES, name="", path=str(trace_dir), entries=files,
+                                bytes=size, last_access=newest))
+    return usage
+
+
+def remove_orphans(usage: List[CacheUsage], dry_run: bool = False) -> List[CacheUsage]:
+    """Deletes the orphaned directories in ``usage`` and returns them."""
+    removed: List[CacheUsage] = []
+    for item in usage:
+        if not item.orphan:
+            continue
+        if not dry_run:
+            try:
+                shutil.rmtree(item.path)
+            except OSError as e:
+                print(f"Could not remove orphaned cache {item.path}: {e}")
+                continue
+        removed.append(item)
+    return removed
+
+
+def enforce_cache_limit(max_bytes: int, projects_file: Optional[Path] = None, delete_orphans: bool = False,
+                        dry_run: bool = False, now: Optional[float] = None,
+                        compact_project: Optional[str] = None) -> GcReport:
+    """
+    Brings the caches under ``max_bytes`` (0 = no limit) by evicting the least
+    recently used entries first: project cache entries one by one, leftover
+    index directories, extracted texts and run traces as whole files. With
+    ``delete_orphans``, orphaned directories are removed before anything else.
+
+    With ``compact_project``, only that project's database is compacted after
+    its entries are deleted. The pipeline passes its own project: other runs
+    (``cli run --jobs``) may be writing to the other databases.
+    """
+    now = time.time() if now is None else now
+    with span("cache_gc", "cache", max_bytes=max_bytes) as gc_span:
+        # Cheap check first: adding up file sizes is enough to tell that nothing needs evicting
+        total = cache_total_bytes()
+        if not delete_orphans and (max_bytes <= 0 or total <= max_bytes):
+            gc_span.set(evicted=0, evicted_bytes=0, orphans=0, total_bytes=total)
+            return GcReport(total_bytes=total)
+
+        report = GcReport(usage=cache_usage(projects_file, now))
+        total = sum(u.bytes for u in report.usage)
+        if delete_orphans:
+            report.removed_orphans = remove_orphans(report.usage, dry_run)
+            total -= sum(u.bytes for u in report.removed_orphans)
+        removed_paths = {u.path for u in report.removed_orphans}
+
+        if max_bytes > 0 and total > max_bytes:
+            # (last access, bytes, location, key, kind); key/kind are None for whole files and directories
+            candidates: List[Tuple[float, int, str, Optional[str], Optional[str]]] = []
+            backends: Dict[str, List[CacheBackend]] = {}
+            for item in report.usage:
+                if item.path in removed_paths:
+                    continue
+                if item.namespace == NAMESPACE_EMBEDDINGS:
+                    backends[item.path] = _project_backends(Path(item.path))
+                    for i, backend in enumerate(backends[item.path]):
+                        candidates.extend((info.last_access, info.size, f"{item.path}#{i}", info.key, info.kind)
+                                          for info in backend.entry_infos())
+                elif item.namespace == NAMESPACE_FAISS_INDEX:
+                    candidates.append((item.last_access, item.bytes, item.path, None, None))
+                elif item.namespace in (NAMESPACE_INGEST, NAMESPACE_TRACES):
+                    if item.namespace == NAMESPACE_INGEST:
+                        files = (Path(item.path) / "extracted").glob("*.json.gz")
+                    else:
+                        files = Path(item.path).glob("*.json")
+                    for path in files:
+                        st = path.stat()
+                        candidates.append((st.st_mtime, st.st_size, str(path), None, None))
+            candidates.sort(key=lambda c: c[0])
+
+            evicted: Dict[str, List[Tuple[str, str]]] = {}
+            for last_access, size, location, key, kind in candidates:
+                if total <= max_bytes:
+                    break
+                if last_access >= now - GC_GRACE_SECONDS:
+                    break  # Everything after this one is newer still
+                if key is not None:
+                    evicted.setdefault(location, []).append((key, kind))
+                elif not dry_run:
+                    try:
+                        if os.path.isdir(location):
+                            shutil.rmtree(location)
+                        else:
+                            os.remove(location)
+                    except OSError as e:
+                        print(f"Could not evict cache {location}: {e}")
+                        continue
+                total -= size
+                report.evicted_entries += 1
+                report.evicted_bytes += size
+
+            for cache_path, cache_backends in backends.items():
+                for i, backend in enumerate(cache_backends):
+                    keys = evicted.get(f"{cache_path}#{i}")
+                    try:
+                        if keys and not dry_run:
+                            backend.delete_many(keys)
+                            if compact_project is None or Path(cache_path).name == compact_project:
+                                backend.compact()  # Hand the freed pages back to the file system
+                    finally:
+                        backend.close()
+            if not dry_run:
+                # Measure again: database pages and file system blocks differ from the value sizes
+                total = sum(u.bytes for u in cache_usage(projects_file, now))
+
+        report.total_bytes = total
+        gc_span.set(evicted=report.evicted_entries, evicted_bytes=report.evicted_bytes,
+                    orphans=len(report.removed_orphans), total_bytes=total)
+    return report
+
+
+if __name__ == '__main__':
+    for item in cache_usage():
+        print(f"{item.namespace:12} {item.name or '-':40} {item.entries:8} entries {item.bytes / 1e6:10.1f} MB"
+              f"{'  (orphan)' if item.orphan else ''}")
@@ -0,0 +1,313 @@
+"""
+Structure-aware chunking of normalized documents.
+
+A NormDoc is first cut into blocks at its section starts
+(``metadata["section_starts"]``, recorded by ``normalize_document``) and page
+boundaries (``metadata["page_spans"]``), so no chunk straddles a section or a
+page. Lines of a block (paragraphs, list items, table rows) are packed
+greedily into chunks of at most ``max_tokens`` tokens. A line longer than
+the budget is split into sentences (CJK and Latin punctuation), and only a
+single sentence longer than the budget is cut inside, by slicing its token
+array, at a boundary that never splits a character.
+
+``chunk_documents`` tokenizes many documents in one batch, spread over
+threads for large inputs. The encoder is loaded once per
+process (``get_tokenizer``).
+
+Every chunk is an exact slice ``text_content[start:end]``, so the offsets
+point back into the document.
+"""
+
+import bisect
+import functools
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import tiktoken
+from pydantic import BaseModel
+
+# Adjust import based on project structure and PYTHONPATH
+try:
+    from app.models.docs import NormDoc
+except ImportError:
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from app.models.docs import NormDoc  # type: ignore
+
+# Bump whenever chunk boundaries or chunk metadata change; it is part of the embedding cache key
+CHUNKER_VERSION = 2
+
+DEFAULT_ENCODING = "cl100k_base"
+# Tokenization threads; below PARALLEL_MIN_CHARS of input a single thread is faster
+DEFAULT_NUM_THREADS = min(8, os.cpu_count() or 1)
+PARALLEL_MIN_CHARS = 1_000_000
+
+# A sentence ends after CJK/Latin terminal punctuation, after a Latin full stop
+# followed by whitespace, or at a line break (normalized text keeps one
+# logical line per paragraph, list item or table row).
+RE_SENTENCE_END = re.compile(r'[。！？!?；;]+[」』）)"\']*|\.(?=\s)|\n')
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """The tiktoken encoding, loaded once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+class Chunk(BaseModel):
+    text: str
+    start: int  # Offset into NormDoc.text_content
+    end: int
+    section: Optional[str] = None
+    page_number: Optional[int] = None
+    token_count: int
+
+
+def _block_boundaries(norm_doc: NormDoc) -> List[Tuple[int, int, Optional[str], Optional[int]]]:
+    """Splits text_content into (start, end, section, page) blocks at section starts and page boundaries."""
+    text_len = len(norm_doc.text_content)
+    metadata = norm_doc.metadata or {}
+    section_starts: Sequence[int] = metadata.get("section_starts") or []
+    # Older NormDocs have sections without offsets; they are chunked without section labels
+    sections: List[str] = norm_doc.sections if len(norm_doc.sections) == len(section_starts) else []
+    page_spans: List[Dict[str, Any]] = metadata.get("page_spans") or []
+
+    cuts = {0, text_len}
+    if sections:
+        cuts.update(section_starts)
+    cuts.update(span["start"] for span in page_spans)
+    cuts = sorted(c for c in cuts if 0 <= c <= text_len)
+
+    page_starts = [span["start"] for span in page_spans]
+    blocks = []
+    for start, end in zip(cuts, cuts[1:]):
+        section = None
+        if sections:
+            # Several headers can share an offset (e.g. "CHAPTER 1" then "1.1"); the last one is the most specific
+            idx = bisect.bisect_right(section_starts, start) - 1
+            section = sections[idx] if idx >= 0 else None
+        page = None
+        if page_spans:
+            idx = bisect.bisect_right(page_starts, start) - 1
+            page = page_spans[idx]["page"] if idx >= 0 else None
+        blocks.append((start, end, section, page))
+    return blocks
+
+
+def _line_spans(text: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """Line spans in text[start:end], trimmed of surrounding whitespace; blank lines are dropped."""
+    spans = []
+    pos = start
+    for line in text[start:end].split("\n"):
+        s, e = pos, pos + len(line)
+        pos = e + 1
+        if line[:1].isspace() or line[-1:].isspace():  # Normalized lines are already stripped
+            stripped = line.strip()
+            s += len(line) - len(line.lstrip())
+            e = s + len(stripped)
+        if s < e:
+            spans.append((s, e))
+    return spans
+
+
+def _sentence_spans(text: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """Sentence spans in text[start:end], trimmed of surrounding whitespace; empty sentences are dropped."""
+    spans = []
+    pos = start
+    for match in RE_SENTENCE_END.finditer(text, start, end):
+        spans.append((pos, match.end()))
+        pos = match.end()
+    spans.append((pos, end))
+
+    trimmed = []
+    for s, e in spans:
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if s < e:
+            trimmed.append((s, e))
+    return trimmed
+
+
+def _count_tokens(tokenizer: tiktoken.Encoding, texts: List[str], num_threads: int) -> List[int]:
+    """
+    Token count of each text (ordinary tokens only). Large inputs are split
+    into one contiguous slice per thread rather than one task per text, so
+    thread overhead stays flat; tiktoken releases the GIL while it encodes.
+    Only the counts are kept: token lists of a 100 MB corpus would not fit
+    in memory as Python ints.
+    """
+    def count(batch: List[str]) -> List[int]:
+        return [len(tokenizer.encode_ordinary(t)) for t in batch]
+
+    if num_threads <= 1 or sum(map(len, texts)) < PARALLEL_MIN_CHARS:
+        return count(texts)
+    step = -(-len(texts) // num_threads)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        parts = executor.map(count, (texts[i:i + step] for i in range(0, len(texts), step)))
+        return [n for part in parts for n in part]
+
+
+def _split_long_sentences(sentences: List[str], tokenizer: tiktoken.Encoding, max_tokens: int,
+                          num_threads: int) -> List[List[Tuple[int, int, int]]]:
+    """
+    Cuts each over-long sentence every max_tokens tokens by slicing its token
+    array; all windows of all sentences are decoded in one batch. Returns
+    (start, end, tokens) pieces with character offsets relative to the
+    sentence. A cut that falls inside a multi-byte character moves back to
+    the start of that character.
+    """
+    if not sentences:
+        return []
+    num_threads = max(1, num_threads)
+    sentence_tokens = tokenizer.encode_ordinary_batch(sentences, num_threads=num_threads)
+    windows = [tokens[i:i + max_tokens] for tokens in sentence_tokens for i in range(0, len(tokens), max_tokens)]
+    window_bytes = iter(tokenizer.decode_bytes_batch(windows, num_threads=num_threads))
+
+    results = []
+    for sentence, tokens in zip(sentences, sentence_tokens):
+        data = sentence.encode("utf-8")
+        pieces: List[Tuple[int, int, int]] = []
+        byte_pos = char_pos = 0
+        byte_cut = pending_tokens = 0
+        for i in range(0, len(tokens), max_tokens):
+            byte_cut += len(next(window_bytes))
+            pending_tokens += min(max_tokens, len(tokens) - i)
+            cut = byte_cut
+            while cut < len(data) and (data[cut] & 0xC0) == 0x80:  # UTF-8 continuation byte
+                cut -= 1
+            if cut <= byte_pos:
+                continue  # The window ended inside a single character; merge it into the next piece
+            char_end = char_pos + len(data[byte_pos:cut].decode("utf-8"))
+            pieces.append((char_pos, char_end, pending_tokens))
+            byte_pos, char_pos, pending_tokens = cut, char_end, 0
+        results.append(pieces)
+    return results
+
+
+def chunk_documents(norm_docs: Sequence[NormDoc], tokenizer: Optional[tiktoken.Encoding] = None,
+                    max_tokens: int = 200, overlap_tokens: int = 0,
+                    num_threads: int = DEFAULT_NUM_THREADS) -> List[List[Chunk]]:
+    """
+    Chunks several NormDocs along sections, pages, lines and sentences;
+    returns one chunk list per document.
+
+    Lines (paragraphs, list items, table rows) are the packing units. Only a
+    line over the budget is split into sentences, and only a sentence over
+    the budget into token windows. Each level is tokenized in one batch
+    across all documents.
+
+    ``overlap_tokens`` > 0 repeats whole trailing lines/sentences of the
+    previous chunk (up to that many tokens) at the start of the next one,
+    within the same block.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    max_tokens = max(1, max_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens - 1))
+
+    doc_blocks = []
+    line_texts: List[str] = []
+    for norm_doc in norm_docs:
+        text = norm_doc.text_content
+        blocks = _block_boundaries(norm_doc) if text.strip() else []
+        block_lines = [_line_spans(text, start, end) for start, end, _, _ in blocks]
+        line_texts.extend(text[s:e] for lines in block_lines for s, e in lines)
+        doc_blocks.append((blocks, block_lines))
+    line_counts = _count_tokens(tokenizer, line_texts, num_threads)
+
+    # Over-long lines -> sentences -> token windows; offsets relative to the line
+    line_sentences = {i: _sentence_spans(line_texts[i], 0, len(line_texts[i]))
+                      for i, n in enumerate(line_counts) if n > max_tokens}
+    sentence_texts = [line_texts[i][s:e] for i, spans in line_sentences.items() for s, e in spans]
+    del line_texts
+    sentence_counts = _count_tokens(tokenizer, sentence_texts, num_threads)
+    windows = iter(_split_long_sentences([t for t, n in zip(sentence_texts, sentence_counts) if n > max_tokens],
+                                         tokenizer, max_tokens, num_threads))
+    sentence_count_iter = iter(sentence_counts)
+    line_units: Dict[int, List[Tuple[int, int, int]]] = {}
+    for i, spans in line_sentences.items():
+        units: List[Tuple[int, int, int]] = []
+        for s, e in spans:
+            n = next(sentence_count_iter)
+            if n > max_tokens:
+                units.extend((s + ws, s + we, wn) for ws, we, wn in next(windows))
+            else:
+                units.append((s, e, n))
+        line_units[i] = units
+
+    results: List[List[Chunk]] = []
+    line_index = 0
+    for norm_doc, (blocks, block_lines) in zip(norm_docs, doc_blocks):
+        text = norm_doc.text_content
+        chunks: List[Chunk] = []
+        for (_, _, section, page), lines in zip(blocks, block_lines):
+            # (start, end, token count) units that each fit the budget
+            units = []
+            for s, e in lines:
+                if line_index in line_units:
+                    units.extend((s + us, s + ue, n) for us, ue, n in line_units[line_index])
+                else:
+                    units.append((s, e, line_counts[line_index]))
+                line_index += 1
+            chunks.extend(_pack_units(text, units, max_tokens, overlap_tokens, section, page))
+        results.append(chunks)
+    return results
+
+
+def chunk_document(norm_doc: NormDoc, tokenizer: Optional[tiktoken.Encoding] = None, max_tokens: int = 200,
+                   overlap_tokens: int = 0) -> List[Chunk]:
+    """Chunks a single NormDoc; see chunk_documents."""
+    return chunk_documents([norm_doc], tokenizer, max_tokens, overlap_tokens)[0]
+
+
+def _pack_units(text: str, units: List[Tuple[int, int, int]], max_tokens: int, overlap_tokens: int,
+                section: Optional[str], page: Optional[int]) -> List[Chunk]:
+    """Greedily packs consecutive units of one block into chunks of at most max_tokens."""
+    chunks: List[Chunk] = []
+    current: List[Tuple[int, int, int]] = []
+    current_tokens = 0
+    for unit in units:
+        # Count one token for the whitespace/newline joining two units
+        if current and current_tokens + 1 + unit[2] > max_tokens:
+            chunks.append(_make_chunk(text, current, current_tokens, section, page))
+            # Carry trailing sentences over as overlap, as long as the next unit still fits
+            carried: List[Tuple[int, int, int]] = []
+            carried_tokens = 0
+            for prev in reversed(current):
+                with_prev = carried_tokens + prev[2] + (1 if carried else 0)
+                if with_prev > overlap_tokens or with_prev + 1 + unit[2] > max_tokens:
+                    break
+                carried.insert(0, prev)
+                carried_tokens = with_prev
+            current, current_tokens = carried, carried_tokens
+        current_tokens += unit[2] + (1 if current else 0)
+        current.append(unit)
+    if current:
+        chunks.append(_make_chunk(text, current, current_tokens, section, page))
+    return chunks
+
+
+def _make_chunk(text: str, units: List[Tuple[int, int, int]], token_count: int,
+                section: Optional[str], page: Optional[int]) -> Chunk:
+    start, end = units[0][0], units[-1][1]
+    return Chunk(text=text[start:end], start=start, end=end, section=section, page_number=page,
+                 token_count=token_count)
+
+
+if __name__ == '__main__':
+    from app.pipeline.normalize import normalize_document
+    from app.models.docs import RawDoc
+
+    demo = RawDoc(
+        id="chunk_demo",
+        content="ACCESS CONTROL\n- 帳號每季審查一次。特權帳號需主管核准。\n"
+                "- Accounts are reviewed quarterly. Privileged accounts need approval.\n"
+                "BACKUP\n- Backups are tested monthly.",
+        doc_type="procedure", metadata={}, source_path="demo.txt",
+    )
+    for chunk in chunk_document(normalize_document(demo), max_tokens=20):
+        print(f"[{chunk.start}:{chunk.end}] section={chunk.section!r} tokens={chunk.token_count}: {chunk.text!r}")
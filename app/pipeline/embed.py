@@ -1,9 +1,10 @@
 import os
 import traceback # Add this import
-from typing import List, Optional
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import openai  # type: ignore # Assuming openai is installed, ignore type errors if stubs are missing
-import tiktoken
 from pydantic import BaseModel
 
 from app.logger import logger # Add this import
@@ -12,12 +13,26 @@ from app.logger import logger # Add this import
 try:
     from app.models.docs import NormDoc, EmbedSet
     from app.pipeline.cache import CacheService
+    from app.pipeline.chunking import CHUNKER_VERSION, Chunk, chunk_document, chunk_documents, get_tokenizer
+    from app.pipeline.llm_utils import record_token_usage
+    from app.pipeline.normalize import NORMALIZATION_VERSION
+    from app.pipeline.tracing import incr, span
 except ImportError:
     import sys
     from pathlib import Path
     sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
     from app.models.docs import NormDoc, EmbedSet  # type: ignore
     from app.pipeline.cache import CacheService  # type: ignore
+    from app.pipeline.chunking import CHUNKER_VERSION, Chunk, chunk_document, chunk_documents, get_tokenizer  # type: ignore
+    from app.pipeline.llm_utils import record_token_usage  # type: ignore
+    from app.pipeline.normalize import NORMALIZATION_VERSION  # type: ignore
+    from app.pipeline.tracing import incr, span  # type: ignore
+
+
+# Chunks sent per embeddings request by iter_embedded_documents; chunks of several documents share a request
+EMBEDDING_BATCH_SIZE = 64
+# NormDocs pulled (and chunked in one tokenizer batch) at a time by iter_embedded_documents
+CHUNK_BATCH_DOCS = 4
 
 
 # Helper for Pydantic list serialization/deserialization with CacheService
@@ -25,28 +40,172 @@ class EmbedSetList(BaseModel):
     items: List[EmbedSet]
 
 
-def _create_text_chunks(text: str, tokenizer: tiktoken.Encoding, max_tokens: int = 400) -> List[str]:
+def _chunk_metadata(chunk: Chunk) -> Dict[str, Any]:
+    """EmbedSet.metadata for a chunk: character offsets into the NormDoc, plus section and page when known."""
+    metadata: Dict[str, Any] = {"char_start": chunk.start, "char_end": chunk.end}
+    if chunk.section is not None:
+        metadata["section"] = chunk.section
+    if chunk.page_number is not None:
+        metadata["page_number"] = chunk.page_number
+    return metadata
+
+
+def _embeddings_cache_key(norm_doc: NormDoc, cache_service: CacheService, embedding_model_name: str,
+                          max_tokens_per_chunk: int, chunk_overlap_tokens: int) -> Tuple[str, str]:
     """
-    Splits text into chunks based on a maximum token count.
+    Returns (cache key of the doc's full embedding set, chunking suffix shared with the EmbedSet ids).
+    NormDoc ids only depend on the raw document, so the normalizer version is part of the suffix:
+    chunk offsets, sections and pages all point into the normalized text.
     """
-    if not text.strip():  # Handle empty or whitespace-only text
-        return []
-        
-    tokens = tokenizer.encode(text)
-    chunks: List[str] = []
-    current_chunk_tokens: List[int] = []
-
-    for token in tokens:
-        current_chunk_tokens.append(token)
-        if len(current_chunk_tokens) >= max_tokens:
-            chunks.append(tokenizer.decode(current_chunk_tokens))
-            current_chunk_tokens = []
-    
-    # Add any remaining tokens as the last chunk
-    if current_chunk_tokens:
-        chunks.append(tokenizer.decode(current_chunk_tokens))
-        
-    return chunks
+    chunking_suffix = (f"tokens{max_tokens_per_chunk}_overlap{chunk_overlap_tokens}_chunker{CHUNKER_VERSION}"
+                       f"_norm{NORMALIZATION_VERSION}")
+    suffix = f"full_embeddings_set_{embedding_model_name}_{chunking_suffix}"
+    return cache_service.generate_key(norm_doc.id, suffix), chunking_suffix
+
+
+class _PendingDoc:
+    """A NormDoc whose chunks are waiting for (or in) an embeddings request."""
+
+    __slots__ = ("norm_doc", "cache_key", "chunks", "vectors", "outstanding", "failed", "cached")
+
+    def __init__(self, norm_doc: NormDoc, cache_key: str, cached: Optional[List[EmbedSet]] = None):
+        self.norm_doc = norm_doc
+        self.cache_key = cache_key
+        self.chunks: List[Chunk] = []
+        self.vectors: List[Optional[List[float]]] = []
+        self.outstanding = 0  # Chunks still waiting for their embedding
+        self.failed = False
+        self.cached = cached
+
+
+def iter_embedded_documents(
+    norm_docs: Iterable[NormDoc],
+    cache_service: CacheService,
+    openai_api_key: Optional[str] = None,
+    embedding_model_name: str = "text-embedding-3-large",
+    max_tokens_per_chunk: int = 200,
+    openai_base_url: Optional[str] = None,
+    chunk_overlap_tokens: int = 0,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    docs_per_chunk_batch: int = CHUNK_BATCH_DOCS
+) -> Iterator[Tuple[NormDoc, List[EmbedSet]]]:
+    """
+    Streaming, cross-document form of ``generate_embeddings``; yields
+    (NormDoc, EmbedSets) in input order.
+
+    Documents are pulled ``docs_per_chunk_batch`` at a time and the uncached
+    ones are chunked together. Their chunks fill embeddings requests of
+    ``batch_size`` inputs regardless of document boundaries. A document is
+    cached and yielded as soon as its last chunk is embedded. Only one
+    group of documents and less than one request of queued chunks are held
+    at a time. Documents in a failed request are yielded with no embeddings
+    and are not cached.
+    """
+    client = None
+    pending: Deque[_PendingDoc] = deque()
+    queue: List[Tuple[_PendingDoc, int]] = []  # (document, chunk index) not sent yet
+
+    def send(requests: List[Tuple[_PendingDoc, int]]) -> None:
+        nonlocal client
+        texts = [doc.chunks[i].text.replace("\n", " ") for doc, i in requests]
+        vectors: List[List[float]] = []
+        try:
+            if client is None:
+                client = openai.OpenAI(api_key=openai_api_key, base_url=openai_base_url)
+            with span("embedding_batch", "embedding", inputs=len(texts), chars=sum(map(len, texts))) as batch_span:
+                response = client.embeddings.create(input=texts, model=embedding_model_name)
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    batch_span.set(tokens=getattr(usage, "total_tokens", 0) or 0)
+            record_token_usage("embedding", getattr(response, "usage", None))
+            vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            if len(vectors) != len(texts):
+                raise ValueError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            names = sorted({doc.norm_doc.id for doc, _ in requests})
+            logger.error(f"Embeddings request of {len(texts)} chunks failed (NormDocs: {names}): {e}\n{traceback.format_exc()}")
+            vectors = []
+            for doc, _ in requests:
+                doc.failed = True
+        for (doc, i), vector in zip(requests, vectors):
+            doc.vectors[i] = vector
+        for doc, _ in requests:
+            doc.outstanding -= 1
+
+    def drain() -> Iterator[Tuple[NormDoc, List[EmbedSet]]]:
+        while pending and pending[0].outstanding == 0:
+            yield _finish_pending_doc(pending.popleft(), cache_service, embedding_model_name, chunking_suffix)
+
+    chunking_suffix = ""
+    doc_iter = iter(norm_docs)
+    while True:
+        group = list(islice(doc_iter, max(1, docs_per_chunk_batch)))
+        if not group:
+            break
+        to_chunk: List[_PendingDoc] = []
+        cache_keys = []
+        for norm_doc in group:
+            cache_key, chunking_suffix = _embeddings_cache_key(norm_doc, cache_service, embedding_model_name,
+                                                               max_tokens_per_chunk, chunk_overlap_tokens)
+            cache_keys.append(cache_key)
+        # One batched cache read per group of documents
+        cached_lists = cache_service.load_json_many(cache_keys, EmbedSetList)
+        for norm_doc, cache_key in zip(group, cache_keys):
+            cached = cached_lists.get(cache_key)
+            if cached is not None:
+                incr("embedding_doc_cache_hits")
+                pending.append(_PendingDoc(norm_doc, cache_key, cached=cached.items))
+            else:
+                incr("embedding_doc_cache_misses")
+                to_chunk.append(_PendingDoc(norm_doc, cache_key))
+                pending.append(to_chunk[-1])
+        if to_chunk:
+            with span("chunk_text", "embedding", docs=len(to_chunk),
+                      chars=sum(len(doc.norm_doc.text_content) for doc in to_chunk)) as chunk_span:
+                chunk_lists = chunk_documents([doc.norm_doc for doc in to_chunk], get_tokenizer(),
+                                              max_tokens=max_tokens_per_chunk, overlap_tokens=chunk_overlap_tokens)
+                chunk_span.set(chunks=sum(map(len, chunk_lists)))
+            for doc, chunks in zip(to_chunk, chunk_lists):
+                doc.chunks = chunks
+                doc.vectors = [None] * len(chunks)
+                doc.outstanding = len(chunks)
+                queue.extend((doc, i) for i in range(len(chunks)))
+        del group, to_chunk
+        while len(queue) >= batch_size:
+            send(queue[:batch_size])
+            del queue[:batch_size]
+        yield from drain()
+
+    if queue:
+        send(queue)
+        queue.clear()
+    yield from drain()
+
+
+def _finish_pending_doc(doc: _PendingDoc, cache_service: CacheService, embedding_model_name: str,
+                        chunking_suffix: str) -> Tuple[NormDoc, List[EmbedSet]]:
+    """Builds (and caches) the EmbedSets of a document whose chunks have all been embedded."""
+    norm_doc = doc.norm_doc
+    if doc.cached is not None:
+        return norm_doc, doc.cached
+    if doc.failed:
+        logger.warning(f"No embeddings generated for NormDoc {norm_doc.id}; it will be retried on the next run.")
+        return norm_doc, []
+    embed_sets = [
+        EmbedSet(
+            id=cache_service.generate_key(norm_doc.id, f"chunk_{i}_{embedding_model_name}_{chunking_suffix}"),
+            norm_doc_id=norm_doc.id,
+            chunk_text=chunk.text,
+            embedding=vector,
+            chunk_index=i,
+            total_chunks=len(doc.chunks),
+            doc_type=norm_doc.doc_type,
+            metadata=_chunk_metadata(chunk)
+        )
+        for i, (chunk, vector) in enumerate(zip(doc.chunks, doc.vectors))
+    ]
+    cache_service.save_json(doc.cache_key, EmbedSetList(items=embed_sets))
+    return norm_doc, embed_sets
 
 
 def generate_embeddings(
@@ -54,19 +213,23 @@ def generate_embeddings(
     cache_service: CacheService, 
     openai_api_key: Optional[str] = None,
     embedding_model_name: str = "text-embedding-3-large",  # Default from settings
-    max_tokens_per_chunk: int = 200  # Changed default
+    max_tokens_per_chunk: int = 200,  # Changed default
+    openai_base_url: Optional[str] = None,  # OpenAI-compatible endpoint override (None = client default)
+    chunk_overlap_tokens: int = 0  # Trailing sentences repeated at the start of the next chunk (see chunking.py)
 ) -> List[EmbedSet]:
     
     # Generate a cache key for the entire norm_doc's set of embeddings,
-    # including model name and chunk size in the key for specificity.
-    doc_embeddings_cache_key_suffix = f"full_embeddings_set_{embedding_model_name}_tokens{max_tokens_per_chunk}"
-    doc_embeddings_cache_key = cache_service.generate_key(norm_doc.id, doc_embeddings_cache_key_suffix)
+    # including model name, chunk size and chunker version in the key for specificity.
+    doc_embeddings_cache_key, chunking_suffix = _embeddings_cache_key(
+        norm_doc, cache_service, embedding_model_name, max_tokens_per_chunk, chunk_overlap_tokens)
     
     cached_embed_set_list = cache_service.load_json(doc_embeddings_cache_key, EmbedSetList)
     if cached_embed_set_list:
+        incr("embedding_doc_cache_hits")
         logger.info(f"Loaded embeddings from cache for NormDoc: {norm_doc.id} (Model: {embedding_model_name}, Chunks: {max_tokens_per_chunk})")
         return cached_embed_set_list.items
 
+    incr("embedding_doc_cache_misses")
     logger.info(f"Generating embeddings for NormDoc: {norm_doc.id} (Model: {embedding_model_name}, Chunks: {max_tokens_per_chunk})...")
     all_embed_sets: List[EmbedSet] = []
 
@@ -77,18 +240,20 @@ def generate_embeddings(
         else:
             logger.debug("OpenAI API key is NOT provided directly; relying on environment variable OPENAI_API_KEY.")
         
-        client = openai.OpenAI(api_key=openai_api_key) 
+        client = openai.OpenAI(api_key=openai_api_key, base_url=openai_base_url)
         
         try:
-            tokenizer = tiktoken.get_encoding("cl100k_base")
-            logger.debug("Successfully loaded tiktoken tokenizer 'cl100k_base'.")
+            tokenizer = get_tokenizer()  # Loaded once per process
         except Exception as e:
             logger.error(f"Failed to get tiktoken encoding 'cl100k_base': {e}\n{traceback.format_exc()}")
             cache_service.save_json(doc_embeddings_cache_key, EmbedSetList(items=[]))
             return []
 
-        text_chunks = _create_text_chunks(norm_doc.text_content, tokenizer, max_tokens=max_tokens_per_chunk)
-        total_chunks = len(text_chunks)
+        with span("chunk_text", "embedding", doc_id=norm_doc.id, chars=len(norm_doc.text_content)) as chunk_span:
+            chunks = chunk_document(norm_doc, tokenizer, max_tokens=max_tokens_per_chunk,
+                                    overlap_tokens=chunk_overlap_tokens)
+            chunk_span.set(chunks=len(chunks))
+        total_chunks = len(chunks)
 
         if total_chunks == 0 and norm_doc.text_content.strip():
             logger.warning(f"Warning: No text chunks generated for non-empty NormDoc: {norm_doc.id}. Content: '{norm_doc.text_content[:100]}...'")
@@ -97,7 +262,8 @@ def generate_embeddings(
             cache_service.save_json(doc_embeddings_cache_key, EmbedSetList(items=[]))
             return []
 
-        for i, chunk_text in enumerate(text_chunks):
+        for i, chunk in enumerate(chunks):
+            chunk_text = chunk.text
             if not chunk_text.strip():
                 logger.debug(f"Skipping empty chunk {i} for NormDoc {norm_doc.id}")
                 # total_chunks -= 1 # This adjustment can be problematic if many are skipped.
@@ -108,10 +274,14 @@ def generate_embeddings(
             logger.debug(f"Embedding chunk {i+1}/{total_chunks} for NormDoc ID: {norm_doc.id}. Chunk preview (first 70 chars): '{processed_chunk_text[:70]}...'")
 
             try:
-                response = client.embeddings.create(
-                    input=[processed_chunk_text],
-                    model=embedding_model_name
-                )
+                with span("embedding_batch", "embedding", inputs=1, chars=len(processed_chunk_text)) as batch_span:
+                    response = client.embeddings.create(
+                        input=[processed_chunk_text],
+                        model=embedding_model_name
+                    )
+                    usage = getattr(response, "usage", None)
+                    if usage is not None:
+                        batch_span.set(tokens=getattr(usage, "total_tokens", 0) or 0)
             except openai.APIError as e_api:
                 logger.error(f"OpenAI APIError during client.embeddings.create for NormDoc {norm_doc.id}, chunk {i}: {e_api}\n{traceback.format_exc()}")
                 logger.error(f"Problematic chunk text (newline-replaced): '{processed_chunk_text}'")
@@ -121,8 +291,9 @@ def generate_embeddings(
                 logger.error(f"Problematic chunk text (newline-replaced): '{processed_chunk_text}'")
                 raise
 
+            record_token_usage("embedding", getattr(response, "usage", None))
             embedding_vector = response.data[0].embedding
-            embed_set_id_suffix = f"chunk_{i}_{embedding_model_name}_tokens{max_tokens_per_chunk}"
+            embed_set_id_suffix = f"chunk_{i}_{embedding_model_name}_{chunking_suffix}"
             embed_set_id = cache_service.generate_key(norm_doc.id, embed_set_id_suffix)
             
             embed_set = EmbedSet(
@@ -132,7 +303,8 @@ def generate_embeddings(
                 embedding=embedding_vector,
                 chunk_index=i,
                 total_chunks=total_chunks,
-                doc_type=norm_doc.doc_type
+                doc_type=norm_doc.doc_type,
+                metadata=_chunk_metadata(chunk)
             )
             all_embed_sets.append(embed_set)
 
@@ -0,0 +1,173 @@
+"""
+Encoding detection and tolerant decoding for plain-text procedure documents.
+
+Procedure files are not always UTF-8: Big5/CP950 and UTF-16 exports are common
+in Taiwanese repositories. ``open_text`` opens a file once, inspects the first
+``SAMPLE_BYTES`` while they are still in the read buffer, and decodes the rest as
+a stream with ``errors="replace"``, so a stray bad byte costs one replacement
+character instead of the whole document.
+
+Detection order, cheapest first:
+
+1. Byte order mark (UTF-8, UTF-16 and UTF-32, LE/BE).
+2. UTF-16 without BOM, recognised by NUL bytes in every other position.
+3. UTF-8 (by far the most common case), tolerating rare stray bytes.
+4. ``charset_normalizer`` on the bounded sample, when installed.
+5. ``FALLBACK_ENCODINGS``, tried strictly in order on the sample.
+6. UTF-8 with replacement characters.
+"""
+
+import codecs
+import io
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+from pydantic import BaseModel
+
+try:
+    from charset_normalizer import from_bytes as _detect_from_bytes
+except ImportError:  # Optional; the fallback list below still covers Big5/GB text
+    _detect_from_bytes = None
+
+# Bytes inspected for detection. They double as the read buffer, so the sample
+# is not read twice.
+SAMPLE_BYTES = 64 * 1024
+
+# Longest BOMs first: the UTF-32-LE BOM starts with the UTF-16-LE one.
+_BOMS: Tuple[Tuple[bytes, str], ...] = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+# Tried in order when no detector is installed (or it gives up). CP950 is the
+# Windows superset of Big5; GB18030 covers GB2312/GBK.
+FALLBACK_ENCODINGS: Tuple[str, ...] = ("cp950", "gb18030")
+
+# Detector results are widened to the superset codec that actually ships in
+# files produced on Windows.
+_SUPERSETS = {"big5": "cp950", "gb2312": "gb18030", "gbk": "gb18030", "ascii": "utf-8", "shift_jis": "cp932"}
+
+# At most this share of even (or odd) bytes may be NUL in the other half of a
+# UTF-16 sample; at least UTF16_MIN_NUL_SHARE of the expected half must be.
+UTF16_MAX_NOISE_SHARE = 0.05
+UTF16_MIN_NUL_SHARE = 0.4
+
+# A sample that is valid UTF-8 apart from a few stray bytes is still UTF-8: at
+# most one undecodable byte per this many well-formed non-ASCII characters.
+# Text in a legacy encoding almost never forms well-formed UTF-8 by accident.
+UTF8_MIN_GOOD_PER_BAD = 50
+
+
+class DetectedEncoding(BaseModel):
+    encoding: str  # Python codec name, e.g. "utf-8", "cp950", "utf-16-le"
+    bom_length: int = 0  # Bytes to skip before decoding
+    source: str  # "bom", "utf16-heuristic", "utf-8", "detector", "fallback" or "default"
+
+
+def _codec_name(encoding: str) -> str:
+    name = codecs.lookup(encoding).name
+    return codecs.lookup(_SUPERSETS.get(name, name)).name
+
+
+def _decodes(sample: bytes, encoding: str, at_eof: bool) -> bool:
+    """Strict incremental decode, so a character cut at the sample end is not an error."""
+    try:
+        codecs.getincrementaldecoder(encoding)(errors="strict").decode(sample, final=at_eof)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def _mostly_utf8(sample: bytes, at_eof: bool) -> bool:
+    text = codecs.getincrementaldecoder("utf-8")(errors="replace").decode(sample, final=at_eof)
+    bad = text.count("\ufffd")
+    good = sum(1 for ch in text if ch > "\x7f") - bad
+    return good >= UTF8_MIN_GOOD_PER_BAD * bad
+
+
+def _sniff_utf16(sample: bytes) -> Optional[str]:
+    pairs = len(sample) // 2
+    if pairs < 2:
+        return None
+    even_nuls = sample[0:pairs * 2:2].count(0)
+    odd_nuls = sample[1:pairs * 2:2].count(0)
+    # ASCII-range text in UTF-16-LE is "x\0x\0...", in UTF-16-BE "\0x\0x..."
+    if odd_nuls >= UTF16_MIN_NUL_SHARE * pairs and even_nuls <= UTF16_MAX_NOISE_SHARE * pairs:
+        return "utf-16-le"
+    if even_nuls >= UTF16_MIN_NUL_SHARE * pairs and odd_nuls <= UTF16_MAX_NOISE_SHARE * pairs:
+        return "utf-16-be"
+    return None
+
+
+def detect_encoding(sample: bytes, at_eof: bool = True) -> DetectedEncoding:
+    """
+    Detects the encoding of ``sample``, the first bytes of a file. ``at_eof``
+    tells whether the sample is the whole file; when it is not, a multibyte
+    character cut off at the end of the sample is not held against an encoding.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return DetectedEncoding(encoding=encoding, bom_length=len(bom), source="bom")
+
+    utf16 = _sniff_utf16(sample)
+    if utf16 is not None:
+        return DetectedEncoding(encoding=utf16, source="utf16-heuristic")
+
+    if _decodes(sample, "utf-8", at_eof) or _mostly_utf8(sample, at_eof):
+        return DetectedEncoding(encoding="utf-8", source="utf-8")
+
+    # Legacy multibyte encodings never use "\n" as a trail byte, so cutting the
+    # sample after its last newline keeps every character whole for the detector.
+    if not at_eof:
+        cut = sample.rfind(b"\n")
+        if cut > 0:
+            sample, at_eof = sample[:cut + 1], True
+
+    if _detect_from_bytes is not None:
+        best = _detect_from_bytes(sample).best()
+        if best is not None and best.encoding:
+            return DetectedEncoding(encoding=_codec_name(best.encoding), source="detector")
+
+    for encoding in FALLBACK_ENCODINGS:
+        if _decodes(sample, encoding, at_eof):
+            return DetectedEncoding(encoding=_codec_name(encoding), source="fallback")
+    return DetectedEncoding(encoding="utf-8", source="default")
+
+
+def open_text(file_path: Path, sample_bytes: int = SAMPLE_BYTES) -> Tuple[io.TextIOWrapper, DetectedEncoding]:
+    """
+    Opens ``file_path`` for reading text in its detected encoding. The returned
+    stream uses universal newlines (like ``open(..., "r")``) and replaces
+    undecodable bytes with U+FFFD. The caller closes it.
+    """
+    raw = open(file_path, "rb", buffering=max(sample_bytes, io.DEFAULT_BUFFER_SIZE))
+    try:
+        # peek() fills the read buffer once; these bytes are decoded later without re-reading
+        sample = raw.peek(sample_bytes)[:sample_bytes]
+        at_eof = len(sample) >= os.fstat(raw.fileno()).st_size
+        detected = detect_encoding(sample, at_eof=at_eof)
+        raw.read(detected.bom_length)
+        return io.TextIOWrapper(raw, encoding=detected.encoding, errors="replace", newline=None), detected
+    except Exception:
+        raw.close()
+        raise
+
+
+def read_text(file_path: Path, sample_bytes: int = SAMPLE_BYTES) -> Tuple[str, DetectedEncoding]:
+    """Reads a whole text file with ``open_text``; returns the text and the detected encoding."""
+    stream, detected = open_text(file_path, sample_bytes)
+    with stream:
+        return stream.read(), detected
+
+
+if __name__ == '__main__':
+    import sys
+
+    for arg in sys.argv[1:]:
+        text, found = read_text(Path(arg))
+        print(f"{arg}: {found.encoding} ({found.source}), {len(text)} chars, "
+              f"{text.count(chr(0xFFFD))} replacement chars")
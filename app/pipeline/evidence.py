@@ -0,0 +1,146 @@
+"""
+Clause-level evidence deduplication and MMR diversification.
+
+Several audit tasks of one clause often retrieve the same procedure chunks.
+The search step therefore stores each retrieved chunk once per project, in
+``ProjectRunData.evidence`` under ``evidence_id_for(embed_set_id)``. The
+clause lists the ids in ``clause.evidence``, and the tasks' ``top_k`` lists
+only hold ``{"evidence_id", "score"}`` references.
+
+Once all tasks of a clause are searched, ``diversify_clause_evidence`` runs
+maximal marginal relevance (MMR) over the clause's evidence. It uses the
+chunk embeddings from the procedure index:
+
+- Evidence is chosen greedily by ``λ * relevance - (1 - λ) * max similarity``
+  to the evidence chosen so far. Relevance is the best score any task gave
+  the chunk.
+- Every task's best evidence is considered before the rest, so each task
+  keeps some evidence before another task gets a second snippet.
+- A chunk nearly identical to one already chosen (cosine at least
+  ``DUPLICATE_SIMILARITY``) is folded into it. Its references are
+  redirected instead of dropped.
+- At most ``budget`` evidence items are kept (0 = no limit).
+
+References to dropped evidence are removed from the tasks, and evidence no
+task references is removed from the clause. The judge therefore sees each
+snippet once, and run.json stores each excerpt once per project.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from app.models.docs import ExternalRegulationClause
+    from app.models.run_data import evidence_id_for
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from app.models.docs import ExternalRegulationClause  # type: ignore
+    from app.models.run_data import evidence_id_for  # type: ignore
+
+# Trade-off between relevance (1.0) and diversity (0.0)
+MMR_LAMBDA = 0.7
+# Chunks at least this similar to chosen evidence count as the same evidence
+DUPLICATE_SIMILARITY = 0.95
+
+
+def _nearest(vector: Optional[np.ndarray], chosen: List[Tuple[str, np.ndarray]]) -> Tuple[float, Optional[str]]:
+    """(max cosine similarity, evidence id) among chosen evidence; (0, None) without vectors."""
+    if vector is None or not chosen:
+        return 0.0, None
+    sims = np.stack([v for _, v in chosen]) @ vector
+    j = int(np.argmax(sims))
+    return float(sims[j]), chosen[j][0]
+
+
+def diversify_clause_evidence(
+    clause: ExternalRegulationClause,
+    vectors: Dict[str, np.ndarray],
+    budget: int = 0,
+    mmr_lambda: float = MMR_LAMBDA,
+    duplicate_similarity: float = DUPLICATE_SIMILARITY
+) -> int:
+    """
+    Deduplicates and diversifies ``clause.evidence`` in place (see the module
+    docstring). ``vectors`` maps evidence ids to unit-length embeddings;
+    evidence without a vector is only deduplicated by id. Returns how many
+    task references were dropped. Legacy ``top_k`` entries (full excerpts,
+    no ``evidence_id``) are left untouched.
+    """
+    listed = set(clause.evidence)
+    relevance: Dict[str, float] = {}
+    first_refs: Dict[str, None] = {}  # Each task's best evidence, in task order
+    for task in clause.tasks:
+        refs = [ref for ref in task.top_k or [] if ref.get("evidence_id") in listed]
+        for ref in refs:
+            score = float(ref.get("score") or 0.0)
+            relevance[ref["evidence_id"]] = max(relevance.get(ref["evidence_id"], score), score)
+        if refs:
+            first_refs.setdefault(refs[0]["evidence_id"])
+    if not relevance:
+        return 0
+
+    chosen: List[str] = []
+    chosen_vectors: List[Tuple[str, np.ndarray]] = []
+    folded: Dict[str, str] = {}
+    for pool in (list(first_refs), [eid for eid in relevance if eid not in first_refs]):
+        while pool and (budget <= 0 or len(chosen) < budget):
+            best_eid, best_value = None, float("-inf")
+            for eid in list(pool):
+                similarity, nearest = _nearest(vectors.get(eid), chosen_vectors)
+                if nearest is not None and similarity >= duplicate_similarity:
+                    folded[eid] = nearest
+                    pool.remove(eid)
+                    continue
+                value = mmr_lambda * relevance[eid] - (1.0 - mmr_lambda) * similarity
+                if value > best_value:
+                    best_eid, best_value = eid, value
+            if best_eid is None:
+                break
+            pool.remove(best_eid)
+            chosen.append(best_eid)
+            vector = vectors.get(best_eid)
+            if vector is not None:
+                chosen_vectors.append((best_eid, vector))
+
+    # Evidence left out by the budget may still duplicate something chosen
+    for eid in relevance:
+        if eid not in folded and eid not in chosen:
+            similarity, nearest = _nearest(vectors.get(eid), chosen_vectors)
+            if nearest is not None and similarity >= duplicate_similarity:
+                folded[eid] = nearest
+
+    kept = set(chosen)
+    dropped = 0
+    for task in clause.tasks:
+        new_refs, seen = [], set()
+        for ref in task.top_k or []:
+            eid = ref.get("evidence_id")
+            if eid not in listed:
+                new_refs.append(ref)  # Legacy entry or unknown reference
+                continue
+            target = eid if eid in kept else folded.get(eid)
+            if target is None or target in seen:
+                dropped += 1
+                continue
+            seen.add(target)
+            new_refs.append(ref if target == eid else {**ref, "evidence_id": target})
+        task.top_k = new_refs
+    clause.evidence = chosen
+    return dropped
+
+
+if __name__ == '__main__':
+    from app.models.docs import AuditTask
+
+    demo = ExternalRegulationClause(id="C1", text="Backups must be tested.", tasks=[
+        AuditTask(id="T1", sentence="backup testing", top_k=[{"evidence_id": "ev_a", "score": 0.9},
+                                                              {"evidence_id": "ev_b", "score": 0.85}]),
+        AuditTask(id="T2", sentence="backup media", top_k=[{"evidence_id": "ev_b", "score": 0.8},
+                                                            {"evidence_id": "ev_c", "score": 0.7}]),
+    ], evidence=["ev_a", "ev_b", "ev_c"])
+    demo_vectors = {"ev_a": np.array([1.0, 0.0]), "ev_b": np.array([0.999, 0.0447]), "ev_c": np.array([0.0, 1.0])}
+    print("dropped:", diversify_clause_evidence(demo, demo_vectors))
+    print({task.id: task.top_k for task in demo.tasks}, list(demo.evidence))
@@ -0,0 +1,306 @@
+"""
+Text extractors for procedure documents, keyed by file suffix.
+
+Each extractor takes ``(file_path, metadata, executor)`` and returns the
+document text. It may add format-specific keys to ``metadata``, such as
+``page_spans`` for PDFs or ``num_rows``/``headers`` for spreadsheets.
+``executor`` is an optional process pool that extractors may use for CPU-heavy
+work; at present only the PDF extractor uses it.
+
+New formats are added with the ``register_extractor`` decorator:
+
+    @register_extractor(".rtf")
+    def extract_rtf(file_path, metadata, executor=None) -> str: ...
+
+DOCX files are read as a stream of parsed XML elements, and XLSX files are
+opened with openpyxl in read-only mode. Memory use therefore stays bounded
+even for very large files.
+"""
+
+import os
+import zipfile
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from pypdf import PdfReader
+
+from app.logger import logger
+from app.pipeline.encoding import read_text
+
+ExtractorFn = Callable[[Path, Dict[str, Any], Optional[Executor]], str]
+
+_EXTRACTORS: Dict[str, ExtractorFn] = {}
+
+
+def register_extractor(*suffixes: str) -> Callable[[ExtractorFn], ExtractorFn]:
+    """Decorator registering ``fn`` for the given suffixes (".pdf", ...); later registrations win."""
+    def decorator(fn: ExtractorFn) -> ExtractorFn:
+        for suffix in suffixes:
+            _EXTRACTORS[suffix.lower()] = fn
+        return fn
+    return decorator
+
+
+def get_extractor(suffix: str) -> Optional[ExtractorFn]:
+    return _EXTRACTORS.get(suffix.lower())
+
+
+def supported_suffixes() -> Tuple[str, ...]:
+    return tuple(sorted(_EXTRACTORS))
+
+
+# ---------------------------------------------------------------------------
+# Plain text
+# ---------------------------------------------------------------------------
+@register_extractor(".txt", ".md")
+def extract_text(file_path: Path, metadata: Dict[str, Any], executor: Optional[Executor] = None) -> str:
+    """
+    Decodes the file in its detected encoding (see ``app.pipeline.encoding``)
+    and records it as ``encoding``. Undecodable bytes become U+FFFD; their
+    count is recorded as ``replaced_chars``.
+    """
+    text, detected = read_text(file_path)
+    metadata["encoding"] = detected.encoding
+    replaced = text.count("\ufffd")
+    if replaced:
+        metadata["replaced_chars"] = replaced
+        logger.warning(f"{file_path}: {replaced} undecodable characters replaced (decoded as {detected.encoding})")
+    return text
+
+
+# ---------------------------------------------------------------------------
+# PDF
+# ---------------------------------------------------------------------------
+# Pages are extracted in ranges of PDF_PAGES_PER_TASK; documents shorter than
+# PDF_PARALLEL_MIN_PAGES are read in-process because starting worker processes
+# costs more than it saves on small files.
+PDF_PAGES_PER_TASK = 8
+PDF_PARALLEL_MIN_PAGES = 24
+# At most this many page ranges per worker are in flight at once. This bounds the
+# work queued ahead of the pages being joined; the joined document text itself is
+# as large as the document (RawDoc.content is a single string).
+PDF_MAX_PENDING_PER_WORKER = 2
+
+# Separator placed between pages in RawDoc.content; page_spans offsets account for it.
+PAGE_SEPARATOR = "\n"
+
+
+def default_pdf_workers() -> int:
+    return max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+def pdf_page_count(file_path: Path) -> int:
+    return len(PdfReader(str(file_path)).pages)
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """
+    Extracts the text of pages [start, stop) of a PDF. This runs in worker
+    processes, so each call opens its own reader. The parsed objects are
+    dropped as soon as the range is done.
+    """
+    reader = PdfReader(file_path)
+    texts: List[str] = []
+    for page_idx in range(start, min(stop, len(reader.pages))):
+        try:
+            texts.append(reader.pages[page_idx].extract_text() or "")
+        except Exception as e:  # A single broken page should not lose the whole document
+            logger.warning(f"Failed to extract text from page {page_idx + 1} of {file_path}: {e}")
+            texts.append("")
+    return texts
+
+
+def iter_pdf_pages(file_path: Path, executor: Optional[Executor] = None,
+                   max_pending: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields ``(page_number, text)`` for every page of a PDF. Page numbers are
+    1-based and come in order.
+
+    With an ``executor`` and a large enough document, page ranges are
+    extracted in parallel. At most ``max_pending`` ranges are submitted ahead
+    of the one being yielded.
+    """
+    num_pages = pdf_page_count(file_path)
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, num_pages))
+              for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+
+    if executor is None or num_pages < PDF_PARALLEL_MIN_PAGES:
+        for start, stop in ranges:
+            for offset, text in enumerate(_extract_page_range(str(file_path), start, stop)):
+                yield start + offset + 1, text
+        return
+
+    workers = getattr(executor, "_max_workers", None) or default_pdf_workers()
+    max_pending = max(1, max_pending or PDF_MAX_PENDING_PER_WORKER * workers)
+    pending = []  # FIFO of (start, future), consumed in page order
+    next_range = 0
+    while next_range < len(ranges) or pending:
+        while next_range < len(ranges) and len(pending) < max_pending:
+            start, stop = ranges[next_range]
+            pending.append((start, executor.submit(_extract_page_range, str(file_path), start, stop)))
+            next_range += 1
+        start, future = pending.pop(0)
+        for offset, text in enumerate(future.result()):
+            yield start + offset + 1, text
+
+
+@register_extractor(".pdf")
+def extract_pdf(file_path: Path, metadata: Dict[str, Any], executor: Optional[Executor] = None) -> str:
+    """
+    Joins the page texts into the document text. Also records ``num_pages`` and
+    ``page_spans`` in ``metadata``. Each span is a ``{"page", "start", "end"}``
+    dict of character offsets into the returned text. The whole text is held
+    in memory: parallel extraction makes large PDFs faster, not smaller.
+    """
+    parts: List[str] = []
+    page_spans: List[Dict[str, int]] = []
+    offset = 0
+    for page_number, text in iter_pdf_pages(file_path, executor):
+        if parts:
+            parts.append(PAGE_SEPARATOR)
+            offset += len(PAGE_SEPARATOR)
+        parts.append(text)
+        page_spans.append({"page": page_number, "start": offset, "end": offset + len(text)})
+        offset += len(text)
+    metadata["num_pages"] = len(page_spans)
+    metadata["page_spans"] = page_spans
+    return "".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# DOCX
+# ---------------------------------------------------------------------------
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_TBL, _W_TR, _W_TC = f"{_W_NS}p", f"{_W_NS}tbl", f"{_W_NS}tr", f"{_W_NS}tc"
+_W_T, _W_TAB, _W_BR, _W_CR = f"{_W_NS}t", f"{_W_NS}tab", f"{_W_NS}br", f"{_W_NS}cr"
+_W_BODY = f"{_W_NS}body"
+
+# Separator between cells when a table row is flattened to one line
+CELL_SEPARATOR = " | "
+
+
+def _paragraph_text(p: ElementTree.Element) -> str:
+    parts: List[str] = []
+    for node in p.iter():
+        if node.tag == _W_T:
+            parts.append(node.text or "")
+        elif node.tag == _W_TAB:
+            parts.append("\t")
+        elif node.tag in (_W_BR, _W_CR):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _table_rows(tbl: ElementTree.Element) -> Iterator[str]:
+    for tr in tbl.findall(_W_TR):
+        cells = [" ".join(filter(None, (_paragraph_text(p).strip() for p in tc.iter(_W_P))))
+                 for tc in tr.findall(_W_TC)]
+        if any(cells):
+            yield CELL_SEPARATOR.join(cells)
+
+
+@register_extractor(".docx")
+def extract_docx(file_path: Path, metadata: Dict[str, Any], executor: Optional[Executor] = None) -> str:
+    """
+    Streams ``word/document.xml`` with iterparse and emits body paragraphs and
+    tables in document order. Each table row becomes one line of cells joined
+    by ``CELL_SEPARATOR``. Elements are cleared once they are handled, so the
+    whole XML tree is never held in memory.
+    """
+    lines: List[str] = []
+    num_paragraphs = num_tables = 0
+    with zipfile.ZipFile(file_path) as package, package.open("word/document.xml") as xml_stream:
+        body = None
+        table_depth = 0
+        for event, elem in ElementTree.iterparse(xml_stream, events=("start", "end")):
+            if event == "start":
+                if elem.tag == _W_BODY:
+                    body = elem
+                elif elem.tag == _W_TBL:
+                    table_depth += 1
+                continue
+            if elem.tag == _W_TBL:
+                table_depth -= 1
+                if table_depth > 0:
+                    continue
+                num_tables += 1
+                lines.extend(_table_rows(elem))
+                lines.append("")
+            elif elem.tag == _W_P and table_depth == 0:
+                num_paragraphs += 1
+                lines.append(_paragraph_text(elem))
+            else:
+                continue
+            # Everything parsed so far has been emitted; drop it.
+            elem.clear()
+            if body is not None:
+                body.clear()
+    metadata["num_paragraphs"] = num_paragraphs
+    metadata["num_tables"] = num_tables
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# XLSX
+# ---------------------------------------------------------------------------
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+@register_extractor(".xlsx", ".xlsm")
+def extract_xlsx(file_path: Path, metadata: Dict[str, Any], executor: Optional[Executor] = None) -> str:
+    """
+    Reads every sheet row by row in openpyxl read-only mode, using cached
+    formula values. Each sheet starts with a ``[sheet name]`` line, and each
+    non-empty row becomes one line of cells joined by ``CELL_SEPARATOR``. The
+    first non-empty row of the first sheet is recorded as ``headers``.
+    """
+    import openpyxl
+
+    lines: List[str] = []
+    num_rows = num_cols = 0
+    headers: Optional[List[str]] = None
+    sheets: List[str] = []
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            sheets.append(sheet.title)
+            if lines:
+                lines.append("")
+            lines.append(f"[{sheet.title}]")
+            for row in sheet.iter_rows(values_only=True):
+                cells = [_cell_text(v) for v in row]
+                while cells and not cells[-1]:
+                    cells.pop()
+                if not cells:
+                    continue
+                if headers is None:
+                    headers = cells
+                num_rows += 1
+                num_cols = max(num_cols, len(cells))
+                lines.append(CELL_SEPARATOR.join(cells))
+    finally:
+        workbook.close()  # read-only workbooks keep the file handle open until closed
+    metadata.update({"num_rows": num_rows, "num_cols": num_cols, "headers": headers, "sheets": sheets})
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import sys
+
+    for arg in sys.argv[1:]:
+        path = Path(arg)
+        extractor = get_extractor(path.suffix)
+        if extractor is None:
+            print(f"{path}: unsupported (supported: {', '.join(supported_suffixes())})")
+            continue
+        meta: Dict[str, Any] = {}
+        text = extractor(path, meta, None)
+        print(f"{path}: {len(text)} chars, metadata keys: {sorted(meta)}")
+        print(text[:500])
@@ -0,0 +1,214 @@
+"""
+Ingestion fingerprint cache.
+
+Each procedure file's ``(absolute path, size, mtime_ns, inode)`` is recorded
+in a small SQLite database, together with the file's SHA-256 and the location
+of its extracted text. When a file's stat still matches on the next run,
+ingestion reuses both: it neither hashes nor re-extracts the file. A file
+that was modified just before it was recorded is re-hashed to confirm it is
+unchanged, but it is still not re-extracted.
+
+The same database holds the per-document ingestion metadata (``document_metadata``
+table: hash, page/row counts, extraction errors, ...). It replaces the old
+``<file>.meta.json`` files that were written next to every source document.
+
+Extracted text is stored once per content hash and ``EXTRACTION_VERSION``
+(gzip JSON under ``extracted/``), so identical files share one entry. Bumping
+the version invalidates every cached extraction after an extractor change.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.app_paths import get_app_data_dir
+from app.logger import logger
+from app.pipeline.cache_backends import ACCESS_RESOLUTION_SECONDS
+
+# Bump when extractor output changes (new metadata keys, different text layout, ...)
+EXTRACTION_VERSION = 2
+
+# Read size used when a file has to be hashed
+HASH_BUFFER_SIZE = 1024 * 1024
+
+# A file modified this close to the moment its fingerprint was recorded may be
+# rewritten again within the same mtime tick without changing size. Such
+# "racy" entries are flagged; the caller re-hashes the file and reuses the
+# extracted text only if the hash still matches (same idea as git's index).
+RACY_WINDOW_NS = 2_000_000_000
+
+
+def hash_file(file_path: Path) -> str:
+    """SHA-256 of a file, read in HASH_BUFFER_SIZE blocks into a reused buffer."""
+    sha256_hash = hashlib.sha256()
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            sha256_hash.update(view[:n])
+    return sha256_hash.hexdigest()
+
+
+class FileFingerprint(BaseModel):
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+
+    @classmethod
+    def of(cls, file_path: Path, stat_result: Optional[os.stat_result] = None) -> "FileFingerprint":
+        st = stat_result or file_path.stat()
+        return cls(path=str(file_path.resolve()), size=st.st_size, mtime_ns=st.st_mtime_ns, inode=st.st_ino)
+
+
+class FingerprintEntry(BaseModel):
+    fingerprint: FileFingerprint
+    sha256: str
+    extracted_path: Optional[str] = None  # Relative to the store's extracted/ directory
+    recorded_at_ns: int
+    racy: bool = False  # Stat matches but cannot be trusted on its own; verify sha256
+
+
+class FingerprintStore:
+    """SQLite-backed fingerprint table plus the extracted-text files it points to. Thread-safe."""
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = root or (get_app_data_dir() / "cache" / "ingest")
+        self.extracted_dir = self.root / "extracted"
+        self.extracted_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "fingerprints.sqlite"
+        self._lock = threading.Lock()
+        # Ingestion runs on a thread pool and the CLI may run several projects in parallel processes.
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_fingerprints ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL, extracted_path TEXT, recorded_at_ns INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS document_metadata ("
+            " path TEXT NOT NULL, doc_type TEXT NOT NULL, sha256 TEXT NOT NULL, metadata_json TEXT NOT NULL,"
+            " updated_at_ns INTEGER NOT NULL, PRIMARY KEY (path, doc_type))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_document_metadata_sha256 ON document_metadata (sha256)")
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    def lookup(self, fingerprint: FileFingerprint) -> Optional[FingerprintEntry]:
+        """Returns the stored entry if the file's stat is unchanged since it was recorded, else None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode, sha256, extracted_path, recorded_at_ns"
+                " FROM file_fingerprints WHERE path = ?", (fingerprint.path,)
+            ).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, inode, sha256, extracted_path, recorded_at_ns = row
+        if (size, mtime_ns, inode) != (fingerprint.size, fingerprint.mtime_ns, fingerprint.inode):
+            return None
+        return FingerprintEntry(fingerprint=fingerprint, sha256=sha256, extracted_path=extracted_path,
+                                recorded_at_ns=recorded_at_ns, racy=recorded_at_ns - mtime_ns < RACY_WINDOW_NS)
+
+    def record(self, fingerprint: FileFingerprint, sha256: str, extracted_path: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_fingerprints"
+                " (path, size, mtime_ns, inode, sha256, extracted_path, recorded_at_ns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint.path, fingerprint.size, fingerprint.mtime_ns, fingerprint.inode,
+                 sha256, extracted_path, time.time_ns()),
+            )
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    def save_document_metadata(self, path: str, doc_type: str, sha256: str, metadata: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO document_metadata (path, doc_type, sha256, metadata_json, updated_at_ns)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (path, doc_type, sha256, json.dumps(metadata, ensure_ascii=False), time.time_ns()),
+            )
+            self._conn.commit()
+
+    def get_document_metadata(self, path: str, doc_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Metadata recorded for ``path`` (most recent across doc types when ``doc_type`` is None)."""
+        query = "SELECT metadata_json FROM document_metadata WHERE path = ?"
+        params: Tuple[Any, ...] = (path,)
+        if doc_type is not None:
+            query += " AND doc_type = ?"
+            params += (doc_type,)
+        with self._lock:
+            row = self._conn.execute(query + " ORDER BY updated_at_ns DESC LIMIT 1", params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def extracted_name(sha256: str) -> str:
+        return f"{sha256}.v{EXTRACTION_VERSION}.json.gz"
+
+    def save_extracted(self, sha256: str, content: str, metadata: Dict[str, Any]) -> str:
+        """Stores extracted text + metadata for a content hash; returns the relative name."""
+        name = self.extracted_name(sha256)
+        target = self.extracted_dir / name
+        if not target.exists():
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            # Level 1: this is a local speed cache, not an archive. Compressing the encoded
+            # bytes in one call avoids gzip.open's text wrapper and its many small writes.
+            data = json.dumps({"content": content, "metadata": metadata}, ensure_ascii=False).encode("utf-8")
+            tmp.write_bytes(gzip.compress(data, compresslevel=1))
+            os.replace(tmp, target)
+        return name
+
+    def load_extracted(self, name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if not name.endswith(f".v{EXTRACTION_VERSION}.json.gz"):
+            return None  # Produced by an older extractor
+        path = self.extracted_dir / name
+        try:
+            data = json.loads(gzip.decompress(path.read_bytes()))
+            # The mtime is the last access time for cache eviction (see app.pipeline.cache_gc)
+            now = time.time()
+            if path.stat().st_mtime < now - ACCESS_RESOLUTION_SECONDS:
+                os.utime(path, (now, now))
+            return data["content"], data["metadata"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable extracted-text cache {path}: {e}")
+            return None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "FingerprintStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = Path(tmp) / "sample.txt"
+        sample.write_text("fingerprint demo", encoding="utf-8")
+        os.utime(sample, ns=(time.time_ns() - 10 * RACY_WINDOW_NS,) * 2)
+        with FingerprintStore(Path(tmp) / "store") as store:
+            fp = FileFingerprint.of(sample)
+            print("before:", store.lookup(fp))
+            digest = hash_file(sample)
+            store.record(fp, digest, store.save_extracted(digest, sample.read_text(encoding="utf-8"), {}))
+            print("after:", store.lookup(fp))
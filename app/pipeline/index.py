@@ -1,7 +1,8 @@
 import json
 import re
+import sqlite3
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import hashlib
 
 import faiss  # type: ignore
@@ -12,10 +13,38 @@ import base64
 # Adjust import based on project structure and PYTHONPATH
 try:
     from app.models.docs import EmbedSet, IndexMeta
+    from app.pipeline.lexical import BM25Index
+    from app.pipeline.tracing import span
 except ImportError:
     import sys
     sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
     from app.models.docs import EmbedSet, IndexMeta  # type: ignore
+    from app.pipeline.lexical import BM25Index  # type: ignore
+    from app.pipeline.tracing import span  # type: ignore
+
+
+# Index metrics, recorded as IndexMeta.metric:
+# - "l2": exhaustive L2 search over the raw vectors, scored 1 / (1 + distance).
+# - "cosine": inner product over L2-normalized float32 vectors. The score is
+#   the cosine similarity itself, comparable across indexes and projects.
+METRIC_L2 = "l2"
+METRIC_COSINE = "cosine"
+INDEX_METRICS = (METRIC_L2, METRIC_COSINE)
+_FAISS_METRICS = {METRIC_L2: faiss.METRIC_L2, METRIC_COSINE: faiss.METRIC_INNER_PRODUCT}
+
+
+def _new_index(dimension: int, metric: str) -> faiss.Index:
+    """Empty exhaustive index for ``metric``, wrapped in IndexIDMap2 so our sequential ids are kept."""
+    base = faiss.IndexFlatIP(dimension) if metric == METRIC_COSINE else faiss.IndexFlatL2(dimension)
+    return faiss.IndexIDMap2(base)
+
+
+def prepare_vectors(embeddings: List[List[float]], metric: str) -> np.ndarray:
+    """float32 matrix of ``embeddings``, L2-normalized in place for cosine indexes (queries included)."""
+    vectors = np.ascontiguousarray(np.asarray(embeddings, dtype='float32'))
+    if metric == METRIC_COSINE and vectors.ndim == 2:
+        faiss.normalize_L2(vectors)  # Zero vectors are left as they are
+    return vectors
 
 
 def _sanitize_filename(name: str) -> str:
@@ -30,7 +59,8 @@ def _create_index_files(
     id_mapping_file_path: Path,
     doc_type: str,
     embedding_model_name: str,
-    vector_dimension: int
+    vector_dimension: int,
+    metric: str = METRIC_L2
 ) -> Optional[IndexMeta]:
     
     print(f"Creating new FAISS index for doc_type '{doc_type}' (model: {embedding_model_name}) at {index_file_path}...")
@@ -39,7 +69,7 @@ def _create_index_files(
         print(f"Error: _create_index_files called with empty all_embed_sets for '{doc_type}'.")
         return None
 
-    embeddings_np = np.array([es.embedding for es in all_embed_sets]).astype('float32')
+    embeddings_np = prepare_vectors([es.embedding for es in all_embed_sets], metric)
     
     # Validate dimensions again, though should match vector_dimension argument
     if embeddings_np.ndim != 2 or embeddings_np.shape[1] != vector_dimension:
@@ -54,13 +84,15 @@ def _create_index_files(
 
     try:
         # Using IndexIDMap2 to associate our sequential numerical_faiss_ids with vectors
-        # IndexFlatL2 performs exhaustive L2 distance search.
-        index = faiss.IndexIDMap2(faiss.IndexFlatL2(vector_dimension))
-        index.add_with_ids(embeddings_np, numerical_faiss_ids)
+        # IndexFlatL2/IndexFlatIP perform exhaustive search.
+        with span("index_build", "index", vectors=len(all_embed_sets), dimension=vector_dimension) as build_span:
+            index = _new_index(vector_dimension, metric)
+            index.add_with_ids(embeddings_np, numerical_faiss_ids)
 
-        faiss.write_index(index, str(index_file_path))
-        with open(id_mapping_file_path, 'w', encoding='utf-8') as f:
-            json.dump(faiss_id_to_embedset_id_map, f, indent=2)  # Store as JSON list
+            faiss.write_index(index, str(index_file_path))
+            with open(id_mapping_file_path, 'w', encoding='utf-8') as f:
+                json.dump(faiss_id_to_embedset_id_map, f, indent=2)  # Store as JSON list
+            build_span.set(bytes=index_file_path.stat().st_size + id_mapping_file_path.stat().st_size)
 
         print(f"Successfully created and saved index for '{doc_type}'. Vectors: {index.ntotal}, Dimension: {index.d}")
         return IndexMeta(
@@ -69,7 +101,8 @@ def _create_index_files(
             doc_type=doc_type,
             num_vectors=index.ntotal,
             vector_dimension=index.d,
-            model_name=embedding_model_name
+            model_name=embedding_model_name,
+            metric=metric
         )
     except Exception as e:
         print(f"Error creating FAISS index for '{doc_type}': {e}")
@@ -87,12 +120,195 @@ def _create_index_files(
         return None
 
 
+def _index_paths(index_dir: Path, doc_type: str, embedding_model_name: str) -> Tuple[Path, Path]:
+    """(.faiss file, id map file) used for a doc_type/model pair."""
+    # 使用 MD5 雜湊來產生安全的檔案名稱
+    base_filename = f"{_sanitize_filename(doc_type)}_{_sanitize_filename(embedding_model_name)}"
+    return index_dir / f"{base_filename}.faiss", index_dir / f"{base_filename}_map.json"
+
+
+def _lexical_index_path(index_file_path: Path) -> Path:
+    """BM25 index file stored next to a .faiss file."""
+    return index_file_path.with_name(f"{index_file_path.stem}_bm25.npz")
+
+
+# Ids per "IN (...)" query of ChunkStore.get_many, below SQLite's host parameter limit
+CHUNK_STORE_BATCH = 500
+
+
+class ChunkStore:
+    """
+    Text and metadata of indexed chunks (EmbedSets without their embedding),
+    kept in a SQLite file next to the index instead of in memory. Retrieval
+    and the evidence table load only the chunks they need (``get_many``).
+    The file is scratch data of one index build: it is recreated empty.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        db_path.unlink(missing_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        # Rebuilt on every run, so durability does not matter
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE chunks (id TEXT PRIMARY KEY, norm_doc_id TEXT NOT NULL, chunk_text TEXT NOT NULL,"
+            " chunk_index INTEGER NOT NULL, total_chunks INTEGER NOT NULL, doc_type TEXT NOT NULL,"
+            " metadata TEXT NOT NULL)"
+        )
+
+    def add(self, embed_sets: List[EmbedSet]) -> None:
+        with self._conn:  # One transaction per batch
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((es.id, es.norm_doc_id, es.chunk_text, es.chunk_index, es.total_chunks, es.doc_type,
+                  json.dumps(es.metadata, ensure_ascii=False)) for es in embed_sets))
+
+    def get_many(self, embed_set_ids: List[str]) -> Dict[str, EmbedSet]:
+        """Text-only EmbedSets (``embedding`` is empty) of the ids that are stored."""
+        ids = list(dict.fromkeys(embed_set_ids))
+        found: Dict[str, EmbedSet] = {}
+        for start in range(0, len(ids), CHUNK_STORE_BATCH):
+            batch = ids[start:start + CHUNK_STORE_BATCH]
+            rows = self._conn.execute(
+                f"SELECT id, norm_doc_id, chunk_text, chunk_index, total_chunks, doc_type, metadata FROM chunks"
+                f" WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall()
+            for es_id, norm_doc_id, chunk_text, chunk_index, total_chunks, doc_type, metadata in rows:
+                found[es_id] = EmbedSet(id=es_id, norm_doc_id=norm_doc_id, chunk_text=chunk_text, embedding=[],
+                                        chunk_index=chunk_index, total_chunks=total_chunks, doc_type=doc_type,
+                                        metadata=json.loads(metadata))
+        return found
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class IndexBuilder:
+    """
+    Builds an index incrementally as EmbedSets stream in (see
+    ``embed.iter_embedded_documents``), so the caller never needs the
+    complete list of EmbedSets, or their Python-float embeddings, in memory.
+
+    Vectors are appended to an in-memory ``IndexIDMap2`` flat index (L2, or
+    inner product over normalized vectors for ``metric="cosine"``) as
+    float32. ``finish()`` writes the index files; the pipeline builds them in
+    a scratch directory that lasts one search step, so they are always
+    rewritten. ``index``, ``ids`` and ``chunks_for`` can be passed to
+    ``retrieve_similar_chunks`` directly.
+
+    Chunk texts are not kept in memory: they go into a ``ChunkStore`` next to
+    the index, and ``chunks_for`` loads the ones a caller asks for. Call
+    ``close()`` before deleting the index directory.
+
+    With ``lexical=True`` the chunk texts also go into a ``BM25Index``
+    (``lexical``) whose document numbers are the FAISS ids. It is saved next to
+    the index files for the hybrid retrieval engines.
+    """
+
+    def __init__(self, index_dir: Path, doc_type: str, embedding_model_name: str, lexical: bool = False,
+                 metric: str = METRIC_L2):
+        index_dir.mkdir(parents=True, exist_ok=True)
+        if metric not in INDEX_METRICS:
+            print(f"Warning: Unknown index metric '{metric}' for '{doc_type}'; using '{METRIC_L2}'.")
+            metric = METRIC_L2
+        self.metric = metric
+        self.index_file_path, self.id_mapping_file_path = _index_paths(index_dir, doc_type, embedding_model_name)
+        self.lexical_index_path = _lexical_index_path(self.index_file_path)
+        self.doc_type = doc_type
+        self.embedding_model_name = embedding_model_name
+        self.index: Optional[faiss.Index] = None
+        self.ids: List[str] = []
+        self._positions: Dict[str, int] = {}  # EmbedSet id -> FAISS id, built on demand
+        self.lexical: Optional[BM25Index] = BM25Index() if lexical else None
+        self.chunks = ChunkStore(self.index_file_path.with_name(f"{self.index_file_path.stem}_chunks.sqlite3"))
+
+    def add(self, embed_sets: List[EmbedSet]) -> int:
+        """Adds the EmbedSets' vectors; returns how many were added (sets with a wrong dimension are skipped)."""
+        usable = [es for es in embed_sets if es.embedding]
+        if not usable:
+            return 0
+        if self.index is None:
+            self.index = _new_index(len(usable[0].embedding), self.metric)
+        dimension = self.index.d
+        skipped = [es.id for es in usable if len(es.embedding) != dimension]
+        if skipped:
+            print(f"Warning: Skipping {len(skipped)} embed sets whose dimension differs from {dimension} for '{self.doc_type}'.")
+            usable = [es for es in usable if len(es.embedding) == dimension]
+            if not usable:
+                return 0
+        with span("index_build", "index", vectors=len(usable), dimension=dimension):
+            vectors = prepare_vectors([es.embedding for es in usable], self.metric)
+            numerical_faiss_ids = np.arange(len(self.ids), len(self.ids) + len(usable), dtype=np.int64)
+            self.index.add_with_ids(vectors, numerical_faiss_ids)
+        if self.lexical is not None:
+            self.lexical.add(es.chunk_text for es in usable)
+        self.chunks.add(usable)
+        self.ids.extend(es.id for es in usable)
+        return len(usable)
+
+    def chunks_for(self, embed_set_ids: List[str]) -> Dict[str, EmbedSet]:
+        """Text-only EmbedSets of indexed chunks, keyed by id; for retrieval and evidence excerpts."""
+        return self.chunks.get_many(embed_set_ids)
+
+    def close(self) -> None:
+        self.chunks.close()
+
+    def vectors_for(self, embed_set_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Unit-length float32 vectors of indexed EmbedSets, keyed by id; ids not in the index are omitted."""
+        if self.index is None:
+            return {}
+        if len(self._positions) != len(self.ids):
+            self._positions = {es_id: position for position, es_id in enumerate(self.ids)}
+        found = [(es_id, self._positions[es_id]) for es_id in dict.fromkeys(embed_set_ids) if es_id in self._positions]
+        if not found:
+            return {}
+        vectors = np.stack([self.index.reconstruct(position) for _, position in found]).astype('float32')
+        faiss.normalize_L2(vectors)  # Already unit length for cosine indexes
+        return {es_id: vectors[row] for row, (es_id, _) in enumerate(found)}
+
+    def finish(self) -> Optional[IndexMeta]:
+        """Writes the index files and returns their IndexMeta; None when empty."""
+        if self.index is None or not self.ids:
+            print(f"Warning: No embed sets provided for doc_type '{self.doc_type}' (model: {self.embedding_model_name}). Cannot build index.")
+            return None
+        try:
+            with span("index_build", "index", vectors=0, dimension=self.index.d) as build_span:
+                faiss.write_index(self.index, str(self.index_file_path))
+                with open(self.id_mapping_file_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.ids, f, indent=2)  # Store as JSON list
+                written = self.index_file_path.stat().st_size + self.id_mapping_file_path.stat().st_size
+                if self.lexical is not None:
+                    self.lexical.save(self.lexical_index_path)
+                    written += self.lexical_index_path.stat().st_size
+                build_span.set(bytes=written)
+        except Exception as e:
+            print(f"Error writing FAISS index for '{self.doc_type}': {e}")
+            for path in (self.index_file_path, self.id_mapping_file_path, self.lexical_index_path):
+                try:
+                    path.unlink(missing_ok=True)
+                except OSError:
+                    print(f"Warning: Could not delete partial index file {path}")
+            return None
+        print(f"Successfully created and saved index for '{self.doc_type}'. Vectors: {self.index.ntotal}, Dimension: {self.index.d}")
+        return IndexMeta(
+            index_file_path=self.index_file_path.resolve(),
+            id_mapping_path=self.id_mapping_file_path.resolve(),
+            doc_type=self.doc_type,
+            num_vectors=self.index.ntotal,
+            vector_dimension=self.index.d,
+            model_name=self.embedding_model_name,
+            metric=self.metric,
+            lexical_index_path=self.lexical_index_path.resolve() if self.lexical is not None else None
+        )
+
+
 def create_or_load_index(
     all_embed_sets: List[EmbedSet], 
     index_dir: Path, 
     doc_type: str, 
     embedding_model_name: str,
-    force_recreate: bool = False
+    force_recreate: bool = False,
+    metric: str = METRIC_L2
 ) -> Optional[IndexMeta]:
 
     if not all_embed_sets:
@@ -100,12 +316,11 @@ def create_or_load_index(
         return None
 
     index_dir.mkdir(parents=True, exist_ok=True)
+    if metric not in INDEX_METRICS:
+        print(f"Warning: Unknown index metric '{metric}' for '{doc_type}'; using '{METRIC_L2}'.")
+        metric = METRIC_L2
 
-    # 使用 MD5 雜湊來產生安全的檔案名稱
-    safe_model_name = _sanitize_filename(embedding_model_name)
-    base_filename = f"{_sanitize_filename(doc_type)}_{safe_model_name}"
-    index_file_path = index_dir / f"{base_filename}.faiss"
-    id_mapping_file_path = index_dir / f"{base_filename}_map.json"
+    index_file_path, id_mapping_file_path = _index_paths(index_dir, doc_type, embedding_model_name)
 
     # Determine vector dimension from the first EmbedSet
     # Assuming all embeddings in the list have the same dimension, which should be guaranteed by earlier steps.
@@ -128,14 +343,18 @@ def create_or_load_index(
             if not isinstance(loaded_id_map, list):
                 raise ValueError("ID mapping file is not a list as expected.")
 
+            if index.metric_type != _FAISS_METRICS.get(metric):
+                print(f"Warning: Index metric differs from '{metric}'. Recreating index.")
+                return _create_index_files(all_embed_sets, index_file_path, id_mapping_file_path, doc_type, embedding_model_name, vector_dimension, metric)
+
             if index.d != vector_dimension:
                 print(f"Warning: Index dimension mismatch. Loaded index has dimension {index.d}, "
                       f"but current embeddings have dimension {vector_dimension}. Recreating index.")
-                return _create_index_files(all_embed_sets, index_file_path, id_mapping_file_path, doc_type, embedding_model_name, vector_dimension)
+                return _create_index_files(all_embed_sets, index_file_path, id_mapping_file_path, doc_type, embedding_model_name, vector_dimension, metric)
 
             if index.ntotal != len(loaded_id_map):
                 print(f"Warning: Index vector count ({index.ntotal}) does not match ID map length ({len(loaded_id_map)}). Recreating index.")
-                return _create_index_files(all_embed_sets, index_file_path, id_mapping_file_path, doc_type, embedding_model_name, vector_dimension)
+                return _create_index_files(all_embed_sets, index_file_path, id_mapping_file_path, doc_type, embedding_model_name, vector_dimension, metric)
             
             # Basic check: Ensure all EmbedSet IDs from input are in the loaded map if counts match.
             # This isn't a perfect check for content match but adds some safety.
@@ -145,7 +364,7 @@ def create_or_load_index(
                 print("Warning: Current EmbedSet IDs differ from loaded ID map. Recreating index.")
                 return _create_index_files(
                     all_embed_sets, index_file_path, id_mapping_file_path,
-                    doc_type, embedding_model_name, vector_dimension
+                    doc_type, embedding_model_name, vector_dimension, metric
                 )
 
             print(f"Successfully loaded index for '{doc_type}'. Vectors: {index.ntotal}, Dimension: {index.d}")
@@ -155,13 +374,14 @@ def create_or_load_index(
                 doc_type=doc_type,
                 num_vectors=index.ntotal,
                 vector_dimension=index.d,
-                model_name=embedding_model_name 
+                model_name=embedding_model_name,
+                metric=metric
             )
         except Exception as e:
             print(f"Error loading existing index for '{doc_type}': {e}. Will attempt to recreate.")
             # Fall through to recreate by calling _create_index_files
 
-    return _create_index_files(all_embed_sets, index_file_path, id_mapping_file_path, doc_type, embedding_model_name, vector_dimension)
+    return _create_index_files(all_embed_sets, index_file_path, id_mapping_file_path, doc_type, embedding_model_name, vector_dimension, metric)
 
 
 if __name__ == '__main__':
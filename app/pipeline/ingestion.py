@@ -1,9 +1,10 @@
-import hashlib
-import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Deque, Iterable, Iterator, List, Dict, Any, Optional, Tuple
 import pandas as pd
-from pypdf import PdfReader
 
 from app.logger import logger # Add this import
 
@@ -11,6 +12,9 @@ from app.logger import logger # Add this import
 # If running this file directly for testing, sys.path adjustments might be needed.
 try:
     from app.models.docs import RawDoc
+    from app.pipeline import extractors
+    from app.pipeline.fingerprints import FileFingerprint, FingerprintStore, hash_file
+    from app.pipeline.tracing import incr, span
 except ImportError:
     # Fallback for direct execution/testing if 'app' is not in PYTHONPATH
     # This is a common pattern but might need adjustment based on actual project structure and test setup
@@ -18,39 +22,167 @@ except ImportError:
     # Assuming the script is in app/pipeline/, to import app.models.docs, we need to go up two levels
     sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
     from app.models.docs import RawDoc
+    from app.pipeline import extractors  # type: ignore
+    from app.pipeline.fingerprints import FileFingerprint, FingerprintStore, hash_file  # type: ignore
+    from app.pipeline.tracing import incr, span  # type: ignore
 
 
 def _calculate_file_hash(file_path: Path) -> str:
     """Reads a file in binary mode by chunks and calculates its SHA-256 hash."""
-    sha256_hash = hashlib.sha256()
     try:
-        with open(file_path, "rb") as f:
-            # Read and update hash string value in blocks of 4K
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        # 1 MiB reads into a reused buffer; the old 4 KB loop dominated start-up on large repositories
+        return hash_file(file_path)
     except IOError as e:
         logger.error(f"Error reading file {file_path} for hashing: {e}")
         return ""  # Return empty string or raise error
 
 
-def ingest_documents(procedure_pdf_paths: List[Path], doc_type: str) -> List[RawDoc]:
-    raw_docs: List[RawDoc] = []
+# Files are extracted on a thread pool of at most this many workers (XLSX/DOCX
+# parsing releases the GIL for zip decompression and I/O; large PDFs
+# additionally fan pages out over a process pool).
+DEFAULT_FILE_WORKERS = 4
 
+
+def _needs_pdf_pool(paths: List[Path], store: Optional[FingerprintStore]) -> bool:
+    for file_path in paths:
+        if file_path.suffix.lower() != ".pdf" or not file_path.is_file():
+            continue
+        if store is not None:
+            entry = store.lookup(FileFingerprint.of(file_path))
+            if entry is not None and entry.extracted_path:
+                continue  # Extracted text will come from the cache
+        try:
+            if extractors.pdf_page_count(file_path) >= extractors.PDF_PARALLEL_MIN_PAGES:
+                return True
+        except Exception:
+            pass  # Reported when the file itself is ingested
+    return False
+
+
+def ingest_documents(procedure_pdf_paths: List[Path], doc_type: str,
+                     pdf_workers: Optional[int] = None, file_workers: Optional[int] = None,
+                     fingerprint_store: Optional[FingerprintStore] = None,
+                     use_fingerprint_cache: bool = True) -> List[RawDoc]:
+    """
+    Reads procedure documents into RawDocs through the extractor registry
+    (see ``app.pipeline.extractors``); the result keeps the input order.
+
+    Files are extracted concurrently on ``file_workers`` threads. Large PDFs
+    also share a pool of ``pdf_workers`` processes (default: CPU count - 1,
+    capped at 4; 0 or 1 extracts in-process) that is only started when needed.
+
+    Unless ``use_fingerprint_cache`` is False, files whose (path, size,
+    mtime_ns, inode) match the fingerprint store are neither hashed nor
+    re-extracted (see ``app.pipeline.fingerprints``).
+    """
     if not procedure_pdf_paths:
         logger.warning("No procedure PDF paths provided.")
-        return raw_docs
+        return []
+    return list(iter_ingest_documents(procedure_pdf_paths, doc_type, pdf_workers, file_workers,
+                                      fingerprint_store, use_fingerprint_cache))
 
-    for file_path in procedure_pdf_paths:
-        if not file_path.is_file() or file_path.suffix.lower() not in [".txt", ".md"]:
-            logger.warning(f"Skipping non-TXT/MD or non-existent file: {file_path}")
-            continue
 
+def iter_ingest_documents(procedure_paths: Iterable[Path], doc_type: str,
+                          pdf_workers: Optional[int] = None, file_workers: Optional[int] = None,
+                          fingerprint_store: Optional[FingerprintStore] = None,
+                          use_fingerprint_cache: bool = True,
+                          max_pending: Optional[int] = None) -> Iterator[RawDoc]:
+    """
+    Streaming form of ``ingest_documents``: yields RawDocs in input order as
+    they are extracted. At most ``max_pending`` files (default: two per
+    worker) are extracted ahead of the consumer, so a slow consumer holds
+    back ingestion instead of letting extracted text pile up in memory.
+    Closing the generator early cancels the files not started yet.
+    """
+    paths = list(procedure_paths)
+    if not paths:
+        return
+    workers = extractors.default_pdf_workers() if pdf_workers is None else pdf_workers
+    file_workers = max(1, min(len(paths), file_workers or DEFAULT_FILE_WORKERS))
+    max_pending = max(1, max_pending or 2 * file_workers)
+    store = fingerprint_store
+    owns_store = False
+    if store is None and use_fingerprint_cache:
+        try:
+            store = FingerprintStore()
+            owns_store = True
+        except Exception as e:  # A broken cache must never block ingestion
+            logger.warning(f"Fingerprint cache unavailable, hashing every file: {e}")
+    pdf_executor: Optional[ProcessPoolExecutor] = None
+    pool: Optional[ThreadPoolExecutor] = None
+    try:
+        if workers > 1 and _needs_pdf_pool(paths, store):
+            # "spawn" avoids forking a process that may be running Qt or other threads.
+            pdf_executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        if file_workers == 1:
+            for p in paths:
+                with span("ingest", "stage", files=1) as ingest_span:
+                    doc = _ingest_file(p, doc_type, pdf_executor, store)
+                    ingest_span.set(chars=len(doc.content) if doc else 0)
+                if doc is not None:
+                    yield doc
+            return
+
+        pool = ThreadPoolExecutor(max_workers=file_workers, thread_name_prefix="ingest")
+        pending: Deque[Future] = deque()
+        remaining = iter(paths)
+        while True:
+            for p in islice(remaining, max_pending - len(pending)):
+                pending.append(pool.submit(_ingest_file, p, doc_type, pdf_executor, store))
+            if not pending:
+                break
+            # The span measures how long the consumer waited on ingestion
+            with span("ingest", "stage", files=1) as ingest_span:
+                doc = pending.popleft().result()
+                ingest_span.set(chars=len(doc.content) if doc else 0)
+            if doc is not None:
+                yield doc
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if pdf_executor is not None:
+            pdf_executor.shutdown(wait=True, cancel_futures=True)
+        if owns_store:
+            store.close()
+
+
+def _load_cached_extraction(file_path: Path, fingerprint: FileFingerprint,
+                            store: FingerprintStore) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """Returns (sha256, content, metadata) for an unchanged file, or None if it must be re-read."""
+    entry = store.lookup(fingerprint)
+    if entry is None or not entry.extracted_path:
+        return None
+    if entry.racy and _calculate_file_hash(file_path) != entry.sha256:
+        return None
+    cached = store.load_extracted(entry.extracted_path)
+    if cached is None:
+        return None
+    if entry.racy:
+        store.record(fingerprint, entry.sha256, entry.extracted_path)  # Now verified; trust the stat next time
+    return (entry.sha256,) + cached
+
+
+def _ingest_file(file_path: Path, doc_type: str, executor: Optional[Executor],
+                 store: Optional[FingerprintStore] = None) -> Optional[RawDoc]:
+    extractor = extractors.get_extractor(file_path.suffix)
+    if not file_path.is_file() or extractor is None:
+        logger.warning(f"Skipping unsupported or non-existent file: {file_path}")
+        return None
+
+    fingerprint = FileFingerprint.of(file_path) if store is not None else None
+    cached = _load_cached_extraction(file_path, fingerprint, store) if store is not None else None
+    if cached is not None:
+        incr("ingest_fingerprint_hits")
+        file_hash, content, metadata = cached
+        # The cache is keyed by content; the name may differ between identical files
+        metadata.update(original_filename=file_path.name, file_type=file_path.suffix.lower())
+    else:
+        if store is not None:
+            incr("ingest_fingerprint_misses")
         file_hash = _calculate_file_hash(file_path)
         if not file_hash:
             logger.warning(f"Skipping file due to hashing error: {file_path}")
-            continue
-
+            return None
         content = ""
         metadata: Dict[str, Any] = {
             "original_filename": file_path.name,
@@ -58,57 +190,66 @@ def ingest_documents(procedure_pdf_paths: List[Path], doc_type: str) -> List[Raw
             "errors": []
         }
 
-        try:
-            abs_file_path = file_path.resolve()
-
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                # Optionally, add line count to metadata if useful
-                # metadata["num_lines"] = content.count('\n') + 1
-            except Exception as e:
-                logger.error(f"Error processing TXT {file_path}: {e}")
-                metadata["errors"].append(f"TXT processing error: {str(e)}")
-                content = ""
-
-            logger.info(f"Ingesting file: {file_path}, Exists: {file_path.exists()}, Size: {file_path.stat().st_size if file_path.exists() else 'N/A'}")
-            logger.debug(f"Content preview (first 50 chars): {content[:50]}")
-            raw_doc_instance = RawDoc(
-                id=file_hash,
-                source_path=abs_file_path,
-                content=content,
-                metadata=metadata.copy(),
-                doc_type=doc_type
-            )
-            raw_docs.append(raw_doc_instance)
-
-            meta_json_path = file_path.parent / f"{file_path.name}.meta.json"
-            meta_json_content = {
-                "file_sha256": file_hash,
-                "source_path": str(abs_file_path),
-                "original_filename": file_path.name,
-                "doc_type": doc_type,
-                "num_rows": metadata.get("num_rows"),
-                "num_cols": metadata.get("num_cols"),
-                "headers": metadata.get("headers"),
-                "errors": metadata.get("errors")
-            }
-            meta_json_content = {k: v for k, v in meta_json_content.items() if v is not None}
-            # Ensure metadata dictionary itself doesn't carry over "num_pages"
-            if "num_pages" in metadata:
-                del metadata["num_pages"]
-            
-            try:
-                with open(meta_json_path, 'w', encoding='utf-8') as meta_f:
-                    json.dump(meta_json_content, meta_f, indent=4)
-            except IOError as e:
-                logger.error(f"Error writing .meta.json for {file_path}: {e}")
+    try:
+        abs_file_path = file_path.resolve()
+
+        if cached is None:
+            with span("extract_file", "ingest", file_type=metadata["file_type"]) as extract_span:
+                try:
+                    content = extractor(file_path, metadata, executor)
+                except Exception as e:
+                    file_kind = metadata["file_type"].lstrip(".").upper()
+                    logger.error(f"Error processing {file_kind} {file_path}: {e}")
+                    metadata["errors"].append(f"{file_kind} processing error: {str(e)}")
+                    metadata.pop("page_spans", None)
+                    content = ""
+                extract_span.set(chars=len(content))
+            if store is not None and not metadata["errors"]:
+                try:
+                    store.record(fingerprint, file_hash, store.save_extracted(file_hash, content, metadata))
+                except Exception as e:
+                    logger.warning(f"Could not cache extracted text for {file_path}: {e}")
 
+        logger.info(f"Ingesting file: {file_path}, Exists: {file_path.exists()}, Size: {file_path.stat().st_size if file_path.exists() else 'N/A'}")
+        logger.debug(f"Content preview (first 50 chars): {content[:50]}")
+        raw_doc_instance = RawDoc(
+            id=file_hash,
+            source_path=abs_file_path,
+            content=content,
+            metadata=metadata.copy(),
+            doc_type=doc_type
+        )
+
+        # Ingestion metadata lives in the fingerprint store inside the app data
+        # directory (never next to the source file) and is only rewritten when
+        # the file changed, or was never recorded under this doc_type.
+        if store is None:
+            return raw_doc_instance
+        if cached is not None and store.get_document_metadata(str(abs_file_path), doc_type) is not None:
+            return raw_doc_instance
+        doc_metadata = {
+            "file_sha256": file_hash,
+            "source_path": str(abs_file_path),
+            "original_filename": file_path.name,
+            "doc_type": doc_type,
+            "num_pages": metadata.get("num_pages"),  # PDFs only
+            "num_rows": metadata.get("num_rows"),  # Spreadsheets only
+            "num_cols": metadata.get("num_cols"),
+            "headers": metadata.get("headers"),
+            "errors": metadata.get("errors")
+        }
+        doc_metadata = {k: v for k, v in doc_metadata.items() if v is not None}
+
+        try:
+            store.save_document_metadata(str(abs_file_path), doc_type, file_hash, doc_metadata)
         except Exception as e:
-            logger.error(f"Unhandled exception processing file {file_path}: {e}")
-            continue
+            logger.error(f"Error saving ingestion metadata for {file_path}: {e}")
+
+        return raw_doc_instance
 
-    return raw_docs
+    except Exception as e:
+        logger.error(f"Unhandled exception processing file {file_path}: {e}")
+        return None
 
 
 if __name__ == '__main__':
@@ -138,11 +279,11 @@ if __name__ == '__main__':
     procedure_txt_list.append(txt_path2)
     logger.info(f"Created a dummy TXT: {txt_path2.name}")
     
-    # Create a TXT file with non-utf-8 content to test error handling
+    # Create a TXT file with non-utf-8 content to exercise encoding detection
     error_txt_path = sub_dir_procedures_pdfs / "error_doc.txt"
     try:
         with open(error_txt_path, 'wb') as f_err:
-            f_err.write(b'\xff\xfe\x00\x00This is not valid UTF-8') # Example: UTF-16 BOM with non-UTF-8 chars
+            f_err.write(b'\xff\xfe\x00\x00This is not valid UTF-8') # UTF-32-LE BOM followed by bytes that do not form UTF-32 (decoded with replacements)
         procedure_txt_list.append(error_txt_path)
         logger.info(f"Created a dummy TXT with invalid encoding: {error_txt_path.name}")
     except Exception as e_create:
@@ -164,15 +305,12 @@ if __name__ == '__main__':
 
     logger.info(f"\nIngesting 'procedure' TXT documents from list: {procedure_txt_list}")
     procedure_docs = ingest_documents(procedure_txt_list, "procedure") # Pass list of paths
-    for doc in procedure_docs:
-        logger.info(f"  RawDoc ID: {doc.id}, Source: {doc.source_path.name}, Type: {doc.doc_type}, Metadata: {doc.metadata}")
-        meta_json_file = doc.source_path.parent / f"{doc.source_path.name}.meta.json"
-        logger.info(f"  Meta JSON exists: {meta_json_file.exists()}")
-        if meta_json_file.exists():
-            with open(meta_json_file, 'r') as f_meta:
-                loaded_meta = json.load(f_meta)
-                logger.info(f"  Meta JSON content: {loaded_meta}")
-                assert "num_pages" not in loaded_meta # Ensure num_pages is not in the meta file
+    with FingerprintStore() as metadata_store:
+        for doc in procedure_docs:
+            logger.info(f"  RawDoc ID: {doc.id}, Source: {doc.source_path.name}, Type: {doc.doc_type}, Metadata: {doc.metadata}")
+            stored_meta = metadata_store.get_document_metadata(str(doc.source_path), doc.doc_type)
+            logger.info(f"  Stored metadata: {stored_meta}")
+            assert not (doc.source_path.parent / f"{doc.source_path.name}.meta.json").exists()
 
     # Test with a non-existent directory (now an empty list or list with non-existent paths)
     logger.info("\nIngesting from a list with a non-existent TXT path:")
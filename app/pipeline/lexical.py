@@ -0,0 +1,177 @@
+"""
+BM25 inverted index over procedure chunks.
+
+Dense retrieval tends to miss exact terms such as job titles (資通安全長),
+short keywords (備份) or article numbers (5.1.2). This index complements it
+and is used by the hybrid retrieval engines in ``app.pipeline.retrieve``.
+
+Tokenization is CJK-aware and needs no dictionary:
+
+- The text is NFKC-folded, so full-width digits and letters match their ASCII forms.
+- Runs of Han, Kana or Hangul characters become overlapping character bigrams.
+  A single character on its own is kept as a unigram.
+- Latin words are lower-cased.
+- Dotted or dashed numbers (``5.1.2``, ``27001-2``) are kept whole.
+
+Documents are numbered in insertion order, so a document's number equals its
+FAISS id when both indexes are built together by ``IndexBuilder``.
+Postings are collected in compact arrays while documents are added.
+``freeze()`` packs them into CSR-style numpy arrays. Those arrays are what
+``save``/``load`` persist (one ``.npz`` file) and what ``search`` scores
+with vectorized BM25.
+"""
+
+import math
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from app.pipeline.tracing import span
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from app.pipeline.tracing import span  # type: ignore
+
+# Bump when tokenize() changes; indexes written by another version are rebuilt.
+LEXICAL_TOKENIZER_VERSION = 1
+
+# Standard BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_CJK_RANGES = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"  # Han, Kana, Hangul
+RE_TOKEN = re.compile(rf"(?P<num>\d+(?:[.\-]\d+)*)|(?P<word>[^\W\d_{_CJK_RANGES}]+)|(?P<cjk>[{_CJK_RANGES}]+)")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into BM25 terms: CJK bigrams, lower-cased words and whole numbers."""
+    tokens: List[str] = []
+    for match in RE_TOKEN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        run = match.group("cjk")
+        if run is None:
+            tokens.append(match.group())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """Incrementally built, persistable BM25 index; see the module docstring."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        # Build-time postings: term -> interleaved (doc, tf) pairs
+        self._pending: Dict[str, array] = {}
+        self._doc_lengths = array("I")
+        # Frozen CSR form, set by freeze() or load()
+        self._term_rows: Optional[Dict[str, int]] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._docs: Optional[np.ndarray] = None
+        self._tfs: Optional[np.ndarray] = None
+        self._lengths: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths) if self._lengths is None else len(self._lengths)
+
+    def add(self, texts: Iterable[str]) -> None:
+        """Adds documents; they are numbered after the ones already added."""
+        if self._lengths is not None:
+            raise RuntimeError("BM25Index is frozen; no documents can be added")
+        with span("lexical_index_build", "index") as build_span:
+            added = 0
+            for text in texts:
+                doc = len(self._doc_lengths)
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    postings = self._pending.get(term)
+                    if postings is None:
+                        postings = self._pending[term] = array("I")
+                    postings.append(doc)
+                    postings.append(tf)
+                self._doc_lengths.append(sum(counts.values()))
+                added += 1
+            build_span.set(docs=added)
+
+    def freeze(self) -> "BM25Index":
+        """Packs the postings into numpy arrays; called implicitly by search() and save()."""
+        if self._lengths is not None:
+            return self
+        terms = sorted(self._pending)
+        sizes = np.fromiter((len(self._pending[t]) // 2 for t in terms), dtype=np.int64, count=len(terms))
+        self._offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        pairs = np.frombuffer(b"".join(self._pending[t].tobytes() for t in terms), dtype=np.uint32)
+        self._docs = pairs[0::2].astype(np.int32)
+        self._tfs = pairs[1::2].astype(np.float32)
+        self._lengths = np.frombuffer(self._doc_lengths.tobytes(), dtype=np.uint32).astype(np.float32)
+        self._term_rows = {term: row for row, term in enumerate(terms)}
+        self._pending = {}
+        return self
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top ``k`` ``(document number, BM25 score)`` pairs, best first; documents sharing no term are omitted."""
+        self.freeze()
+        num_docs = len(self._lengths)
+        if k <= 0 or num_docs == 0:
+            return []
+        with span("lexical_search", "search", k=k, docs=num_docs):
+            avg_length = float(self._lengths.mean()) or 1.0
+            scores = np.zeros(num_docs, dtype=np.float32)
+            for term in dict.fromkeys(tokenize(query)):  # Unique terms, query order
+                row = self._term_rows.get(term)
+                if row is None:
+                    continue
+                start, stop = self._offsets[row], self._offsets[row + 1]
+                docs, tfs = self._docs[start:stop], self._tfs[start:stop]
+                df = stop - start
+                idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[docs] / avg_length)
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)  # A term occurs once per doc in its postings
+            hits = np.flatnonzero(scores)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            # Best first; ties go to the earlier document so results are deterministic
+            hits = hits[np.lexsort((hits, -scores[hits]))]
+            return [(int(doc), float(scores[doc])) for doc in hits]
+
+    def save(self, path: Path) -> None:
+        self.freeze()
+        terms = sorted(self._term_rows, key=self._term_rows.__getitem__)
+        with open(path, "wb") as f:
+            np.savez(f, version=np.array([LEXICAL_TOKENIZER_VERSION]), params=np.array([self.k1, self.b]),
+                     terms=np.array(terms, dtype=str), offsets=self._offsets, docs=self._docs, tfs=self._tfs,
+                     lengths=self._lengths)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        """Loads an index written by ``save``; raises ValueError for another tokenizer version."""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"][0]) != LEXICAL_TOKENIZER_VERSION:
+                raise ValueError(f"{path} was built with lexical tokenizer v{int(data['version'][0])}, "
+                                 f"expected v{LEXICAL_TOKENIZER_VERSION}")
+            k1, b = (float(v) for v in data["params"])
+            index = cls(k1=k1, b=b)
+            index._term_rows = {str(term): row for row, term in enumerate(data["terms"])}
+            index._offsets, index._docs, index._tfs = data["offsets"], data["docs"], data["tfs"]
+            index._lengths = data["lengths"]
+        return index
+
+
+if __name__ == '__main__':
+    demo = BM25Index()
+    demo.add([
+        "資通安全長應每年檢討資通安全政策。",
+        "Backups (備份) are tested monthly per clause 5.1.2.",
+        "存取權限每季審查一次。",
+    ])
+    print(tokenize("資通安全長 ＩＳＯ ２７００１ 5.1.2"))
+    for query in ("資通安全長", "備份", "5.1.2", "quarterly"):
+        print(query, demo.search(query, 3))
@@ -1,15 +1,55 @@
 from __future__ import annotations
 
 import json
+import threading
 from typing import Dict, Any, Optional, Union, List
 from openai import OpenAI, APIError
 from app.logger import logger
+from app.pipeline.tracing import span
+
+
+# Process-wide token accounting. The batch CLI reports these per project, and
+# since each project runs in its own worker process the counters stay separate.
+_token_usage_lock = threading.Lock()
+_token_usage: Dict[str, int] = {}
+
+
+def reset_token_usage() -> None:
+    """Clears the process-wide token counters."""
+    with _token_usage_lock:
+        _token_usage.clear()
+
+
+def record_token_usage(kind: str, usage: Any) -> None:
+    """
+    Adds the ``usage`` block of an OpenAI response to the process-wide counters.
+
+    Args:
+        kind: "chat" or "embedding"; used as the key prefix.
+        usage: The response ``usage`` object (may be None for servers that omit it).
+    """
+    if usage is None:
+        return
+    with _token_usage_lock:
+        _token_usage[f"{kind}_calls"] = _token_usage.get(f"{kind}_calls", 0) + 1
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = getattr(usage, field, None)
+            if isinstance(value, int):
+                key = f"{kind}_{field}"
+                _token_usage[key] = _token_usage.get(key, 0) + value
+
+
+def get_token_usage() -> Dict[str, int]:
+    """Returns a snapshot of the process-wide token counters."""
+    with _token_usage_lock:
+        return dict(_token_usage)
 
 def call_llm_api(
     prompt: str,
     model_name: str,
     api_key: str,
-    expected_response_type: str = "boolean"  # "boolean", "json_list", "json_object", "text"
+    expected_response_type: str = "boolean",  # "boolean", "json_list", "json_object", "text"
+    base_url: Optional[str] = None
 ) -> Optional[Union[bool, List[Dict[str, Any]], Dict[str, Any], str]]:
     """
     Helper function to interact with an LLM using OpenAI's API.
@@ -23,6 +63,8 @@ def call_llm_api(
                                 "json_list" for a list of dicts (e.g., {"audit_tasks": [...]}).
                                 "json_object" for a generic JSON object (e.g., compliance judgment).
                                 "text" for a raw text response.
+        base_url: Optional OpenAI-compatible endpoint (e.g. a local test server).
+                  None uses the client default (api.openai.com or OPENAI_BASE_URL).
 
     Returns:
         The parsed response from the LLM or None if an error occurs.
@@ -34,7 +76,7 @@ def call_llm_api(
         logger.error("OpenAI API key is missing. Cannot make the API call.")
         return None
 
-    client = OpenAI(api_key=api_key)
+    client = OpenAI(api_key=api_key, base_url=base_url)
 
     system_message_content = "You are an AI assistant helping with compliance audits. Please provide responses in the requested JSON format. All textual content in your response that is intended for human reading (like reasoning or descriptions) should be in Traditional Chinese, using Taiwan-specific terminology (請使用台灣常用的繁體中文)."
     if expected_response_type in ["boolean", "json_list", "json_object"]:
@@ -46,24 +88,30 @@ def call_llm_api(
     ]
 
     try:
-        # For newer models that support it, use response_format to enforce JSON output.
-        # Example models: gpt-3.5-turbo-1106, gpt-4-turbo-preview
-        # This might need adjustment based on the specific model_name used.
-        if expected_response_type in ["json_list", "json_object", "boolean"] and ("1106" in model_name or "turbo-preview" in model_name or "gpt-4" in model_name):
-            logger.info("Attempting to use JSON response format for the model.")
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.2,  # Low temperature for more deterministic/factual output
-                response_format={"type": "json_object"},
-            )
-        else:
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.2,
-            )
+        with span("llm_call", "llm", model=model_name, prompt_chars=len(prompt)) as llm_span:
+            # For newer models that support it, use response_format to enforce JSON output.
+            # Example models: gpt-3.5-turbo-1106, gpt-4-turbo-preview
+            # This might need adjustment based on the specific model_name used.
+            if expected_response_type in ["json_list", "json_object", "boolean"] and ("1106" in model_name or "turbo-preview" in model_name or "gpt-4" in model_name):
+                logger.info("Attempting to use JSON response format for the model.")
+                completion = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=0.2,  # Low temperature for more deterministic/factual output
+                    response_format={"type": "json_object"},
+                )
+            else:
+                completion = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=0.2,
+                )
             
+            usage = getattr(completion, "usage", None)
+            if usage is not None:
+                llm_span.set(prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                             completion_tokens=getattr(usage, "completion_tokens", 0) or 0)
+        record_token_usage("chat", usage)
         response_content = completion.choices[0].message.content
         logger.debug(f"Raw LLM Response Content: {response_content}")
 
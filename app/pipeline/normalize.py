@@ -1,15 +1,35 @@
+import multiprocessing
+import os
 import re
 import unicodedata
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 # Adjust import based on project structure and PYTHONPATH
 try:
     from app.models.docs import RawDoc, NormDoc
+    from app.pipeline.cache import CacheService
+    from app.pipeline.tracing import incr, span
 except ImportError:
     import sys
     from pathlib import Path
     sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
     from app.models.docs import RawDoc, NormDoc
+    from app.pipeline.cache import CacheService  # type: ignore
+    from app.pipeline.tracing import incr, span  # type: ignore
+
+# Bump whenever normalize_document's output changes; cached NormDocs of older versions are ignored,
+# and so are the embeddings and EmbedSet ids derived from them (see embed._embeddings_cache_key)
+NORMALIZATION_VERSION = 2
+
+# Inputs with fewer characters in total (across the documents still to be
+# normalized) are processed in-process: spawning workers and pickling the
+# documents costs more than it saves.
+PARALLEL_MIN_CHARS = 2_000_000
+
+# Documents pulled at a time by iter_normalize_documents
+STREAM_BATCH_DOCS = 4
 
 # Pre-compile regex patterns for efficiency
 # Pattern for multiple spaces/tabs
@@ -21,9 +41,90 @@ RE_SECTION_TITLES = re.compile(r'^\s*(Chapter|Section|Part|Article)\s+[\w\d\-.]+
 # Pattern for consolidating multiple newlines
 RE_MULTI_NEWLINE = re.compile(r'\n\s*\n+')
 
+# --- Single-pass patterns used by _normalize_text --------------------------
+# Same as the patterns above, rewritten to run over the whole document with
+# re.MULTILINE: "\s" becomes "whitespace except newline" so that no match
+# can cross a line boundary.
+_WS = r'[^\S\n]'
+_SECTION_NUMBER_BODY = r'(?:[(\[]?\w+(?:[.]\w+)*[.)\]]?' + _WS + r'*)+'
+_SECTION_TITLE_BODY = r'(?i:Chapter|Section|Part|Article)' + _WS + r'+[\w\d\-.]+' + _WS + r'*[:\-–]?' + _WS + r'*'
+# Matches every line once: leading whitespace + section number + section
+# title (the old strip/sub/strip/sub/strip sequence), capturing the rest of
+# the line. Consuming whole lines keeps the engine from retrying at every
+# character, which is what made a whole-document sub() slow.
+RE_LINE_REMAINDER = re.compile(
+    r'^' + _WS + r'*(?:' + _SECTION_NUMBER_BODY + r')?(?:' + _SECTION_TITLE_BODY + r')?([^\n]*)',
+    flags=re.MULTILINE,
+)
+# Line boundaries str.splitlines() honours besides "\n"
+RE_OTHER_LINE_BREAKS = re.compile('[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
 
-def normalize_document(raw_doc: RawDoc) -> NormDoc:
-    text = raw_doc.content
+_NORMALIZATION_STEPS = ["unicode_nfc", "space_tab_consolidation", "leading_trailing_strip_lines",
+                        "basic_section_number_title_removal", "extra_newline_consolidation"]
+
+
+def _normalize_text(text: str, doc_id: str) -> Tuple[str, List[str], List[str]]:
+    """Cleans one block of text; returns (text, identified sections, steps applied)."""
+    final_text_content, identified_sections_basic, _, normalization_steps_applied = \
+        _normalize_text_with_sections(text, doc_id)
+    return final_text_content, identified_sections_basic, normalization_steps_applied
+
+
+def _normalize_text_with_sections(text: str, doc_id: str) -> Tuple[str, List[str], List[int], List[str]]:
+    """
+    Cleans one block of text; returns (text, identified sections, section
+    start offsets into the cleaned text, steps applied).
+
+    Produces exactly the output of ``_normalize_text_reference``. Instead of
+    several regex calls per line, it makes a few passes over the whole
+    document: one MULTILINE findall strips every line and removes its section
+    number/title, and a single comprehension collects the sections.
+    """
+    normalization_steps_applied = list(_NORMALIZATION_STEPS)
+    try:
+        if not unicodedata.is_normalized('NFC', text):  # Quick check; most documents already are
+            text = unicodedata.normalize('NFC', text)
+    except Exception as e:
+        print(f"Error during Unicode normalization for doc {doc_id}: {e}")
+        normalization_steps_applied.remove("unicode_nfc")
+
+    if '\t' in text or '  ' in text:
+        text = RE_MULTI_SPACE_TAB.sub(' ', text)
+    if RE_OTHER_LINE_BREAKS.search(text):
+        text = "\n".join(text.splitlines())
+
+    lines = text.split("\n")
+    # One remainder per line (findall yields exactly len(lines) matches); only trailing whitespace is left to strip
+    cleaned_lines = [rest.rstrip() if rest[-1:].isspace() else rest for rest in RE_LINE_REMAINDER.findall(text)]
+
+    # A line is a section header when nothing but its number/title was left,
+    # or when it is short ALL CAPS text (isupper ignores whitespace, so the
+    # unstripped line gives the same answer).
+    section_line_indexes = [
+        i for i, (line, cleaned) in enumerate(zip(lines, cleaned_lines))
+        if (not cleaned and line and not line.isspace())
+        or (line.isupper() and 3 < len(line.strip()) < 150)
+    ]
+    identified_sections_basic = [lines[i].strip() for i in section_line_indexes]
+
+    # Blank and fully-removed lines disappear; the rest are joined with single newlines.
+    final_text_content = "\n".join(filter(None, cleaned_lines))
+
+    # A section starts where its header line sits in the cleaned text (kept
+    # ALL CAPS headers) or where the next kept line begins (removed headers).
+    section_starts: List[int] = []
+    if section_line_indexes:
+        line_starts = list(accumulate((len(c) + 1 if c else 0 for c in cleaned_lines), initial=0))
+        section_starts = [min(line_starts[i], len(final_text_content)) for i in section_line_indexes]
+    return final_text_content, identified_sections_basic, section_starts, normalization_steps_applied
+
+
+def _normalize_text_reference(text: str, doc_id: str) -> Tuple[str, List[str], List[str]]:
+    """
+    Original line-by-line implementation of ``_normalize_text``. It is kept
+    as the reference for the differential tests and the micro-benchmark
+    (``python -m tests.benchmarks.normalize_bench``).
+    """
     normalization_steps_applied = []
 
     # 1. Unicode Normalization
@@ -31,7 +132,7 @@ def normalize_document(raw_doc: RawDoc) -> NormDoc:
         text = unicodedata.normalize('NFC', text)
         normalization_steps_applied.append("unicode_nfc")
     except Exception as e:
-        print(f"Error during Unicode normalization for doc {raw_doc.id}: {e}")
+        print(f"Error during Unicode normalization for doc {doc_id}: {e}")
         # Continue with original text if normalization fails
 
     # 2. Initial whitespace cleanup (consolidate spaces/tabs)
@@ -91,12 +192,58 @@ def normalize_document(raw_doc: RawDoc) -> NormDoc:
     final_text_content = RE_MULTI_NEWLINE.sub('\n', final_text_content).strip()
     normalization_steps_applied.append("extra_newline_consolidation")
 
+    return final_text_content, identified_sections_basic, normalization_steps_applied
+
+
+def _normalize_pages(raw_doc: RawDoc) -> Tuple[str, List[str], List[int], List[str], List[Dict[str, int]]]:
+    """
+    Normalizes a paged document (e.g. a PDF) page by page so that page
+    boundaries survive cleaning; returns the joined text plus section starts
+    and page_spans re-based onto it. Pages that end up empty are dropped
+    from the spans.
+    """
+    parts: List[str] = []
+    sections: List[str] = []
+    section_starts: List[int] = []
+    steps: List[str] = []
+    page_spans: List[Dict[str, int]] = []
+    offset = 0
+    for page_span in raw_doc.metadata["page_spans"]:
+        page_text = raw_doc.content[page_span["start"]:page_span["end"]]
+        page_text, page_sections, page_section_starts, steps = _normalize_text_with_sections(page_text, raw_doc.id)
+        page_start = offset + 1 if parts else offset  # Where this page's text begins once joined
+        sections.extend(page_sections)
+        section_starts.extend(page_start + start for start in page_section_starts)
+        if not page_text:
+            continue
+        if parts:
+            parts.append("\n")
+        parts.append(page_text)
+        page_spans.append({"page": page_span["page"], "start": page_start, "end": page_start + len(page_text)})
+        offset = page_start + len(page_text)
+    # Headers on trailing empty pages point just past the end; clamp them like _normalize_text does
+    section_starts = [min(start, offset) for start in section_starts]
+    return "".join(parts), sections, section_starts, steps, page_spans
+
+
+def normalize_document(raw_doc: RawDoc) -> NormDoc:
+    page_spans = None
+    if raw_doc.metadata.get("page_spans"):
+        final_text_content, identified_sections_basic, section_starts, normalization_steps_applied, page_spans = \
+            _normalize_pages(raw_doc)
+    else:
+        final_text_content, identified_sections_basic, section_starts, normalization_steps_applied = \
+            _normalize_text_with_sections(raw_doc.content, raw_doc.id)
+
     # 5. NormDoc Creation
     norm_doc_id = f"norm_{raw_doc.id}"
-    metadata = raw_doc.metadata.copy()
+    metadata: Dict[str, Any] = raw_doc.metadata.copy()
+    if page_spans is not None:
+        metadata["page_spans"] = page_spans  # Offsets into text_content, used to tag chunks with page numbers
     metadata["normalization_applied"] = normalization_steps_applied
     if identified_sections_basic:
         metadata["basic_sections_identified_count"] = len(identified_sections_basic)
+        metadata["section_starts"] = section_starts  # Offset of each entry of sections in text_content, used by the chunker
 
     return NormDoc(
         id=norm_doc_id,
@@ -108,6 +255,84 @@ def normalize_document(raw_doc: RawDoc) -> NormDoc:
     )
 
 
+def _normdoc_cache_key(raw_doc: RawDoc) -> str:
+    # raw_doc.id is the SHA-256 of the source file, so the key changes with the content
+    return CacheService.generate_key(raw_doc.id, f"normdoc_v{NORMALIZATION_VERSION}")
+
+
+def _default_workers() -> int:
+    return max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+def normalize_documents(raw_docs: List[RawDoc], cache_service: Optional[CacheService] = None,
+                        max_workers: Optional[int] = None) -> List[NormDoc]:
+    """
+    Normalizes ``raw_docs`` (same order in the result).
+
+    With a ``cache_service``, NormDocs are cached under the raw doc hash plus
+    NORMALIZATION_VERSION, so unchanged documents are never re-normalized.
+    The remaining documents are normalized in a spawn-based process pool
+    when there are at least two of them and together they hold
+    PARALLEL_MIN_CHARS characters or more; otherwise they are normalized in
+    this process.
+    """
+    results: List[Optional[NormDoc]] = [None] * len(raw_docs)
+    pending: List[int] = []
+    cache_keys = [_normdoc_cache_key(raw_doc) for raw_doc in raw_docs]
+    # One batched cache read for the whole list
+    cached_docs = cache_service.load_json_many(cache_keys, NormDoc) if cache_service else {}
+    for i, raw_doc in enumerate(raw_docs):
+        cached = cached_docs.get(cache_keys[i])
+        if cached is not None:
+            incr("normalize_cache_hits")
+            # The cache is keyed by content; identical files may carry different names
+            cached.metadata.update({k: v for k, v in raw_doc.metadata.items() if k in ("original_filename", "file_type")})
+            cached.doc_type = raw_doc.doc_type
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    workers = _default_workers() if max_workers is None else max_workers
+    total_chars = sum(len(raw_docs[i].content) for i in pending)
+    if len(pending) > 1 and workers > 1 and total_chars >= PARALLEL_MIN_CHARS:
+        # "spawn" avoids forking a process that may be running Qt or other threads.
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            normalized = list(pool.map(normalize_document, [raw_docs[i] for i in pending]))
+    else:
+        normalized = [normalize_document(raw_docs[i]) for i in pending]
+
+    to_cache: Dict[str, NormDoc] = {}
+    for i, norm_doc in zip(pending, normalized):
+        incr("normalize_cache_misses")
+        results[i] = norm_doc
+        # Documents that failed extraction may succeed next time with the same file hash
+        if cache_service is not None and not raw_docs[i].metadata.get("errors"):
+            to_cache[cache_keys[i]] = norm_doc
+    if to_cache:
+        cache_service.save_json_many(to_cache)
+    return results  # type: ignore[return-value]
+
+
+
+def iter_normalize_documents(raw_docs: Iterable[RawDoc], cache_service: Optional[CacheService] = None,
+                             batch_size: int = STREAM_BATCH_DOCS,
+                             max_workers: Optional[int] = None) -> Iterator[NormDoc]:
+    """
+    Streaming form of ``normalize_documents``: pulls ``batch_size`` RawDocs
+    at a time from ``raw_docs`` and yields their NormDocs in order, so only
+    one batch of documents is held at once.
+    """
+    raw_iter = iter(raw_docs)
+    while True:
+        batch = list(islice(raw_iter, max(1, batch_size)))
+        if not batch:
+            return
+        with span("normalize", "stage", docs=len(batch), chars=sum(len(d.content) for d in batch)):
+            normalized = normalize_documents(batch, cache_service, max_workers)
+        del batch
+        yield from normalized
+
 if __name__ == '__main__':
     from pathlib import Path
 
@@ -5,25 +5,29 @@ import os # Added for os.path.getmtime
 import traceback # Add this import
 import threading # For confirm_event
 from pathlib import Path
-from typing import List, Callable, Dict, Any, Optional, Union
+from typing import List, Callable, Dict, Any, Optional, Tuple, Union
 
 import shutil # For cleaning up temp directories
 
 from app.logger import logger
-from app.models.project import CompareProject
+from app.models.project_data import ProjectData
 from app.models.docs import ExternalRegulationClause, AuditTask, RawDoc, NormDoc, EmbedSet # Added RawDoc, NormDoc, EmbedSet
 from app.models.run_data import ProjectRunData # Import from new module
-from app.pipeline_settings import PipelineSettings # Corrected import to app.pipeline_settings
+from app.pipeline_settings import PipelineSettings, FUSED_RETRIEVAL_ENGINES, RETRIEVAL_ENGINE_DENSE # Corrected import to app.pipeline_settings
 from app.pipeline.llm_utils import call_llm_api
 
 # Import necessary functions from other pipeline modules
 from app.app_paths import get_app_data_dir # Added import
-from app.pipeline.ingestion import ingest_documents
-from app.pipeline.normalize import normalize_document
-from app.pipeline.embed import generate_embeddings
-from app.pipeline.index import create_or_load_index, IndexMeta # Added IndexMeta
-from app.pipeline.retrieve import retrieve_similar_chunks, MatchSet # Added MatchSet
+from app.pipeline.ingestion import iter_ingest_documents
+from app.pipeline.normalize import iter_normalize_documents
+from app.pipeline.embed import generate_embeddings, iter_embedded_documents
+from app.pipeline.index import IndexBuilder, IndexMeta # Added IndexMeta
+from app.pipeline.retrieve import apply_score_cutoffs, retrieve_chunks, MatchSet # Added MatchSet
+from app.pipeline.evidence import diversify_clause_evidence, evidence_id_for
+from app.pipeline.rerank import RerankScoreCache, get_reranker, rerank_matches
 from app.pipeline.cache import CacheService # For embedding caching if generate_embeddings uses it
+from app.pipeline.cache_gc import enforce_cache_limit
+from app.pipeline.tracing import Tracer, activate, export_run_trace, span
 
 # Pydantic models for GUI data structures
 from pydantic import BaseModel # Ensure pydantic.BaseModel is imported
@@ -51,12 +55,15 @@ def _load_run_json(run_json_path: Path) -> Optional[ProjectRunData]:
     return None
 
 def _save_run_json(run_data: ProjectRunData, run_json_path: Path) -> None:
-    try:
-        run_json_path.parent.mkdir(parents=True, exist_ok=True)
-        run_json_path.write_text(json.dumps(run_data.to_dict(), indent=4, ensure_ascii=False), encoding='utf-8')
-        logger.info(f"Project run data saved to {run_json_path}")
-    except IOError as e:
-        logger.error(f"Error saving run.json to {run_json_path}: {e}")
+    with span("save_run_json", "io") as save_span:
+        try:
+            run_json_path.parent.mkdir(parents=True, exist_ok=True)
+            data = json.dumps(run_data.to_dict(), indent=4, ensure_ascii=False).encode('utf-8')
+            run_json_path.write_bytes(data)
+            save_span.set(bytes=len(data))
+            logger.info(f"Project run data saved to {run_json_path}")
+        except IOError as e:
+            logger.error(f"Error saving run.json to {run_json_path}: {e}")
 
 
 def load_external_regulations_from_json(external_regulations_json_path: Path) -> List[ExternalRegulationClause]:
@@ -105,13 +112,39 @@ def load_external_regulations_from_json(external_regulations_json_path: Path) ->
     return external_regulation_clauses
 
 
-def run_project_pipeline_v1_1(project: CompareProject,
+def run_project_pipeline_v1_1(project: ProjectData,
                               settings: PipelineSettings,
                               progress_callback: Callable[[float, Union[str, AuditPlanClauseUIData]], None],
-                              cancel_cb: Callable[[], bool]):
+                              cancel_cb: Callable[[], bool]) -> bool:
     """
     Main orchestrator for the V1.1 pipeline.
+
+    Returns True when all four steps ran to completion, False if the pipeline
+    stopped early because of invalid input or cancellation.
+
+    When ``settings.trace_enabled`` is set, the run is traced: a timing summary
+    is logged and a Chrome trace is written to ``<app data>/traces/``.
     """
+    if not settings.trace_enabled:
+        return _run_pipeline_steps(project, settings, progress_callback, cancel_cb)
+
+    tracer = Tracer(project.name)
+    completed = False
+    try:
+        with activate(tracer):
+            with span("pipeline_run", "run", project=project.name) as run_span:
+                completed = _run_pipeline_steps(project, settings, progress_callback, cancel_cb)
+                run_span.set(completed=completed)
+        return completed
+    finally:
+        export_run_trace(tracer, get_app_data_dir() / "traces")
+
+
+def _run_pipeline_steps(project: ProjectData,
+                        settings: PipelineSettings,
+                        progress_callback: Callable[[float, Union[str, AuditPlanClauseUIData]], None],
+                        cancel_cb: Callable[[], bool]) -> bool:
+    """Body of ``run_project_pipeline_v1_1``; see there for the return value."""
     logger.info(f"Starting pipeline v1.1 for project: {project.name}")
     progress_callback(0.0, "Initializing pipeline...")
 
@@ -120,19 +153,19 @@ def run_project_pipeline_v1_1(project: CompareProject,
     if not ext_reg_path or not ext_reg_path.exists():
         logger.error("ExternalRegulations JSON path not specified or file does not exist.")
         progress_callback(1.0, "Error: ExternalRegulations JSON file not found.")
-        return
+        return False
 
     run_json_path = project.run_json_path
     if not run_json_path:
         logger.error("Project run_json_path is not set.")
         progress_callback(1.0, "Error: run.json path not configured for the project.")
-        return
+        return False
 
     # --- Load Initial Data ---
     initial_clauses_from_json = load_external_regulations_from_json(ext_reg_path)
     if not initial_clauses_from_json:
         progress_callback(1.0, "Error: No external_regulation clauses loaded from source JSON. Stopping pipeline.")
-        return
+        return False
 
     # --- Load or Initialize ProjectRunData ---
     loaded_project_run_data = _load_run_json(run_json_path)
@@ -208,6 +241,7 @@ def run_project_pipeline_v1_1(project: CompareProject,
                     updated_clause.metadata.pop('clause_compliant', None)
                     updated_clause.metadata.pop('clause_compliance_description', None)
                     updated_clause.metadata.pop('clause_improvement_suggestions', None)
+                    updated_clause.evidence = [] # Unreferenced table entries are dropped on save
                 else: # Not invalidating search/judge, try to preserve them
                     if updated_clause.tasks and existing_version.tasks:
                         # This part is tricky: tasks might have different lengths or IDs if audit_plan changed text
@@ -224,6 +258,8 @@ def run_project_pipeline_v1_1(project: CompareProject,
                         if 'clause_improvement_suggestions' in existing_version.metadata:
                              updated_clause.metadata['clause_improvement_suggestions'] = existing_version.metadata['clause_improvement_suggestions']
                         # Task-level compliance and top_k are part of the task objects, copied above if not invalidated.
+                        # The top_k references resolve against the project's evidence table, which is kept.
+                        updated_clause.evidence = list(existing_version.evidence)
                 
             external_regulation_clauses_for_run.append(updated_clause)
 
@@ -267,23 +303,24 @@ def run_project_pipeline_v1_1(project: CompareProject,
 
     if not external_regulation_clauses_for_run:
         progress_callback(1.0, "No external_regulation clauses to process after loading/merging. Stopping pipeline.")
-        return
+        return False
 
     # --- Step 1: Need-Check ---
     if cancel_cb():
         progress_callback(1.0, "Pipeline cancelled.")
-        return
+        return False
     progress_callback(0.1, "Starting Step 1: Need-Check...")
     # external_regulation_clauses_for_run = execute_need_check_step(external_regulation_clauses_for_run, project.run_json_path, settings, cancel_cb)
     # Update run_data and save (within execute_need_check_step or here)
-    execute_need_check_step(
-        external_regulation_clauses=external_regulation_clauses_for_run, 
-        project_run_json_path=project.run_json_path,
-        current_project_run_data=project_run_data, # Pass the main run data object
-        settings=settings, 
-        progress_callback=progress_callback, # Pass down for finer-grained progress
-        cancel_cb=cancel_cb
-    )
+    with span("need_check", "stage"):
+        execute_need_check_step(
+            external_regulation_clauses=external_regulation_clauses_for_run, 
+            project_run_json_path=project.run_json_path,
+            current_project_run_data=project_run_data, # Pass the main run data object
+            settings=settings, 
+            progress_callback=progress_callback, # Pass down for finer-grained progress
+            cancel_cb=cancel_cb
+        )
     # _save_run_json is now called within execute_need_check_step after each update.
     # After Need-Check, external_regulations_file_timestamp is effectively "stable" for this run regarding need_procedure
     project_run_data.external_regulations_file_timestamp = os.path.getmtime(project.external_regulations_json_path)
@@ -294,16 +331,17 @@ def run_project_pipeline_v1_1(project: CompareProject,
     # --- Step 2: Audit-Plan ---
     if cancel_cb():
         progress_callback(1.0, "Pipeline cancelled.")
-        return
+        return False
     progress_callback(0.3, "Starting Step 2: Audit-Plan...")
-    execute_audit_plan_step(
-        external_regulation_clauses=external_regulation_clauses_for_run,
-        project_run_json_path=project.run_json_path,
-        current_project_run_data=project_run_data,
-        settings=settings,
-        progress_callback=progress_callback,
-        cancel_cb=cancel_cb
-    )
+    with span("audit_plan", "stage"):
+        execute_audit_plan_step(
+            external_regulation_clauses=external_regulation_clauses_for_run,
+            project_run_json_path=project.run_json_path,
+            current_project_run_data=project_run_data,
+            settings=settings,
+            progress_callback=progress_callback,
+            cancel_cb=cancel_cb
+        )
     # After Audit-Plan, tasks are stable, related to external_regulations_file_timestamp
     project_run_data.external_regulations_file_timestamp = os.path.getmtime(project.external_regulations_json_path)
     _save_run_json(project_run_data, project.run_json_path) # Save updated timestamp
@@ -326,16 +364,17 @@ def run_project_pipeline_v1_1(project: CompareProject,
     # Step 3: Procedure Association (Search)
     if cancel_cb():
         progress_callback(1.0, "Pipeline cancelled.")
-        return
+        return False
     progress_callback(0.6, "Starting Step 3: Search for Procedures...")
-    execute_search_step(
-        external_regulation_clauses=external_regulation_clauses_for_run,
-        project=project, # Pass the whole project for paths
-        current_project_run_data=project_run_data,
-        settings=settings,
-        progress_callback=progress_callback,
-        cancel_cb=cancel_cb
-    )
+    with span("search", "stage"):
+        execute_search_step(
+            external_regulation_clauses=external_regulation_clauses_for_run,
+            project=project, # Pass the whole project for paths
+            current_project_run_data=project_run_data,
+            settings=settings,
+            progress_callback=progress_callback,
+            cancel_cb=cancel_cb
+        )
     # After Search, procedure_files_timestamps are stable for this run regarding top_k
     if project.procedure_doc_paths:
         project_run_data.procedure_files_timestamps = {
@@ -350,16 +389,17 @@ def run_project_pipeline_v1_1(project: CompareProject,
     # Step 4: Evidence Assessment (Judge)
     if cancel_cb():
         progress_callback(1.0, "Pipeline cancelled.")
-        return
+        return False
     progress_callback(0.8, "Starting Step 4: Judging Compliance...")
-    execute_judge_step(
-        external_regulation_clauses=external_regulation_clauses_for_run,
-        project_run_json_path=project.run_json_path, # For saving progress
-        current_project_run_data=project_run_data,
-        settings=settings,
-        progress_callback=progress_callback,
-        cancel_cb=cancel_cb
-    )
+    with span("judge", "stage"):
+        execute_judge_step(
+            external_regulation_clauses=external_regulation_clauses_for_run,
+            project_run_json_path=project.run_json_path, # For saving progress
+            current_project_run_data=project_run_data,
+            settings=settings,
+            progress_callback=progress_callback,
+            cancel_cb=cancel_cb
+        )
     # After Judge, all results are final for the current file states
     project_run_data.external_regulations_file_timestamp = os.path.getmtime(project.external_regulations_json_path)
     if project.procedure_doc_paths:
@@ -373,6 +413,7 @@ def run_project_pipeline_v1_1(project: CompareProject,
 
     progress_callback(1.0, "Pipeline v1.1 completed successfully.")
     logger.info(f"Pipeline v1.1 finished for project: {project.name}")
+    return True
 
 # Placeholder for PipelineSettings if it's not defined elsewhere yet
 # This should ideally be in app.settings or a dedicated models file.
@@ -422,44 +463,46 @@ def execute_need_check_step(
             progress_callback(base_progress + current_step_progress, f"Need-Check: Clause {clause.id} (skipped)")
             continue
 
-        logger.info(f"Performing Need-Check for clause: {clause.id} - {clause.text[:50]}...")
+        with span("need_check_clause", "clause", clause_id=clause.id):
+            logger.info(f"Performing Need-Check for clause: {clause.id} - {clause.text[:50]}...")
         
-        # Construct prompt for LLM
-        # Basic prompt, can be enhanced with more context or specific instructions
-        prompt = (
-            f"Determine if the following external_regulation clause requires a detailed audit procedure to verify its implementation. "
-            f"For compliance and safety, unless the clause explicitly states that no procedure is needed, assume that a detailed audit procedure is required. "
-            f"Respond with a JSON object containing a single key 'requires_procedure' with a boolean value (true or false).\n\n"
-            f"ExternalRegulation Clause Text: \"{clause.text}\""
-        )
+            # Construct prompt for LLM
+            # Basic prompt, can be enhanced with more context or specific instructions
+            prompt = (
+                f"Determine if the following external_regulation clause requires a detailed audit procedure to verify its implementation. "
+                f"For compliance and safety, unless the clause explicitly states that no procedure is needed, assume that a detailed audit procedure is required. "
+                f"Respond with a JSON object containing a single key 'requires_procedure' with a boolean value (true or false).\n\n"
+                f"ExternalRegulation Clause Text: \"{clause.text}\""
+            )
 
-        llm_response = call_llm_api(
-            prompt=prompt,
-            model_name=settings.llm_model_need_check,
-            api_key=settings.openai_api_key,
-            expected_response_type="boolean"
-        )
+            llm_response = call_llm_api(
+                prompt=prompt,
+                model_name=settings.llm_model_need_check,
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                expected_response_type="boolean"
+            )
 
-        if llm_response is not None and isinstance(llm_response, bool):
-            clause.need_procedure = llm_response
-            logger.info(f"Need-Check for clause {clause.id}: {llm_response}")
-        else:
-            clause.need_procedure = None # Mark as undetermined on error
-            logger.error(f"Failed to determine need_procedure for clause {clause.id}. LLM response: {llm_response}")
-            # Optionally, implement retry logic or specific error handling here
+            if llm_response is not None and isinstance(llm_response, bool):
+                clause.need_procedure = llm_response
+                logger.info(f"Need-Check for clause {clause.id}: {llm_response}")
+            else:
+                clause.need_procedure = None # Mark as undetermined on error
+                logger.error(f"Failed to determine need_procedure for clause {clause.id}. LLM response: {llm_response}")
+                # Optionally, implement retry logic or specific error handling here
 
-        clauses_processed +=1
+            clauses_processed +=1
         
-        # Update the specific clause in current_project_run_data.external_regulation_clauses
-        # This assumes current_project_run_data.external_regulation_clauses is the same list object
-        # or requires finding and updating the clause by ID if it's a copy.
-        # For simplicity, if external_regulation_clauses is a mutable list shared, direct update works.
-        # Otherwise:
-        for i, run_clause in enumerate(current_project_run_data.external_regulation_clauses):
-            if run_clause.id == clause.id:
-                current_project_run_data.external_regulation_clauses[i] = clause
-                break
-        _save_run_json(current_project_run_data, project_run_json_path)
+            # Update the specific clause in current_project_run_data.external_regulation_clauses
+            # This assumes current_project_run_data.external_regulation_clauses is the same list object
+            # or requires finding and updating the clause by ID if it's a copy.
+            # For simplicity, if external_regulation_clauses is a mutable list shared, direct update works.
+            # Otherwise:
+            for i, run_clause in enumerate(current_project_run_data.external_regulation_clauses):
+                if run_clause.id == clause.id:
+                    current_project_run_data.external_regulation_clauses[i] = clause
+                    break
+            _save_run_json(current_project_run_data, project_run_json_path)
         
         base_progress = 0.1
         step_progress_span = 0.2 # Step 1 is 10% to 30%
@@ -530,65 +573,70 @@ def execute_audit_plan_step(
             progress_callback(overall_progress, message)
             continue
 
-        logger.info(f"Performing Audit-Plan for clause: {clause.id} - {clause.title[:50]}...")
-
-        prompt = (
-            f"Act as an auditor validating compliance for the external_regulation clause: '{clause.text}'.\n"
-            f"Your goal is to generate **one or more effective search queries (audit task sentences)** to find supporting evidence in internal documentation.\n"
-            f"Each query should be precise and target text that directly confirms, defines, or exemplifies a specific aspect of the external_regulation clause.\n"
-            f"If the external_regulation clause has multiple distinct components or requirements, generate a separate, focused query for each.\n"
-            f"For example, if a clause states 'A is X and B is Y', you might generate one query for 'A is X' and another for 'B is Y'.\n"
-            f"Return a JSON object containing a single key 'audit_tasks'. The value of 'audit_tasks' must be a list of dictionaries.\n"
-            f"Each dictionary in the list must have an 'id' (e.g., 'task_001', 'task_002', ...) and a 'sentence' (your generated search query for that specific aspect).\n"
-            f"Ensure IDs are unique for tasks generated for the same clause (e.g., task_001, task_002).\n\n"
-            f"ExternalRegulation Clause Text: \"{clause.text}\""
-        )
-
-        llm_response = call_llm_api(
-            prompt=prompt,
-            model_name=settings.llm_model_audit_plan,
-            api_key=settings.openai_api_key,
-            expected_response_type="json_object" # Expecting a JSON object with 'audit_tasks' key
-        )
+        with span("audit_plan_clause", "clause", clause_id=clause.id) as clause_span:
+            logger.info(f"Performing Audit-Plan for clause: {clause.id} - {clause.title[:50]}...")
+
+            prompt = (
+                f"Act as an auditor validating compliance for the external_regulation clause: '{clause.text}'.\n"
+                f"Your goal is to generate **one or more effective search queries (audit task sentences)** to find supporting evidence in internal documentation.\n"
+                f"Each query should be precise and target text that directly confirms, defines, or exemplifies a specific aspect of the external_regulation clause.\n"
+                f"If the external_regulation clause has multiple distinct components or requirements, generate a separate, focused query for each.\n"
+                f"For example, if a clause states 'A is X and B is Y', you might generate one query for 'A is X' and another for 'B is Y'.\n"
+                f"Return a JSON object containing a single key 'audit_tasks'. The value of 'audit_tasks' must be a list of dictionaries.\n"
+                f"Each dictionary in the list must have an 'id' (e.g., 'task_001', 'task_002', ...) and a 'sentence' (your generated search query for that specific aspect).\n"
+                f"Ensure IDs are unique for tasks generated for the same clause (e.g., task_001, task_002).\n\n"
+                f"ExternalRegulation Clause Text: \"{clause.text}\""
+            )
 
-        clause.tasks = [] # Initialize/clear tasks for this clause before processing LLM response
+            llm_response = call_llm_api(
+                prompt=prompt,
+                model_name=settings.llm_model_audit_plan,
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                expected_response_type="json_object" # Expecting a JSON object with 'audit_tasks' key
+            )
 
-        if llm_response and isinstance(llm_response, dict) and 'audit_tasks' in llm_response:
-            tasks_data = llm_response['audit_tasks']
-            if isinstance(tasks_data, list):
-                if not tasks_data: # LLM returned an empty list of tasks
-                    logger.info(f"LLM returned an empty list of audit tasks for clause {clause.id}.")
-                    # clause.tasks remains empty, which is the correct state.
-                else:
-                    for task_idx, task_data in enumerate(tasks_data):
-                        if isinstance(task_data, dict) and "id" in task_data and "sentence" in task_data:
-                            try:
-                                audit_task = AuditTask(id=str(task_data["id"]), sentence=str(task_data["sentence"]))
-                                clause.tasks.append(audit_task)
-                            except Exception as e: # Pydantic validation error or other issues
-                                logger.error(f"Error creating AuditTask from data {task_data} for clause {clause.id}, task index {task_idx}: {e}")
-                        else:
-                            logger.error(f"Invalid task data format in list for clause {clause.id}, task index {task_idx}: {task_data}")
+            clause.tasks = [] # Initialize/clear tasks for this clause before processing LLM response
+            clause.evidence = [] # Evidence belongs to the old tasks
+
+            if llm_response and isinstance(llm_response, dict) and 'audit_tasks' in llm_response:
+                tasks_data = llm_response['audit_tasks']
+                if isinstance(tasks_data, list):
+                    if not tasks_data: # LLM returned an empty list of tasks
+                        logger.info(f"LLM returned an empty list of audit tasks for clause {clause.id}.")
+                        # clause.tasks remains empty, which is the correct state.
+                    else:
+                        for task_idx, task_data in enumerate(tasks_data):
+                            if isinstance(task_data, dict) and "id" in task_data and "sentence" in task_data:
+                                try:
+                                    audit_task = AuditTask(id=str(task_data["id"]), sentence=str(task_data["sentence"]))
+                                    clause.tasks.append(audit_task)
+                                except Exception as e: # Pydantic validation error or other issues
+                                    logger.error(f"Error creating AuditTask from data {task_data} for clause {clause.id}, task index {task_idx}: {e}")
+                            else:
+                                logger.error(f"Invalid task data format in list for clause {clause.id}, task index {task_idx}: {task_data}")
                     
-                    if clause.tasks: # Log only if tasks were successfully created
-                        task_ids = ", ".join([t.id for t in clause.tasks])
-                        logger.info(f"Audit-Plan for clause {clause.id} generated {len(clause.tasks)} tasks: {task_ids}")
-                    else: # Tasks list is empty due to errors in processing individual task data
-                        logger.error(f"No valid audit tasks were processed for clause {clause.id} from LLM response, though tasks data was present.")
+                        if clause.tasks: # Log only if tasks were successfully created
+                            task_ids = ", ".join([t.id for t in clause.tasks])
+                            logger.info(f"Audit-Plan for clause {clause.id} generated {len(clause.tasks)} tasks: {task_ids}")
+                        else: # Tasks list is empty due to errors in processing individual task data
+                            logger.error(f"No valid audit tasks were processed for clause {clause.id} from LLM response, though tasks data was present.")
 
+                else:
+                    logger.error(f"LLM response for clause {clause.id} has 'audit_tasks' but it's not a list: {tasks_data}")
+                    # clause.tasks remains empty
             else:
-                logger.error(f"LLM response for clause {clause.id} has 'audit_tasks' but it's not a list: {tasks_data}")
+                logger.error(f"Failed to generate audit tasks or invalid JSON object structure for clause {clause.id}. LLM response: {llm_response}")
                 # clause.tasks remains empty
-        else:
-            logger.error(f"Failed to generate audit tasks or invalid JSON object structure for clause {clause.id}. LLM response: {llm_response}")
-            # clause.tasks remains empty
             
-        # Update and save run.json
-        for i, run_clause in enumerate(current_project_run_data.external_regulation_clauses):
-            if run_clause.id == clause.id:
-                current_project_run_data.external_regulation_clauses[i] = clause
-                break
-        _save_run_json(current_project_run_data, project_run_json_path)
+            clause_span.set(tasks=len(clause.tasks))
+
+            # Update and save run.json
+            for i, run_clause in enumerate(current_project_run_data.external_regulation_clauses):
+                if run_clause.id == clause.id:
+                    current_project_run_data.external_regulation_clauses[i] = clause
+                    break
+            _save_run_json(current_project_run_data, project_run_json_path)
 
         ui_tasks = [AuditTaskUIData(id=t.id, sentence=t.sentence) for t in clause.tasks]
         message = AuditPlanClauseUIData(
@@ -613,7 +661,7 @@ def execute_audit_plan_step(
 
 def execute_search_step(
     external_regulation_clauses: List[ExternalRegulationClause],
-    project: CompareProject,
+    project: ProjectData,
     current_project_run_data: ProjectRunData,
     settings: PipelineSettings,
     progress_callback: Callable[[float, Union[str, AuditPlanClauseUIData]], None],
@@ -629,190 +677,229 @@ def execute_search_step(
         return
 
     # --- Procedure Document Processing ---
-    raw_docs_procedures: List[RawDoc] = ingest_documents(project.procedure_doc_paths, "procedure")
-    logger.info(f"Ingested {len(raw_docs_procedures)} raw procedure documents.")
-    if not raw_docs_procedures:
-        logger.warning("No raw procedure documents were ingested. Skipping search step.")
-        # logger.error(f"Failed to ingest documents from paths: {project.procedure_doc_paths}") # This was a bit redundant with the warning and the count log
-        progress_callback(0.8, "Search: No procedure documents ingested.")
-        return
-    
-    # logger.info(f"Successfully ingested {len(raw_docs_procedures)} procedure documents") # Moved up
-    
-    norm_docs_procedures: List[NormDoc] = [normalize_document(doc) for doc in raw_docs_procedures]
-    
-    # Store NormDoc original filenames for later reference in task.top_k
-    norm_doc_id_to_filename: Dict[str, str] = {nd.id: nd.metadata.get("original_filename", "Unknown Filename") for nd in norm_docs_procedures}
-
-    # Initialize CacheService for embeddings if needed by generate_embeddings
-    cache_service = CacheService(project_name=project.name)
+    # Initialize CacheService for normalized documents and embeddings
+    cache_service = CacheService(project_name=project.name, backend=settings.cache_backend,
+                                 memory_max_bytes=settings.cache_memory_mb * 1024 * 1024, codec=settings.cache_codec)
 
-    all_proc_embed_sets: List[EmbedSet] = []
-    try:
-        for norm_doc in norm_docs_procedures:
-            if cancel_cb():
-                logger.info("Embedding generation cancelled by user.")
-                break
-            logger.debug(f"Generating embeddings for normalized document: {norm_doc.id} (source: {norm_doc.metadata.get('original_filename', 'N/A')})")
-            api_key = getattr(settings, 'openai_api_key', '') # Ensure settings has this attribute
-            embeds = generate_embeddings(norm_doc, cache_service, api_key, settings.embedding_model)
-            if embeds:
-                all_proc_embed_sets.extend(embeds)
-                logger.debug(f"Successfully generated {len(embeds)} embedding sets for {norm_doc.id}.")
-            else:
-                logger.warning(f"No embeddings generated for document {norm_doc.id}.")
-    except Exception as e:
-        logger.error(f"Error during embedding generation loop for procedures: {e}\n{traceback.format_exc()}")
-        # Depending on desired behavior, you might want to clear all_proc_embed_sets or re-raise
-    
-    if cancel_cb(): # Check again if loop was broken by cancel_cb
-        logger.info("Search step cancelled or no procedure embeddings generated due to cancellation.")
-        progress_callback(0.8, "Search: Cancelled or no procedure embeddings.")
-        return
-
-    # Create temporary FAISS index for procedures
     # Create temporary FAISS index for procedures
     import hashlib # Ensure hashlib is imported
-    # import tempfile # Ensure tempfile is imported (though we are moving away from it) -> No longer needed for path
-    # Import get_app_data_dir if not already imported at the top -> Handled by global import
-
     project_path_hash = hashlib.md5(str(project.run_json_path.parent).encode('utf-8')).hexdigest()
-    
-    # Modify this part for the FAISS index directory
-    # temp_index_dir = Path(tempfile.gettempdir()) / f"regulens_temp_index_{project_path_hash}" # Old way
-    temp_index_dir = get_app_data_dir() / "cache" / "faiss_index" / f"project_{project_path_hash}" # New way
-    temp_index_dir.mkdir(parents=True, exist_ok=True)
-    
-    logger.info(f"Proceeding to FAISS index creation with {len(all_proc_embed_sets)} embedding sets for procedures.")
-    proc_index_meta: Optional[IndexMeta] = None # Initialize
+    temp_index_dir = get_app_data_dir() / "cache" / "faiss_index" / f"project_{project_path_hash}"
+    index_builder: Optional[IndexBuilder] = None
+    # Every exit below, early returns and errors included, closes the caches and removes the index directory
     try:
-        if all_proc_embed_sets: # Only attempt index creation if there are embeddings
-            proc_index_meta = create_or_load_index(
-                all_proc_embed_sets, temp_index_dir, f"procedures_{project_path_hash}", settings.embedding_model
-            )
-        else:
-            logger.warning("Skipping FAISS index creation as there are no procedure embeddings.")
-    except Exception as e:
-        logger.error(f"Error during FAISS index creation for procedures: {e}\n{traceback.format_exc()}")
-        # proc_index_meta will remain None
-
-    if not proc_index_meta and all_proc_embed_sets: # Log error only if embeddings were present but index failed
-        logger.error("Failed to create procedure FAISS index. Aborting search step.")
-        progress_callback(0.8, "Search: Failed to create procedure index.")
-        if temp_index_dir.exists():
-            try:
-                shutil.rmtree(temp_index_dir)
-            except OSError as e_rm:
-                logger.error(f"Error removing FAISS index directory {temp_index_dir} after creation failure: {e_rm}")
-        return
-    elif not all_proc_embed_sets and not proc_index_meta: # Case where no embeddings, so no index
-        logger.info("No procedure embeddings were generated, so no FAISS index created. Search step cannot proceed with retrieval.")
-        # The original `if cancel_cb() or not all_proc_embed_sets:` check before this block should handle
-        # sending progress_callback and returning. If it reaches here, it implies cancel_cb() was false
-        # but all_proc_embed_sets was empty.
-        # The existing `if not proc_index_meta:` check before retrieval loop will handle this.
-        # Ensure the message indicates that the process cannot continue.
-        progress_callback(0.8, "Search: No procedure embeddings, index not created.") # Added specific message
-        return # Explicitly return if no index due to no embeddings
-
-
-    # --- Iterate through Audit Tasks ---
-    # The check `if not proc_index_meta:` before retrieval loop is crucial.
-    # If we returned above due to no embeddings, this part won't run.
-    # If proc_index_meta is None due to an error during creation (and embeddings were present),
-    # we already returned. So this part should only run if proc_index_meta is valid.
-
-    if not proc_index_meta: # This is a safeguard, should have been handled by previous blocks
-        logger.error("Critical: Procedure FAISS index is not available. Aborting search step.")
-        progress_callback(0.8, "Search: Procedure index unavailable.")
-        return
-
-    total_tasks_to_search = sum(len(c.tasks) for c in external_regulation_clauses if c.need_procedure and c.tasks)
-    tasks_searched = 0
-    
-    # Create a map of all EmbedSets for easy lookup by retrieve_similar_chunks
-    all_embed_sets_map: Dict[str, EmbedSet] = {es.id: es for es in all_proc_embed_sets}
+        api_key = getattr(settings, 'openai_api_key', '') # Ensure settings has this attribute
+
+        # Keyword and hybrid engines also need a BM25 index over the same chunks
+        index_builder = IndexBuilder(temp_index_dir, f"procedures_{project_path_hash}", settings.embedding_model,
+                                     lexical=settings.retrieval_engine != RETRIEVAL_ENGINE_DENSE,
+                                     metric=settings.index_metric)
+
+        # Documents stream through ingestion -> normalization -> chunking/embedding
+        # -> index one bounded batch at a time (see iter_ingest_documents,
+        # iter_normalize_documents, iter_embedded_documents), so neither the
+        # documents' text nor their float embeddings are all held in memory. Chunk
+        # texts go to the index builder's chunk store; only the matched ones are
+        # loaded back, for retrieval and the evidence excerpts.
+        norm_doc_id_to_filename: Dict[str, str] = {}  # For later reference in task.top_k
+        docs_processed = 0
+        raw_stream = iter_ingest_documents(project.procedure_doc_paths, "procedure")
+        norm_stream = iter_normalize_documents(raw_stream, cache_service)
+        embed_stream = iter_embedded_documents(norm_stream, cache_service, api_key, settings.embedding_model,
+                                               max_tokens_per_chunk=settings.chunk_max_tokens,
+                                               openai_base_url=settings.openai_base_url,
+                                               chunk_overlap_tokens=settings.chunk_overlap_tokens)
+        try:
+            for norm_doc, embeds in embed_stream:
+                docs_processed += 1
+                norm_doc_id_to_filename[norm_doc.id] = norm_doc.metadata.get("original_filename", "Unknown Filename")
+                if embeds:
+                    index_builder.add(embeds)
+                    logger.debug(f"Successfully generated {len(embeds)} embedding sets for {norm_doc.id}.")
+                else:
+                    logger.warning(f"No embeddings generated for document {norm_doc.id}.")
+                if cancel_cb():
+                    logger.info("Embedding generation cancelled by user.")
+                    break
+        except Exception as e:
+            logger.error(f"Error while streaming procedure documents: {e}\n{traceback.format_exc()}")
+        finally:
+            # Stops the upstream stages (and their worker pools) when the loop ends early
+            for stream in (embed_stream, norm_stream, raw_stream):
+                stream.close()
+        logger.info(f"Processed {docs_processed} procedure documents into {len(index_builder.ids)} indexed chunks.")
+
+        if docs_processed == 0 and not cancel_cb():
+            logger.warning("No raw procedure documents were ingested. Skipping search step.")
+            progress_callback(0.8, "Search: No procedure documents ingested.")
+            return
+
+        if cancel_cb(): # Check again if loop was broken by cancel_cb
+            logger.info("Search step cancelled or no procedure embeddings generated due to cancellation.")
+            progress_callback(0.8, "Search: Cancelled or no procedure embeddings.")
+            return
+
+        if not index_builder.ids:
+            logger.info("No procedure embeddings were generated, so no FAISS index created. Search step cannot proceed with retrieval.")
+            progress_callback(0.8, "Search: No procedure embeddings, index not created.")
+            return
+
+        proc_index_meta: Optional[IndexMeta] = index_builder.finish()
+        if not proc_index_meta:
+            logger.error("Failed to create procedure FAISS index. Aborting search step.")
+            progress_callback(0.8, "Search: Failed to create procedure index.")
+            return
+
+        total_tasks_to_search = sum(len(c.tasks) for c in external_regulation_clauses if c.need_procedure and c.tasks)
+        tasks_searched = 0
+
+        # With a reranker, retrieve a wider candidate set per task and let it pick the top-k (see app.pipeline.rerank)
+        reranker = get_reranker(settings.reranker, settings.rerank_model_path)
+        retrieval_k = max(settings.rerank_candidates, settings.audit_retrieval_top_k) if reranker.enabled else settings.audit_retrieval_top_k
+        rerank_cache = RerankScoreCache(cache_service, f"{reranker.name}:{settings.rerank_model_path}") if reranker.enabled else None
+
+
+        for clause_idx, clause in enumerate(external_regulation_clauses):
+            if not clause.need_procedure or not clause.tasks:
+                continue
+            if cancel_cb(): break
 
+            # 1. Retrieve candidates for the clause's tasks that have no evidence yet
+            candidates: Dict[int, Tuple[str, List[MatchSet]]] = {}
+            for task_idx, task in enumerate(clause.tasks):
+                if cancel_cb(): break
+            
+                # TODO: Should check if task.top_k is already populated and not empty.
+                # The current model has default_factory=list, so it's always a list.
+                # We should perhaps initialize it to None to distinguish.
+                if task.top_k and len(task.top_k) > 0: 
+                    logger.debug(f"Skipping search for task '{task.id}' as top_k evidence already exists.")
+                    tasks_searched += 1
+                    # Update progress
+                    base_progress = 0.6 # Search step is 60-80%
+                    step_progress_span = 0.2
+                    current_task_progress = (tasks_searched / total_tasks_to_search) * step_progress_span if total_tasks_to_search > 0 else 0
+                    progress_callback(base_progress + current_task_progress, f"Search: Task {task.id} (skipped)")
+                    continue
+
+                with span("search_task", "task", clause_id=clause.id, task_id=task.id) as task_span:
+                    logger.info(f"Searching for task: {task.id} - {task.sentence[:50]}...")
+
+                    # Embed the task sentence. This needs a way to embed a single string.
+                    # Reusing generate_embeddings for a single, temporary NormDoc.
+                    # This is a bit hacky; a dedicated embed_single_text function would be cleaner.
+                    temp_task_norm_doc = NormDoc(id=f"task_{task.id}_query", raw_doc_id="task_query", 
+                                                 text_content=task.sentence, sections=[], metadata={}, doc_type="task_query_text")
+                    task_embed_sets = generate_embeddings(temp_task_norm_doc, cache_service, api_key, settings.embedding_model,
+                                                          openai_base_url=settings.openai_base_url)
+            
+                    if not task_embed_sets:
+                        logger.error(f"Failed to generate embedding for task: {task.id}")
+                        tasks_searched += 1
+                        continue
+            
+                    task_embedding = task_embed_sets[0] # Assuming one EmbedSet for the short sentence
+
+                    candidates[task_idx] = (task.sentence, retrieve_chunks(
+                        query_embed_set=task_embedding,
+                        target_index_meta=proc_index_meta,
+                        target_chunks=index_builder.chunks_for,  # Loads only the retrieved procedure chunks
+                        k_results=retrieval_k,
+                        engine=settings.retrieval_engine,
+                        # The indexes built above are searched in memory instead of being re-read for every task
+                        faiss_index_obj=index_builder.index,
+                        id_map_list_obj=index_builder.ids,
+                        lexical_index_obj=index_builder.lexical,
+                    ))
+                    task_span.set(candidates=len(candidates[task_idx][1]))
+            if cancel_cb(): break
 
-    for clause_idx, clause in enumerate(external_regulation_clauses):
-        if not clause.need_procedure or not clause.tasks:
-            continue
-        if cancel_cb(): break
+            # 2. Rerank the candidates of all these tasks in one batch and keep each task's best top-k
+            reranked = rerank_matches(reranker, candidates, settings.audit_retrieval_top_k, rerank_cache)
 
-        for task_idx, task in enumerate(clause.tasks):
-            if cancel_cb(): break
+            # 3. The matches above the score cutoffs become the tasks' evidence
+            fused_scores = settings.retrieval_engine in FUSED_RETRIEVAL_ENGINES and not reranker.enabled
+            for task_idx, matches in reranked.items():
+                task = clause.tasks[task_idx]
+                retrieved = len(matches)
+                matches = apply_score_cutoffs(matches, settings.retrieval_min_score, settings.retrieval_relative_score,
+                                              fused=fused_scores)
             
-            # TODO: Should check if task.top_k is already populated and not empty.
-            # The current model has default_factory=list, so it's always a list.
-            # We should perhaps initialize it to None to distinguish.
-            if task.top_k and len(task.top_k) > 0: 
-                logger.debug(f"Skipping search for task '{task.id}' as top_k evidence already exists.")
+                task.top_k = [] # Clear previous results if any, or initialize
+                # Text and metadata are loaded only for chunks that are not evidence yet
+                new_chunk_ids = [m.matched_embed_set_id for m in matches
+                                 if evidence_id_for(m.matched_embed_set_id) not in current_project_run_data.evidence]
+                new_chunks = index_builder.chunks_for(new_chunk_ids) if new_chunk_ids else {}
+                for match in matches:
+                    # Each chunk is stored once per project; the task keeps a reference and its own score
+                    evidence_id = evidence_id_for(match.matched_embed_set_id)
+                    matched_embed_set = new_chunks.get(match.matched_embed_set_id)
+                    if evidence_id not in current_project_run_data.evidence:
+                        if matched_embed_set is None:
+                            continue
+                        source_filename = norm_doc_id_to_filename.get(matched_embed_set.norm_doc_id, "Unknown Source TXT")
+                        # Page number might be in matched_embed_set.metadata if populated during embedding/chunking
+                        page_no = matched_embed_set.metadata.get("page_number", "N/A") # Example key
+                        current_project_run_data.evidence[evidence_id] = {
+                            "embed_set_id": matched_embed_set.id,
+                            "excerpt": matched_embed_set.chunk_text,
+                            "source_txt": source_filename,
+                            "page_no": page_no,
+                            "section": matched_embed_set.metadata.get("section"),
+                        }
+                    if evidence_id not in clause.evidence:
+                        clause.evidence.append(evidence_id)
+                    task.top_k.append({"evidence_id": evidence_id, "score": match.score})
+            
+                logger.info(f"Found {len(task.top_k)} evidence snippets for task {task.id} ({retrieved - len(matches)} below the score cutoffs)")
                 tasks_searched += 1
-                # Update progress
+
                 base_progress = 0.6 # Search step is 60-80%
                 step_progress_span = 0.2
                 current_task_progress = (tasks_searched / total_tasks_to_search) * step_progress_span if total_tasks_to_search > 0 else 0
-                progress_callback(base_progress + current_task_progress, f"Search: Task {task.id} (skipped)")
-                continue
-
-            logger.info(f"Searching for task: {task.id} - {task.sentence[:50]}...")
-
-            # Embed the task sentence. This needs a way to embed a single string.
-            # Reusing generate_embeddings for a single, temporary NormDoc.
-            # This is a bit hacky; a dedicated embed_single_text function would be cleaner.
-            temp_task_norm_doc = NormDoc(id=f"task_{task.id}_query", raw_doc_id="task_query", 
-                                         text_content=task.sentence, sections=[], metadata={}, doc_type="task_query_text")
-            task_embed_sets = generate_embeddings(temp_task_norm_doc, cache_service, api_key, settings.embedding_model)
-            
-            if not task_embed_sets:
-                logger.error(f"Failed to generate embedding for task: {task.id}")
-                tasks_searched += 1
-                continue
-            
-            task_embedding = task_embed_sets[0] # Assuming one EmbedSet for the short sentence
-
-            matches: List[MatchSet] = retrieve_similar_chunks(
-                query_embed_set=task_embedding,
-                target_index_meta=proc_index_meta,
-                target_embed_sets_map=all_embed_sets_map, # Map of EmbedSet.id to EmbedSet for procedure chunks
-                k_results=settings.audit_retrieval_top_k,
-                # faiss_index_obj and id_map_list_obj are loaded by retrieve_similar_chunks
-            )
-            
-            task.top_k = [] # Clear previous results if any, or initialize
-            for match in matches:
-                matched_embed_set = all_embed_sets_map.get(match.matched_embed_set_id)
-                if matched_embed_set:
-                    source_filename = norm_doc_id_to_filename.get(matched_embed_set.norm_doc_id, "Unknown Source TXT")
-                    # Page number might be in matched_embed_set.metadata if populated during embedding/chunking
-                    page_no = matched_embed_set.metadata.get("page_number", "N/A") # Example key
-                    task.top_k.append({
-                        "excerpt": matched_embed_set.chunk_text,
-                        "source_txt": source_filename,
-                        "page_no": page_no,
-                        "score": match.score
-                    })
-            
-            logger.info(f"Found {len(task.top_k)} evidence snippets for task {task.id}")
-            tasks_searched += 1
-
-            # Update and save run.json (after each task or each clause)
-            # For now, saving after each task to ensure progress is kept.
-            # This might be too frequent for large projects.
+                progress_callback(base_progress + current_task_progress, f"Search: Task {task.id} ({len(task.top_k)} found)")
+
+            # Deduplicate the clause's evidence and keep a diverse, budgeted set for the judge prompt
+            if clause.evidence and not cancel_cb():
+                with span("diversify_evidence", "search", clause_id=clause.id, candidates=len(clause.evidence)) as mmr_span:
+                    embed_set_ids = {current_project_run_data.evidence[eid]["embed_set_id"]: eid for eid in clause.evidence
+                                     if current_project_run_data.evidence.get(eid, {}).get("embed_set_id")}
+                    vectors = {embed_set_ids[es_id]: vector for es_id, vector in index_builder.vectors_for(list(embed_set_ids)).items()}
+                    dropped = diversify_clause_evidence(clause, vectors, settings.clause_evidence_budget,
+                                                        settings.evidence_mmr_lambda)
+                    mmr_span.set(kept=len(clause.evidence), dropped_refs=dropped)
+                logger.info(f"Clause {clause.id}: {len(clause.evidence)} distinct evidence snippets kept, {dropped} task references dropped.")
+
+            # Update and save run.json once per clause rather than after every task
             current_project_run_data.external_regulation_clauses[clause_idx] = clause # Ensure the main list is updated
             _save_run_json(current_project_run_data, project.run_json_path)
 
-            base_progress = 0.6 # Search step is 60-80%
-            step_progress_span = 0.2
-            current_task_progress = (tasks_searched / total_tasks_to_search) * step_progress_span if total_tasks_to_search > 0 else 0
-            progress_callback(base_progress + current_task_progress, f"Search: Task {task.id} ({len(task.top_k)} found)")
+        if cache_service.memory is not None:
+            memory_stats = cache_service.memory.stats()
+            logger.info(f"In-memory cache: {memory_stats['hits']} hits, {memory_stats['misses']} misses, "
+                        f"{memory_stats['evictions']} evictions, {memory_stats['bytes'] / 1e6:.1f} MB held.")
+    finally:
+        cache_service.close()
+        if index_builder is not None:
+            index_builder.close()
+        # Clean up temporary FAISS index directory
+        if temp_index_dir.exists():
+            try:
+                shutil.rmtree(temp_index_dir)
+                logger.info(f"Removed temporary index directory: {temp_index_dir}")
+            except OSError as e:
+                logger.error(f"Error removing temporary index directory {temp_index_dir}: {e}")
 
-    # Clean up temporary FAISS index directory
-    try:
-        shutil.rmtree(temp_index_dir)
-        logger.info(f"Removed temporary index directory: {temp_index_dir}")
-    except OSError as e:
-        logger.error(f"Error removing temporary index directory {temp_index_dir}: {e}")
+    # Keep the caches under their size cap; entries of this run are too recent to be evicted.
+    # Only this project's database is compacted: parallel runs may be writing to the others.
+    if settings.cache_max_mb > 0:
+        try:
+            gc_report = enforce_cache_limit(settings.cache_max_mb * 1024 * 1024, compact_project=project.name)
+            if gc_report.evicted_entries:
+                logger.info(f"Cache size cap: evicted {gc_report.evicted_entries} entries "
+                            f"({gc_report.evicted_bytes / 1e6:.1f} MB); caches now use {gc_report.total_bytes / 1e6:.1f} MB.")
+        except Exception as e:  # A failed cleanup must never fail the run
+            logger.warning(f"Enforcing the cache size cap failed: {e}")
 
 
 def execute_judge_step(
@@ -857,85 +944,107 @@ def execute_judge_step(
             logger.info("Judge step cancelled.")
             break
         
-        logger.info(f"Judging clause: {clause.id} - {clause.title[:50]}...")
-
-        # 1. Collect all evidence for the clause
-        all_evidence_texts = []
-        for task_idx, task in enumerate(clause.tasks):
-            if task.top_k:
-                for ev_idx, ev_item in enumerate(task.top_k):
-                    # Using a more detailed evidence header
-                    evidence_header = f"Evidence for Task '{task.id}' ({task.sentence[:30]}...), Snippet {ev_idx+1}"
-                    evidence_detail = f"(Source: {ev_item.get('source_txt', 'N/A')}, Page: {ev_item.get('page_no', 'N/A')}, Score: {ev_item.get('score', 0.0):.2f})"
-                    all_evidence_texts.append(f"{evidence_header} {evidence_detail}:\n{ev_item.get('excerpt', '')}")
+        with span("judge_clause", "clause", clause_id=clause.id) as clause_span:
+            logger.info(f"Judging clause: {clause.id} - {clause.title[:50]}...")
+
+            # 1. Collect all evidence for the clause. Deduplicated evidence is listed once,
+            # with every task that retrieved it; legacy per-task snippets as they were stored.
+            all_evidence_texts = []
+            evidence_tasks: Dict[str, List[str]] = {}
+            evidence_scores: Dict[str, float] = {}
+            for task_idx, task in enumerate(clause.tasks):
+                if task.top_k:
+                    for ev_idx, ev_item in enumerate(task.top_k):
+                        evidence_id = ev_item.get('evidence_id')
+                        if evidence_id in clause.evidence and evidence_id in current_project_run_data.evidence:
+                            evidence_tasks.setdefault(evidence_id, []).append(task.id)
+                            evidence_scores[evidence_id] = max(evidence_scores.get(evidence_id, float('-inf')), ev_item.get('score', 0.0))
+                            continue
+                        # Using a more detailed evidence header
+                        evidence_header = f"Evidence for Task '{task.id}' ({task.sentence[:30]}...), Snippet {ev_idx+1}"
+                        section_detail = f", Section: {ev_item['section']}" if ev_item.get('section') else ""
+                        evidence_detail = f"(Source: {ev_item.get('source_txt', 'N/A')}, Page: {ev_item.get('page_no', 'N/A')}{section_detail}, Score: {ev_item.get('score', 0.0):.2f})"
+                        all_evidence_texts.append(f"{evidence_header} {evidence_detail}:\n{ev_item.get('excerpt', '')}")
+            for evidence_id in clause.evidence:
+                if evidence_id not in evidence_tasks:
+                    continue
+                ev_item = current_project_run_data.evidence[evidence_id]
+                task_list = ", ".join(f"'{task_id}'" for task_id in evidence_tasks[evidence_id])
+                evidence_header = f"Evidence {evidence_id} (retrieved for Task {task_list})"
+                section_detail = f", Section: {ev_item['section']}" if ev_item.get('section') else ""
+                evidence_detail = f"(Source: {ev_item.get('source_txt', 'N/A')}, Page: {ev_item.get('page_no', 'N/A')}{section_detail}, Score: {evidence_scores[evidence_id]:.2f})"
+                all_evidence_texts.append(f"{evidence_header} {evidence_detail}:\n{ev_item.get('excerpt', '')}")
         
-        if not all_evidence_texts:
-            evidence_prompt_str = "No evidence was retrieved for this external_regulation clause through any of its audit tasks."
-            logger.info(f"No evidence found for clause {clause.id}. Proceeding with judgment based on lack of evidence.")
-        else:
-            evidence_prompt_str = "\n\n".join(all_evidence_texts)
-
-        # 2. Construct Clause-Level Prompt
-        prompt = (
-            f"Your task is to determine if the provided 'Aggregated Evidence' (extracted from internal company documents) adequately demonstrates "
-            f"that the company has a documented procedure or policy in place that corresponds to the 'ExternalRegulation Clause' (from external regulations). "
-            f"Focus strictly on whether the internal documentation addresses the requirements of the external_regulation clause from a documentation standpoint, "
-            f"not on whether the procedures are perfectly implemented in practice.\n\n"
+            if not all_evidence_texts:
+                evidence_prompt_str = "No evidence was retrieved for this external_regulation clause through any of its audit tasks."
+                logger.info(f"No evidence found for clause {clause.id}. Proceeding with judgment based on lack of evidence.")
+            else:
+                evidence_prompt_str = "\n\n".join(all_evidence_texts)
+
+            clause_span.set(evidence_snippets=len(all_evidence_texts))
+
+            # 2. Construct Clause-Level Prompt
+            prompt = (
+                f"Your task is to determine if the provided 'Aggregated Evidence' (extracted from internal company documents) adequately demonstrates "
+                f"that the company has a documented procedure or policy in place that corresponds to the 'ExternalRegulation Clause' (from external regulations). "
+                f"Focus strictly on whether the internal documentation addresses the requirements of the external_regulation clause from a documentation standpoint, "
+                f"not on whether the procedures are perfectly implemented in practice.\n\n"
             
-            f"ExternalRegulation Clause ID: {clause.id}\n"
-            f"ExternalRegulation Clause Text (External Regulation): \"{clause.text}\"\n\n"
-            f"Aggregated Evidence (from Internal Company Documents):\n{evidence_prompt_str}\n\n"
+                f"ExternalRegulation Clause ID: {clause.id}\n"
+                f"ExternalRegulation Clause Text (External Regulation): \"{clause.text}\"\n\n"
+                f"Aggregated Evidence (from Internal Company Documents):\n{evidence_prompt_str}\n\n"
             
-            f"Respond with a JSON object containing the following keys:\n"
-            f"1. 'compliant': boolean (Set to true if the internal documentation, as shown in the 'Aggregated Evidence', adequately documents a procedure or policy that addresses the 'ExternalRegulation Clause'. Set to false otherwise, including if evidence is insufficient or irrelevant).\n"
-            f"2. 'compliance_description': string (Explain how the provided 'Aggregated Evidence' demonstrates documented compliance or where the internal documentation falls short in addressing the 'ExternalRegulation Clause'. Quote or refer to specific parts of the evidence if helpful to illustrate the connection or gap).\n"
-            f"3. 'improvement_suggestions': string (If 'compliant' is false, or if documentation only partially addresses the clause, suggest specific additions or changes to the internal documentation to make it fully address the 'ExternalRegulation Clause'. If 'compliant' is true and documentation is comprehensive for this clause, state that no further documentation improvements are suggested based on the provided evidence for this specific clause.)\n\n"
+                f"Respond with a JSON object containing the following keys:\n"
+                f"1. 'compliant': boolean (Set to true if the internal documentation, as shown in the 'Aggregated Evidence', adequately documents a procedure or policy that addresses the 'ExternalRegulation Clause'. Set to false otherwise, including if evidence is insufficient or irrelevant).\n"
+                f"2. 'compliance_description': string (Explain how the provided 'Aggregated Evidence' demonstrates documented compliance or where the internal documentation falls short in addressing the 'ExternalRegulation Clause'. Quote or refer to specific parts of the evidence if helpful to illustrate the connection or gap).\n"
+                f"3. 'improvement_suggestions': string (If 'compliant' is false, or if documentation only partially addresses the clause, suggest specific additions or changes to the internal documentation to make it fully address the 'ExternalRegulation Clause'. If 'compliant' is true and documentation is comprehensive for this clause, state that no further documentation improvements are suggested based on the provided evidence for this specific clause.)\n\n"
             
-            f"**Your entire assessment for the ExternalRegulation Clause must be derived SOLELY from the text presented in the 'Aggregated Evidence' section above.**\n"
-            f"Based *only* on the provided 'Aggregated Evidence', does the internal documentation show a corresponding procedure or policy for the 'ExternalRegulation Clause'? Provide your assessment in the specified JSON format."
-        )
+                f"**Your entire assessment for the ExternalRegulation Clause must be derived SOLELY from the text presented in the 'Aggregated Evidence' section above.**\n"
+                f"Based *only* on the provided 'Aggregated Evidence', does the internal documentation show a corresponding procedure or policy for the 'ExternalRegulation Clause'? Provide your assessment in the specified JSON format."
+            )
 
-        llm_response = call_llm_api(
-            prompt=prompt,
-            model_name=settings.llm_model_judge,
-            api_key=settings.openai_api_key,
-            expected_response_type="json_object"
-        )
+            llm_response = call_llm_api(
+                prompt=prompt,
+                model_name=settings.llm_model_judge,
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                expected_response_type="json_object"
+            )
 
-        # 3. Process LLM Response and Store Judgment
-        clause_compliant_status = None
-        clause_compliance_desc = "Error: Failed to get valid compliance description from LLM for clause."
-        clause_improvement_sugg = "Error: Failed to get valid improvement suggestions from LLM for clause."
+            # 3. Process LLM Response and Store Judgment
+            clause_compliant_status = None
+            clause_compliance_desc = "Error: Failed to get valid compliance description from LLM for clause."
+            clause_improvement_sugg = "Error: Failed to get valid improvement suggestions from LLM for clause."
 
-        if llm_response and isinstance(llm_response, dict) and "compliant" in llm_response:
-            clause_compliant_status = llm_response.get("compliant")
-            clause_compliance_desc = llm_response.get("compliance_description", "")
-            clause_improvement_sugg = llm_response.get("improvement_suggestions", "")
+            if llm_response and isinstance(llm_response, dict) and "compliant" in llm_response:
+                clause_compliant_status = llm_response.get("compliant")
+                clause_compliance_desc = llm_response.get("compliance_description", "")
+                clause_improvement_sugg = llm_response.get("improvement_suggestions", "")
 
-            if not clause_compliance_desc:
-                logger.warning(f"LLM response for clause {clause.id} is missing 'compliance_description'. Storing as empty string.")
-            if not clause_improvement_sugg:
-                logger.warning(f"LLM response for clause {clause.id} is missing 'improvement_suggestions'. Storing as empty string.")
+                if not clause_compliance_desc:
+                    logger.warning(f"LLM response for clause {clause.id} is missing 'compliance_description'. Storing as empty string.")
+                if not clause_improvement_sugg:
+                    logger.warning(f"LLM response for clause {clause.id} is missing 'improvement_suggestions'. Storing as empty string.")
             
-            logger.info(f"Judgment for clause {clause.id}: Compliant={clause_compliant_status}")
-            logger.debug(f"Clause {clause.id} - Compliance Description: {clause_compliance_desc[:100]}...")
-            logger.debug(f"Clause {clause.id} - Improvement Suggestions: {clause_improvement_sugg[:100]}...")
-        else:
-            logger.error(f"Failed to judge compliance for clause {clause.id}. LLM response: {llm_response}")
-
-        clause.metadata['clause_compliant'] = clause_compliant_status
-        clause.metadata['clause_compliance_description'] = clause_compliance_desc
-        clause.metadata['clause_improvement_suggestions'] = clause_improvement_sugg
-
-        # 4. Propagate Judgment to Tasks
-        for task in clause.tasks:
-            task.compliant = clause_compliant_status
-            task.metadata["compliance_description"] = clause_compliance_desc
-            task.metadata["improvement_suggestions"] = clause_improvement_sugg
-            task.metadata.pop("judge_reasoning", None) # Remove old task-specific key if it exists
+                logger.info(f"Judgment for clause {clause.id}: Compliant={clause_compliant_status}")
+                logger.debug(f"Clause {clause.id} - Compliance Description: {clause_compliance_desc[:100]}...")
+                logger.debug(f"Clause {clause.id} - Improvement Suggestions: {clause_improvement_sugg[:100]}...")
+            else:
+                logger.error(f"Failed to judge compliance for clause {clause.id}. LLM response: {llm_response}")
+
+            clause.metadata['clause_compliant'] = clause_compliant_status
+            clause.metadata['clause_compliance_description'] = clause_compliance_desc
+            clause.metadata['clause_improvement_suggestions'] = clause_improvement_sugg
+
+            # 4. Propagate Judgment to Tasks
+            for task in clause.tasks:
+                task.compliant = clause_compliant_status
+                task.metadata["compliance_description"] = clause_compliance_desc
+                task.metadata["improvement_suggestions"] = clause_improvement_sugg
+                task.metadata.pop("judge_reasoning", None) # Remove old task-specific key if it exists
         
-        current_project_run_data.external_regulation_clauses[clause_idx_in_main_list] = clause # Update in main list
-        _save_run_json(current_project_run_data, project_run_json_path)
+            current_project_run_data.external_regulation_clauses[clause_idx_in_main_list] = clause # Update in main list
+            _save_run_json(current_project_run_data, project_run_json_path)
         
         judged_clauses_count += 1
         current_clause_progress = (judged_clauses_count / total_clauses_to_judge_count) * step_progress_span
@@ -944,7 +1053,7 @@ def execute_judge_step(
 
 if __name__ == '__main__':
     # This is a basic test runner.
-    # In a real scenario, CompareProject and PipelineSettings would be instantiated properly.
+    # In a real scenario, ProjectData and PipelineSettings would be instantiated properly.
     
     # Create a dummy project
     mock_project_dir = Path("temp_pipeline_test_project")
@@ -969,7 +1078,7 @@ if __name__ == '__main__':
     # run_json_file.write_text(json.dumps(mock_run_data, indent=4))
 
 
-    test_project = CompareProject(name="TestProject")
+    test_project = ProjectData(name="TestProject")
     test_project.external_regulations_json_path = external_regulations_json_file
     test_project.run_json_path = mock_project_dir / "run.json" # Important: set this path
 
@@ -1082,4 +1191,3 @@ if __name__ == '__main__':
 # And ensure these settings are loaded from config_default.yaml or another config source.
 # The main application would be responsible for creating and passing PipelineSettings instance.
 
-print("app.pipeline.pipeline_v1_1.py created/updated.")
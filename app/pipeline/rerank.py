@@ -0,0 +1,229 @@
+"""
+Optional rerank stage between retrieval and the tasks' ``top_k``.
+
+Retrieval casts a wide net (``PipelineSettings.rerank_candidates`` matches per
+task). A reranker then rescores each (task sentence, chunk) pair and keeps the
+best ``audit_retrieval_top_k``. Recall stays high, and fewer, better snippets
+reach the judge prompt.
+
+Backends (``PipelineSettings.reranker``):
+
+- ``"none"`` (default): ``NoOpReranker`` keeps the retrieval order and only
+  truncates to k.
+- ``"cross-encoder"``: ``OnnxCrossEncoderReranker`` runs a small cross-encoder
+  (e.g. an ONNX export of ms-marco-MiniLM) on the CPU. It needs the optional
+  ``onnxruntime`` and ``tokenizers`` packages, and a model directory holding
+  ``model.onnx`` and ``tokenizer.json``. Without them, ``get_reranker`` logs a
+  warning and falls back to the no-op backend.
+
+``rerank_matches`` scores the candidates of several tasks in one batched pass.
+Scores are cached per (query hash, chunk id) in the project's CacheService,
+so a resumed run or an unchanged task costs no model calls.
+"""
+
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+try:
+    from app.logger import logger
+    from app.models.assessments import MatchSet
+    from app.pipeline.cache import CacheService
+    from app.pipeline.tracing import span
+    from app.pipeline_settings import RERANKER_CROSS_ENCODER, RERANKER_NONE
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from app.logger import logger  # type: ignore
+    from app.models.assessments import MatchSet  # type: ignore
+    from app.pipeline.cache import CacheService  # type: ignore
+    from app.pipeline.tracing import span  # type: ignore
+    from app.pipeline_settings import RERANKER_CROSS_ENCODER, RERANKER_NONE  # type: ignore
+
+try:
+    import onnxruntime  # type: ignore
+    from tokenizers import Tokenizer  # type: ignore
+except ImportError:  # Optional; the no-op reranker needs neither
+    onnxruntime = None
+    Tokenizer = None
+
+# (query, passage) pairs per model call
+RERANK_BATCH_SIZE = 32
+# Cross-encoder input length in tokens (query and passage together)
+RERANK_MAX_LENGTH = 256
+
+
+class Reranker:
+    """Scores (query, passage) pairs; higher is more relevant."""
+    name = RERANKER_NONE
+    enabled = True  # False: keep the retrieval order
+    batch_size = RERANK_BATCH_SIZE
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        raise NotImplementedError
+
+
+class NoOpReranker(Reranker):
+    enabled = False
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        return [0.0] * len(pairs)
+
+
+class OnnxCrossEncoderReranker(Reranker):
+    """Cross-encoder exported to ONNX, run on the CPU with onnxruntime."""
+    name = RERANKER_CROSS_ENCODER
+
+    def __init__(self, model_dir: Path, batch_size: int = RERANK_BATCH_SIZE, max_length: int = RERANK_MAX_LENGTH):
+        if onnxruntime is None or Tokenizer is None:
+            raise ImportError("The cross-encoder reranker needs the 'onnxruntime' and 'tokenizers' packages")
+        self.model_dir = Path(model_dir)
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.session = onnxruntime.InferenceSession(str(self.model_dir / "model.onnx"),
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        scores: List[float] = []
+        for start in range(0, len(pairs), self.batch_size):
+            encodings = self.tokenizer.encode_batch(list(pairs[start:start + self.batch_size]))
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            logits = np.asarray(logits, dtype=np.float64).reshape(len(encodings), -1)
+            if logits.shape[1] == 1:  # Single relevance logit (ms-marco style)
+                batch_scores = 1.0 / (1.0 + np.exp(-logits[:, 0]))
+            else:  # (not relevant, relevant) logits
+                exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+                batch_scores = exp[:, -1] / exp.sum(axis=1)
+            scores.extend(float(s) for s in batch_scores)
+        return scores
+
+
+def get_reranker(name: str, model_path: Optional[Path] = None) -> Reranker:
+    """Reranker for ``PipelineSettings.reranker``; falls back to ``NoOpReranker`` when it cannot be loaded."""
+    if not name or name == RERANKER_NONE:
+        return NoOpReranker()
+    if name == RERANKER_CROSS_ENCODER:
+        if model_path is None:
+            logger.warning("Cross-encoder reranker selected but no rerank_model_path is set; reranking is off.")
+            return NoOpReranker()
+        try:
+            return OnnxCrossEncoderReranker(model_path)
+        except Exception as e:
+            logger.warning(f"Could not load the cross-encoder reranker from {model_path}: {e}. Reranking is off.")
+            return NoOpReranker()
+    logger.warning(f"Unknown reranker '{name}'; reranking is off.")
+    return NoOpReranker()
+
+
+class RerankScores(BaseModel):
+    scores: Dict[str, float] = Field(default_factory=dict)  # Chunk (EmbedSet) id -> rerank score
+
+
+class RerankScoreCache:
+    """Rerank scores per (query hash, chunk id), one cache file per reranker model and query."""
+
+    def __init__(self, cache_service: CacheService, model_id: str):
+        self.cache_service = cache_service
+        self.model_id = model_id
+        self._loaded: Dict[str, RerankScores] = {}  # Cache key -> scores, for queries seen this run
+        self._dirty: set = set()
+
+    def _key(self, query: str) -> str:
+        return CacheService.generate_key("rerank", self.model_id, query)
+
+    def _scores(self, query: str) -> RerankScores:
+        key = self._key(query)
+        if key not in self._loaded:
+            self._loaded[key] = self.cache_service.load_json(key, RerankScores) or RerankScores()
+        return self._loaded[key]
+
+    def get(self, query: str, chunk_id: str) -> Optional[float]:
+        return self._scores(query).scores.get(chunk_id)
+
+    def put(self, query: str, chunk_id: str, score: float) -> None:
+        self._scores(query).scores[chunk_id] = score
+        self._dirty.add(self._key(query))
+
+    def flush(self) -> None:
+        for key in self._dirty:
+            self.cache_service.save_json(key, self._loaded[key])
+        self._dirty.clear()
+
+
+def rerank_matches(
+    reranker: Reranker,
+    candidates: Dict[Hashable, Tuple[str, List[MatchSet]]],
+    k: int,
+    cache: Optional[RerankScoreCache] = None
+) -> Dict[Hashable, List[MatchSet]]:
+    """
+    Reranks each task's candidate matches and keeps its best ``k``.
+    ``candidates`` maps a task key to (query text, retrieved matches). The
+    pairs of all tasks that are not cached are scored in one batched pass.
+    Reranked matches carry the reranker's score in ``score`` and the
+    retrieval score in ``retrieval_score``.
+    """
+    if not reranker.enabled:
+        return {task_id: matches[:k] for task_id, (_, matches) in candidates.items()}
+
+    scores: Dict[Tuple[str, str], float] = {}
+    pending: Dict[Tuple[str, str], str] = {}  # (query, chunk id) -> chunk text, each pair once
+    for query, matches in candidates.values():
+        for match in matches:
+            pair = (query, match.matched_embed_set_id)
+            if pair in scores or pair in pending:
+                continue
+            cached = cache.get(*pair) if cache is not None else None
+            if cached is None:
+                pending[pair] = match.matched_chunk_text
+            else:
+                scores[pair] = cached
+
+    with span("rerank", "search", reranker=reranker.name, tasks=len(candidates),
+              pairs=len(scores) + len(pending), cached=len(scores)):
+        if pending:
+            new_scores = reranker.score([(query, text) for (query, _), text in pending.items()])
+            for pair, score in zip(pending, new_scores):
+                scores[pair] = score
+                if cache is not None:
+                    cache.put(*pair, score)
+            if cache is not None:
+                cache.flush()
+
+    reranked: Dict[Hashable, List[MatchSet]] = {}
+    for task_id, (query, matches) in candidates.items():
+        rescored = [m.model_copy(update={"score": scores[(query, m.matched_embed_set_id)], "retrieval_score": m.score})
+                    for m in matches]
+        # Stable sort: ties keep the retrieval order
+        reranked[task_id] = sorted(rescored, key=lambda m: -m.score)[:k]
+    return reranked
+
+
+if __name__ == '__main__':
+    class OverlapReranker(Reranker):
+        """Toy backend: share of query words found in the passage."""
+        name = "word-overlap"
+
+        def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+            return [len(set(q.lower().split()) & set(p.lower().split())) / max(len(q.split()), 1) for q, p in pairs]
+
+    def demo_match(i: int, text: str, score: float) -> MatchSet:
+        return MatchSet(query_norm_doc_id="q", query_embed_set_id="q", query_chunk_text="q", matched_norm_doc_id="d",
+                        matched_embed_set_id=f"es{i}", matched_chunk_text=text, score=score,
+                        query_doc_type="task_query_text", matched_doc_type="procedures")
+
+    demo_candidates = {"T1": ("backup restore test", [demo_match(0, "Passwords rotate yearly", 0.9),
+                                                      demo_match(1, "The backup restore test runs monthly", 0.8)])}
+    print(get_reranker(RERANKER_NONE).name)
+    for task_id, kept in rerank_matches(OverlapReranker(), demo_candidates, k=1).items():
+        print(task_id, [(m.matched_chunk_text, m.score, m.retrieval_score) for m in kept])
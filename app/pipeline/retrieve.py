@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Callable, Dict, List, Mapping, Optional, Union
 
 import faiss  # type: ignore
 import numpy as np
@@ -10,19 +10,46 @@ try:
     from app.models.docs import EmbedSet, IndexMeta
     from app.models.assessments import MatchSet
     # For testing, we might need create_or_load_index
-    from app.pipeline.index import create_or_load_index 
+    from app.pipeline.index import METRIC_COSINE, create_or_load_index, prepare_vectors
+    from app.pipeline.lexical import BM25Index
+    from app.pipeline.tracing import span
+    from app.pipeline_settings import (RETRIEVAL_ENGINES, RETRIEVAL_ENGINE_BM25, RETRIEVAL_ENGINE_DENSE,
+                                       RETRIEVAL_ENGINE_HYBRID_RRF)
 except ImportError:
     import sys
     sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
     from app.models.docs import EmbedSet, IndexMeta  # type: ignore
     from app.models.assessments import MatchSet  # type: ignore
-    from app.pipeline.index import create_or_load_index  # type: ignore
+    from app.pipeline.index import METRIC_COSINE, create_or_load_index, prepare_vectors  # type: ignore
+    from app.pipeline.lexical import BM25Index  # type: ignore
+    from app.pipeline.tracing import span  # type: ignore
+    from app.pipeline_settings import (RETRIEVAL_ENGINES, RETRIEVAL_ENGINE_BM25, RETRIEVAL_ENGINE_DENSE,  # type: ignore
+                                       RETRIEVAL_ENGINE_HYBRID_RRF)
+
+# Hybrid engines ask each retriever for this many times k candidates before fusing
+HYBRID_CANDIDATE_MULTIPLIER = 4
+# Reciprocal-rank fusion constant; larger values flatten the difference between ranks
+RRF_K = 60
+# Share of the dense similarity in hybrid fusion; the rest goes to BM25
+HYBRID_DENSE_WEIGHT = 0.5
+
+# Where retrieval gets the matched chunks' text from: a dict of every EmbedSet by
+# id, or a lookup that loads only the requested ids (e.g. IndexBuilder.chunks_for),
+# so the caller does not need to hold every chunk of the corpus in memory.
+ChunkSource = Union[Mapping[str, EmbedSet], Callable[[List[str]], Dict[str, EmbedSet]]]
+
+
+def _resolve_chunks(target_chunks: ChunkSource, embed_set_ids: List[str]) -> Dict[str, EmbedSet]:
+    """EmbedSets of ``embed_set_ids`` that ``target_chunks`` knows, by id."""
+    if callable(target_chunks):
+        return target_chunks(embed_set_ids)
+    return {es_id: target_chunks[es_id] for es_id in embed_set_ids if es_id in target_chunks}
 
 
 def retrieve_similar_chunks(
     query_embed_set: EmbedSet,
     target_index_meta: IndexMeta,
-    target_embed_sets_map: Dict[str, EmbedSet],  # Maps EmbedSet.id to EmbedSet object
+    target_chunks: ChunkSource,  # EmbedSet.id -> EmbedSet, as a dict or a lookup (see ChunkSource)
     k_results: int,
     faiss_index_obj: Optional[faiss.Index] = None,
     id_map_list_obj: Optional[List[str]] = None  # List of EmbedSet.id, index is FAISS ID
@@ -42,7 +69,8 @@ def retrieve_similar_chunks(
                 print(f"Error: Index file not found at {target_index_meta.index_file_path}")
                 return results
             # print(f"Loading FAISS index from: {target_index_meta.index_file_path}")
-            loaded_index = faiss.read_index(str(target_index_meta.index_file_path))
+            with span("index_load", "index", bytes=target_index_meta.index_file_path.stat().st_size):
+                loaded_index = faiss.read_index(str(target_index_meta.index_file_path))
         
         if loaded_id_map is None:
             if not target_index_meta.id_mapping_path.exists():
@@ -70,7 +98,8 @@ def retrieve_similar_chunks(
         print(f"Error: Query EmbedSet '{query_embed_set.id}' has an empty embedding list.")
         return results
         
-    query_vector_np = np.array([query_embed_set.embedding], dtype='float32')
+    # Cosine indexes hold normalized vectors; the query is normalized the same way
+    query_vector_np = prepare_vectors([query_embed_set.embedding], target_index_meta.metric)
     
     if query_vector_np.shape[1] != loaded_index.d:
         print(f"Error: Query vector dimension ({query_vector_np.shape[1]}) "
@@ -90,7 +119,8 @@ def retrieve_similar_chunks(
             return results
 
         # print(f"Performing FAISS search with k={actual_k} for query {query_embed_set.id} against {target_index_meta.doc_type} index.")
-        distances, faiss_ids = loaded_index.search(query_vector_np, actual_k)
+        with span("search", "search", k=actual_k, vectors=loaded_index.ntotal):
+            distances, faiss_ids = loaded_index.search(query_vector_np, actual_k)
         
     except RuntimeError as re:  # Catch FAISS specific runtime errors
         print(f"FAISS runtime error during search for query {query_embed_set.id}: {re}")
@@ -99,6 +129,7 @@ def retrieve_similar_chunks(
         print(f"Unexpected error during FAISS search for query {query_embed_set.id}: {e}")
         return results
 
+    found = []  # (EmbedSet id, distance) in rank order
     for i in range(faiss_ids.shape[1]):  # Iterate through found neighbors for the query
         faiss_internal_id = faiss_ids[0, i]
         dist = distances[0, i]
@@ -113,16 +144,20 @@ def retrieve_similar_chunks(
                   f"for ID map of length {len(loaded_id_map)}. Skipping this match.")
             continue
 
-        matched_embed_set_id = loaded_id_map[faiss_internal_id]
-        matched_embed_set = target_embed_sets_map.get(matched_embed_set_id)
+        found.append((loaded_id_map[faiss_internal_id], dist))
 
+    # Only the k matched chunks are looked up
+    matched_embed_sets = _resolve_chunks(target_chunks, [es_id for es_id, _ in found])
+    for matched_embed_set_id, dist in found:
+        matched_embed_set = matched_embed_sets.get(matched_embed_set_id)
         if matched_embed_set is None:
-            print(f"Error: EmbedSet ID '{matched_embed_set_id}' (from FAISS ID {faiss_internal_id}) "
-                  f"not found in target_embed_sets_map. Skipping this match.")
+            print(f"Error: EmbedSet ID '{matched_embed_set_id}' not found in target_chunks. Skipping this match.")
             continue
 
-        # L2 distance is non-negative.
-        similarity_score = 1.0 / (1.0 + float(dist))
+        if target_index_meta.metric == METRIC_COSINE:
+            similarity_score = float(dist)  # Inner product of unit vectors: the cosine similarity
+        else:
+            similarity_score = 1.0 / (1.0 + float(dist))  # L2 distance is non-negative.
 
         results.append(MatchSet(
             query_norm_doc_id=query_embed_set.norm_doc_id,
@@ -137,11 +172,167 @@ def retrieve_similar_chunks(
             matched_doc_type=target_index_meta.doc_type  # Or matched_embed_set.doc_type
         ))
         
-    # Results from FAISS are already sorted by distance (ascending),
-    # so the derived similarity_score (descending) will also be sorted.
+    # Results from FAISS are already sorted best first (ascending L2 distance or
+    # descending inner product), so similarity_score is sorted descending.
+    return results
+
+
+def retrieve_lexical_chunks(
+    query_embed_set: EmbedSet,
+    target_index_meta: IndexMeta,
+    target_chunks: ChunkSource,
+    k_results: int,
+    lexical_index_obj: Optional[BM25Index] = None,
+    id_map_list_obj: Optional[List[str]] = None
+) -> List[MatchSet]:
+    """
+    BM25 search for the query chunk's text. The index's document numbers are
+    FAISS ids, so they are resolved through the same id map. The score is the
+    BM25 score squashed into [0, 1) as ``s / (1 + s)``, like the dense
+    ``1 / (1 + distance)``. The raw value is kept in ``lexical_score``.
+    """
+    results: List[MatchSet] = []
+    if k_results == 0:
+        return results
+    try:
+        if lexical_index_obj is None:
+            if target_index_meta.lexical_index_path is None or not target_index_meta.lexical_index_path.exists():
+                print(f"Error: No BM25 index available for doc_type '{target_index_meta.doc_type}'.")
+                return results
+            lexical_index_obj = BM25Index.load(target_index_meta.lexical_index_path)
+        if id_map_list_obj is None:
+            with open(target_index_meta.id_mapping_path, 'r', encoding='utf-8') as f:
+                id_map_list_obj = json.load(f)
+    except Exception as e:
+        print(f"Error loading BM25 index or ID map for doc_type '{target_index_meta.doc_type}': {e}")
+        return results
+
+    found = [(id_map_list_obj[doc_number] if doc_number < len(id_map_list_obj) else None, doc_number, bm25_score)
+             for doc_number, bm25_score in lexical_index_obj.search(query_embed_set.chunk_text, k_results)]
+    matched_embed_sets = _resolve_chunks(target_chunks, [es_id for es_id, _, _ in found if es_id is not None])
+    for matched_embed_set_id, doc_number, bm25_score in found:
+        matched_embed_set = matched_embed_sets.get(matched_embed_set_id) if matched_embed_set_id is not None else None
+        if matched_embed_set is None:
+            print(f"Error: BM25 document {doc_number} has no EmbedSet in target_chunks. Skipping this match.")
+            continue
+        results.append(MatchSet(
+            query_norm_doc_id=query_embed_set.norm_doc_id,
+            query_embed_set_id=query_embed_set.id,
+            query_chunk_text=query_embed_set.chunk_text,
+            matched_norm_doc_id=matched_embed_set.norm_doc_id,
+            matched_embed_set_id=matched_embed_set.id,
+            matched_chunk_text=matched_embed_set.chunk_text,
+            score=bm25_score / (1.0 + bm25_score),
+            lexical_score=bm25_score,
+            query_doc_type=query_embed_set.doc_type,
+            matched_doc_type=target_index_meta.doc_type
+        ))
     return results
 
 
+def fuse_matches(
+    dense_matches: List[MatchSet],
+    lexical_matches: List[MatchSet],
+    k_results: int,
+    method: str = "rrf",
+    dense_weight: float = HYBRID_DENSE_WEIGHT
+) -> List[MatchSet]:
+    """
+    Fuses two ranked match lists into the top ``k_results`` by EmbedSet id.
+
+    - ``"rrf"``: weighted reciprocal rank, ``w / (RRF_K + rank)``, rescaled so
+      a chunk ranked first by both retrievers scores 1.0.
+    - ``"weighted"``: ``dense_weight * dense score + (1 - dense_weight) * lexical score``.
+      Both scores are at most 1 (cosine similarities can be negative).
+
+    A chunk found by only one retriever gets nothing from the other. Fused
+    matches keep both ``raw_faiss_distance`` and ``lexical_score``. Ties keep
+    dense order first.
+    """
+    fused: Dict[str, MatchSet] = {}
+    scores: Dict[str, float] = {}
+    for weight, matches in ((dense_weight, dense_matches), (1.0 - dense_weight, lexical_matches)):
+        for rank, match in enumerate(matches, start=1):
+            key = match.matched_embed_set_id
+            contribution = weight / (RRF_K + rank) if method == "rrf" else weight * match.score
+            scores[key] = scores.get(key, 0.0) + contribution
+            existing = fused.get(key)
+            if existing is None:
+                fused[key] = match
+            elif match.lexical_score is not None:
+                fused[key] = existing.model_copy(update={"lexical_score": match.lexical_score})
+    scale = (RRF_K + 1) if method == "rrf" else 1.0
+    ranked = sorted(fused, key=lambda key: -scores[key])  # Stable: dense order breaks ties
+    return [fused[key].model_copy(update={"score": scores[key] * scale}) for key in ranked[:k_results]]
+
+
+def apply_score_cutoffs(
+    matches: List[MatchSet],
+    min_score: float = 0.0,
+    relative_score: float = 0.0,
+    fused: bool = False
+) -> List[MatchSet]:
+    """
+    Adaptive k: of the (up to k) ``matches``, keeps those scoring at least
+    ``min_score`` and at least ``relative_score`` times the best match's
+    score. A value of 0 disables a cutoff. The relative cutoff only applies
+    when the best score is positive. Scores are whatever the retrieval engine
+    produced, so thresholds depend on the engine and index metric.
+
+    With ``fused`` (scores from ``fuse_matches``) the relative cutoff is
+    skipped: a chunk found by only one retriever, such as an exact-term BM25
+    hit, scores about half of one both retrievers found.
+    """
+    if not matches:
+        return matches
+    best = max(m.score for m in matches)
+    floors = []
+    if min_score > 0:
+        floors.append(min_score)
+    if relative_score > 0 and best > 0 and not fused:
+        floors.append(best * relative_score)
+    if not floors:
+        return matches
+    floor = max(floors)
+    return [m for m in matches if m.score >= floor]
+
+
+def retrieve_chunks(
+    query_embed_set: EmbedSet,
+    target_index_meta: IndexMeta,
+    target_chunks: ChunkSource,
+    k_results: int,
+    engine: str = RETRIEVAL_ENGINE_DENSE,
+    faiss_index_obj: Optional[faiss.Index] = None,
+    id_map_list_obj: Optional[List[str]] = None,
+    lexical_index_obj: Optional[BM25Index] = None
+) -> List[MatchSet]:
+    """
+    Retrieves the top ``k_results`` chunks with the engine selected by
+    ``PipelineSettings.retrieval_engine`` (see ``RETRIEVAL_ENGINES``).
+    Unknown engines, and hybrid engines without a BM25 index, fall back to
+    dense retrieval.
+    """
+    has_lexical = lexical_index_obj is not None or target_index_meta.lexical_index_path is not None
+    if engine not in RETRIEVAL_ENGINES or (engine != RETRIEVAL_ENGINE_DENSE and not has_lexical):
+        print(f"Warning: Retrieval engine '{engine}' is unknown or has no BM25 index; using dense retrieval.")
+        engine = RETRIEVAL_ENGINE_DENSE
+    if engine == RETRIEVAL_ENGINE_DENSE:
+        return retrieve_similar_chunks(query_embed_set, target_index_meta, target_chunks, k_results,
+                                       faiss_index_obj=faiss_index_obj, id_map_list_obj=id_map_list_obj)
+    if engine == RETRIEVAL_ENGINE_BM25:
+        return retrieve_lexical_chunks(query_embed_set, target_index_meta, target_chunks, k_results,
+                                       lexical_index_obj=lexical_index_obj, id_map_list_obj=id_map_list_obj)
+
+    candidates = k_results * HYBRID_CANDIDATE_MULTIPLIER
+    dense = retrieve_similar_chunks(query_embed_set, target_index_meta, target_chunks, candidates,
+                                    faiss_index_obj=faiss_index_obj, id_map_list_obj=id_map_list_obj)
+    lexical = retrieve_lexical_chunks(query_embed_set, target_index_meta, target_chunks, candidates,
+                                      lexical_index_obj=lexical_index_obj, id_map_list_obj=id_map_list_obj)
+    method = "rrf" if engine == RETRIEVAL_ENGINE_HYBRID_RRF else "weighted"
+    return fuse_matches(dense, lexical, k_results, method=method)
+
+
 if __name__ == '__main__':
     print("Starting retrieval module test...")
     
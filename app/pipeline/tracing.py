@@ -0,0 +1,351 @@
+"""Lightweight span tracing for the pipeline.
+
+Pipeline code wraps units of work in ``span(...)`` blocks::
+
+    from app.pipeline.tracing import span
+
+    with span("llm_call", "llm", model=model_name) as s:
+        ...
+        s.set(prompt_tokens=usage.prompt_tokens)
+
+Spans nest per thread and record wall time plus arbitrary numeric/string
+attributes (counts, bytes, ids). When no tracer is active, ``span`` returns a
+shared no-op object so instrumentation costs almost nothing.
+
+A ``Tracer`` is activated for the duration of a run with ``activate(tracer)``.
+It can export a Chrome trace-event JSON file (open it in ``chrome://tracing``
+or https://ui.perfetto.dev) and format a per-span summary table for the log.
+Custom collectors subclass ``TraceHook`` and are attached either to one tracer
+(``Tracer.add_hook``) or to every tracer in the process (``add_global_hook``).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.logger import logger
+
+# export_run_trace keeps this many trace files per directory and deletes older ones
+TRACE_KEEP_FILES = 50
+
+
+class Span:
+    """One timed unit of work. Attributes are free-form JSON-serializable values."""
+
+    __slots__ = ("name", "category", "start_ns", "end_ns", "thread_id", "depth", "parent", "attrs")
+
+    def __init__(self, name: str, category: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.thread_id = threading.get_ident()
+        self.attrs = attrs
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1_000_000
+
+    def set(self, **attrs: Any) -> None:
+        """Sets (overwrites) attributes on the span."""
+        self.attrs.update(attrs)
+
+    def incr(self, key: str, value: float = 1) -> None:
+        """Adds ``value`` to a numeric attribute, starting from 0."""
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+
+class _NullSpan:
+    """Stand-in returned when tracing is inactive; accepts and ignores everything."""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def incr(self, key: str, value: float = 1) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class TraceHook:
+    """
+    Base class for custom collectors. Override any of the methods; all of them
+    are called synchronously on the thread that produced the event, so keep
+    them cheap.
+    """
+
+    def on_span_start(self, tracer: "Tracer", span: Span) -> None:
+        pass
+
+    def on_span_end(self, tracer: "Tracer", span: Span) -> None:
+        pass
+
+    def on_counter(self, tracer: "Tracer", name: str, value: float) -> None:
+        pass
+
+    def on_finish(self, tracer: "Tracer") -> None:
+        pass
+
+
+_global_hooks: List[TraceHook] = []
+
+
+def add_global_hook(hook: TraceHook) -> None:
+    """Attaches ``hook`` to every tracer in this process, including future ones."""
+    if hook not in _global_hooks:
+        _global_hooks.append(hook)
+
+
+def remove_global_hook(hook: TraceHook) -> None:
+    if hook in _global_hooks:
+        _global_hooks.remove(hook)
+
+
+class Tracer:
+    """Collects finished spans and named counters for one pipeline run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: List[Span] = []
+        self.counters: Dict[str, float] = {}
+        self._hooks: List[TraceHook] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin_ns = time.perf_counter_ns()
+        self._origin_epoch_us = time.time_ns() // 1000
+
+    def add_hook(self, hook: TraceHook) -> None:
+        self._hooks.append(hook)
+
+    def _all_hooks(self) -> List[TraceHook]:
+        return self._hooks + _global_hooks
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    @contextmanager
+    def span(self, name: str, category: str, **attrs: Any) -> Iterator[Span]:
+        stack = self._stack()
+        current = Span(name, category, stack[-1] if stack else None, attrs)
+        stack.append(current)
+        for hook in self._all_hooks():
+            hook.on_span_start(self, current)
+        try:
+            yield current
+        except BaseException as e:
+            current.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            current.end_ns = time.perf_counter_ns()
+            stack.pop()
+            with self._lock:
+                self.spans.append(current)
+            for hook in self._all_hooks():
+                hook.on_span_end(self, current)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Adds ``value`` to a run-wide counter (e.g. cache hits)."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self._all_hooks():
+            hook.on_counter(self, name, value)
+
+    def finish(self) -> None:
+        for hook in self._all_hooks():
+            hook.on_finish(self)
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Returns the run as a Chrome trace-event document (complete "X" events)."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        events = []
+        for s in spans:
+            end_ns = s.end_ns if s.end_ns is not None else s.start_ns
+            events.append({
+                "name": s.name,
+                "cat": s.category,
+                "ph": "X",
+                "ts": self._origin_epoch_us + (s.start_ns - self._origin_ns) / 1000,
+                "dur": (end_ns - s.start_ns) / 1000,
+                "pid": pid,
+                "tid": s.thread_id,
+                "args": s.attrs,
+            })
+        events.sort(key=lambda e: e["ts"])
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"run": self.name, "counters": counters},
+        }
+
+    def write_chrome_trace(self, path: Path) -> int:
+        """Writes the Chrome trace JSON to ``path`` and returns the bytes written."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(self.to_chrome_trace(), ensure_ascii=False, default=str).encode("utf-8")
+        path.write_bytes(data)
+        return len(data)
+
+    def summary_rows(self) -> List[Dict[str, Any]]:
+        """
+        Aggregates spans by (category, name): count, total/mean/max wall time in
+        milliseconds, and the sum of every numeric attribute.
+        """
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            row = groups.setdefault((s.category, s.name), {
+                "category": s.category, "name": s.name, "count": 0,
+                "total_ms": 0.0, "max_ms": 0.0, "attrs": {},
+            })
+            duration = s.duration_ms
+            row["count"] += 1
+            row["total_ms"] += duration
+            row["max_ms"] = max(row["max_ms"], duration)
+            for key, value in s.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    row["attrs"][key] = row["attrs"].get(key, 0) + value
+        rows = sorted(groups.values(), key=lambda r: r["total_ms"], reverse=True)
+        for row in rows:
+            row["mean_ms"] = row["total_ms"] / row["count"] if row["count"] else 0.0
+        return rows
+
+    def format_summary(self) -> str:
+        """Formats ``summary_rows`` (and counters) as a fixed-width table."""
+        lines = [f"{'Category':<10} {'Span':<24} {'Count':>7} {'Total ms':>11} {'Mean ms':>9} {'Max ms':>9}  Totals"]
+        for row in self.summary_rows():
+            totals = ", ".join(f"{k}={v:g}" for k, v in sorted(row["attrs"].items()))
+            lines.append(
+                f"{row['category'][:10]:<10} {row['name'][:24]:<24} {row['count']:>7} "
+                f"{row['total_ms']:>11.1f} {row['mean_ms']:>9.1f} {row['max_ms']:>9.1f}  {totals}"
+            )
+        with self._lock:
+            counters = dict(self.counters)
+        if counters:
+            lines.append("Counters: " + ", ".join(f"{k}={v:g}" for k, v in sorted(counters.items())))
+        return "\n".join(lines)
+
+
+# ----------------------------------------------------------------------------
+# Process-wide active tracer
+# ----------------------------------------------------------------------------
+# A plain global (rather than a ContextVar) so spans opened on worker threads
+# are still recorded. Only one pipeline runs per process at a time.
+_active_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _active_tracer
+
+
+@contextmanager
+def activate(tracer: Tracer) -> Iterator[Tracer]:
+    """Makes ``tracer`` the target of module-level ``span``/``incr`` calls."""
+    global _active_tracer
+    previous = _active_tracer
+    _active_tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _active_tracer = previous
+        tracer.finish()
+
+
+@contextmanager
+def _null_span_cm() -> Iterator[_NullSpan]:
+    yield NULL_SPAN
+
+
+def span(name: str, category: str, **attrs: Any):
+    """Opens a span on the active tracer, or a no-op span if tracing is off."""
+    tracer = _active_tracer
+    if tracer is None:
+        return _null_span_cm()
+    return tracer.span(name, category, **attrs)
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Increments a counter on the active tracer, if any."""
+    tracer = _active_tracer
+    if tracer is not None:
+        tracer.incr(name, value)
+
+
+def prune_traces(trace_dir: Path, keep: int = TRACE_KEEP_FILES) -> int:
+    """Deletes all but the ``keep`` newest ``*.json`` traces in ``trace_dir``; returns the number deleted."""
+    try:
+        traces = sorted(trace_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    except OSError:
+        return 0
+    deleted = 0
+    for old in traces[keep:]:
+        try:
+            old.unlink()
+            deleted += 1
+        except OSError:
+            pass  # Removed concurrently, or still open elsewhere
+    return deleted
+
+
+def export_run_trace(tracer: Tracer, trace_dir: Path, keep: int = TRACE_KEEP_FILES) -> Optional[Path]:
+    """
+    Writes ``tracer`` to ``trace_dir/<run name>_<timestamp>.json`` and logs the
+    summary table. Only the ``keep`` newest traces are kept (0 = all). Returns
+    the trace path, or None if writing failed.
+    """
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in tracer.name) or "run"
+    trace_path = trace_dir / f"{safe_name}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    logger.info(f"Pipeline timing summary for '{tracer.name}':\n{tracer.format_summary()}")
+    try:
+        written = tracer.write_chrome_trace(trace_path)
+    except OSError as e:
+        logger.error(f"Error writing pipeline trace to {trace_path}: {e}")
+        return None
+    logger.info(f"Pipeline trace written to {trace_path} ({written} bytes)")
+    if keep > 0:
+        pruned = prune_traces(trace_dir, keep)
+        if pruned:
+            logger.info(f"Deleted {pruned} old pipeline traces from {trace_dir}")
+    return trace_path
+
+
+if __name__ == '__main__':
+    # Small demo: trace a fake two-stage run and print the summary and trace size.
+    import tempfile
+
+    demo = Tracer("tracing_demo")
+    with activate(demo):
+        with span("pipeline_run", "run"):
+            for stage in ("need_check", "judge"):
+                with span(stage, "stage"):
+                    for clause_id in ("C001", "C002"):
+                        with span("llm_call", "llm", clause_id=clause_id) as s:
+                            time.sleep(0.01)
+                            s.set(prompt_tokens=120, completion_tokens=30)
+            incr("embedding_doc_cache_hits", 3)
+
+    print(demo.format_summary())
+    with tempfile.TemporaryDirectory() as tmp:
+        size = demo.write_chrome_trace(Path(tmp) / "demo_trace.json")
+        print(f"Chrome trace: {size} bytes, {len(demo.spans)} spans")
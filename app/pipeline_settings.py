@@ -12,9 +12,39 @@ from pydantic import BaseModel, Field
 # Using an absolute-like import from app.
 from app.settings import Settings
 
+# Values of PipelineSettings.retrieval_engine (see app.pipeline.retrieve.retrieve_chunks)
+RETRIEVAL_ENGINE_DENSE = "FAISS"  # Embedding similarity only
+RETRIEVAL_ENGINE_BM25 = "BM25"  # Keyword (BM25) only
+RETRIEVAL_ENGINE_HYBRID_RRF = "Hybrid-RRF"  # Both, fused by reciprocal rank
+RETRIEVAL_ENGINE_HYBRID_WEIGHTED = "Hybrid-Weighted"  # Both, fused by weighted score
+RETRIEVAL_ENGINES = (RETRIEVAL_ENGINE_DENSE, RETRIEVAL_ENGINE_BM25, RETRIEVAL_ENGINE_HYBRID_RRF,
+                     RETRIEVAL_ENGINE_HYBRID_WEIGHTED)
+# Engines whose scores fuse two retrievers; a chunk only one of them found scores about half
+FUSED_RETRIEVAL_ENGINES = (RETRIEVAL_ENGINE_HYBRID_RRF, RETRIEVAL_ENGINE_HYBRID_WEIGHTED)
+
+# Values of PipelineSettings.reranker (see app.pipeline.rerank.get_reranker)
+RERANKER_NONE = "none"  # Keep the retrieval order
+RERANKER_CROSS_ENCODER = "cross-encoder"  # Local ONNX cross-encoder, when installed
+RERANKERS = (RERANKER_NONE, RERANKER_CROSS_ENCODER)
+
+# Values of PipelineSettings.cache_backend (see app.pipeline.cache_backends)
+CACHE_BACKEND_FILE = "file"  # One file per entry (the original layout)
+CACHE_BACKEND_SQLITE = "sqlite"  # One SQLite database per project
+CACHE_BACKENDS = (CACHE_BACKEND_FILE, CACHE_BACKEND_SQLITE)
+
+# Values of PipelineSettings.cache_codec (see app.pipeline.cache_codecs)
+CACHE_CODEC_NONE = "none"  # Uncompressed JSON
+CACHE_CODEC_GZIP = "gzip"  # gzip level 1
+CACHE_CODEC_ZSTD = "zstd"  # Needs the optional zstandard package
+CACHE_CODEC_LZ4 = "lz4"  # Needs the optional lz4 package
+CACHE_CODECS = (CACHE_CODEC_NONE, CACHE_CODEC_GZIP, CACHE_CODEC_ZSTD, CACHE_CODEC_LZ4)
+
 
 class PipelineSettings(BaseModel):
     openai_api_key: str = Field(default="")
+    # OpenAI-compatible endpoint, e.g. "http://127.0.0.1:8000/v1" for a local stand-in server.
+    # None keeps the client default (api.openai.com, or OPENAI_BASE_URL if set).
+    openai_base_url: Optional[str] = Field(default=None)
     embedding_model: str = Field(default="default_embedding_model")
     # llm_model: str = Field(default="default_llm_model") # General LLM model - REMOVED
     local_model_path: Optional[Path] = Field(default=None)
@@ -23,13 +53,42 @@ class PipelineSettings(BaseModel):
     # score_threshold: float = Field(default=0.7) # Used in old pipeline logic (if ever reactivated) - REMOVED
     # report_theme: str = Field(default="default.css") - REMOVED
     language: str = Field(default="en")
-    retrieval_engine: str = Field(default="FAISS")
+    retrieval_engine: str = Field(default=RETRIEVAL_ENGINE_DENSE)  # One of RETRIEVAL_ENGINES
 
     # Fields for pipeline_v1_1 (retained and potentially new ones if any)
     llm_model_need_check: str = Field(default="default_model_need_check")
     llm_model_audit_plan: str = Field(default="default_model_audit_plan")
     llm_model_judge: str = Field(default="default_model_judge") # For Step 4 of v1.1
     audit_retrieval_top_k: int = Field(default=5) # Retained from previous "New fields"
+    # Adaptive retrieval (see app.pipeline.retrieve.apply_score_cutoffs): of the top-k matches, keep only
+    # those scoring at least retrieval_min_score and at least retrieval_relative_score x the best score (0 = off).
+    # The relative cutoff is skipped for fused (hybrid) scores unless a reranker rescored the matches.
+    retrieval_min_score: float = Field(default=0.0)
+    retrieval_relative_score: float = Field(default=0.8)
+    # Optional rerank stage (see app.pipeline.rerank): retrieve rerank_candidates matches per task,
+    # rescore them with the reranker and keep the best audit_retrieval_top_k
+    reranker: str = Field(default=RERANKER_NONE)  # One of RERANKERS
+    rerank_model_path: Optional[Path] = Field(default=None)  # Directory with model.onnx and tokenizer.json
+    rerank_candidates: int = Field(default=50)
+    # Most distinct evidence snippets kept per clause across all of its tasks, i.e. sent to the judge (0 = no limit)
+    clause_evidence_budget: int = Field(default=12)
+    # MMR trade-off when choosing a clause's evidence (see app.pipeline.evidence): 1.0 = relevance only
+    evidence_mmr_lambda: float = Field(default=0.7)
+    # Procedure chunking (see app.pipeline.chunking): token budget per chunk and sentence overlap between chunks
+    chunk_max_tokens: int = Field(default=200)
+    chunk_overlap_tokens: int = Field(default=0)
+    # Vector index metric (see app.pipeline.index): "cosine" scores matches by cosine similarity, "l2" by 1 / (1 + distance)
+    index_metric: str = Field(default="cosine")
+    # Storage of the per-project embedding/normalization cache, one of CACHE_BACKENDS
+    cache_backend: str = Field(default=CACHE_BACKEND_SQLITE)
+    # Size cap of all caches under <app data>/cache in MB; least recently used entries are evicted beyond it (0 = no limit)
+    cache_max_mb: int = Field(default=4096)
+    # In-memory LRU in front of the per-project cache for the duration of a run, in MB (0 = off)
+    cache_memory_mb: int = Field(default=64)
+    # Compression of cached JSON values, one of CACHE_CODECS; entries written with any codec stay readable
+    cache_codec: str = Field(default=CACHE_CODEC_GZIP)
+    # Write a per-run Chrome trace and a timing summary (see app.pipeline.tracing)
+    trace_enabled: bool = Field(default=True)
 
 
     @classmethod
@@ -40,6 +99,7 @@ class PipelineSettings(BaseModel):
         """
         return cls(
             openai_api_key=settings.get("openai.api_key", ""), # Updated to reflect typical nesting if changed in config
+            openai_base_url=settings.get("openai.base_url") or None,
             embedding_model=settings.get("embedding_model") or "default_embedding_model",
             # llm_model=settings.get("llm_model") or "default_llm_model", # REMOVED
             local_model_path=Path(settings.get("local_model_path")) if settings.get("local_model_path") else None,
@@ -48,13 +108,28 @@ class PipelineSettings(BaseModel):
             # score_threshold=float(settings.get("score_threshold", 0.7)), # REMOVED
             # report_theme=settings.get("report_theme", "default.css"), # REMOVED
             language=settings.get("language", "en"),
-            retrieval_engine=settings.get("retrieval_engine", "FAISS"),
+            retrieval_engine=settings.get("retrieval_engine", RETRIEVAL_ENGINE_DENSE),
 
             # Settings for v1.1 pipeline from config_default.yaml or user settings
             llm_model_need_check=settings.get("llm.model_need_check", "default_model_need_check"),
             llm_model_audit_plan=settings.get("llm.model_audit_plan", "default_model_audit_plan"),
             llm_model_judge=settings.get("llm.model_judge", "default_model_judge"),
-            audit_retrieval_top_k=int(settings.get("audit.retrieval_top_k", 5))
+            audit_retrieval_top_k=int(settings.get("audit.retrieval_top_k", 5)),
+            retrieval_min_score=float(settings.get("audit.retrieval_min_score", 0.0)),
+            retrieval_relative_score=float(settings.get("audit.retrieval_relative_score", 0.8)),
+            reranker=settings.get("audit.reranker", RERANKER_NONE) or RERANKER_NONE,
+            rerank_model_path=Path(settings.get("audit.rerank_model_path")) if settings.get("audit.rerank_model_path") else None,
+            rerank_candidates=int(settings.get("audit.rerank_candidates", 50)),
+            clause_evidence_budget=int(settings.get("audit.clause_evidence_budget", 12)),
+            evidence_mmr_lambda=float(settings.get("audit.evidence_mmr_lambda", 0.7)),
+            chunk_max_tokens=int(settings.get("pipeline.chunk_max_tokens", 200)),
+            chunk_overlap_tokens=int(settings.get("pipeline.chunk_overlap_tokens", 0)),
+            index_metric=settings.get("pipeline.index_metric", "cosine"),
+            cache_backend=settings.get("pipeline.cache_backend", CACHE_BACKEND_SQLITE) or CACHE_BACKEND_SQLITE,
+            cache_max_mb=int(settings.get("pipeline.cache_max_mb", 4096)),
+            cache_memory_mb=int(settings.get("pipeline.cache_memory_mb", 64)),
+            cache_codec=settings.get("pipeline.cache_codec", CACHE_CODEC_GZIP) or CACHE_CODEC_GZIP,
+            trace_enabled=bool(settings.get("pipeline.trace_enabled", True))
         )
 
 # print("app.pipeline_settings.py created with PipelineSettings model.") # Comment out print
@@ -20,6 +20,7 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Signal, QCoreApplication
 from PySide6.QtWidgets import QApplication
 
+from .pipeline_settings import RETRIEVAL_ENGINES, RETRIEVAL_ENGINE_DENSE
 from .settings import Settings
 from .translator import Translator
 from .utils.theme_manager import get_available_themes
@@ -186,7 +187,7 @@ class SettingsDialog(QDialog):
         page_layout.addRow(self.models_embedding_label, self.embedding_model_combo)
         # 新增檢索引擎下拉式選單
         self.retrieval_engine_combo = QComboBox()
-        self.retrieval_engine_combo.addItems(["FAISS"])
+        self.retrieval_engine_combo.addItems(list(RETRIEVAL_ENGINES))
         self.models_retrieval_engine_label = QLabel(self.translator.get("settings_label_retrieval_engine", "Retrieval Engine:"))
         page_layout.addRow(self.models_retrieval_engine_label, self.retrieval_engine_combo)
         # Audit Top-K
@@ -252,7 +253,7 @@ class SettingsDialog(QDialog):
         self.key_edit.setText(s.get("openai.api_key", ""))
         self.timeout_spin.setValue(int(s.get("openai.timeout", 60)))
         self.embedding_model_combo.setCurrentText(s.get("embedding_model", "text-embedding-3-large"))
-        self.retrieval_engine_combo.setCurrentText(s.get("retrieval_engine", "FAISS"))
+        self.retrieval_engine_combo.setCurrentText(s.get("retrieval_engine", RETRIEVAL_ENGINE_DENSE))
         self.audit_top_k_spin.setValue(int(s.get("audit.retrieval_top_k", 5)))
         self.model_need_check_combo.setCurrentText(s.get("llm.model_need_check", "gpt-4o"))
         self.model_audit_plan_combo.setCurrentText(s.get("llm.model_audit_plan", "gpt-4o"))
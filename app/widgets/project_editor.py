@@ -420,6 +420,9 @@ class ProjectEditor(QWidget):
         dialog_title = self.translator.get("select_procedure_docs_dialog_title", "Select Procedure Documents")
         file_filter = self.translator.get("text_files_filter", "Text Files (*.txt)") + ";;" + \
                       self.translator.get("markdown_files_filter", "Markdown Files (*.md)") + ";;" + \
+                      self.translator.get("pdf_files_filter", "PDF Files (*.pdf)") + ";;" + \
+                      self.translator.get("word_files_filter", "Word Documents (*.docx)") + ";;" + \
+                      self.translator.get("excel_files_filter", "Excel Workbooks (*.xlsx *.xlsm)") + ";;" + \
                       self.translator.get("all_files_filter", "All Files (*.*)")
 
 
@@ -160,9 +160,11 @@ class RunEvidenceDetailsDialog(QDialog):
     New dialog to display details from ProjectRunData:
     ExternalRegulationClause text, ALL its AuditTasks, their top_k evidence, and judge reasoning.
     """
-    def __init__(self, clause: ExternalRegulationClause, translator, parent: QWidget | None = None): # task parameter removed
+    def __init__(self, clause: ExternalRegulationClause, translator, parent: QWidget | None = None,
+                 run_data: Optional[ProjectRunData] = None): # task parameter removed
         super().__init__(parent)
         self.clause = clause
+        self.run_data = run_data # Resolves the tasks' evidence references when their sections are built
         self.translator = translator # Store translator
 
         # 外規標題優先順序: title > text > id
@@ -258,6 +260,12 @@ class RunEvidenceDetailsDialog(QDialog):
         self.translator.language_changed.connect(self._retranslate_ui)
         self._retranslate_ui() # Initial translation
 
+    def _task_evidence(self, task: AuditTask) -> list:
+        """The task's evidence with excerpts looked up in the project's evidence table."""
+        if self.run_data is None:
+            return task.top_k or []
+        return self.run_data.task_evidence(task)
+
     def _toggle_evidence_item(self, checked: bool, button: QToolButton, details_widget: QWidget):
         details_widget.setVisible(checked)
         # button.setArrowType(Qt.DownArrow if checked else Qt.RightArrow) # Replaced by setIcon
@@ -370,7 +378,7 @@ class RunEvidenceDetailsDialog(QDialog):
                 # If needed, a small label "Found X evidence items:" can be added here.
 
                 if task_data.top_k:
-                    for ev_idx, ev_item in enumerate(task_data.top_k):
+                    for ev_idx, ev_item in enumerate(self._task_evidence(task_data)):
                         # --- Level 2 Toggle: Evidence Item Summary ---
                         score_val = ev_item.get('score', 0.0)
                         score_str = f"{score_val:.4f}" if isinstance(score_val, float) else str(score_val)
@@ -527,7 +535,8 @@ class ResultsViewer(QWidget):
 
         # The dialog will now handle displaying all tasks for the clause.
         # The specific task_id is not needed to select a single task anymore.
-        dialog = RunEvidenceDetailsDialog(clause=target_clause, translator=self.translator, parent=self)
+        dialog = RunEvidenceDetailsDialog(clause=target_clause, translator=self.translator, parent=self,
+                                          run_data=self.project.project_run_data)
         dialog.exec_()
 
 
@@ -1001,7 +1010,7 @@ class ResultsViewer(QWidget):
                             if header_name == headers[3]: cell.fill = clause_status_fill
                         current_row += 1
                     else:
-                        for evidence_idx, ev_item in enumerate(task.top_k):
+                        for evidence_idx, ev_item in enumerate(self.project.project_run_data.task_evidence(task)):
                             evidence_data_row = {
                                 headers[8]: ev_item.get('source_txt', ''),
                                 headers[9]: str(ev_item.get('page_no', '')),
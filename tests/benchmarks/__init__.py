@@ -0,0 +1,8 @@
+"""
+Pipeline benchmark suite.
+
+Synthetic regulation/procedure corpora (``corpus``), a deterministic in-process
+OpenAI stub (``stub_openai``) and the harness that runs the pipeline per
+scenario and checks the results against ``baselines.json`` (``harness``).
+Run with ``python -m tests.benchmarks --help``.
+"""
@@ -0,0 +1,93 @@
+"""
+Chunking benchmark on a large mixed Chinese/English procedure corpus.
+
+Compares the old fixed-window chunker (encode the whole document, append
+tokens one by one in a Python loop, decode each window) with
+``chunk_documents`` (one tokenizer batch across documents, single-threaded
+and threaded), and prints wall time and throughput:
+
+    python -m tests.benchmarks.chunking_bench [--mb 100] [--files 20] [--threads 8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import tiktoken
+
+from app.models.docs import NormDoc, RawDoc
+from app.pipeline.chunking import DEFAULT_NUM_THREADS, chunk_documents, get_tokenizer
+from app.pipeline.normalize import normalize_document
+from tests.benchmarks.corpus import generate_procedure_corpus
+
+
+def fixed_window_chunks_reference(text: str, max_tokens: int = 200) -> List[str]:
+    """The previous embed._create_text_chunks, including its per-call get_encoding."""
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    if not text.strip():
+        return []
+    tokens = tokenizer.encode(text)
+    chunks: List[str] = []
+    current_chunk_tokens: List[int] = []
+    for token in tokens:
+        current_chunk_tokens.append(token)
+        if len(current_chunk_tokens) >= max_tokens:
+            chunks.append(tokenizer.decode(current_chunk_tokens))
+            current_chunk_tokens = []
+    if current_chunk_tokens:
+        chunks.append(tokenizer.decode(current_chunk_tokens))
+    return chunks
+
+
+def build_docs(megabytes: float, n_files: int, seed: int = 0) -> List[NormDoc]:
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_procedure_corpus(Path(tmp), megabytes, n_files=n_files, seed=seed)
+        raw_docs = [RawDoc(id=p.stem, source_path=p, content=p.read_text(encoding="utf-8"), metadata={},
+                           doc_type="procedure") for p in paths]
+    return [normalize_document(raw) for raw in raw_docs]
+
+
+def timed(label: str, mb: float, fn) -> object:
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34}{elapsed:>10.2f}{mb / elapsed:>12.1f}")
+    return result
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mb", type=float, default=100.0, help="Size of the synthetic corpus")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--max-tokens", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=DEFAULT_NUM_THREADS)
+    parser.add_argument("--skip-reference", action="store_true", help="Do not run the old fixed-window chunker")
+    args = parser.parse_args(argv)
+
+    docs = build_docs(args.mb, args.files)
+    mb = sum(len(d.text_content.encode("utf-8")) for d in docs) / (1024 * 1024)
+    get_tokenizer()  # Load outside the timings
+    print(f"{len(docs)} documents, {mb:.1f} MB after normalization")
+    print(f"{'chunker':<34}{'seconds':>10}{'MB/s':>12}")
+
+    if not args.skip_reference:
+        reference = timed("fixed window, per-token loop", mb,
+                          lambda: [fixed_window_chunks_reference(d.text_content, args.max_tokens) for d in docs])
+        print(f"{'':<34}{sum(map(len, reference)):>10} chunks")
+    single = timed("chunk_documents, 1 thread", mb,
+                   lambda: chunk_documents(docs, max_tokens=args.max_tokens, num_threads=1))
+    threaded = timed(f"chunk_documents, {args.threads} threads", mb,
+                     lambda: chunk_documents(docs, max_tokens=args.max_tokens, num_threads=args.threads))
+    if single != threaded:
+        print("OUTPUT MISMATCH between single-threaded and threaded runs")
+        return 1
+    print(f"{'':<34}{sum(map(len, threaded)):>10} chunks")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
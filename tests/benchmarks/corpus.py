@@ -0,0 +1,96 @@
+"""
+Deterministic synthetic corpora for the benchmark harness.
+
+``generate_external_json`` writes an external-regulations JSON file in the
+format read by ``load_external_regulations_from_json`` ({"name": ..., "C001":
+"...", ...}). ``generate_procedure_corpus`` writes procedure ``.txt`` files of
+a requested total size. Both are driven by a seed so the same scenario always
+produces byte-identical inputs.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+from pathlib import Path
+from typing import List
+
+# Vocabulary for regulation-like Traditional Chinese / English text. The mix
+# exercises the normalizer (section numbers, chapter titles, full-width
+# punctuation) and the tokenizer (CJK + ASCII).
+_SUBJECTS = [
+    "資訊安全管理制度", "存取控制程序", "備份作業", "委外廠商", "個人資料檔案",
+    "系統變更管理", "營運持續計畫", "資安事件通報", "實體安全區域", "密碼管理",
+    "the information security officer", "the change advisory board",
+    "privileged accounts", "backup media", "incident response records",
+]
+_VERBS = [
+    "應每年至少審查一次", "應經權責主管核准後始得執行", "應留存紀錄至少五年",
+    "應定期辦理教育訓練", "應依風險等級採取適當控制措施", "應建立異常監控機制",
+    "shall be reviewed quarterly", "shall be approved before deployment",
+    "must be encrypted at rest", "must be logged and monitored",
+]
+_QUALIFIERS = [
+    "並將結果陳報資訊安全委員會。", "且相關文件應妥善保存。", "以確保服務不中斷。",
+    "如有例外情形應事先申請。", "並納入年度稽核範圍。",
+    "in accordance with the retention schedule.", "and exceptions are documented.",
+]
+_CHAPTERS = ["總則", "組織與權責", "作業程序", "紀錄管理", "附則", "Scope", "Definitions"]
+
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(_SUBJECTS)}{rng.choice(_VERBS)}，{rng.choice(_QUALIFIERS)}"
+
+
+def generate_external_json(path: Path, n_clauses: int, seed: int = 0, name: str = "Synthetic Regulation") -> Path:
+    """Writes ``n_clauses`` clauses (C001, C002, ...) to ``path`` and returns it."""
+    rng = random.Random(seed)
+    data = {"name": name}
+    for i in range(1, n_clauses + 1):
+        sentences = " ".join(_sentence(rng) for _ in range(rng.randint(1, 3)))
+        data[f"C{i:03d}"] = f"第{i}條 {rng.choice(_CHAPTERS)}\n{sentences}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def generate_procedure_corpus(directory: Path, megabytes: float, n_files: int = 1, seed: int = 0) -> List[Path]:
+    """
+    Writes ``n_files`` procedure ``.txt`` files totalling roughly ``megabytes``
+    MB (UTF-8) into ``directory`` and returns their paths.
+    """
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    target_per_file = max(1, int(megabytes * 1024 * 1024 / max(1, n_files)))
+    paths: List[Path] = []
+    for file_idx in range(n_files):
+        lines: List[str] = [f"程序書 PROC-{file_idx + 1:03d}"]
+        size = len(lines[0].encode("utf-8"))
+        chapter = 0
+        section = 0
+        while size < target_per_file:
+            if section == 0 or rng.random() < 0.05:
+                chapter += 1
+                section = 0
+                line = f"第{chapter}章 {rng.choice(_CHAPTERS)}"
+                lines.append("")
+            else:
+                line = f"{chapter}.{section} " + "".join(_sentence(rng) for _ in range(rng.randint(1, 4)))
+            section += 1
+            lines.append(line)
+            size += len(line.encode("utf-8")) + 1
+        path = directory / f"procedure_{file_idx + 1:03d}.txt"
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ext = generate_external_json(Path(tmp) / "external.json", 5)
+        procs = generate_procedure_corpus(Path(tmp) / "procedures", 0.05, n_files=2)
+        print(ext.read_text(encoding="utf-8")[:300])
+        for p in procs:
+            print(p.name, p.stat().st_size, "bytes")
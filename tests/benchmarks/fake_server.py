@@ -0,0 +1,225 @@
+"""
+OpenAI-compatible stand-in HTTP server for load tests.
+
+Serves ``POST /v1/chat/completions`` and ``POST /v1/embeddings`` with the same
+deterministic answers as the in-process stub (``stub_openai``), plus injectable
+per-request latency, HTTP 429 rate limiting and HTTP 500 errors. Point the
+pipeline at it with ``PipelineSettings.openai_base_url = server.base_url``.
+
+    with FakeOpenAIServer(latency_ms=20, rate_limit_rate=0.05) as server:
+        settings.openai_base_url = server.base_url
+        ...
+        print(server.stats)
+
+Injected failures come from a seeded RNG, so a given request sequence always
+fails the same way. Run standalone with ``python -m tests.benchmarks.fake_server``.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from tests.benchmarks.stub_openai import StubBackend, hash_embedding
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    # Send headers and body in one segment; otherwise Nagle + delayed ACK adds ~40 ms per request.
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002 - silence per-request logging
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, err_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": {"message": message, "type": err_type, "param": None, "code": None}}, headers)
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "fake-chat", "object": "model"},
+                                                              {"id": "fake-embedding", "object": "model"}]})
+        else:
+            self._error(404, f"Unknown path {self.path}", "invalid_request_error")
+
+    def do_POST(self) -> None:  # noqa: N802
+        fake: FakeOpenAIServer = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._error(400, "Request body is not valid JSON", "invalid_request_error")
+            return
+
+        path = self.path.rstrip("/")
+        if path not in ("/v1/chat/completions", "/v1/embeddings"):
+            self._error(404, f"Unknown path {self.path}", "invalid_request_error")
+            return
+
+        outcome = fake._next_outcome()
+        if fake.latency_ms:
+            time.sleep(fake.latency_ms / 1000.0)
+        if outcome == "rate_limited":
+            self._error(429, "Rate limit reached (injected)", "rate_limit_error",
+                        {"Retry-After": str(fake.retry_after_s)})
+            return
+        if outcome == "error":
+            self._error(500, "Internal server error (injected)", "server_error")
+            return
+
+        if path == "/v1/chat/completions":
+            self._send_json(200, fake._chat_payload(request))
+        else:
+            self._send_json(200, fake._embeddings_payload(request))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: "FakeOpenAIServer"
+
+
+class FakeOpenAIServer:
+    """Threaded local server; use as a context manager or call ``start``/``stop``."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 rate_limit_rate: float = 0.0, error_rate: float = 0.0, retry_after_s: float = 0.0,
+                 embedding_dimension: int = 256, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.retry_after_s = retry_after_s
+        self._backend = StubBackend(dimension=embedding_dimension)
+        self._lock = threading.Lock()
+        self._httpd: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.configure(latency_ms=latency_ms, rate_limit_rate=rate_limit_rate, error_rate=error_rate, seed=seed)
+
+    # ------------------------------------------------------------------
+    def configure(self, latency_ms: Optional[float] = None, rate_limit_rate: Optional[float] = None,
+                  error_rate: Optional[float] = None, seed: Optional[int] = None) -> None:
+        """Changes the fault/latency profile; passing ``seed`` also resets the counters."""
+        with self._lock:
+            if latency_ms is not None:
+                self.latency_ms = latency_ms
+            if rate_limit_rate is not None:
+                self.rate_limit_rate = rate_limit_rate
+            if error_rate is not None:
+                self.error_rate = error_rate
+            if seed is not None:
+                self._rng = random.Random(seed)
+                self.stats: Dict[str, int] = {"requests": 0, "rate_limited": 0, "errors": 0,
+                                              "chat": 0, "embeddings": 0, "embedding_inputs": 0}
+
+    def _next_outcome(self) -> str:
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return "rate_limited"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return "error"
+            return "ok"
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def _chat_payload(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self._count("chat")
+        messages = request.get("messages") or [{"content": ""}]
+        prompt = str(messages[-1].get("content", ""))
+        content = json.dumps(self._backend.chat_reply(prompt), ensure_ascii=False)
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        return {
+            "id": f"chatcmpl-fake-{self.stats['chat']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake-chat"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _embeddings_payload(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        raw = request.get("input", [])
+        inputs = [raw] if isinstance(raw, str) else [str(x) for x in raw]
+        self._count("embeddings")
+        self._count("embedding_inputs", len(inputs))
+        tokens = sum(len(t) for t in inputs) // 4
+        return {
+            "object": "list",
+            "model": request.get("model", "fake-embedding"),
+            "data": [{"object": "embedding", "index": i,
+                      "embedding": hash_embedding(text, self._backend.dimension)}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    # ------------------------------------------------------------------
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        """Binds and starts serving; a no-op if already running. ``base_url`` is valid afterwards."""
+        if self._httpd is not None:
+            return self
+        self._httpd = _Server((self.host, self.port), _Handler)
+        self._httpd.fake = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--dimension", type=int, default=256)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(port=args.port, latency_ms=args.latency_ms, rate_limit_rate=args.rate_limit_rate,
+                              error_rate=args.error_rate, embedding_dimension=args.dimension).start()
+    print(f"Serving fake OpenAI API at {server.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
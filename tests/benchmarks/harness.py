@@ -0,0 +1,400 @@
+"""
+Benchmark harness: runs the full v1.1 pipeline on synthetic inputs against the
+in-process OpenAI stub and reports per-stage latency/throughput, peak RSS and
+bytes written.
+
+Every scenario runs in a fresh interpreter with ``REGULENS_DATA_DIR`` pointing
+at a temporary directory, so peak RSS is per scenario and the caches, FAISS
+files and run.json it writes never touch the real ``user_data``.
+
+Usage (from the repository root)::
+
+    python -m tests.benchmarks                       # tiny + small, compare with baselines
+    python -m tests.benchmarks -s medium --latency-ms 20
+    python -m tests.benchmarks --http --rate-limit-rate 0.05   # through the local HTTP server
+    python -m tests.benchmarks --clauses 100 --procedure-mb 5
+    python -m tests.benchmarks --update-baselines    # record current numbers
+    python -m tests.benchmarks --check               # exit 1 on regressions or missing baselines
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+BASELINES_PATH = Path(__file__).resolve().parent / "baselines.json"
+
+
+class Scenario(BaseModel):
+    name: str
+    clauses: int
+    procedure_mb: float
+    procedure_files: int = 1
+    latency_ms: float = 0.0  # Artificial latency per stubbed chat/embedding request
+    # "stub" patches the OpenAI client in-process; "http" goes through FakeOpenAIServer
+    # via PipelineSettings.openai_base_url (real client, real HTTP, injectable 429/500s).
+    transport: str = "stub"
+    rate_limit_rate: float = 0.0  # http transport only
+    error_rate: float = 0.0  # http transport only
+    embedding_dimension: int = 256
+    top_k: int = 5
+    seed: int = 0
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "tiny": Scenario(name="tiny", clauses=5, procedure_mb=0.05),
+    "small": Scenario(name="small", clauses=40, procedure_mb=0.5, procedure_files=4, latency_ms=1.0),
+    "medium": Scenario(name="medium", clauses=200, procedure_mb=5.0, procedure_files=10, latency_ms=5.0),
+}
+
+# Pipeline areas guarded by the baselines, mapped to "<category>.<span name>".
+TRACKED_STAGES: Dict[str, str] = {
+    "ingestion": "stage.ingest",
+    "normalization": "stage.normalize",
+    "chunking": "embedding.chunk_text",
+    "embedding": "embedding.embedding_batch",
+    "indexing": "index.index_build",
+    "retrieval": "search.search",
+    "persistence": "io.save_run_json",
+    "cache_writes": "cache.cache_save_json",
+}
+
+# Allowed ratio of current/baseline before a metric counts as a regression.
+# Timings also get an absolute slack so sub-millisecond noise is ignored.
+TOLERANCES: Dict[str, float] = {"time": 1.5, "rss": 1.25, "bytes": 1.10}
+TIME_SLACK_MS = 20.0
+
+
+# ----------------------------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------------------------
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def stage_metrics(tracer) -> Dict[str, Dict[str, Any]]:
+    """
+    Per "<category>.<name>" span group: count, total/mean/p50/p95/max latency in
+    ms, operations per second, and for every numeric attribute its total and
+    rate per second (e.g. ``bytes_per_s``, ``vectors_per_s``).
+    """
+    durations: Dict[str, List[float]] = {}
+    attrs: Dict[str, Dict[str, float]] = {}
+    for s in tracer.spans:
+        key = f"{s.category}.{s.name}"
+        durations.setdefault(key, []).append(s.duration_ms)
+        bucket = attrs.setdefault(key, {})
+        for attr, value in s.attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                bucket[attr] = bucket.get(attr, 0) + value
+
+    metrics: Dict[str, Dict[str, Any]] = {}
+    for key, values in durations.items():
+        values.sort()
+        total_ms = sum(values)
+        seconds = total_ms / 1000.0
+        row: Dict[str, Any] = {
+            "count": len(values),
+            "total_ms": round(total_ms, 3),
+            "mean_ms": round(total_ms / len(values), 3),
+            "p50_ms": round(_percentile(values, 50), 3),
+            "p95_ms": round(_percentile(values, 95), 3),
+            "max_ms": round(values[-1], 3),
+            "ops_per_s": round(len(values) / seconds, 2) if seconds > 0 else None,
+        }
+        for attr, total in attrs[key].items():
+            row[attr] = total
+            row[f"{attr}_per_s"] = round(total / seconds, 2) if seconds > 0 else None
+        metrics[key] = row
+    return metrics
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 2)
+
+
+def _io_write_bytes() -> Optional[int]:
+    """Bytes this process passed to write() so far (Linux only)."""
+    try:
+        for line in Path("/proc/self/io").read_text().splitlines():
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _dir_bytes(root: Path, exclude: tuple = ()) -> int:
+    total = 0
+    for path in root.rglob("*"):
+        if path.is_file() and not any(part in exclude for part in path.relative_to(root).parts):
+            total += path.stat().st_size
+    return total
+
+
+def regression_metrics(result: Dict[str, Any]) -> Dict[str, float]:
+    """The flat metric set stored in and compared against the baselines."""
+    flat: Dict[str, float] = {"wall_s": result["wall_s"], "bytes_written": result["bytes_written"]}
+    if result.get("peak_rss_mb") is not None:
+        flat["peak_rss_mb"] = result["peak_rss_mb"]
+    for area, key in TRACKED_STAGES.items():
+        stage = result["stages"].get(key)
+        if stage:
+            flat[f"{area}_ms"] = stage["total_ms"]
+    return flat
+
+
+def compare_to_baseline(current: Dict[str, float], baseline: Dict[str, float]) -> List[str]:
+    """Returns a human-readable line for every metric that regressed past its tolerance."""
+    regressions = []
+    for metric, base in baseline.items():
+        value = current.get(metric)
+        if value is None or not base:
+            continue
+        if metric.endswith("_ms") or metric == "wall_s":
+            slack = TIME_SLACK_MS if metric.endswith("_ms") else TIME_SLACK_MS / 1000.0
+            limit = base * TOLERANCES["time"] + slack
+        elif metric == "peak_rss_mb":
+            limit = base * TOLERANCES["rss"]
+        else:
+            limit = base * TOLERANCES["bytes"]
+        if value > limit:
+            regressions.append(f"{metric}: {value:g} > {limit:g} (baseline {base:g})")
+    return regressions
+
+
+# ----------------------------------------------------------------------------
+# Worker (runs inside the per-scenario interpreter)
+# ----------------------------------------------------------------------------
+def run_worker(scenario: Scenario, workdir: Path) -> Dict[str, Any]:
+    """Generates inputs, runs the pipeline under the stub and collects metrics."""
+    from app.logger import logger
+    # Keep console logging out of the measurements; warnings still show up.
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    from app.models.project_data import ProjectData
+    from app.pipeline import tracing
+    from app.pipeline.pipeline_v1_1 import run_project_pipeline_v1_1
+    from app.pipeline_settings import PipelineSettings
+    from tests.benchmarks.corpus import generate_external_json, generate_procedure_corpus
+    from tests.benchmarks.fake_server import FakeOpenAIServer
+    from tests.benchmarks.stub_openai import StubBackend, patch_openai
+
+    inputs = workdir / "inputs"
+    ext = generate_external_json(inputs / "external.json", scenario.clauses, seed=scenario.seed)
+    procedures = generate_procedure_corpus(inputs / "procedures", scenario.procedure_mb,
+                                           n_files=scenario.procedure_files, seed=scenario.seed)
+    data_dir = Path(os.environ["REGULENS_DATA_DIR"])
+    project = ProjectData(
+        name=f"bench_{scenario.name}",
+        external_regulations_json_path=ext,
+        procedure_doc_paths=procedures,
+        run_json_path=data_dir / "projects" / f"bench_{scenario.name}" / "run.json",
+    )
+    settings = PipelineSettings(
+        openai_api_key="stub-key",
+        embedding_model="stub-embedding",
+        llm_model_need_check="stub-chat",
+        llm_model_audit_plan="stub-chat",
+        llm_model_judge="stub-chat",
+        audit_retrieval_top_k=scenario.top_k,
+        trace_enabled=True,
+    )
+
+    # Grab the run's tracer when the pipeline finishes with it.
+    class _Capture(tracing.TraceHook):
+        tracer = None
+
+        def on_finish(self, tracer):
+            _Capture.tracer = tracer
+
+    capture = _Capture()
+    tracing.add_global_hook(capture)
+    if scenario.transport == "http":
+        server = FakeOpenAIServer(latency_ms=scenario.latency_ms, rate_limit_rate=scenario.rate_limit_rate,
+                                  error_rate=scenario.error_rate, embedding_dimension=scenario.embedding_dimension,
+                                  seed=scenario.seed).start()
+        transport = server
+        settings.openai_base_url = server.base_url
+    else:
+        backend = StubBackend(latency_ms=scenario.latency_ms, dimension=scenario.embedding_dimension)
+        transport = patch_openai(backend)
+
+    io_before = _io_write_bytes()
+    started = time.perf_counter()
+    try:
+        with transport:
+            completed = run_project_pipeline_v1_1(project, settings, lambda *_: None, lambda: False)
+    finally:
+        tracing.remove_global_hook(capture)
+    wall_s = time.perf_counter() - started
+    io_after = _io_write_bytes()
+    calls = dict(server.stats) if scenario.transport == "http" else dict(backend.calls)
+
+    return {
+        "scenario": scenario.model_dump(),
+        "completed": completed,
+        "wall_s": round(wall_s, 4),
+        "peak_rss_mb": _peak_rss_mb(),
+        # Files the pipeline left on disk (caches, index, run.json), excluding logs and traces
+        "bytes_written": _dir_bytes(data_dir, exclude=("logs", "traces")),
+        "io_write_bytes": (io_after - io_before) if io_before is not None and io_after is not None else None,
+        "input_bytes": ext.stat().st_size + sum(p.stat().st_size for p in procedures),
+        "stub_calls": calls,
+        "stages": stage_metrics(capture.tracer) if capture.tracer else {},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+# ----------------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------------
+def run_scenario(scenario: Scenario, keep_workdir: Optional[Path] = None) -> Dict[str, Any]:
+    """Runs ``scenario`` in a fresh interpreter and returns its result dict."""
+    with tempfile.TemporaryDirectory(prefix=f"regulens_bench_{scenario.name}_") as tmp:
+        workdir = keep_workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        output = workdir / "result.json"
+        env = dict(os.environ, REGULENS_DATA_DIR=str(workdir / "data"))
+        cmd = [sys.executable, "-m", "tests.benchmarks.harness", "--worker",
+               scenario.model_dump_json(), "--workdir", str(workdir), "--output", str(output)]
+        proc = subprocess.run(cmd, cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Benchmark worker for '{scenario.name}' failed:\n{proc.stderr[-4000:]}")
+        return json.loads(output.read_text(encoding="utf-8"))
+
+
+def baseline_matches(baseline: Optional[Dict[str, Any]], scenario: Scenario) -> bool:
+    """
+    True when ``baseline`` was recorded for ``scenario``. Scenario fields the
+    baseline predates take their defaults, so adding a field does not orphan
+    every stored baseline.
+    """
+    if not baseline or "scenario" not in baseline:
+        return False
+    try:
+        return Scenario.model_validate(baseline["scenario"]) == scenario
+    except ValueError:
+        return False
+
+
+def load_baselines(path: Path = BASELINES_PATH) -> Dict[str, Any]:
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {}
+
+
+def save_baselines(baselines: Dict[str, Any], path: Path = BASELINES_PATH) -> None:
+    path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    sc = result["scenario"]
+    lines = [
+        f"== {sc['name']}: {sc['clauses']} clauses, {sc['procedure_mb']} MB in {sc['procedure_files']} file(s), "
+        f"latency {sc['latency_ms']} ms via {sc['transport']} ==",
+        f"wall {result['wall_s']:.2f}s | peak RSS {result['peak_rss_mb']} MB | "
+        f"on disk {result['bytes_written']} B | write() {result['io_write_bytes']} B | stub calls {result['stub_calls']}",
+        f"{'Stage':<28} {'Count':>7} {'Total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'ops/s':>10}  Throughput",
+    ]
+    for key, row in sorted(result["stages"].items(), key=lambda kv: kv[1]["total_ms"], reverse=True):
+        rates = ", ".join(f"{k}={v:g}" for k, v in row.items() if k.endswith("_per_s") and k != "ops_per_s" and v)
+        lines.append(f"{key[:28]:<28} {row['count']:>7} {row['total_ms']:>10.1f} {row['p50_ms']:>8.2f} "
+                     f"{row['p95_ms']:>8.2f} {row['ops_per_s'] or 0:>10g}  {rates}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmarks", description="Regulens-AI pipeline benchmarks")
+    parser.add_argument("-s", "--scenario", nargs="+", choices=sorted(SCENARIOS), default=["tiny", "small"])
+    parser.add_argument("--clauses", type=int, help="Run a custom scenario with this many clauses")
+    parser.add_argument("--procedure-mb", type=float, default=1.0, help="Custom scenario procedure corpus size")
+    parser.add_argument("--procedure-files", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, help="Override the stub latency for every scenario")
+    parser.add_argument("--http", action="store_true", help="Go through the local FakeOpenAIServer instead of the in-process stub")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="With --http: fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="With --http: fraction of requests answered with 500")
+    parser.add_argument("--output", help="Write all results as JSON to this file")
+    parser.add_argument("--update-baselines", action="store_true", help="Store these results as the new baselines")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if any metric regressed or a scenario has no baseline")
+    # Internal: run one scenario in this interpreter
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_worker(Scenario.model_validate_json(args.worker), Path(args.workdir))
+        Path(args.output).write_text(json.dumps(result, indent=2), encoding="utf-8")
+        return 0
+
+    if args.clauses:
+        scenarios = [Scenario(name="custom", clauses=args.clauses, procedure_mb=args.procedure_mb,
+                              procedure_files=args.procedure_files)]
+    else:
+        scenarios = [SCENARIOS[name] for name in args.scenario]
+    if args.latency_ms is not None:
+        scenarios = [s.model_copy(update={"latency_ms": args.latency_ms}) for s in scenarios]
+    if args.http:
+        scenarios = [s.model_copy(update={"transport": "http", "rate_limit_rate": args.rate_limit_rate,
+                                          "error_rate": args.error_rate}) for s in scenarios]
+
+    baselines = load_baselines()
+    results = []
+    regressed = False
+    missing: List[str] = []
+    for scenario in scenarios:
+        result = run_scenario(scenario)
+        results.append(result)
+        print(format_report(result))
+        baseline = baselines.get(scenario.name)
+        current = regression_metrics(result)
+        if args.update_baselines:
+            baselines[scenario.name] = {"scenario": result["scenario"], "metrics": current,
+                                        "python": result["python"], "platform": result["platform"]}
+        elif baseline_matches(baseline, scenario):
+            regressions = compare_to_baseline(current, baseline["metrics"])
+            if regressions:
+                regressed = True
+                print("REGRESSIONS vs baseline:\n  " + "\n  ".join(regressions))
+            else:
+                print("OK vs baseline")
+        else:
+            # Without a baseline nothing is checked; --check must not pass silently
+            missing.append(scenario.name)
+            print("(no matching baseline)")
+        print()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.update_baselines:
+        save_baselines(baselines)
+        print(f"Baselines written to {BASELINES_PATH}")
+    if args.check and missing:
+        print(f"No matching baseline for: {', '.join(missing)} (record one with --update-baselines)")
+    return 1 if (args.check and (regressed or missing)) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Micro-benchmark: single-pass ``_normalize_text`` vs. the line-by-line reference.
+
+Runs both implementations on the bundled sample procedures and on synthetic
+corpora, checks that their outputs are identical, and prints the best-of-N
+time for each along with the speed-up:
+
+    python -m tests.benchmarks.normalize_bench [--mb 2] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from app.pipeline.normalize import _normalize_text, _normalize_text_reference
+from tests.benchmarks.corpus import generate_procedure_corpus
+
+SAMPLE_DATA_DIR = Path(__file__).resolve().parents[2] / "sample_data"
+
+
+def sample_texts() -> List[Tuple[str, str]]:
+    return [(p.parent.parent.name.split("_")[0], p.read_text(encoding="utf-8"))
+            for p in sorted(SAMPLE_DATA_DIR.glob("*/procedures/*.txt"))]
+
+
+def synthetic_texts(megabytes: float, seed: int = 0) -> List[Tuple[str, str]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_procedure_corpus(Path(tmp), megabytes, n_files=1, seed=seed)
+        return [(f"synthetic {megabytes:g} MB", paths[0].read_text(encoding="utf-8"))]
+
+
+def best_of(fn: Callable[[str, str], object], text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text, "bench")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mb", type=float, default=2.0, help="Size of the synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'input':<26}{'chars':>10}{'reference ms':>14}{'single-pass ms':>16}{'speed-up':>10}")
+    for label, text in sample_texts() + synthetic_texts(args.mb):
+        if _normalize_text(text, "bench") != _normalize_text_reference(text, "bench"):
+            print(f"{label}: OUTPUT MISMATCH")
+            return 1
+        ref = best_of(_normalize_text_reference, text, args.repeat)
+        fast = best_of(_normalize_text, text, args.repeat)
+        print(f"{label:<26}{len(text):>10}{ref * 1000:>14.2f}{fast * 1000:>16.2f}{ref / fast:>9.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
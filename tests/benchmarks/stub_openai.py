@@ -0,0 +1,120 @@
+"""
+In-process stand-in for the ``openai.OpenAI`` client.
+
+It answers the three chat prompts the pipeline sends (need-check, audit-plan,
+judge) and embedding requests deterministically, after an optional artificial
+latency, so benchmark runs are reproducible and never touch the network.
+
+Use ``patch_openai(...)`` to install it for the duration of a run.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import mock
+
+import numpy as np
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def hash_embedding(text: str, dimension: int) -> List[float]:
+    """Unit-length pseudo-random vector seeded by ``text`` (same text -> same vector)."""
+    rng = np.random.default_rng(int.from_bytes(_digest(text)[:8], "little"))
+    vec = rng.standard_normal(dimension).astype("float32")
+    vec /= np.linalg.norm(vec) or 1.0
+    return vec.tolist()
+
+
+def _usage(prompt_tokens: int, completion_tokens: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens)
+
+
+class StubBackend:
+    """Shared state behind every stub client: latency, vector size and call counters."""
+
+    def __init__(self, latency_ms: float = 0.0, embedding_latency_ms: Optional[float] = None, dimension: int = 256):
+        self.chat_latency_s = latency_ms / 1000.0
+        self.embedding_latency_s = (latency_ms if embedding_latency_ms is None else embedding_latency_ms) / 1000.0
+        self.dimension = dimension
+        self.calls: Dict[str, int] = {"chat": 0, "embeddings": 0, "embedding_inputs": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.calls[key] += n
+
+    # ------------------------------------------------------------------
+    def chat_reply(self, prompt: str) -> Dict[str, Any]:
+        """Deterministic JSON answer for the pipeline prompt in ``prompt``."""
+        seed = _digest(prompt)
+        if "requires_procedure" in prompt:
+            # Roughly three out of four clauses need a procedure.
+            return {"requires_procedure": seed[0] % 4 != 0}
+        if "'audit_tasks'" in prompt:
+            n_tasks = 1 + seed[1] % 3
+            return {"audit_tasks": [
+                {"id": f"task_{i + 1:03d}", "sentence": f"查核程序是否規範第{seed[2 + i] % 9 + 1}項控制要求"}
+                for i in range(n_tasks)
+            ]}
+        if "'compliant'" in prompt:
+            compliant = seed[3] % 2 == 0
+            return {
+                "compliant": compliant,
+                "compliance_description": "內部文件已涵蓋相關要求。" if compliant else "內部文件未見對應規範。",
+                "improvement_suggestions": "無需額外改善。" if compliant else "建議補充相關作業程序。",
+            }
+        return {"text": "ok"}
+
+    def chat_create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> SimpleNamespace:
+        self._count("chat")
+        if self.chat_latency_s:
+            time.sleep(self.chat_latency_s)
+        prompt = messages[-1]["content"]
+        content = json.dumps(self.chat_reply(prompt), ensure_ascii=False)
+        message = SimpleNamespace(content=content, role="assistant")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message, finish_reason="stop", index=0)],
+            usage=_usage(len(prompt) // 4, len(content) // 4),
+            model=model,
+        )
+
+    def embeddings_create(self, input: Any, model: str, **kwargs: Any) -> SimpleNamespace:
+        inputs = [input] if isinstance(input, str) else list(input)
+        self._count("embeddings")
+        self._count("embedding_inputs", len(inputs))
+        if self.embedding_latency_s:
+            time.sleep(self.embedding_latency_s)
+        data = [SimpleNamespace(embedding=hash_embedding(text, self.dimension), index=i, object="embedding")
+                for i, text in enumerate(inputs)]
+        return SimpleNamespace(data=data, model=model,
+                               usage=_usage(sum(len(t) for t in inputs) // 4))
+
+
+class StubOpenAI:
+    """Drop-in for ``openai.OpenAI``; construction arguments are accepted and ignored."""
+
+    backend: StubBackend = StubBackend()
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        backend = type(self).backend
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=backend.chat_create))
+        self.embeddings = SimpleNamespace(create=backend.embeddings_create)
+
+
+@contextmanager
+def patch_openai(backend: StubBackend) -> Iterator[StubBackend]:
+    """Routes every OpenAI client the pipeline creates to ``backend``."""
+    client_cls = type("BoundStubOpenAI", (StubOpenAI,), {"backend": backend})
+    with mock.patch("openai.OpenAI", client_cls), \
+            mock.patch("app.pipeline.llm_utils.OpenAI", client_cls):
+        yield backend
@@ -0,0 +1,22 @@
+import pytest
+
+from tests.benchmarks.fake_server import FakeOpenAIServer
+
+
+@pytest.fixture(scope="session")
+def _fake_openai_server_session():
+    with FakeOpenAIServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fake_openai_server(_fake_openai_server_session):
+    """
+    Local OpenAI-compatible server (see tests/benchmarks/fake_server.py), shared
+    by the session and reset to no latency/faults before each test. Tests can
+    call ``fake_openai_server.configure(...)`` and point clients or
+    ``PipelineSettings.openai_base_url`` at ``fake_openai_server.base_url``.
+    """
+    server = _fake_openai_server_session
+    server.configure(latency_ms=0.0, rate_limit_rate=0.0, error_rate=0.0, seed=0)
+    yield server
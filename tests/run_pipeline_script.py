@@ -3,25 +3,10 @@ import os
 from pathlib import Path
 import json
 from typing import List, Optional, Union, Callable, Dict, Any
-from unittest.mock import patch, MagicMock # Import MagicMock for mocking modules
 
 # Add the /app directory to sys.path to allow imports from app.*
 sys.path.insert(0, "/app")
 
-# --- Minimal CompareProject definition to avoid PySide6 dependency ---
-class HeadlessCompareProject:
-    def __init__(self, name: str):
-        self.name: str = name
-        self.external_regulations_json_path: Optional[Path] = None
-        self.procedure_doc_paths: List[Path] = []
-        self.run_json_path: Optional[Path] = None
-        self.base_dir: Optional[Path] = None
-
-    def get_document_paths_by_type(self, doc_type: str) -> List[Path]:
-        if doc_type == "procedure":
-            return self.procedure_doc_paths
-        return []
-
 # --- Configuration ---
 project_name = "sample2_符合規範Demo"
 external_regulations_json_path = Path(f"sample_data/{project_name}/external_regulations/external.json")
@@ -42,13 +27,8 @@ def my_cancel_cb() -> bool:
     return False
 
 def main():
-    # --- Mock PySide6 before any problematic app imports ---
-    mock_pyside = MagicMock()
-    sys.modules['PySide6'] = mock_pyside
-    sys.modules['PySide6.QtCore'] = MagicMock()
-    sys.modules['PySide6.QtGui'] = MagicMock() 
-    sys.modules['PySide6.QtWidgets'] = MagicMock()
-    
+    # The pipeline only depends on the Qt-free ProjectData model, so no PySide6 stubs are needed.
+    from app.models.project_data import ProjectData
     from app.pipeline_settings import PipelineSettings
 
     temp_run_dir.mkdir(parents=True, exist_ok=True)
@@ -57,11 +37,12 @@ def main():
         run_json_path.unlink()
         print(f"Cleared existing run file: {run_json_path}")
 
-    project_instance = HeadlessCompareProject(name=project_name)
-    project_instance.external_regulations_json_path = external_regulations_json_path
-    project_instance.procedure_doc_paths = procedure_doc_paths
-    project_instance.run_json_path = run_json_path
-    project_instance.base_dir = Path(f"sample_data/{project_name}")
+    project_instance = ProjectData(
+        name=project_name,
+        external_regulations_json_path=external_regulations_json_path,
+        procedure_doc_paths=procedure_doc_paths,
+        run_json_path=run_json_path,
+    )
 
     print(f"Project Name: {project_instance.name}")
     print(f"External Regulations JSON Path: {project_instance.external_regulations_json_path}")
@@ -89,12 +70,7 @@ def main():
 
     print("\n--- Starting Pipeline Execution ---")
     
-    # Corrected patch: Replace the class app.models.project.CompareProject with HeadlessCompareProject
-    patcher = patch('app.models.project.CompareProject', HeadlessCompareProject)
-    
     try:
-        mock_compare_project_class_actual = patcher.start() # This will be HeadlessCompareProject
-        
         from app.pipeline.pipeline_v1_1 import run_project_pipeline_v1_1, AuditPlanClauseUIData
         
         run_project_pipeline_v1_1(project_instance, settings, my_progress_callback, my_cancel_cb)
@@ -104,8 +80,6 @@ def main():
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        patcher.stop() 
 
     if run_json_path.exists():
         print(f"\n--- Contents of {run_json_path} ---")
@@ -0,0 +1,126 @@
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.models.assessments import MatchSet
+from app.models.docs import AuditTask, EmbedSet, ExternalRegulationClause
+from app.pipeline.evidence import diversify_clause_evidence
+from app.pipeline.index import IndexBuilder
+from app.pipeline.retrieve import apply_score_cutoffs, retrieve_chunks
+from app.pipeline_settings import FUSED_RETRIEVAL_ENGINES, PipelineSettings
+
+
+def _matches(*scores):
+    return [MatchSet(query_norm_doc_id="q", query_embed_set_id="q", query_chunk_text="q", matched_norm_doc_id="d",
+                     matched_embed_set_id=f"es{i}", matched_chunk_text=f"chunk {i}", score=score,
+                     query_doc_type="task_query_text", matched_doc_type="procedures")
+            for i, score in enumerate(scores)]
+
+
+def test_score_cutoffs():
+    matches = _matches(0.82, 0.7, 0.55, 0.3)
+    assert apply_score_cutoffs(matches) == matches
+    assert [m.score for m in apply_score_cutoffs(matches, min_score=0.5)] == [0.82, 0.7, 0.55]
+    assert [m.score for m in apply_score_cutoffs(matches, relative_score=0.8)] == [0.82, 0.7]
+    assert [m.score for m in apply_score_cutoffs(matches, min_score=0.75, relative_score=0.5)] == [0.82]
+    # Nothing clears an absolute floor: the task gets no evidence
+    assert apply_score_cutoffs(matches, min_score=0.9) == []
+    # A non-positive best score disables the relative cutoff
+    assert len(apply_score_cutoffs(_matches(-0.1, -0.2), relative_score=0.9)) == 2
+
+
+@pytest.mark.parametrize("engine", FUSED_RETRIEVAL_ENGINES)
+def test_keyword_only_match_survives_cutoffs_of_hybrid_engines(tmp_path: Path, engine: str):
+    rng = np.random.default_rng(5)
+    query_vector = rng.random(8)
+    texts = ["資通安全長應每年檢討資通安全政策並核定。", "密碼長度至少十二碼並每九十日更換。"]
+    texts += [f"lorem ipsum {i}" for i in range(28)]
+    vectors = [query_vector + 10.0, query_vector] + [rng.random(8) for _ in texts[2:]]
+    embed_sets = [EmbedSet(id=f"es{i}", norm_doc_id="doc", chunk_text=text, embedding=vector.tolist(),
+                           chunk_index=i, total_chunks=len(texts), doc_type="procedure")
+                  for i, (text, vector) in enumerate(zip(texts, vectors))]
+    builder = IndexBuilder(tmp_path, "procedures", "model", lexical=True)
+    builder.add(embed_sets)
+    meta = builder.finish()
+    # es1 is the nearest vector and shares words with the query; es0 is far away but names the 資通安全長
+    query = embed_sets[1].model_copy(update={"id": "q", "chunk_text": "資通安全長 密碼長度"})
+    matches = retrieve_chunks(query, meta, builder.chunks_for, 3, engine=engine, faiss_index_obj=builder.index,
+                              id_map_list_obj=builder.ids, lexical_index_obj=builder.lexical)
+    assert matches[0].matched_embed_set_id == "es1" and "es0" in [m.matched_embed_set_id for m in matches]
+
+    defaults = PipelineSettings.model_fields
+    relative = defaults["retrieval_relative_score"].default
+    assert relative > 0
+    kept = apply_score_cutoffs(matches, defaults["retrieval_min_score"].default, relative, fused=True)
+    assert "es0" in [m.matched_embed_set_id for m in kept]
+    # Applied to the fused scores, the relative cutoff would have dropped the keyword-only match
+    assert "es0" not in [m.matched_embed_set_id for m in apply_score_cutoffs(matches, relative_score=relative)]
+    builder.close()
+
+
+def _clause(*tasks, vectors=None):
+    """Clause whose tasks reference evidence ids; ``tasks`` are (task id, [(evidence id, score), ...])."""
+    evidence: List[str] = []
+    audit_tasks = []
+    for name, refs in tasks:
+        evidence.extend(eid for eid, _ in refs if eid not in evidence)
+        audit_tasks.append(AuditTask(id=name, sentence=name, top_k=[{"evidence_id": eid, "score": s} for eid, s in refs]))
+    clause = ExternalRegulationClause(id="C", text="clause", tasks=audit_tasks, evidence=evidence)
+    return clause, {eid: np.asarray(v, dtype=np.float32) for eid, v in (vectors or {}).items()}
+
+
+def test_evidence_shared_by_tasks_is_stored_once():
+    clause, vectors = _clause(("a", [("x", 0.9), ("y", 0.7)]), ("b", [("x", 0.8)]))
+    assert diversify_clause_evidence(clause, vectors) == 0
+    assert clause.evidence == ["x", "y"]
+    assert [ref["evidence_id"] for ref in clause.tasks[1].top_k] == ["x"]
+
+
+def test_near_duplicate_evidence_is_folded():
+    clause, vectors = _clause(("a", [("x", 0.9), ("z", 0.6)]), ("b", [("x2", 0.85)]),
+                              vectors={"x": [1, 0], "x2": [0.999, 0.0447], "z": [0, 1]})
+    assert diversify_clause_evidence(clause, vectors) == 0
+    assert clause.evidence == ["x", "z"]
+    assert [ref["evidence_id"] for ref in clause.tasks[1].top_k] == ["x"]  # Redirected, not dropped
+    assert clause.tasks[1].top_k[0]["score"] == 0.85
+
+
+def test_budget_keeps_each_tasks_best_evidence_first():
+    clause, vectors = _clause(("a", [("a0", 0.9), ("a1", 0.88), ("a2", 0.87)]), ("b", [("b0", 0.5), ("b1", 0.45)]),
+                              ("c", []), ("d", [("d0", 0.6)]))
+    assert diversify_clause_evidence(clause, vectors, budget=4) == 2
+    assert [[ref["evidence_id"] for ref in t.top_k] for t in clause.tasks] == [["a0", "a1"], ["b0"], [], ["d0"]]
+    assert diversify_clause_evidence(clause, vectors, budget=4) == 0  # Already within budget
+    assert diversify_clause_evidence(clause, vectors, budget=2) == 2
+    assert [[ref["evidence_id"] for ref in t.top_k] for t in clause.tasks] == [["a0"], [], [], ["d0"]]
+    assert clause.evidence == ["a0", "d0"]
+
+
+def test_mmr_prefers_diverse_evidence():
+    refs = ("a", [("a0", 0.9), ("a1", 0.85), ("a2", 0.8)])
+    vectors = {"a0": [1, 0, 0], "a1": [0.9, 0.43, 0], "a2": [0, 0, 1]}
+    clause, es_vectors = _clause(refs, vectors=vectors)
+    diversify_clause_evidence(clause, es_vectors, budget=2)
+    assert clause.evidence == ["a0", "a2"]
+    clause, es_vectors = _clause(refs, vectors=vectors)
+    diversify_clause_evidence(clause, es_vectors, budget=2, mmr_lambda=1.0)  # Relevance only
+    assert clause.evidence == ["a0", "a1"]
+
+
+def test_legacy_top_k_entries_pass_through():
+    legacy = {"excerpt": "old", "score": 0.5, "source_txt": "p.txt"}
+    clause = ExternalRegulationClause(id="C", text="clause", tasks=[AuditTask(id="a", sentence="a", top_k=[legacy])])
+    assert diversify_clause_evidence(clause, {}, budget=1) == 0
+    assert clause.tasks[0].top_k == [legacy]
+
+
+def test_index_builder_returns_unit_vectors(tmp_path):
+    embed_sets = [EmbedSet(id=f"e{i}", norm_doc_id="d", chunk_text=f"t{i}", embedding=[float(i + 1), 1.0],
+                           chunk_index=i, total_chunks=3, doc_type="procedure") for i in range(3)]
+    builder = IndexBuilder(tmp_path, "procedures", "model")
+    builder.add(embed_sets)
+    builder.finish()
+    vectors = builder.vectors_for(["e2", "missing"])
+    assert list(vectors) == ["e2"] and np.isclose(np.linalg.norm(vectors["e2"]), 1.0)
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+from tests.benchmarks.corpus import generate_external_json, generate_procedure_corpus
+from tests.benchmarks.harness import (SCENARIOS, baseline_matches, compare_to_baseline, load_baselines,
+                                      regression_metrics, run_scenario)
+
+
+def test_corpus_is_deterministic(tmp_path: Path):
+    a = generate_procedure_corpus(tmp_path / "a", 0.02, n_files=2, seed=7)
+    b = generate_procedure_corpus(tmp_path / "b", 0.02, n_files=2, seed=7)
+    assert [p.read_bytes() for p in a] == [p.read_bytes() for p in b]
+    assert sum(p.stat().st_size for p in a) >= 0.02 * 1024 * 1024
+
+    ext = generate_external_json(tmp_path / "external.json", 12, seed=7)
+    assert '"C012"' in ext.read_text(encoding="utf-8")
+
+
+def test_compare_to_baseline_flags_only_real_regressions():
+    baseline = {"wall_s": 2.0, "embedding_ms": 100.0, "peak_rss_mb": 200.0, "bytes_written": 1000}
+    assert compare_to_baseline(dict(baseline), baseline) == []
+    assert compare_to_baseline({"embedding_ms": 160.0}, baseline) == []  # within 1.5x + slack
+    regressed = compare_to_baseline(
+        {"wall_s": 4.0, "embedding_ms": 400.0, "peak_rss_mb": 300.0, "bytes_written": 1200}, baseline)
+    assert len(regressed) == 4
+
+
+def test_stored_baselines_match_their_scenarios():
+    baselines = load_baselines()
+    for name in ("tiny", "small"):
+        assert baseline_matches(baselines.get(name), SCENARIOS[name])
+    # Fields a baseline predates take their defaults; any other difference is a different scenario
+    old = {"scenario": {k: v for k, v in SCENARIOS["tiny"].model_dump().items() if k != "transport"}}
+    assert baseline_matches(old, SCENARIOS["tiny"])
+    assert not baseline_matches(old, SCENARIOS["tiny"].model_copy(update={"transport": "http"}))
+    assert not baseline_matches(None, SCENARIOS["tiny"])
+
+
+def test_tiny_scenario_runs_end_to_end():
+    result = run_scenario(SCENARIOS["tiny"])
+    assert result["completed"] is True
+    assert result["stub_calls"]["chat"] > 0
+    assert result["bytes_written"] > 0
+    assert "stage.ingest" in result["stages"] and "io.save_run_json" in result["stages"]
+    metrics = regression_metrics(result)
+    assert {"wall_s", "bytes_written", "ingestion_ms", "persistence_ms"} <= set(metrics)
+
+
+def test_tiny_scenario_over_http_uses_base_url():
+    result = run_scenario(SCENARIOS["tiny"].model_copy(update={"transport": "http"}))
+    assert result["completed"] is True
+    # Every chat call went through the local server via PipelineSettings.openai_base_url
+    assert result["stub_calls"]["chat"] > 0
+    assert result["stub_calls"]["requests"] >= result["stub_calls"]["chat"]
@@ -0,0 +1,130 @@
+import gzip
+from pathlib import Path
+
+import numpy as np
+
+from app import cli
+from app.models.docs import NormDoc
+from app.pipeline import cache_codecs
+from app.pipeline.cache import CacheService, MemoryLRU
+from app.pipeline.cache_backends import FileCacheBackend, SQLiteCacheBackend, migrate_cache
+from app.pipeline_settings import CACHE_CODECS
+
+
+def _doc(i: int) -> NormDoc:
+    return NormDoc(id=f"doc{i}", raw_doc_id=f"raw{i}", text_content=f"text {i}", sections=[], metadata={},
+                   doc_type="procedure")
+
+
+def test_sqlite_backend_batches(tmp_path: Path):
+    backend = SQLiteCacheBackend(tmp_path / "cache.sqlite3")
+    backend.put_many({f"k{i}": str(i).encode() for i in range(1200)}, "npy")  # More keys than one IN (...) query
+    assert backend.get_many(["k0", "k1199", "missing", "k0"], "npy") == {"k0": b"0", "k1199": b"1199"}
+    assert len(backend.get_many([f"k{i}" for i in range(1200)], "npy")) == 1200
+    assert backend.get_many(["k5"], "json.gz") == {}  # Kinds are separate
+    assert backend.exists("k7", "npy") and not backend.exists("k7", "json.gz")
+    assert backend._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    backend.close()
+
+
+def test_cache_service_round_trip_with_both_backends(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    for backend in ("sqlite", "file"):
+        cache = CacheService(project_name=f"p_{backend}", backend=backend)
+        cache.save_json_many({f"key{i}": _doc(i) for i in range(3)})
+        cache.save_numpy("vec", np.arange(4, dtype=np.float32))
+        loaded = cache.load_json_many(["key0", "key2", "nope"], NormDoc)
+        assert sorted(loaded) == ["key0", "key2"] and loaded["key2"].text_content == "text 2"
+        assert cache.load_json("key1", NormDoc).id == "doc1"
+        assert np.array_equal(cache.load_numpy("vec"), np.arange(4, dtype=np.float32))
+        assert cache.exists("key1", "json.gz") and not cache.exists("nope", "json.gz")
+        cache.close()
+    assert (tmp_path / "cache" / "embeddings" / "p_sqlite" / "cache.sqlite3").exists()
+    assert (tmp_path / "cache" / "embeddings" / "p_file" / "key0.json.gz").exists()
+
+
+def test_legacy_files_are_read_and_migrated(tmp_path: Path, monkeypatch, capsys):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    cache_dir = tmp_path / "cache" / "embeddings" / "legacy"
+    cache_dir.mkdir(parents=True)
+    # Layout written by earlier versions: one gzip-compressed JSON file per entry
+    for i in range(3):
+        with gzip.open(cache_dir / f"key{i}.json.gz", "wt", encoding="utf-8") as f:
+            f.write(_doc(i).model_dump_json())
+
+    cache = CacheService(project_name="legacy")
+    assert cache.load_json("key1", NormDoc).id == "doc1"  # Read through to the old file
+    assert cache.backend.get("key1", "json.gz") is not None  # ...and copied into SQLite
+    cache.close()
+
+    assert cli.main(["cache", "migrate", "--project", "legacy"]) == cli.EXIT_OK
+    assert '"entries": 3' in capsys.readouterr().out
+    assert not list(cache_dir.glob("*.json.gz"))
+    cache = CacheService(project_name="legacy")
+    assert cache._legacy is None and sorted(cache.load_json_many(["key0", "key1", "key2"], NormDoc)) == ["key0", "key1", "key2"]
+    cache.close()
+
+
+def test_migrate_back_to_files(tmp_path: Path):
+    sqlite = SQLiteCacheBackend(tmp_path / "cache.sqlite3")
+    sqlite.put("a", "npy", b"123")
+    files = FileCacheBackend(tmp_path)
+    assert migrate_cache(sqlite, files) == 1
+    assert (tmp_path / "a.npy").read_bytes() == b"123" and sqlite.exists("a", "npy")
+    sqlite.close()
+
+
+def test_memory_tier_serves_repeated_loads(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    cache = CacheService(project_name="memory")
+    cache.save_json("k", _doc(1))
+    first = cache.load_json("k", NormDoc)
+    assert cache.load_json("k", NormDoc) is first  # Second load skips the backend entirely
+    assert cache.load_json_many(["k"], NormDoc)["k"] is first
+    assert cache.memory.stats()["hits"] == 2
+
+    cache.save_json("k", _doc(2))  # Saving invalidates the decoded copy
+    assert cache.load_json("k", NormDoc).id == "doc2"
+
+    cache.save_numpy("v", np.ones(4, dtype=np.float32))
+    array = cache.load_numpy("v")
+    assert cache.load_numpy("v") is array and not array.flags.writeable
+    cache.close()
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    lru = MemoryLRU(max_bytes=100)
+    for i in range(5):
+        lru.put(f"k{i}", "npy", i, 30)
+    assert len(lru) == 3 and lru.bytes == 90 and lru.evictions == 2
+    assert lru.get("k0", "npy") is None and lru.get("k2", "npy") == 2
+    lru.put("k5", "npy", 5, 30)  # k2 was just used, so k3 goes
+    assert lru.get("k3", "npy") is None and lru.get("k2", "npy") == 2
+    lru.put("huge", "npy", 0, 101)  # Larger than the budget: not kept
+    assert lru.get("huge", "npy") is None and lru.bytes == 90
+
+
+def test_codecs_are_recorded_per_entry(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    written = {}
+    for codec in (c for c in CACHE_CODECS if cache_codecs.codec_available(c)):
+        cache = CacheService(project_name="codecs", codec=codec, memory_max_bytes=0)
+        cache.save_json(codec, _doc(len(written)))
+        written[codec] = cache.backend.get(codec, "json.gz")
+        cache.close()
+    assert written["none"][4:] == _doc(0).model_dump_json().encode()
+    assert written["gzip"][:4] == cache_codecs.CODEC_MAGIC + b"\x01"
+
+    # Any codec reads what the others wrote, and headerless gzip from earlier versions
+    cache = CacheService(project_name="codecs", codec="none", memory_max_bytes=0)
+    cache.backend.put("legacy", "json.gz", gzip.compress(_doc(9).model_dump_json().encode()))
+    loaded = cache.load_json_many(list(written) + ["legacy"], NormDoc)
+    assert [loaded[key].id for key in list(written) + ["legacy"]] == [f"doc{i}" for i in range(len(written))] + ["doc9"]
+    cache.close()
+
+
+def test_missing_codec_falls_back_to_gzip():
+    assert cache_codecs.resolve_codec("brotli") == "gzip"
+    if not cache_codecs.codec_available("zstd"):
+        assert cache_codecs.resolve_codec("zstd") == "gzip"
+    assert cache_codecs.decode(cache_codecs.encode(b"{}", "gzip")) == (b"{}", "gzip")
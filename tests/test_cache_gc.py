@@ -0,0 +1,115 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from app import cli
+from app.pipeline import cache_gc
+from app.pipeline.cache_backends import SQLiteCacheBackend
+from app.pipeline.cache_gc import cache_usage, enforce_cache_limit, known_projects
+
+DAY = 24 * 3600
+
+
+def _project_cache(root: Path, name: str, entries: int, last_access: float) -> SQLiteCacheBackend:
+    backend = SQLiteCacheBackend(root / "cache" / "embeddings" / name / "cache.sqlite3")
+    backend.put_many({f"{name}{i}": os.urandom(10_000) for i in range(entries)}, "npy")
+    backend._conn.execute("UPDATE entries SET last_access = ?", (int(last_access),))
+    return backend
+
+
+def test_last_access_is_refreshed_on_read(tmp_path: Path):
+    backend = _project_cache(tmp_path, "p", 2, time.time() - DAY)
+    backend.get_many(["p0"], "npy")
+    by_key = {info.key: info.last_access for info in backend.entry_infos()}
+    assert by_key["p0"] > time.time() - 60 > by_key["p1"]
+    assert backend.stats() == (2, 20_000, by_key["p0"])
+    backend.close()
+
+
+def test_usage_and_orphans(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    (tmp_path / "projects.json").write_text(json.dumps([{"name": "kept", "run_json_path": "/data/kept/run.json"}]))
+    for name in ("kept", "deleted"):
+        _project_cache(tmp_path, name, 3, time.time() - DAY).close()
+    leftover = tmp_path / "cache" / "faiss_index" / "project_abc"
+    leftover.mkdir(parents=True)
+    (leftover / "procedures.faiss").write_bytes(b"x" * 100)
+    os.utime(leftover / "procedures.faiss", (time.time() - DAY, time.time() - DAY))
+
+    usage = {(u.namespace, u.name): u for u in cache_usage()}
+    assert usage[("embeddings", "kept")].entries == 3 and usage[("embeddings", "kept")].bytes >= 30_000
+    assert [key for key, u in usage.items() if u.orphan] == [("embeddings", "deleted"), ("faiss_index", "project_abc")]
+    (tmp_path / "traces").mkdir()
+    (tmp_path / "traces" / "run.json").write_text("{}")
+    assert any(u.namespace == "traces" and u.entries == 1 for u in cache_usage())
+
+    report = enforce_cache_limit(0, delete_orphans=True)
+    assert len(report.removed_orphans) == 2 and report.evicted_entries == 0
+    assert sorted(p.name for p in (tmp_path / "cache" / "embeddings").iterdir()) == ["kept"]
+    assert not leftover.exists()
+
+
+def test_projects_run_with_dir_are_not_orphans(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path / "data"))
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "projects.json").write_text(json.dumps([{"name": "kept", "run_json_path": "/data/kept/run.json"}]))
+    project_dir = tmp_path / "adhoc"
+    (project_dir / "procedures").mkdir(parents=True)
+    (project_dir / "external.json").write_text(json.dumps({"C001": "clause"}), encoding="utf-8")
+    (project_dir / "procedures" / "p.txt").write_text("procedure", encoding="utf-8")
+
+    args = cli.build_parser().parse_args(["run", "--dir", str(project_dir)])
+    assert [p["name"] for p in cli.select_projects(args)] == ["adhoc"]
+    assert known_projects() == {"kept", "adhoc"}
+
+    for name in ("kept", "adhoc", "deleted"):
+        _project_cache(data_dir, name, 2, time.time() - DAY).close()
+    report = enforce_cache_limit(0, delete_orphans=True)
+    assert [u.name for u in report.removed_orphans] == ["deleted"]
+    assert sorted(p.name for p in (data_dir / "cache" / "embeddings").iterdir()) == ["adhoc", "kept"]
+
+
+def test_size_cap_evicts_least_recently_used_entries(tmp_path: Path, monkeypatch, capsys):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    now = time.time()
+    _project_cache(tmp_path, "old", 20, now - 3 * DAY).close()
+    _project_cache(tmp_path, "recent", 20, now - DAY).close()
+    _project_cache(tmp_path, "running", 20, now).close()  # Inside the grace period: never evicted
+
+    assert cli.main(["cache", "gc", "--max-mb", "0", "--dry-run"]) == cli.EXIT_OK
+    assert '"evicted_entries": 0' in capsys.readouterr().out
+
+    report = enforce_cache_limit(500_000)
+    assert report.total_bytes <= 500_000 and report.evicted_entries >= 20
+    remaining = {u.name: u.entries for u in cache_usage()}
+    assert remaining["old"] == 0 and remaining["recent"] > 0 and remaining["running"] == 20
+
+    # A cap below what the grace period protects evicts everything else and stops there
+    report = enforce_cache_limit(1)
+    assert {u.name: u.entries for u in cache_usage()} == {"old": 0, "recent": 0, "running": 20}
+    assert report.total_bytes > 1
+
+
+def test_under_the_cap_opens_no_database(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    _project_cache(tmp_path, "p", 5, time.time() - DAY).close()
+
+    def full_scan(*args, **kwargs):
+        raise AssertionError("cache_usage must not run under the cap")
+
+    monkeypatch.setattr(cache_gc, "cache_usage", full_scan)
+    report = enforce_cache_limit(10_000_000)
+    assert report.evicted_entries == 0 and report.usage == [] and report.total_bytes >= 50_000
+
+
+def test_compact_project_leaves_other_databases_alone(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    for name in ("mine", "other"):
+        _project_cache(tmp_path, name, 20, time.time() - DAY).close()
+    compacted = []
+    monkeypatch.setattr(SQLiteCacheBackend, "compact", lambda self: compacted.append(self.db_path.parent.name))
+
+    report = enforce_cache_limit(1, compact_project="mine")
+    assert report.evicted_entries == 40 and compacted == ["mine"]
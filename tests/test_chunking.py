@@ -0,0 +1,68 @@
+from app.models.docs import RawDoc
+from app.pipeline import chunking
+from app.pipeline.chunking import chunk_document, chunk_documents, get_tokenizer
+from app.pipeline.embed import _chunk_metadata
+from app.pipeline.normalize import normalize_document
+
+TOKENIZER = get_tokenizer()
+
+
+def _norm(content: str, metadata=None):
+    return normalize_document(RawDoc(id="doc", source_path="doc.txt", content=content,
+                                     metadata=metadata or {}, doc_type="procedure"))
+
+
+def test_section_starts_point_into_normalized_text():
+    norm = _norm("ACCESS CONTROL\n- Accounts are reviewed quarterly.\n\nBACKUP\n- Backups are tested monthly.")
+    assert norm.sections == ["ACCESS CONTROL", "BACKUP"]
+    starts = norm.metadata["section_starts"]
+    assert norm.text_content[starts[1]:].startswith("- Backups")
+
+
+def test_chunks_follow_sections_and_sentences_with_exact_offsets():
+    norm = _norm("ACCESS CONTROL\n- 帳號每季審查一次。特權帳號需主管核准。\n"
+                 "- Accounts are reviewed quarterly. Privileged accounts need approval.\n"
+                 "BACKUP\n- Backups are tested monthly.")
+    chunks = chunk_document(norm, TOKENIZER, max_tokens=20)
+
+    assert [c.section for c in chunks][-1] == "BACKUP"
+    assert all(c.section == "ACCESS CONTROL" for c in chunks[:-1])
+    for chunk in chunks:
+        assert chunk.text == norm.text_content[chunk.start:chunk.end]
+        assert chunk.token_count <= 20
+        # Every chunk ends on a sentence boundary
+        assert chunk.text[-1] in "。." or chunk.end == len(norm.text_content)
+    assert _chunk_metadata(chunks[-1]) == {"char_start": chunks[-1].start, "char_end": chunks[-1].end,
+                                           "section": "BACKUP"}
+
+
+def test_long_cjk_sentence_is_cut_between_characters():
+    sentence = "資訊安全管理系統應定期審查存取權限並保存紀錄" * 20
+    norm = _norm(f"- {sentence}")
+    chunks = chunk_document(norm, TOKENIZER, max_tokens=30)
+    assert len(chunks) > 1
+    assert "".join(c.text for c in chunks) == norm.text_content
+    assert all(len(TOKENIZER.encode(c.text)) <= 31 for c in chunks)
+
+
+def test_overlap_repeats_trailing_sentences():
+    text = "- " + " ".join(f"Control {i} is reviewed by the owner." for i in range(12))
+    norm = _norm(text)
+    plain = chunk_document(norm, TOKENIZER, max_tokens=40)
+    overlapped = chunk_document(norm, TOKENIZER, max_tokens=40, overlap_tokens=12)
+    assert all(a.end <= b.start for a, b in zip(plain, plain[1:]))
+    assert len(overlapped) > len(plain)
+    assert all(b.start < a.end for a, b in zip(overlapped, overlapped[1:]))
+    assert overlapped[-1].end == plain[-1].end
+
+
+def test_batch_chunking_matches_per_document_and_threads(monkeypatch):
+    docs = [_norm("ACCESS CONTROL\n- " + "帳號每季審查一次。Accounts are reviewed quarterly. " * 30),
+            _norm(""),
+            _norm("- " + "x" * 3000)]
+    expected = [chunk_document(doc, TOKENIZER, max_tokens=50) for doc in docs]
+    assert chunk_documents(docs, TOKENIZER, max_tokens=50, num_threads=1) == expected
+
+    monkeypatch.setattr(chunking, "PARALLEL_MIN_CHARS", 0)
+    assert chunk_documents(docs, TOKENIZER, max_tokens=50, num_threads=3) == expected
+    assert get_tokenizer() is get_tokenizer()
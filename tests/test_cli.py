@@ -0,0 +1,60 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+from app import cli
+
+
+def _make_project_dir(base: Path, name: str = "proj") -> Path:
+    project_dir = base / name
+    (project_dir / "external_regulations").mkdir(parents=True)
+    (project_dir / "procedures").mkdir()
+    (project_dir / "external_regulations" / "external.json").write_text(
+        json.dumps({"name": name, "C001": "clause text"}), encoding="utf-8"
+    )
+    (project_dir / "procedures" / "internal.txt").write_text("procedure text", encoding="utf-8")
+    (project_dir / "procedures" / "notes.bin").write_bytes(b"\x00")
+    return project_dir
+
+
+def test_project_dict_from_directory(tmp_path):
+    project_dir = _make_project_dir(tmp_path)
+    data = cli.project_dict_from_directory(project_dir)
+
+    assert data["name"] == "proj"
+    assert data["external_regulations_json_path"].endswith("external.json")
+    assert [Path(p).name for p in data["procedure_doc_paths"]] == ["internal.txt"]
+    assert data["run_json_path"] == str(project_dir.resolve() / "run.json")
+
+
+def test_project_dict_from_directory_missing_json(tmp_path):
+    (tmp_path / "empty").mkdir()
+    assert cli.project_dict_from_directory(tmp_path / "empty") is None
+
+
+def test_run_no_selection_is_usage_error(tmp_path):
+    code = cli.main(["run", "--projects-file", str(tmp_path / "missing.json"), "--quiet"])
+    assert code == cli.EXIT_USAGE
+
+
+def test_run_emits_json_lines_and_exit_codes(tmp_path, capsys, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path / "data"))  # --dir runs are recorded for cache gc
+    ok_dir = _make_project_dir(tmp_path, "ok")
+    bad_dir = _make_project_dir(tmp_path, "bad")
+
+    def fake_pipeline(project, settings, progress_callback, cancel_cb):
+        progress_callback(0.5, "halfway")
+        return project.name == "ok"
+
+    with patch("app.pipeline.pipeline_v1_1.run_project_pipeline_v1_1", side_effect=fake_pipeline):
+        code = cli.main(["run", "--dir", str(ok_dir), "--dir", str(bad_dir), "--api-key", "sk-test"])
+
+    assert code == cli.EXIT_FAILED
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert events[0]["event"] == "batch_started"
+    assert {"event": "progress", "project": "ok", "progress": 0.5, "message": "halfway"}.items() <= events[2].items()
+
+    summary = events[-1]
+    assert summary["event"] == "summary"
+    assert summary["completed"] == 1 and summary["failed"] == 1
+    assert [r["status"] for r in summary["results"]] == ["completed", "failed"]
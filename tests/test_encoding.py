@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pytest
+
+from app.pipeline import encoding
+from app.pipeline.encoding import detect_encoding, read_text
+from app.pipeline.ingestion import ingest_documents
+
+TEXT = "資訊安全管理程序\r\n第一條 系統帳號應每季審查一次。\r\nAccess reviews are performed quarterly.\r\n"
+EXPECTED = TEXT.replace("\r\n", "\n")
+
+
+@pytest.mark.parametrize("codec, data", [
+    ("utf-8", TEXT.encode("utf-8-sig")),
+    ("utf-16-le", TEXT.encode("utf-16")),  # Native BOM
+    ("utf-16-be", TEXT.encode("utf-16-be")),  # No BOM
+    ("cp950", (TEXT * 20).encode("cp950")),
+    ("gb18030", (TEXT * 20).encode("gb18030")),
+])
+def test_read_text_detects_encoding(tmp_path: Path, codec: str, data: bytes):
+    path = tmp_path / "proc.txt"
+    path.write_bytes(data)
+    text, detected = read_text(path)
+    assert detected.encoding == codec
+    assert text.lstrip("﻿").startswith(EXPECTED)
+
+
+def test_sample_boundary_inside_a_character(tmp_path: Path):
+    path = tmp_path / "proc.txt"
+    path.write_bytes(("a" + "控制" * 200).encode("utf-8"))
+    text, detected = read_text(path, sample_bytes=8)  # Cuts the second character in half
+    assert detected.encoding == "utf-8" and text == "a" + "控制" * 200
+
+
+def test_fallback_without_detector(monkeypatch):
+    monkeypatch.setattr(encoding, "_detect_from_bytes", None)
+    assert detect_encoding((TEXT * 5).encode("big5")).encoding == "cp950"
+    assert detect_encoding(b"plain \xff\xff\xff").source == "default"
+
+
+def test_ingestion_decodes_legacy_files_with_metadata(tmp_path: Path):
+    big5 = tmp_path / "big5.txt"
+    big5.write_bytes((TEXT * 10).encode("big5"))
+    broken = tmp_path / "broken.txt"
+    broken.write_bytes("控制 ok\n".encode("utf-8") * 50 + b"\xff\n")
+
+    docs = ingest_documents([big5, broken], "procedure", use_fingerprint_cache=False)
+    assert docs[0].content == EXPECTED * 10 and docs[0].metadata["encoding"] == "cp950"
+    assert not docs[0].metadata["errors"]
+    assert docs[1].metadata["encoding"] == "utf-8" and docs[1].metadata["replaced_chars"] == 1
+    assert docs[1].content.endswith("ok\n�\n")
@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import docx
+import openpyxl
+
+from app.pipeline import extractors
+from app.pipeline.extractors import get_extractor, register_extractor, supported_suffixes
+from app.pipeline.fingerprints import FingerprintStore
+from app.pipeline.ingestion import ingest_documents
+
+
+def _write_docx(path: Path) -> Path:
+    document = docx.Document()
+    document.add_heading("Access Control Procedure", level=1)
+    document.add_paragraph("Accounts are reviewed quarterly.")
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "Control"
+    table.cell(0, 1).text = "Owner"
+    table.cell(1, 0).text = "AC-01"
+    table.cell(1, 1).text = "IT Security"
+    document.add_paragraph("Exceptions require CISO approval.")
+    document.save(str(path))
+    return path
+
+
+def _write_xlsx(path: Path) -> Path:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Mapping"
+    sheet.append(["Clause", "Procedure", None])
+    sheet.append(["C001", "PROC-001", None])
+    sheet.append([None, None, None])
+    sheet.append(["C002", 12.0, "note"])
+    workbook.create_sheet("Empty")
+    workbook.save(str(path))
+    return path
+
+
+def test_registry_covers_formats_and_accepts_plugins():
+    assert {".txt", ".md", ".pdf", ".docx", ".xlsx"} <= set(supported_suffixes())
+    assert get_extractor(".DOCX") is extractors.extract_docx
+
+    @register_extractor(".csvx")
+    def extract_csvx(file_path, metadata, executor=None):
+        return "custom"
+
+    try:
+        assert get_extractor(".csvx") is extract_csvx
+    finally:
+        extractors._EXTRACTORS.pop(".csvx")
+
+
+def test_docx_paragraphs_and_tables_in_document_order(tmp_path: Path):
+    metadata = {}
+    text = extractors.extract_docx(_write_docx(tmp_path / "proc.docx"), metadata)
+    lines = [line for line in text.splitlines() if line]
+    assert lines == ["Access Control Procedure", "Accounts are reviewed quarterly.",
+                     "Control | Owner", "AC-01 | IT Security", "Exceptions require CISO approval."]
+    assert metadata["num_tables"] == 1
+
+
+def test_xlsx_read_only_rows(tmp_path: Path):
+    metadata = {}
+    text = extractors.extract_xlsx(_write_xlsx(tmp_path / "mapping.xlsx"), metadata)
+    assert text.splitlines() == ["[Mapping]", "Clause | Procedure", "C001 | PROC-001", "C002 | 12 | note",
+                                 "", "[Empty]"]
+    assert metadata["headers"] == ["Clause", "Procedure"]
+    assert metadata["num_rows"] == 3 and metadata["num_cols"] == 3
+
+
+def test_ingest_documents_dispatches_in_parallel_and_keeps_order(tmp_path: Path):
+    txt = tmp_path / "notes.txt"
+    txt.write_text("- plain text", encoding="utf-8")
+    paths = [_write_xlsx(tmp_path / "mapping.xlsx"), txt, tmp_path / "skip.bin",
+             _write_docx(tmp_path / "proc.docx")]
+    paths[2].write_bytes(b"\x00")
+
+    with FingerprintStore(tmp_path / "store") as store:
+        docs = ingest_documents(paths, "procedure", file_workers=3, fingerprint_store=store)
+        meta = store.get_document_metadata(str(paths[0].resolve()), "procedure")
+    assert [d.metadata["original_filename"] for d in docs] == ["mapping.xlsx", "notes.txt", "proc.docx"]
+    assert meta["num_rows"] == 3 and meta["headers"] == ["Clause", "Procedure"]
+    assert not list(tmp_path.glob("*.meta.json"))
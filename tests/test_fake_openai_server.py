@@ -0,0 +1,48 @@
+import openai
+import pytest
+
+from app.pipeline.llm_utils import call_llm_api
+from app.pipeline_settings import PipelineSettings
+from app.settings import Settings
+
+
+def test_call_llm_api_uses_base_url(fake_openai_server):
+    result = call_llm_api(
+        prompt="Respond with 'requires_procedure' for clause C001.",
+        model_name="gpt-4o",
+        api_key="test-key",
+        expected_response_type="boolean",
+        base_url=fake_openai_server.base_url,
+    )
+    assert isinstance(result, bool)
+    assert fake_openai_server.stats["chat"] == 1
+
+
+def test_embeddings_are_deterministic(fake_openai_server):
+    client = openai.OpenAI(api_key="test-key", base_url=fake_openai_server.base_url)
+    first = client.embeddings.create(input=["條文一", "clause two"], model="text-embedding-3-small")
+    second = client.embeddings.create(input=["條文一"], model="text-embedding-3-small")
+    assert len(first.data) == 2 and len(first.data[0].embedding) == 256
+    assert first.data[0].embedding == second.data[0].embedding
+    assert first.data[0].embedding != first.data[1].embedding
+    assert fake_openai_server.stats["embedding_inputs"] == 3
+
+
+def test_injected_rate_limits_and_errors(fake_openai_server):
+    client = openai.OpenAI(api_key="test-key", base_url=fake_openai_server.base_url, max_retries=0)
+    fake_openai_server.configure(rate_limit_rate=1.0)
+    with pytest.raises(openai.RateLimitError):
+        client.embeddings.create(input=["x"], model="m")
+
+    fake_openai_server.configure(rate_limit_rate=0.0, error_rate=1.0)
+    assert call_llm_api("requires_procedure?", "gpt-4o", "test-key", base_url=fake_openai_server.base_url) is None
+    assert fake_openai_server.stats["rate_limited"] == 1
+    assert fake_openai_server.stats["errors"] >= 1
+
+
+def test_pipeline_settings_reads_base_url(tmp_path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    settings = Settings()
+    settings.set("openai.base_url", "http://127.0.0.1:9/v1")
+    assert PipelineSettings.from_settings(settings).openai_base_url == "http://127.0.0.1:9/v1"
+    assert PipelineSettings().openai_base_url is None
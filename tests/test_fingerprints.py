@@ -0,0 +1,72 @@
+import hashlib
+import os
+import time
+from pathlib import Path
+from unittest import mock
+
+from app.pipeline import extractors, ingestion
+from app.pipeline.fingerprints import FileFingerprint, FingerprintStore, hash_file
+from app.pipeline.ingestion import ingest_documents
+
+
+def _age(path: Path, seconds: float = 60) -> None:
+    """Backdates mtime so the fingerprint is outside the racy window."""
+    stamp = time.time_ns() - int(seconds * 1e9)
+    os.utime(path, ns=(stamp, stamp))
+
+
+def test_hash_file_matches_hashlib(tmp_path: Path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    path = tmp_path / "blob.bin"
+    path.write_bytes(data)
+    assert hash_file(path) == hashlib.sha256(data).hexdigest()
+
+
+def test_unchanged_file_skips_hashing_and_extraction(tmp_path: Path):
+    proc = tmp_path / "proc.txt"
+    proc.write_text("- Backups are tested monthly.", encoding="utf-8")
+    _age(proc)
+
+    with FingerprintStore(tmp_path / "store") as store:
+        (first,) = ingest_documents([proc], "procedure", fingerprint_store=store)
+        with mock.patch.object(ingestion, "hash_file") as hashed, \
+                mock.patch.dict(extractors._EXTRACTORS, {".txt": mock.Mock(side_effect=AssertionError)}):
+            (second,) = ingest_documents([proc], "procedure", fingerprint_store=store)
+        hashed.assert_not_called()
+        assert second.id == first.id and second.content == first.content
+
+        # Content change (new size and mtime) invalidates the entry.
+        proc.write_text("- Backups are tested weekly, not monthly.", encoding="utf-8")
+        _age(proc, 30)
+        (third,) = ingest_documents([proc], "procedure", fingerprint_store=store)
+        assert third.id != first.id and "weekly" in third.content
+
+
+def test_racy_entry_is_rehashed_but_not_reextracted(tmp_path: Path):
+    proc = tmp_path / "proc.txt"
+    proc.write_text("- Fresh file", encoding="utf-8")  # mtime == now, i.e. racy
+
+    with FingerprintStore(tmp_path / "store") as store:
+        ingest_documents([proc], "procedure", fingerprint_store=store)
+        assert store.lookup(FileFingerprint.of(proc)).racy
+        with mock.patch.object(ingestion, "hash_file", wraps=hash_file) as hashed, \
+                mock.patch.dict(extractors._EXTRACTORS, {".txt": mock.Mock(side_effect=AssertionError)}):
+            (doc,) = ingest_documents([proc], "procedure", fingerprint_store=store)
+        hashed.assert_called_once()
+        assert doc.content == "- Fresh file"
+
+
+def test_metadata_is_centralized_and_written_only_on_change(tmp_path: Path):
+    proc = tmp_path / "proc.txt"
+    proc.write_text("- Access reviews", encoding="utf-8")
+    _age(proc)
+
+    with FingerprintStore(tmp_path / "store") as store:
+        (doc,) = ingest_documents([proc], "procedure", fingerprint_store=store)
+        meta = store.get_document_metadata(str(proc.resolve()), "procedure")
+        assert meta["file_sha256"] == doc.id and meta["original_filename"] == "proc.txt"
+
+        with mock.patch.object(store, "save_document_metadata") as saved:
+            ingest_documents([proc], "procedure", fingerprint_store=store)
+        saved.assert_not_called()
+    assert not list(tmp_path.glob("*.meta.json"))
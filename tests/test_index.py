@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pytest
+
+from app.models.docs import EmbedSet
+from app.pipeline.index import METRIC_COSINE, METRIC_L2, IndexBuilder, create_or_load_index
+from app.pipeline.retrieve import retrieve_similar_chunks
+
+
+def _embed_sets(n: int = 12, dimension: int = 6):
+    rng = np.random.default_rng(3)
+    # Deliberately not unit length, so normalization matters
+    return [EmbedSet(id=f"es{i}", norm_doc_id="doc", chunk_text=f"chunk {i}",
+                     embedding=(rng.normal(size=dimension) * (i + 1)).tolist(),
+                     chunk_index=i, total_chunks=n, doc_type="procedure") for i in range(n)]
+
+
+def test_cosine_index_scores_are_cosine_similarities(tmp_path: Path):
+    embed_sets = _embed_sets()
+    builder = IndexBuilder(tmp_path, "procedures", "model", metric=METRIC_COSINE)
+    builder.add(embed_sets[:5])
+    builder.add(embed_sets[5:])
+    meta = builder.finish()
+    assert meta.metric == METRIC_COSINE and faiss.read_index(str(meta.index_file_path)).metric_type == faiss.METRIC_INNER_PRODUCT
+
+    query = embed_sets[0].model_copy(update={"id": "q", "embedding": [2 * v for v in embed_sets[0].embedding]})
+    matches = retrieve_similar_chunks(query, meta, {es.id: es for es in embed_sets}, 12)
+    vectors = np.array([es.embedding for es in embed_sets])
+    q = np.array(query.embedding)
+    expected = vectors @ q / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(q))
+    assert matches[0].matched_embed_set_id == "es0" and matches[0].score == pytest.approx(1.0, abs=1e-5)
+    for match in matches:
+        assert match.score == pytest.approx(expected[int(match.matched_embed_set_id[2:])], abs=1e-5)
+    assert [m.score for m in matches] == sorted((m.score for m in matches), reverse=True)
+
+
+def test_metric_change_rebuilds_index(tmp_path: Path):
+    embed_sets = _embed_sets()
+    l2_meta = create_or_load_index(embed_sets, tmp_path, "procedures", "model")
+    assert l2_meta.metric == METRIC_L2
+    cosine_meta = create_or_load_index(embed_sets, tmp_path, "procedures", "model", metric=METRIC_COSINE)
+    assert faiss.read_index(str(cosine_meta.index_file_path)).metric_type == faiss.METRIC_INNER_PRODUCT
+
+    builder = IndexBuilder(tmp_path, "procedures", "model", metric=METRIC_L2)
+    builder.add(embed_sets)
+    assert builder.finish().metric == METRIC_L2  # Same ids, other metric: the files are rewritten
+    assert faiss.read_index(str(cosine_meta.index_file_path)).metric_type == faiss.METRIC_L2
+
+
+def test_chunk_store_loads_only_requested_chunks(tmp_path: Path):
+    embed_sets = _embed_sets()
+    for es in embed_sets:
+        es.metadata = {"page_number": es.chunk_index + 1}
+    builder = IndexBuilder(tmp_path, "procedures", "model")
+    builder.add(embed_sets)
+    meta = builder.finish()
+
+    chunks = builder.chunks_for(["es3", "missing", "es7"])
+    assert sorted(chunks) == ["es3", "es7"]
+    assert chunks["es3"].chunk_text == "chunk 3" and chunks["es3"].metadata == {"page_number": 4}
+    assert chunks["es3"].embedding == []
+
+    matches = retrieve_similar_chunks(embed_sets[5], meta, builder.chunks_for, 3,
+                                      faiss_index_obj=builder.index, id_map_list_obj=builder.ids)
+    assert matches[0].matched_embed_set_id == "es5" and matches[0].matched_chunk_text == "chunk 5"
+    builder.close()
@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+import tiktoken
+
+from app.pipeline import extractors
+from app.pipeline.chunking import chunk_document
+from app.pipeline.extractors import iter_pdf_pages
+from app.pipeline.ingestion import ingest_documents
+from app.pipeline.normalize import normalize_document
+
+
+def _write_pdf(path: Path, pages: List[str]) -> Path:
+    """Writes a minimal PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(out)
+    return path
+
+
+def test_iter_pdf_pages_is_lazy_and_ordered(tmp_path: Path, monkeypatch):
+    pdf = _write_pdf(tmp_path / "manual.pdf", [f"- Page {i} control text" for i in range(1, 31)])
+    monkeypatch.setattr(extractors, "PDF_PAGES_PER_TASK", 4)
+
+    pages = iter_pdf_pages(pdf)
+    assert next(pages) == (1, "- Page 1 control text")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        parallel = list(iter_pdf_pages(pdf, executor, max_pending=2))
+    assert [n for n, _ in parallel] == list(range(1, 31))
+    assert parallel[29][1] == "- Page 30 control text"
+
+
+def test_ingest_pdf_with_process_pool_records_pages(tmp_path: Path, monkeypatch):
+    pdf = _write_pdf(tmp_path / "manual.pdf", [f"- Backup rule number {i}" for i in range(1, 11)])
+    monkeypatch.setattr(extractors, "PDF_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(extractors, "PDF_PAGES_PER_TASK", 3)
+
+    (raw,) = ingest_documents([pdf], "procedure", pdf_workers=2, use_fingerprint_cache=False)
+    assert raw.metadata["num_pages"] == 10
+    spans = raw.metadata["page_spans"]
+    assert [s["page"] for s in spans] == list(range(1, 11))
+    assert raw.content[spans[6]["start"]:spans[6]["end"]] == "- Backup rule number 7"
+
+
+def test_pdf_page_numbers_reach_chunks(tmp_path: Path):
+    pdf = _write_pdf(tmp_path / "manual.pdf", ["- Access review", "", "- Change approval"])
+    (raw,) = ingest_documents([pdf], "procedure", pdf_workers=0, use_fingerprint_cache=False)
+    norm = normalize_document(raw)
+    # The blank page disappears, the others keep their original numbers.
+    assert [s["page"] for s in norm.metadata["page_spans"]] == [1, 3]
+
+    chunks = chunk_document(norm, tiktoken.get_encoding("cl100k_base"), max_tokens=50)
+    assert [(c.text, c.page_number) for c in chunks] == [("- Access review", 1), ("- Change approval", 3)]
@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.models.docs import EmbedSet
+from app.pipeline.index import IndexBuilder
+from app.pipeline.lexical import BM25Index, tokenize
+from app.pipeline.retrieve import fuse_matches, retrieve_chunks
+from app.pipeline_settings import RETRIEVAL_ENGINES
+
+TEXTS = [
+    "資通安全長應每年檢討資通安全政策並核定。",
+    "系統備份每月測試一次，備份媒體異地保存。",
+    "Access rights are reviewed quarterly per clause 5.1.2.",
+    "新進人員應於到職一週內完成資安教育訓練。",
+    "密碼長度至少十二碼並每九十日更換。",
+]
+
+
+def _embed_sets():
+    rng = np.random.default_rng(7)
+    return [EmbedSet(id=f"es{i}", norm_doc_id=f"doc{i}", chunk_text=text, embedding=rng.random(8).tolist(),
+                     chunk_index=0, total_chunks=1, doc_type="procedure") for i, text in enumerate(TEXTS)]
+
+
+def test_tokenize_cjk_bigrams_words_and_numbers():
+    assert tokenize("資通安全長") == ["資通", "通安", "安全", "全長"]
+    assert tokenize("依 ＩＳＯ ２７００１ 第5.1.2條 Backup") == ["依", "iso", "27001", "第", "5.1.2", "條", "backup"]
+
+
+def test_bm25_ranks_exact_terms_and_round_trips(tmp_path: Path):
+    index = BM25Index()
+    index.add(TEXTS[:2])
+    index.add(TEXTS[2:])  # Numbering continues across calls
+    assert [doc for doc, _ in index.search("備份", 3)] == [1]
+    assert [doc for doc, _ in index.search("clause 5.1.2", 3)] == [2]
+    assert index.search("完全無關", 3) == []
+
+    index.save(tmp_path / "bm25.npz")
+    loaded = BM25Index.load(tmp_path / "bm25.npz")
+    assert len(loaded) == len(TEXTS)
+    for query in ("資通安全長", "備份 教育訓練", "quarterly"):
+        assert loaded.search(query, 5) == index.search(query, 5)
+
+
+@pytest.mark.parametrize("engine", RETRIEVAL_ENGINES)
+def test_retrieval_engines_find_exact_term(tmp_path: Path, engine: str):
+    embed_sets = _embed_sets()
+    builder = IndexBuilder(tmp_path, "procedures", "model", lexical=True)
+    builder.add(embed_sets)
+    meta = builder.finish()
+    assert meta.lexical_index_path.exists()
+    by_id = {es.id: es for es in embed_sets}
+    # The query vector equals chunk 4's, but its text names the 資通安全長 of chunk 0
+    query = embed_sets[4].model_copy(update={"id": "q", "chunk_text": "資通安全長的職責"})
+
+    # Both in memory and from the files written next to the FAISS index
+    for kwargs in ({"faiss_index_obj": builder.index, "id_map_list_obj": builder.ids,
+                    "lexical_index_obj": builder.lexical}, {}):
+        matches = retrieve_chunks(query, meta, by_id, 2, engine=engine, **kwargs)
+        found = [m.matched_embed_set_id for m in matches]
+        assert len(found) == (1 if engine == "BM25" else 2)
+        assert ("es4" in found) == (engine != "BM25")
+        assert ("es0" in found) == (engine != "FAISS")
+        assert all(0.0 < m.score <= 1.0 for m in matches)
+
+
+def test_rrf_scores_top_of_both_lists_as_one(tmp_path: Path):
+    embed_sets = _embed_sets()
+    builder = IndexBuilder(tmp_path, "procedures", "model", lexical=True)
+    builder.add(embed_sets)
+    meta = builder.finish()
+    query = embed_sets[1].model_copy(update={"id": "q", "chunk_text": "備份"})
+    dense = retrieve_chunks(query, meta, {es.id: es for es in embed_sets}, 3, engine="FAISS")
+    lexical = retrieve_chunks(query, meta, {es.id: es for es in embed_sets}, 3, engine="BM25")
+    (top, *_) = fuse_matches(dense, lexical, 3)
+    assert top.matched_embed_set_id == "es1" and top.score == pytest.approx(1.0)
+    assert top.raw_faiss_distance is not None and top.lexical_score is not None
@@ -0,0 +1,66 @@
+from pathlib import Path
+from unittest import mock
+
+from app.models.docs import RawDoc
+from app.pipeline import normalize
+from app.pipeline.cache import CacheService
+from app.pipeline.normalize import normalize_document, normalize_documents
+
+
+def _raw(doc_id: str, content: str, name: str = "proc.txt") -> RawDoc:
+    return RawDoc(id=doc_id, source_path=Path(name), content=content,
+                  metadata={"original_filename": name, "file_type": ".txt", "errors": []}, doc_type="procedure")
+
+
+def test_normalize_documents_matches_serial_and_uses_process_pool(monkeypatch):
+    docs = [_raw(f"doc{i}", f"- 第{i}章\t總則\n\n\n- 內容 {i}  說明") for i in range(3)]
+    monkeypatch.setattr(normalize, "PARALLEL_MIN_CHARS", 1)
+    with mock.patch.object(normalize, "ProcessPoolExecutor", wraps=normalize.ProcessPoolExecutor) as pool:
+        result = normalize_documents(docs, max_workers=2)
+    pool.assert_called_once()
+    assert result == [normalize_document(d) for d in docs]
+
+
+def test_normdoc_cache_hits_skip_normalization_and_track_version(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    cache = CacheService(project_name="normalize_test")
+    first = normalize_documents([_raw("abc", "- Access review")], cache)
+
+    with mock.patch.object(normalize, "normalize_document", side_effect=AssertionError):
+        (cached,) = normalize_documents([_raw("abc", "- Access review", name="copy.txt")], cache)
+    assert cached.text_content == first[0].text_content
+    assert cached.metadata["original_filename"] == "copy.txt"
+
+    monkeypatch.setattr(normalize, "NORMALIZATION_VERSION", normalize.NORMALIZATION_VERSION + 1)
+    with mock.patch.object(normalize, "normalize_document", wraps=normalize_document) as renormalized:
+        normalize_documents([_raw("abc", "- Access review")], cache)
+    renormalized.assert_called_once()
+
+
+# --- Differential tests: single-pass normalizer vs. the line-by-line reference ---
+
+_FUZZ_PIECES = list("aZ 1.2()[]\t\n\r\x0b\x0c\x1c\x1f\x85　\xa0-–:第章條。，éſ") + [
+    "Chapter ", "SECTION 2: ", "1.2.3 ", "(A.1) ", "[3] ", "\r\n", " ", "ARTICLE IV", "  ", "\n\n",
+    "abc", "ABC DEF", " \n", "　\n", "é", "Part 7 – ",
+]
+
+
+def _assert_same(text: str):
+    assert normalize._normalize_text(text, "t") == normalize._normalize_text_reference(text, "t"), repr(text)
+
+
+def test_single_pass_normalizer_matches_reference_on_sample_and_synthetic_data(tmp_path: Path):
+    from tests.benchmarks.corpus import generate_procedure_corpus
+
+    samples = sorted((Path(__file__).resolve().parent.parent / "sample_data").glob("*/procedures/*.txt"))
+    assert samples
+    for path in samples + generate_procedure_corpus(tmp_path, 0.3, n_files=3, seed=7):
+        _assert_same(path.read_text(encoding="utf-8"))
+
+
+def test_single_pass_normalizer_matches_reference_on_fuzzed_text():
+    import random
+
+    rng = random.Random(36)
+    for _ in range(5000):
+        _assert_same("".join(rng.choice(_FUZZ_PIECES) for _ in range(rng.randint(0, 40))))
@@ -0,0 +1,46 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from app.models.project_data import ProjectData
+
+
+def test_project_data_roundtrip(tmp_path: Path):
+    ext = tmp_path / "external.json"
+    ext.write_text("{}", encoding="utf-8")
+    proc = tmp_path / "internal.txt"
+    proc.write_text("procedure", encoding="utf-8")
+
+    project = ProjectData(
+        name="Roundtrip",
+        external_regulations_json_path=ext,
+        procedure_doc_paths=[proc],
+        run_json_path=tmp_path / "run.json",
+    )
+    assert project.ready is True
+
+    restored = ProjectData.from_dict(project.to_dict())
+    assert type(restored) is ProjectData
+    assert restored.to_dict() == project.to_dict()
+
+
+def test_project_data_rename_validates():
+    project = ProjectData(name="Old", run_json_path=Path("run.json"))
+    project.rename("  New  ")
+    assert project.name == "New"
+    try:
+        project.rename("   ")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Empty names must be rejected")
+
+
+def test_pipeline_and_cli_import_without_qt():
+    # Run in a fresh interpreter so modules imported by other tests don't leak in.
+    code = (
+        "import sys, app.pipeline, app.pipeline.pipeline_v1_1, app.cli; "
+        "sys.exit(1 if any(m.startswith('PySide6') for m in sys.modules) else 0)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parent.parent)
+    assert result.returncode == 0
@@ -0,0 +1,57 @@
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from app.models.assessments import MatchSet
+from app.pipeline.cache import CacheService
+from app.pipeline.rerank import NoOpReranker, Reranker, RerankScoreCache, get_reranker, rerank_matches
+from app.pipeline_settings import RERANKER_CROSS_ENCODER
+
+
+class CountingReranker(Reranker):
+    """Scores a pair by the passage's number; records every call."""
+    name = "counting"
+
+    def __init__(self):
+        self.calls: List[List[Tuple[str, str]]] = []
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        self.calls.append(list(pairs))
+        return [float(passage.split()[-1]) for _, passage in pairs]
+
+
+def _matches(*ids):
+    return [MatchSet(query_norm_doc_id="q", query_embed_set_id="q", query_chunk_text="q", matched_norm_doc_id="d",
+                     matched_embed_set_id=f"es{i}", matched_chunk_text=f"chunk {i}", score=1.0 - rank / 10,
+                     query_doc_type="task_query_text", matched_doc_type="procedures")
+            for rank, i in enumerate(ids)]
+
+
+def test_no_op_reranker_keeps_retrieval_order():
+    kept = rerank_matches(NoOpReranker(), {0: ("query", _matches(3, 1, 2))}, k=2)
+    assert [m.matched_embed_set_id for m in kept[0]] == ["es3", "es1"] and kept[0][0].retrieval_score is None
+
+
+def test_candidates_of_all_tasks_are_scored_in_one_batch(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    reranker = CountingReranker()
+    cache = RerankScoreCache(CacheService(project_name="rerank_test"), "counting")
+    candidates = {0: ("backup", _matches(1, 5, 3)), 1: ("access", _matches(2, 4)), 2: ("backup", _matches(5, 3))}
+
+    kept = rerank_matches(reranker, candidates, k=2, cache=cache)
+    assert len(reranker.calls) == 1 and len(reranker.calls[0]) == 5  # Task 2 repeats task 0's pairs
+    assert [m.matched_embed_set_id for m in kept[0]] == ["es5", "es3"]
+    assert kept[0][0].score == 5.0 and kept[0][0].retrieval_score == 0.9
+    assert [m.matched_embed_set_id for m in kept[1]] == ["es4", "es2"]
+
+    # A new run reads the scores from the cache
+    cache = RerankScoreCache(CacheService(project_name="rerank_test"), "counting")
+    again = rerank_matches(reranker, candidates, k=2, cache=cache)
+    assert len(reranker.calls) == 1
+    assert [[m.matched_embed_set_id for m in ms] for ms in again.values()] == \
+        [[m.matched_embed_set_id for m in ms] for ms in kept.values()]
+
+
+def test_cross_encoder_falls_back_to_no_op(tmp_path: Path):
+    assert not get_reranker(RERANKER_CROSS_ENCODER).enabled
+    assert not get_reranker(RERANKER_CROSS_ENCODER, tmp_path / "missing-model").enabled
+    assert not get_reranker("unknown").enabled
@@ -0,0 +1,48 @@
+import json
+
+from app.models.docs import AuditTask, ExternalRegulationClause
+from app.models.run_data import ProjectRunData, evidence_id_for
+
+
+def _legacy_clause(clause_id: str, num_tasks: int) -> dict:
+    """A clause as older run.json files stored it: every task copies the same excerpt."""
+    entry = {"excerpt": "Backups are tested every quarter. " * 20, "source_txt": "backup.txt", "page_no": 3,
+             "section": "4.2"}
+    tasks = [{"id": f"{clause_id}-T{i}", "sentence": "backup testing", "top_k": [{**entry, "score": 0.9 - i / 100}]}
+             for i in range(num_tasks)]
+    return {"id": clause_id, "text": "Backups must be tested.", "tasks": tasks}
+
+
+def test_legacy_excerpts_move_to_the_evidence_table():
+    legacy = {"project_name": "p", "external_regulation_clauses": [_legacy_clause("C1", 5), _legacy_clause("C2", 5)]}
+    run_data = ProjectRunData.from_dict(legacy)
+
+    assert len(run_data.evidence) == 1
+    evidence_id = next(iter(run_data.evidence))
+    assert evidence_id == evidence_id_for("backup.txt\n" + "Backups are tested every quarter. " * 20)
+    task = run_data.external_regulation_clauses[1].tasks[2]
+    assert task.top_k == [{"evidence_id": evidence_id, "score": 0.88}]
+    assert run_data.external_regulation_clauses[0].evidence == [evidence_id]
+    # Resolved entries look like the legacy ones
+    assert run_data.task_evidence(task) == [{**legacy["external_regulation_clauses"][1]["tasks"][2]["top_k"][0],
+                                             "evidence_id": evidence_id}]
+
+    saved = json.dumps(run_data.to_dict())
+    assert len(saved) * 3 < len(json.dumps(legacy))
+    assert ProjectRunData.from_dict(json.loads(saved)).to_dict() == run_data.to_dict()
+
+
+def test_per_clause_evidence_dicts_are_merged():
+    clause = {"id": "C1", "text": "t", "evidence": {"ev_a": {"embed_set_id": "a", "excerpt": "A"}},
+              "tasks": [{"id": "T1", "sentence": "s", "top_k": [{"evidence_id": "ev_a", "score": 0.5}]}]}
+    run_data = ProjectRunData.from_dict({"project_name": "p", "external_regulation_clauses": [clause]})
+    assert run_data.external_regulation_clauses[0].evidence == ["ev_a"]
+    assert run_data.evidence == {"ev_a": {"embed_set_id": "a", "excerpt": "A"}}
+
+
+def test_unreferenced_evidence_is_not_saved():
+    task = AuditTask(id="T1", sentence="s", top_k=[{"evidence_id": "ev_a", "score": 0.5}])
+    run_data = ProjectRunData("p", [ExternalRegulationClause(id="C1", text="t", tasks=[task], evidence=["ev_a"])],
+                              evidence={"ev_a": {"excerpt": "A"}, "ev_old": {"excerpt": "dropped by MMR"}})
+    assert list(run_data.to_dict()["evidence"]) == ["ev_a"]
+    assert run_data.task_evidence(AuditTask(id="T2", sentence="s")) == []
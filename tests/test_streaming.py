@@ -0,0 +1,95 @@
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+
+from app.models.docs import EmbedSet, NormDoc
+from app.pipeline.cache import CacheService
+from app.pipeline import embed
+from app.pipeline.embed import iter_embedded_documents
+from app.pipeline.index import IndexBuilder, create_or_load_index
+from app.pipeline.ingestion import iter_ingest_documents
+from app.pipeline.normalize import iter_normalize_documents
+from tests.benchmarks.stub_openai import StubBackend, patch_openai
+
+
+def _docs(n: int, pulled: List[str]) -> Iterator[NormDoc]:
+    for i in range(n):
+        pulled.append(f"doc{i}")
+        text = "\n".join(f"- Control {i}.{j} is reviewed by the owner every quarter." for j in range(6))
+        yield NormDoc(id=f"doc{i}", raw_doc_id=f"raw{i}", text_content=text, sections=[], metadata={},
+                      doc_type="procedure")
+
+
+def test_embeddings_are_batched_across_documents_with_back_pressure(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    cache = CacheService(project_name="stream_test")
+    pulled: List[str] = []
+    backend = StubBackend(dimension=8)
+
+    with patch_openai(backend):
+        stream = iter_embedded_documents(_docs(7, pulled), cache, "key", "stub-model", max_tokens_per_chunk=15,
+                                         batch_size=5, docs_per_chunk_batch=2)
+        first_doc, first_embeds = next(stream)
+        # Only the first group of documents has been pulled from upstream
+        assert first_doc.id == "doc0" and pulled == ["doc0", "doc1"]
+        results = [(first_doc, first_embeds)] + list(stream)
+
+    assert [doc.id for doc, _ in results] == [f"doc{i}" for i in range(7)]
+    total_chunks = sum(len(embeds) for _, embeds in results)
+    assert total_chunks == 42 and backend.calls["embedding_inputs"] == 42
+    assert backend.calls["embeddings"] == 9  # ceil(42 / 5), requests span document boundaries
+    assert all(es.metadata["char_end"] > es.metadata["char_start"] for _, embeds in results for es in embeds)
+
+    # Second run is served from the per-document cache
+    with patch_openai(StubBackend(dimension=8)) as second:
+        cached = list(iter_embedded_documents(_docs(7, []), cache, "key", "stub-model", max_tokens_per_chunk=15))
+    assert second.calls["embeddings"] == 0
+    assert [[es.id for es in embeds] for _, embeds in cached] == [[es.id for es in embeds] for _, embeds in results]
+
+
+def test_index_builder_matches_batch_index(tmp_path: Path):
+    rng = np.random.default_rng(0)
+    embed_sets = [EmbedSet(id=f"e{i}", norm_doc_id="d", chunk_text=f"t{i}", embedding=rng.random(4).tolist(),
+                           chunk_index=i, total_chunks=10, doc_type="procedure") for i in range(10)]
+    builder = IndexBuilder(tmp_path / "stream", "procedures", "model")
+    for start in range(0, 10, 3):
+        builder.add(embed_sets[start:start + 3])
+    meta = builder.finish()
+    reference = create_or_load_index(embed_sets, tmp_path / "batch", "procedures", "model")
+    assert meta.num_vectors == reference.num_vectors == 10
+    assert meta.index_file_path.read_bytes() == reference.index_file_path.read_bytes()
+    written = meta.index_file_path.read_bytes()
+    rebuilt = IndexBuilder(tmp_path / "stream", "procedures", "model")
+    rebuilt.add(embed_sets)
+    assert rebuilt.finish() is not None and meta.index_file_path.read_bytes() == written  # Rewritten, same content
+
+
+def test_ingest_and_normalize_streams_keep_order_and_stop_early(tmp_path: Path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"proc{i}.txt"
+        path.write_text(f"- Procedure {i} text", encoding="utf-8")
+        paths.append(path)
+
+    raw_stream = iter_ingest_documents(paths, "procedure", file_workers=2, use_fingerprint_cache=False, max_pending=2)
+    norm_stream = iter_normalize_documents(raw_stream, batch_size=2)
+    assert next(norm_stream).metadata["original_filename"] == "proc0.txt"
+    norm_stream.close()
+    raw_stream.close()
+
+    docs = list(iter_normalize_documents(
+        iter_ingest_documents(paths, "procedure", file_workers=3, use_fingerprint_cache=False), batch_size=4))
+    assert [d.text_content for d in docs] == [f"- Procedure {i} text" for i in range(6)]
+
+
+def test_normalization_version_is_part_of_embedding_keys(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REGULENS_DATA_DIR", str(tmp_path))
+    cache = CacheService(project_name="norm_version_test")
+    doc = next(_docs(1, []))
+    with patch_openai(StubBackend(dimension=8)):
+        (_, before), = iter_embedded_documents(iter([doc]), cache, "key", "stub-model", max_tokens_per_chunk=15)
+        monkeypatch.setattr(embed, "NORMALIZATION_VERSION", embed.NORMALIZATION_VERSION + 1)
+        (_, after), = iter_embedded_documents(iter([doc]), cache, "key", "stub-model", max_tokens_per_chunk=15)
+    # A new normalizer re-chunks the document instead of serving cached chunks, offsets and ids
+    assert len(before) == len(after) and not {es.id for es in before} & {es.id for es in after}
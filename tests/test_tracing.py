@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from app.pipeline import tracing
+from app.pipeline.tracing import TraceHook, Tracer, activate, export_run_trace, incr, span
+
+
+def test_span_is_noop_without_active_tracer():
+    assert tracing.get_tracer() is None
+    with span("anything", "stage") as s:
+        s.set(count=1)
+        s.incr("bytes", 10)
+    assert s is tracing.NULL_SPAN
+
+
+def test_nested_spans_and_summary():
+    tracer = Tracer("demo")
+    with activate(tracer):
+        with span("need_check", "stage"):
+            for _ in range(3):
+                with span("llm_call", "llm") as s:
+                    s.set(prompt_tokens=10)
+        incr("cache_hits", 2)
+    assert tracing.get_tracer() is None
+
+    by_name = {s.name: s for s in tracer.spans}
+    assert by_name["llm_call"].parent is by_name["need_check"]
+    assert by_name["llm_call"].depth == 1
+
+    rows = {(r["category"], r["name"]): r for r in tracer.summary_rows()}
+    assert rows[("llm", "llm_call")]["count"] == 3
+    assert rows[("llm", "llm_call")]["attrs"]["prompt_tokens"] == 30
+    summary = tracer.format_summary()
+    assert "llm_call" in summary and "cache_hits=2" in summary
+
+
+def test_spans_on_worker_threads_are_recorded_with_own_stack():
+    tracer = Tracer("threads")
+
+    def work():
+        with span("embedding_batch", "embedding"):
+            pass
+
+    with activate(tracer):
+        with span("search", "stage"):
+            t = threading.Thread(target=work)
+            t.start()
+            t.join()
+
+    worker_span = next(s for s in tracer.spans if s.name == "embedding_batch")
+    assert worker_span.parent is None
+    assert len(tracer.spans) == 2
+
+
+def test_chrome_trace_export_and_error_attr(tmp_path: Path):
+    tracer = Tracer("export")
+    with activate(tracer):
+        try:
+            with span("save_run_json", "io") as s:
+                s.set(bytes=123)
+                raise IOError("disk full")
+        except IOError:
+            pass
+
+    path = tmp_path / "trace.json"
+    written = tracer.write_chrome_trace(path)
+    assert written == path.stat().st_size
+    doc = json.loads(path.read_text(encoding="utf-8"))
+    (event,) = doc["traceEvents"]
+    assert event["ph"] == "X" and event["name"] == "save_run_json" and event["cat"] == "io"
+    assert event["args"] == {"bytes": 123, "error": "OSError"}
+    assert event["dur"] >= 0
+
+
+def test_hooks_receive_events():
+    class Collector(TraceHook):
+        def __init__(self):
+            self.ended = []
+            self.counters = []
+            self.finished = False
+
+        def on_span_end(self, tracer, span):
+            self.ended.append(span.name)
+
+        def on_counter(self, tracer, name, value):
+            self.counters.append((name, value))
+
+        def on_finish(self, tracer):
+            self.finished = True
+
+    local, global_ = Collector(), Collector()
+    tracing.add_global_hook(global_)
+    try:
+        tracer = Tracer("hooks")
+        tracer.add_hook(local)
+        with activate(tracer):
+            with span("index_build", "index"):
+                incr("vectors", 5)
+    finally:
+        tracing.remove_global_hook(global_)
+
+    for collector in (local, global_):
+        assert collector.ended == ["index_build"]
+        assert collector.counters == [("vectors", 5)]
+        assert collector.finished
+
+
+def test_export_keeps_only_the_newest_traces(tmp_path: Path):
+    for i in range(4):
+        old = tmp_path / f"old_{i}.json"
+        old.write_text("{}")
+        os.utime(old, (1_000_000 + i, 1_000_000 + i))
+    tracer = Tracer("keep")
+    with activate(tracer):
+        with span("pipeline_run", "run"):
+            pass
+    written = export_run_trace(tracer, tmp_path, keep=3)
+    assert sorted(p.name for p in tmp_path.glob("*.json")) == sorted([written.name, "old_2.json", "old_3.json"])